@@ -0,0 +1,228 @@
+"""Animation Scheduler (một nhịp after() chung cho mọi hiệu ứng UI, additive)
+
+Trước đây mỗi hiệu ứng (fade tooltip/toast/cửa sổ, hover Treeview, nút, badge phiên bản nhấp nháy mãi
+mỗi 100 ms) tự chạy chuỗi after() riêng. Scheduler gom lại:
+- Một nhịp cố định (ui_settings.animation_fps, mặc định 30 khung/giây), chỉ chạy khi còn việc.
+- Tween theo thời gian thực: step(t) với t = 0..1 tính từ đồng hồ, nên vòng lặp bận -> bỏ khung
+  (nhảy thẳng tới trạng thái đúng) thay vì chạy chậm dần; số khung bị bỏ ghi vào ui.anim.frames_dropped.
+- update(key, fn): gom thay đổi thuộc tính trong một khung (cùng key -> chỉ lần ghi cuối được áp dụng).
+- Ngân sách mỗi khung (ANIMATION_FRAME_BUDGET_MS): vượt thì phần còn lại chờ khung sau (xoay vòng).
+- Cửa sổ mất focus / thu nhỏ -> tạm dừng: không vẽ khung trung gian, vòng lặp (badge) đứng yên,
+  tween có hạn vẫn kết thúc đúng hạn (toast vẫn tự đóng).
+- ui_settings.animation_enabled=false -> tắt hẳn: tween nhảy thẳng tới trạng thái cuối, vòng lặp không chạy.
+"""
+from __future__ import annotations
+import logging
+import time
+from typing import Any, Callable, Dict, Hashable, Optional
+
+from utils import metrics
+
+logger = logging.getLogger("suk.ui.anim")
+
+DEFAULT_FPS = 30
+ANIMATION_FRAME_BUDGET_MS = 8.0
+
+
+class _Anim:
+    __slots__ = ('step', 'start', 'duration', 'on_done', 'loop', 'gap', 'last_frame')
+
+    def __init__(self, step, start, duration, on_done, loop, gap):
+        self.step = step
+        self.start = start
+        self.duration = duration
+        self.on_done = on_done
+        self.loop = loop
+        self.gap = gap
+        self.last_frame = 0.0
+
+
+class AnimationScheduler:
+    """Điều phối mọi hiệu ứng trên luồng Tk qua một nhịp after() duy nhất."""
+
+    def __init__(self, root, fps: int = DEFAULT_FPS, enabled: bool = True,
+                 budget_ms: float = ANIMATION_FRAME_BUDGET_MS):
+        self.root = root
+        self.enabled = bool(enabled)
+        self.frame_s = 1.0 / max(1, int(fps))
+        self.budget_s = budget_ms / 1000.0
+        self._anims: Dict[Hashable, _Anim] = {}
+        self._pending: Dict[Hashable, Callable[[], Any]] = {}
+        self._job = None
+        self._due = 0.0
+        self._paused = False
+        self._state_check = None
+
+    @classmethod
+    def from_config(cls, root, get_config_value) -> "AnimationScheduler":
+        return cls(root, fps=get_config_value('ui_settings', 'animation_fps', DEFAULT_FPS),
+                   enabled=get_config_value('ui_settings', 'animation_enabled', True))
+
+    # ---- API ----
+    def animate(self, key: Hashable, duration_ms: float, step: Callable[[float], Any],
+                on_done: Optional[Callable[[], Any]] = None, delay_ms: float = 0, loop: bool = False,
+                fps: Optional[int] = None):
+        """Tween step(t), t: 0 -> 1 trong duration_ms (sau delay_ms). loop=True: qua lại 0 -> 1 -> 0 mãi mãi
+        (tới khi cancel). fps: giới hạn tần suất riêng cho hiệu ứng chậm. Cùng key -> thay hiệu ứng cũ."""
+        self._anims.pop(key, None)
+        if not self.enabled:
+            if loop:
+                return
+            finish = lambda: self._finish(key, _Anim(step, 0.0, 0.0, on_done, False, 0.0))
+            if delay_ms > 0:
+                self.root.after(int(delay_ms), finish)
+            else:
+                finish()
+            return
+        gap = 1.0 / fps if fps else 0.0
+        self._anims[key] = _Anim(step, time.perf_counter() + delay_ms / 1000.0, max(1.0, duration_ms) / 1000.0,
+                                 on_done, loop, gap)
+        self._schedule()
+
+    def update(self, key: Hashable, fn: Callable[[], Any]):
+        """Gom thay đổi thuộc tính vào khung kế tiếp; cùng key trong một khung -> chỉ lần cuối được chạy."""
+        if not self.enabled:
+            fn()
+            return
+        self._pending[key] = fn
+        self._schedule()
+
+    def cancel(self, key: Hashable):
+        self._anims.pop(key, None)
+        self._pending.pop(key, None)
+
+    @property
+    def paused(self) -> bool:
+        return self._paused
+
+    def watch_window_state(self):
+        """Tạm dừng khi app mất focus hoặc cửa sổ chính bị thu nhỏ; chạy tiếp khi quay lại."""
+        for seq in ('<FocusIn>', '<FocusOut>'):
+            self.root.bind_all(seq, self._queue_state_check, add='+')
+        for seq in ('<Map>', '<Unmap>'):
+            self.root.bind(seq, self._queue_state_check, add='+')
+
+    def close(self):
+        self._anims.clear()
+        self._pending.clear()
+        if self._job is not None:
+            try:
+                self.root.after_cancel(self._job)
+            except Exception:
+                pass
+            self._job = None
+
+    # ---- Nội bộ ----
+    def _queue_state_check(self, _evt=None):
+        if self._state_check is None:
+            self._state_check = self.root.after_idle(self._check_state)
+
+    def _check_state(self):
+        self._state_check = None
+        try:
+            paused = self.root.state() in ('iconic', 'withdrawn') or not self.root.tk.call('focus')
+        except Exception:
+            paused = False
+        if paused != self._paused:
+            self._paused = paused
+            logger.debug("Animation %s", "tạm dừng" if paused else "chạy tiếp")
+            if self._job is not None:
+                self.root.after_cancel(self._job)
+                self._job = None
+            self._schedule()
+
+    def _schedule(self):
+        if self._job is not None:
+            return
+        now = time.perf_counter()
+        if self._pending:
+            delay = self.frame_s
+        else:
+            due = None
+            for a in self._anims.values():
+                if self._paused:
+                    if a.loop:
+                        continue
+                    nxt = a.start + a.duration  # Tạm dừng: chỉ cần thức dậy lúc tween hết hạn
+                else:
+                    nxt = max(a.start, a.last_frame + a.gap)
+                due = nxt if due is None else min(due, nxt)
+            if due is None:
+                return
+            delay = max(self.frame_s, due - now)
+        self._due = now + delay
+        self._job = self.root.after(int(delay * 1000), self._tick)
+
+    def _finish(self, key, a: _Anim):
+        try:
+            a.step(1.0)
+            if a.on_done:
+                a.on_done()
+        except Exception as ex:  # Widget đã bị hủy (TclError) ...
+            logger.debug("Animation %s lỗi khi kết thúc: %s", key, ex)
+
+    def _tick(self):
+        self._job = None
+        now = time.perf_counter()
+        late = now - self._due
+        if late > self.frame_s:
+            metrics.inc('ui.anim.frames_dropped', int(late / self.frame_s))
+        pending, self._pending = self._pending, {}
+        for key, fn in pending.items():
+            try:
+                fn()
+            except Exception as ex:
+                logger.debug("Animation update %s lỗi: %s", key, ex)
+        done_keys = []
+        for key, a in list(self._anims.items()):
+            if time.perf_counter() - now > self.budget_s:
+                metrics.inc('ui.anim.over_budget')
+                break  # Phần còn lại chờ khung sau
+            done_keys.append(key)
+            elapsed = now - a.start
+            if elapsed < 0:
+                continue
+            if not a.loop and elapsed >= a.duration:
+                del self._anims[key]
+                self._finish(key, a)
+                continue
+            if self._paused or now - a.last_frame < a.gap:
+                continue
+            if a.loop:
+                phase = (elapsed / a.duration) % 2.0
+                t = phase if phase <= 1.0 else 2.0 - phase
+            else:
+                t = elapsed / a.duration
+            a.last_frame = now
+            try:
+                a.step(t)
+            except Exception as ex:
+                logger.debug("Animation %s dừng: %s", key, ex)
+                self._anims.pop(key, None)
+        # Xoay vòng: hiệu ứng đã xử lý xuống cuối để khung sau ưu tiên phần bị cắt vì hết ngân sách
+        for key in done_keys:
+            a = self._anims.pop(key, None)
+            if a is not None:
+                self._anims[key] = a
+        metrics.observe('ui.anim.frame_ms', (time.perf_counter() - now) * 1000.0)
+        self._schedule()
+
+
+def scheduler_for(widget) -> Optional[AnimationScheduler]:
+    """Scheduler gắn trên cửa sổ gốc (MainApp.animations); None nếu chưa có."""
+    try:
+        return getattr(widget._root(), 'animations', None)
+    except Exception:
+        return None
+
+
+def batch_update(widget, key: Hashable, fn: Callable[[], Any]):
+    """update() qua scheduler của widget; không có scheduler -> chạy ngay."""
+    sched = scheduler_for(widget)
+    if sched is None:
+        fn()
+    else:
+        sched.update(key, fn)
+
+
+__all__ = ["AnimationScheduler", "scheduler_for", "batch_update", "DEFAULT_FPS"]
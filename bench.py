@@ -0,0 +1,271 @@
+"""Benchmark Harness (utils hot paths, additive)
+
+Đo các đường nóng của utils trên bộ dữ liệu giả lập (datagen) ở nhiều quy mô, thay vì đoán:
+    get_daily_records (cold / warm), append_daily_record (có kiểm tra chồng giờ), update_daily_record,
+    delete_daily_record_by_id, compute_month_total, verify_data_integrity, read_all_subscriptions,
+    record_water_sale, backup_data (PDF một tháng; bỏ qua nếu thiếu fpdf2 hoặc font Unicode).
+
+- Bộ dữ liệu mỗi quy mô sinh một lần vào loadtest_data/bench_<rows>_s<seed>/ và dùng lại; mỗi lần chạy
+  làm trên bản sao tạm (các ca ghi không làm bẩn bộ gốc), utils được trỏ sang bằng set_data_dir().
+- Mỗi ca chạy tới `repeat` lần hoặc hết `budget` giây (tối thiểu 1 lần): p50/p99/trung bình (ms),
+  thông lượng (ops/s, dòng/s cho ca quét toàn bộ), bộ nhớ đỉnh (tracemalloc, đo riêng 1 lần để không
+  làm sai thời gian).
+- Kết quả lưu JSON trong diagnostics/; so với baseline (diagnostics/bench_baseline.json hoặc --baseline):
+  p50 chậm hơn quá ngưỡng (mặc định 25%, và chênh > BENCH_NOISE_MS) -> đánh dấu hồi quy.
+"""
+from __future__ import annotations
+import importlib.util
+import json
+import logging
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import utils
+import datagen
+
+logger = logging.getLogger("suk.bench")
+
+DEFAULT_SIZES = (10_000, 100_000)
+DEFAULT_REPEAT = 20
+DEFAULT_BUDGET_S = 10.0
+DEFAULT_THRESHOLD = 0.25
+BENCH_NOISE_MS = 1.0  # Chênh lệch nhỏ hơn mức này không tính là hồi quy (nhiễu đo)
+BENCH_SEED = 2024
+DATASET_DIR = "loadtest_data"
+DIAGNOSTICS_DIR = "diagnostics"
+BASELINE_FILE = os.path.join(DIAGNOSTICS_DIR, "bench_baseline.json")
+BENCH_COURT = "Sân 1"
+BENCH_WATER = "Aquafina"
+
+
+def dataset_path(rows: int, seed: int = BENCH_SEED) -> str:
+    """Bộ dữ liệu chuẩn cho quy mô rows (sinh nếu chưa có, dùng lại giữa các lần chạy)."""
+    out_dir = os.path.join(utils._base_dir(), DATASET_DIR, f"bench_{rows}_s{seed}")
+    if not os.path.exists(os.path.join(out_dir, utils.DAILY_FILE)):
+        logger.info("Sinh bộ dữ liệu benchmark %s dòng -> %s", rows, out_dir)
+        datagen.generate_dataset(datagen.GenOptions(out_dir=out_dir, rows=rows, seed=seed, force=True))
+    return out_dir
+
+
+def _percentile(sorted_ms: List[float], pct: float) -> float:
+    """Percentile kiểu nearest-rank trên danh sách đã sắp xếp."""
+    if not sorted_ms:
+        return 0.0
+    k = max(0, min(len(sorted_ms) - 1, int(round(pct / 100.0 * len(sorted_ms) + 0.5)) - 1))
+    return sorted_ms[k]
+
+
+class _Case:
+    """Một ca đo: setup() trước mỗi lần (không tính giờ), op(i) là phần được đo.
+    skip() (nếu có) trả lý do bỏ qua ca (thiếu thư viện/font...) hoặc None để chạy."""
+
+    def __init__(self, name: str, op: Callable[[int], Any], setup: Optional[Callable[[], None]] = None,
+                 scans_rows: bool = False, skip: Optional[Callable[[], Optional[str]]] = None):
+        self.name = name
+        self.op = op
+        self.setup = setup
+        self.scans_rows = scans_rows
+        self.skip = skip
+
+
+def _run_case(case: _Case, rows: int, repeat: int, budget_s: float) -> Dict[str, Any]:
+    samples: List[float] = []
+    started = time.perf_counter()
+    i = 0
+    while i < repeat and (i == 0 or time.perf_counter() - started < budget_s):
+        if case.setup:
+            case.setup()
+        t0 = time.perf_counter()
+        case.op(i)
+        samples.append((time.perf_counter() - t0) * 1000.0)
+        i += 1
+    # Bộ nhớ đỉnh: đo riêng một lần (tracemalloc làm chậm đáng kể nên không trộn vào số đo thời gian)
+    if case.setup:
+        case.setup()
+    tracemalloc.start()
+    try:
+        case.op(i)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    samples.sort()
+    total_s = sum(samples) / 1000.0
+    ops = len(samples) / total_s if total_s > 0 else 0.0
+    return {
+        'case': case.name,
+        'rows': rows,
+        'n': len(samples),
+        'p50_ms': round(_percentile(samples, 50), 3),
+        'p99_ms': round(_percentile(samples, 99), 3),
+        'mean_ms': round(sum(samples) / len(samples), 3),
+        'ops_per_s': round(ops, 2),
+        'rows_per_s': round(ops * rows) if case.scans_rows else None,
+        'peak_mem_kb': round(peak / 1024),
+        'status': 'ok',
+    }
+
+
+def _build_cases(rows: int) -> List[_Case]:
+    """Các ca đo trên thư mục dữ liệu hiện tại (đã trỏ sang bản sao tạm)."""
+    records = utils.get_daily_records()
+    days = sorted({r.ngay for r in records if len(r.ngay) == 10 and r.ngay[4] == '-'})
+    last_day = datetime.strptime(days[-1], '%Y-%m-%d')
+    mid_month = days[len(days) // 2][:7]
+    appended: List[List[str]] = []  # Dòng do ca append ghi (update/delete làm trên các dòng này)
+    next_day: List[int] = [0]
+
+    def cold_setup():
+        utils.invalidate_all_caches(publish=False)
+
+    def append_op(i):
+        # Ngày sau cuối bộ dữ liệu: kiểm tra trùng giờ tra index chiếm dụng tháng như khi nhập thật
+        next_day[0] += 1
+        ngay = (last_day + timedelta(days=next_day[0])).strftime('%Y-%m-%d')
+        utils.append_daily_record(ngay, BENCH_COURT, '5h-6h', 100_000, loai='Chơi', nguoi='bench')
+        appended.append(list(utils._undo_stack[-1][1]))
+
+    def appended_setup():
+        # update/delete chạy riêng (--cases) hoặc sau khi delete đã xóa hết: tự ghi một dòng để làm
+        if not appended:
+            append_op(0)
+
+    def update_op(i):
+        row = appended[i % len(appended)]
+        new_gia = int(row[3]) + 1000
+        utils.update_daily_record(row[0], row[1], row[2], int(row[3]), row[0], row[1], row[2], new_gia, row[4], row[5])
+        row[3] = str(new_gia)
+
+    def delete_op(i):
+        utils.delete_daily_record_by_id(appended.pop()[6])
+
+    water_ready: List[bool] = []
+
+    def water_setup():
+        # Đủ tồn kho cho mọi lần bán (chỉ chạy lần đầu)
+        if not water_ready:
+            utils.add_water_item(BENCH_WATER, 1_000_000, 10_000)
+            water_ready.append(True)
+
+    def month_total_op(i):
+        utils._invalidate_month_cache()
+        utils.compute_month_total(mid_month)
+
+    def backup_skip() -> Optional[str]:
+        if importlib.util.find_spec('fpdf') is None:
+            return 'thiếu fpdf2'
+        try:
+            from report_engine import resolve_report_font
+            resolve_report_font()
+        except RuntimeError as ex:
+            return str(ex)
+        return None
+
+    def backup_op(i):
+        out = os.path.join(utils.data_dir(), f"bench_report_{i}.pdf")
+        utils.backup_data(month=mid_month, out_path=out)
+        os.remove(out)
+
+    return [
+        _Case('get_daily_records_cold', lambda i: utils.get_daily_records(), setup=cold_setup, scans_rows=True),
+        _Case('get_daily_records_warm', lambda i: utils.get_daily_records()),
+        _Case('compute_month_total', month_total_op, scans_rows=True),
+        _Case('verify_data_integrity', lambda i: utils.verify_data_integrity(), scans_rows=True),
+        _Case('read_all_subscriptions', lambda i: utils.read_all_subscriptions()),
+        _Case('append_daily_record', append_op, scans_rows=True),
+        _Case('update_daily_record', update_op, setup=appended_setup, scans_rows=True),
+        _Case('delete_daily_record_by_id', delete_op, setup=appended_setup, scans_rows=True),
+        _Case('record_water_sale', lambda i: utils.record_water_sale(days[-1], BENCH_WATER, 1), setup=water_setup),
+        _Case('backup_data', backup_op, scans_rows=True, skip=backup_skip),
+    ]
+
+
+def run_benchmarks(sizes=DEFAULT_SIZES, repeat: int = DEFAULT_REPEAT, budget_s: float = DEFAULT_BUDGET_S,
+                   only: Optional[List[str]] = None,
+                   progress: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+    """Chạy mọi ca ở từng quy mô. Trả dict kết quả (lưu bằng save_results)."""
+    results: List[Dict[str, Any]] = []
+    previous = utils._data_dir_override
+    logging.getLogger("fontTools").setLevel(logging.WARNING)  # fpdf2 subset font log mỗi lần xuất PDF
+    try:
+        for rows in sizes:
+            src = dataset_path(rows)
+            work = tempfile.mkdtemp(prefix=f"suk_bench_{rows}_")
+            try:
+                for name in sorted(utils._CSV_FILE_SET):
+                    shutil.copy2(os.path.join(src, name), os.path.join(work, name))
+                utils.set_data_dir(work)
+                for case in _build_cases(rows):
+                    if only and case.name not in only:
+                        continue
+                    reason = case.skip() if case.skip else None
+                    if reason:
+                        res = {'case': case.name, 'rows': rows, 'status': f'skipped: {reason}'}
+                    else:
+                        try:
+                            res = _run_case(case, rows, repeat, budget_s)
+                        except ImportError as ex:
+                            res = {'case': case.name, 'rows': rows, 'status': f'skipped: {ex}'}
+                    results.append(res)
+                    if progress:
+                        progress(res)
+            finally:
+                shutil.rmtree(work, ignore_errors=True)
+    finally:
+        utils.set_data_dir(previous)
+    return {
+        'timestamp': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'repeat': repeat,
+        'budget_s': budget_s,
+        'results': results,
+    }
+
+
+def save_results(report: Dict[str, Any], out_path: Optional[str] = None) -> str:
+    if not out_path:
+        out_dir = os.path.join(utils._base_dir(), DIAGNOSTICS_DIR)
+        os.makedirs(out_dir, exist_ok=True)
+        out_path = os.path.join(out_dir, time.strftime('bench_%Y%m%d_%H%M%S.json'))
+    tmp = out_path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, out_path)
+    return out_path
+
+
+def load_baseline(path: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    path = path or os.path.join(utils._base_dir(), BASELINE_FILE)
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any], threshold: float = DEFAULT_THRESHOLD) -> List[Dict[str, Any]]:
+    """So p50 từng (quy mô, ca) với baseline. Trả danh sách so sánh, 'regression'=True nếu chậm quá ngưỡng."""
+    base: Dict[Tuple[int, str], Dict[str, Any]] = {
+        (r['rows'], r['case']): r for r in baseline.get('results', []) if r.get('status') == 'ok'}
+    out = []
+    for r in report.get('results', []):
+        old = base.get((r['rows'], r['case']))
+        if r.get('status') != 'ok' or not old:
+            continue
+        ratio = r['p50_ms'] / old['p50_ms'] if old['p50_ms'] else 1.0
+        out.append({
+            'rows': r['rows'], 'case': r['case'], 'base_p50_ms': old['p50_ms'], 'p50_ms': r['p50_ms'],
+            'ratio': round(ratio, 3),
+            'regression': ratio > 1 + threshold and r['p50_ms'] - old['p50_ms'] > BENCH_NOISE_MS,
+        })
+    return out
+
+
+__all__ = ["run_benchmarks", "save_results", "load_baseline", "compare", "dataset_path", "DEFAULT_SIZES"]
@@ -0,0 +1,307 @@
+"""Chart Renderer (Agg, off the Tk thread, additive)
+
+- Gom dữ liệu + vẽ biểu đồ chạy trên worker nền bằng backend Agg (matplotlib.figure.Figure,
+  không dùng pyplot) -> luồng Tk chỉ còn việc hiển thị ảnh PNG (tk.PhotoImage).
+- Kết quả cache theo (thế hệ dữ liệu, loại biểu đồ, dpi): thế hệ = mtime/size của daily_records.csv
+  và monthly_stats.csv. Mở lại cửa sổ khi dữ liệu chưa đổi -> lấy PNG có sẵn (RAM, rồi tới đĩa
+  trong cache/charts/), không đọc CSV, không vẽ lại.
+- Chuỗi thời gian dài được giảm điểm bằng LTTB (Largest-Triangle-Three-Buckets) để giữ hình dạng
+  đỉnh/đáy mà không vẽ hàng nghìn điểm.
+
+Cấu hình (performance):
+    chart_daily_days   : số ngày gần nhất của biểu đồ doanh thu theo ngày (0 = toàn bộ), mặc định 30
+    chart_max_points   : số điểm tối đa sau khi giảm điểm, mặc định 365
+"""
+from __future__ import annotations
+import hashlib
+import io
+import logging
+import os
+import threading
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Sequence, Tuple
+
+import utils
+
+logger = logging.getLogger("suk.charts")
+
+CHART_TYPES = ('daily_revenue', 'court_share', 'monthly_compare', 'activity')
+OVERVIEW = 'overview'  # 2x2 gộp, dùng khi lưu ảnh
+CACHE_DIR = os.path.join("cache", "charts")
+DEFAULT_DPI = 96
+EXPORT_DPI = 300
+CHART_SIZE_IN = (6.0, 3.8)
+OVERVIEW_SIZE_IN = (15, 10)
+DEFAULT_DAILY_DAYS = 30
+DEFAULT_MAX_POINTS = 365
+MONTHS_SHOWN = 12
+
+_render_lock = threading.Lock()  # matplotlib không an toàn khi nhiều luồng cùng vẽ
+_png_cache: Dict[Tuple[str, str, int], bytes] = {}
+_data_cache: Dict[str, Any] = {}  # {'key': generation, 'data': {...}}
+
+
+# ---------------------- THẾ HỆ DỮ LIỆU ----------------------
+
+def chart_generation() -> str:
+    """Khóa phiên bản dữ liệu của biểu đồ (đổi khi daily/monthly đổi hoặc cấu hình biểu đồ đổi)."""
+    parts = [utils._file_signature(utils.DAILY_FILE), utils._file_signature(utils.MONTHLY_FILE),
+             _daily_days(), _max_points()]
+    return hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()[:16]
+
+
+def _daily_days() -> int:
+    try:
+        return max(int(utils.get_config_value('performance', 'chart_daily_days', DEFAULT_DAILY_DAYS)), 0)
+    except (TypeError, ValueError):
+        return DEFAULT_DAILY_DAYS
+
+
+def _max_points() -> int:
+    try:
+        return max(int(utils.get_config_value('performance', 'chart_max_points', DEFAULT_MAX_POINTS)), 3)
+    except (TypeError, ValueError):
+        return DEFAULT_MAX_POINTS
+
+
+# ---------------------- GIẢM ĐIỂM ----------------------
+
+def downsample_lttb(points: Sequence[Tuple[float, float]], threshold: int) -> List[Tuple[float, float]]:
+    """Largest-Triangle-Three-Buckets: giữ điểm đầu/cuối và trong mỗi bucket chọn điểm tạo tam giác
+    lớn nhất với điểm đã chọn trước và trung bình bucket kế tiếp."""
+    n = len(points)
+    if threshold >= n or threshold < 3:
+        return list(points)
+    sampled = [points[0]]
+    every = (n - 2) / (threshold - 2)
+    a = 0
+    for i in range(threshold - 2):
+        start = int(i * every) + 1
+        end = int((i + 1) * every) + 1
+        nxt_start, nxt_end = end, min(int((i + 2) * every) + 1, n)
+        nxt = points[nxt_start:nxt_end] or [points[-1]]
+        avg_x = sum(p[0] for p in nxt) / len(nxt)
+        avg_y = sum(p[1] for p in nxt) / len(nxt)
+        ax, ay = points[a]
+        best, best_area = start, -1.0
+        for j in range(start, min(end, n - 1)):
+            area = abs((ax - avg_x) * (points[j][1] - ay) - (ax - points[j][0]) * (avg_y - ay))
+            if area > best_area:
+                best, best_area = j, area
+        sampled.append(points[best])
+        a = best
+    sampled.append(points[-1])
+    return sampled
+
+
+# ---------------------- DỮ LIỆU ----------------------
+
+def collect_chart_data() -> Dict[str, Any]:
+    """Đọc & gom dữ liệu cho biểu đồ (worker nền). Cache theo thế hệ dữ liệu."""
+    generation = chart_generation()
+    if _data_cache.get('key') == generation:
+        return _data_cache['data']
+    daily_records = utils.get_daily_records()
+    monthly_stats = utils.read_monthly_stats()
+
+    daily_data: Dict[str, int] = defaultdict(int)
+    court_data: Dict[str, int] = defaultdict(int)
+    activity_data: Dict[str, int] = defaultdict(int)
+    for r in daily_records:
+        if r.ngay:
+            daily_data[r.ngay] += r.gia_vnd
+        court_data[r.san or 'Unknown'] += r.gia_vnd
+        activity_data[r.loai or 'Không rõ'] += 1
+
+    days = _daily_days()
+    sorted_dates = sorted(daily_data)
+    if days:
+        sorted_dates = sorted_dates[-days:]
+    series = [(datetime.strptime(d, '%Y-%m-%d').toordinal(), daily_data[d]) for d in sorted_dates]
+    raw_points = len(series)
+    series = downsample_lttb(series, _max_points())
+
+    months = []
+    for stat in monthly_stats[-MONTHS_SHOWN:]:
+        month = stat.get('thang', '')
+        try:
+            datetime.strptime(month + '-01', '%Y-%m-%d')
+        except ValueError:
+            continue
+        months.append((month, stat.get('tong_doanh_thu_vnd', 0), stat.get('loi_nhuan_vnd', 0)))
+    data = {
+        'has_daily': bool(daily_records),
+        'has_monthly': bool(monthly_stats),
+        'daily_days': days,
+        'daily_series': series,
+        'daily_raw_points': raw_points,
+        'court_data': dict(court_data),
+        'months': months,
+        'activity_data': dict(activity_data),
+    }
+    _data_cache.update(key=generation, data=data)
+    return data
+
+
+# ---------------------- VẼ ----------------------
+
+def _draw(chart_type: str, ax, data: Dict[str, Any]):
+    from matplotlib.ticker import FuncFormatter  # type: ignore
+    if chart_type == 'daily_revenue':
+        if not data['daily_series']:
+            ax.set_axis_off()
+            return
+        dates = [datetime.fromordinal(int(x)) for x, _ in data['daily_series']]
+        values = [v for _, v in data['daily_series']]
+        dense = len(values) > 60
+        ax.plot(dates, values, marker=None if dense else 'o', linewidth=1.5 if dense else 2,
+                markersize=5, color='#2196F3')
+        span = f"{data['daily_days']} ngày gần nhất" if data['daily_days'] else 'toàn bộ'
+        sampled = f", {len(values)}/{data['daily_raw_points']} điểm" if len(values) < data['daily_raw_points'] else ''
+        ax.set_title(f'Doanh thu theo ngày ({span}{sampled})', fontweight='bold')
+        ax.set_ylabel('Doanh thu (VND)')
+        ax.tick_params(axis='x', rotation=45)
+        ax.grid(True, alpha=0.3)
+        ax.yaxis.set_major_formatter(FuncFormatter(lambda x, p: f'{x/1000:.0f}K'))
+    elif chart_type == 'court_share':
+        if not data['court_data']:
+            ax.set_axis_off()
+            return
+        courts = list(data['court_data'].keys())
+        colors = ['#FF9800', '#4CAF50', '#9C27B0', '#F44336'][:len(courts)]
+        ax.pie(list(data['court_data'].values()), labels=courts, autopct='%1.1f%%', colors=colors, startangle=90)
+        ax.set_title('Doanh thu theo sân', fontweight='bold')
+    elif chart_type == 'monthly_compare':
+        if not data['months']:
+            ax.set_axis_off()
+            return
+        x = range(len(data['months']))
+        width = 0.35
+        ax.bar([i - width/2 for i in x], [r for _, r, _ in data['months']], width, label='Doanh thu', color='#2196F3', alpha=0.8)
+        ax.bar([i + width/2 for i in x], [p for _, _, p in data['months']], width, label='Lợi nhuận', color='#4CAF50', alpha=0.8)
+        ax.set_title('So sánh doanh thu & lợi nhuận theo tháng', fontweight='bold')
+        ax.set_ylabel('Số tiền (VND)')
+        ax.set_xticks(list(x))
+        ax.set_xticklabels([f"{m[5:7]}/{m[:4]}" for m, _, _ in data['months']], rotation=45)
+        ax.legend()
+        ax.grid(True, alpha=0.3)
+        ax.yaxis.set_major_formatter(FuncFormatter(lambda x, p: f'{x/1000000:.1f}M'))
+    elif chart_type == 'activity':
+        if not data['activity_data']:
+            ax.set_axis_off()
+            return
+        colors = ['#FF5722', '#3F51B5', '#009688', '#795548'][:len(data['activity_data'])]
+        bars = ax.bar(list(data['activity_data'].keys()), list(data['activity_data'].values()), color=colors, alpha=0.8)
+        ax.set_title('Phân bố loại hoạt động', fontweight='bold')
+        ax.set_ylabel('Số lượng')
+        for bar in bars:
+            height = bar.get_height()
+            ax.text(bar.get_x() + bar.get_width() / 2., height, f'{int(height)}', ha='center', va='bottom')
+    else:
+        raise ValueError(f"Loại biểu đồ không hỗ trợ: {chart_type}")
+
+
+FONT_FAMILY = ['DejaVu Sans', 'Arial Unicode MS', 'Arial']  # có dấu tiếng Việt
+
+
+def _render_png(chart_type: str, data: Dict[str, Any], dpi: int) -> bytes:
+    import matplotlib  # type: ignore
+    # Qua danh sách sans-serif: matplotlib chọn font đầu tiên có sẵn, không cảnh báo font thiếu
+    fonts = FONT_FAMILY + [f for f in matplotlib.rcParams['font.sans-serif'] if f not in FONT_FAMILY]
+    with matplotlib.rc_context({'font.family': 'sans-serif', 'font.sans-serif': fonts}):
+        return _figure_png(chart_type, data, dpi)
+
+
+def _figure_png(chart_type: str, data: Dict[str, Any], dpi: int) -> bytes:
+    from matplotlib.figure import Figure  # type: ignore
+    from matplotlib.backends.backend_agg import FigureCanvasAgg  # type: ignore
+    if chart_type == OVERVIEW:
+        fig = Figure(figsize=OVERVIEW_SIZE_IN, dpi=dpi)
+        axes = fig.subplots(2, 2).flatten()
+        for t, ax in zip(CHART_TYPES, axes):
+            _draw(t, ax, data)
+        fig.suptitle('Biểu đồ thống kê SUK Pickleball', fontsize=16, fontweight='bold')
+    else:
+        fig = Figure(figsize=CHART_SIZE_IN, dpi=dpi)
+        _draw(chart_type, fig.add_subplot(1, 1, 1), data)
+    fig.tight_layout()
+    FigureCanvasAgg(fig)
+    buf = io.BytesIO()
+    fig.savefig(buf, format='png', dpi=dpi)
+    return buf.getvalue()
+
+
+def _disk_path(chart_type: str, generation: str, dpi: int) -> str:
+    return os.path.join(utils._abs_path(CACHE_DIR), f"{chart_type}_{dpi}_{generation}.png")
+
+
+def _store_disk(chart_type: str, generation: str, dpi: int, png: bytes):
+    path = _disk_path(chart_type, generation, dpi)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        prefix = f"{chart_type}_{dpi}_"
+        for name in os.listdir(os.path.dirname(path)):  # Bỏ ảnh của thế hệ cũ
+            if name.startswith(prefix) and not name.endswith(f"{generation}.png"):
+                try:
+                    os.remove(os.path.join(os.path.dirname(path), name))
+                except OSError:
+                    pass
+        tmp = path + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(png)
+        os.replace(tmp, path)
+    except Exception as ex:
+        logger.debug("Không ghi được cache biểu đồ: %s", ex)
+
+
+def render_charts(chart_types: Iterable[str] = CHART_TYPES, dpi: int = DEFAULT_DPI) -> Dict[str, Any]:
+    """PNG của các biểu đồ (chạy trên worker). Trả {'generation', 'has_data', 'cached', 'images': {type: bytes}}.
+    Dữ liệu chưa đổi -> lấy từ cache (RAM -> đĩa) mà không đọc CSV."""
+    generation = chart_generation()
+    images: Dict[str, bytes] = {}
+    missing = []
+    for chart_type in chart_types:
+        key = (generation, chart_type, dpi)
+        png = _png_cache.get(key)
+        if png is None:
+            path = _disk_path(chart_type, generation, dpi)
+            if os.path.exists(path):
+                try:
+                    with open(path, 'rb') as f:
+                        png = f.read()
+                    _png_cache[key] = png
+                except OSError:
+                    png = None
+        if png is None:
+            missing.append(chart_type)
+        else:
+            images[chart_type] = png
+    has_data = True
+    if missing:
+        data = collect_chart_data()
+        has_data = data['has_daily'] or data['has_monthly']
+        if has_data:
+            with _render_lock:
+                for chart_type in missing:
+                    png = _render_png(chart_type, data, dpi)
+                    images[chart_type] = png
+                    _png_cache[(generation, chart_type, dpi)] = png
+                    _store_disk(chart_type, generation, dpi, png)
+        # Giữ RAM cache chỉ cho thế hệ hiện tại
+        for key in [k for k in _png_cache if k[0] != generation]:
+            _png_cache.pop(key, None)
+    return {'generation': generation, 'has_data': has_data, 'cached': not missing, 'images': images}
+
+
+def save_overview(path: str, dpi: int = EXPORT_DPI) -> str:
+    """Lưu ảnh 2x2 độ phân giải cao (dùng cache nếu dữ liệu chưa đổi)."""
+    png = render_charts((OVERVIEW,), dpi)['images'].get(OVERVIEW)
+    if png is None:
+        raise FileNotFoundError("Chưa có dữ liệu để tạo biểu đồ")
+    with open(path, 'wb') as f:
+        f.write(png)
+    return path
+
+
+__all__ = ["CHART_TYPES", "chart_generation", "collect_chart_data", "downsample_lttb", "render_charts", "save_overview"]
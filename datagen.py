@@ -0,0 +1,311 @@
+"""Synthetic Data Generator (load testing, additive)
+
+Sinh bộ dữ liệu giả lập "nhiều năm" cho cả 6 CSV (daily_records, monthly_subscriptions, water_items,
+water_sales, monthly_stats, profit_shares) vào một thư mục RIÊNG để thử tải app / benchmark mà không
+đụng dữ liệu thật. Chạy app trên bộ dữ liệu đó: SUK_DATA_DIR=<thư mục> python main.py
+
+- Ghi dạng luồng: từng ngày sinh xong ghi ngay ra file, chỉ giữ tổng theo tháng trong RAM
+  -> 10 triệu dòng vẫn dùng bộ nhớ cố định.
+- Quy mô theo số dòng daily (rows, 10k..10M) + khoảng ngày + tỉ lệ lấp sân (occupancy):
+  rows & days -> suy ra occupancy; chỉ rows -> suy ra số ngày (~10 năm, lấp sân dày hơn nếu cần).
+  Chỉ dùng các sân thật (utils.SCHEDULE_COURTS); vượt sức chứa thì kéo dài thêm ngày chứ không
+  bịa thêm sân (Sân 3, Sân 4, ... không tồn tại trong app).
+- overlap_rate: tỉ lệ dòng cố ý chồng giờ với lượt đặt trước đó (cùng ngày, cùng sân).
+- dirty_rate: tỉ lệ dòng "bẩn" (giá không phải số, ngày sai định dạng, khung giờ hỏng, thiếu/trùng
+  record_id, khoảng trắng thừa) giống dữ liệu nhập tay lâu năm.
+- seed cố định -> dữ liệu lặp lại được giữa các lần chạy (so sánh benchmark).
+"""
+from __future__ import annotations
+import csv
+import logging
+import math
+import os
+import random
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional
+
+import utils
+from pricing import compute_slot_price
+
+logger = logging.getLogger("suk.datagen")
+
+MIN_ROWS = 10_000
+MAX_ROWS = 10_000_000
+OPEN_HOUR = 5   # Giờ mở cửa
+CLOSE_HOUR = 23  # Giờ đóng cửa (lượt cuối kết thúc trước giờ này)
+SLOT_LENGTHS = (1, 1, 1, 2, 2, 3)  # Phân bố độ dài lượt đặt (giờ)
+MAX_OCCUPANCY = 0.95
+DEFAULT_MAX_DAYS = 3653  # ~10 năm khi không chỉ định --days
+ACTIVITIES = ('Chơi', 'Chơi', 'Chơi', 'Chơi', 'Tập')
+PLAYERS = (
+    'Anh Tuấn', 'Chị Hoa', 'Nhóm Bách Khoa', 'CLB Sài Gòn', 'Anh Minh', 'Chị Lan', 'Team Pick 247',
+    'Anh Hùng', 'Cô Mai', 'Nhóm văn phòng', 'Anh Khoa', 'Chị Thảo', 'Thầy Dũng', '',
+)
+WATER_CATALOG = (
+    ('Aquafina', 10_000), ('Revive', 15_000), ('Sting', 15_000), ('Pocari', 20_000),
+    ('Trà xanh 0 độ', 15_000), ('Nước dừa', 25_000), ('Red Bull', 20_000), ('Lavie', 8_000),
+)
+WEEKDAY_SETS = ('Thứ 2, Thứ 4, Thứ 6', 'Thứ 3, Thứ 5, Thứ 7', 'Thứ 7, Chủ nhật', 'Thứ 2, Thứ 5', 'Thứ 4, Thứ 6')
+COST_REASONS = ('Điện + nước', 'Thuê mặt bằng', 'Sửa lưới, sơn sân', 'Lương nhân viên', '')
+PROGRESS_STEP = 0.05
+
+
+@dataclass
+class GenOptions:
+    out_dir: str
+    rows: int = 100_000
+    start: str = '2021-01-01'
+    days: Optional[int] = None
+    occupancy: float = 0.6
+    courts: int = 2
+    overlap_rate: float = 0.002
+    dirty_rate: float = 0.001
+    subs_per_month: int = 12
+    water_per_day: int = 15
+    seed: int = 2024
+    force: bool = False
+
+
+@dataclass
+class _MonthAgg:
+    daily: int = 0
+    subs: int = 0
+    water: int = 0
+
+
+@dataclass
+class GenResult:
+    out_dir: str
+    start: str
+    end: str
+    days: int
+    occupancy: float
+    courts: int
+    counts: Dict[str, int] = field(default_factory=dict)
+
+
+def _mean_slot_len() -> float:
+    return sum(SLOT_LENGTHS) / len(SLOT_LENGTHS)
+
+
+def plan_scale(rows: int, courts: int, occupancy: float, days: Optional[int]) -> tuple:
+    """(days, occupancy) cho số dòng mục tiêu trên `courts` sân. Mỗi ngày/sân có H giờ mở cửa; lấp o phần
+    giờ với lượt trung bình L giờ -> khoảng courts*H*o/L lượt/ngày. Không ghi --days -> tối đa
+    DEFAULT_MAX_DAYS ngày, nâng occupancy (tới MAX_OCCUPANCY) trước khi kéo dài thêm ngày. Có --days mà
+    vượt sức chứa thì kéo dài số ngày (số sân là cố định)."""
+    if not 0 < occupancy <= MAX_OCCUPANCY:
+        raise ValueError(f"occupancy phải trong (0, {MAX_OCCUPANCY}]")
+    per_court_day = (CLOSE_HOUR - OPEN_HOUR) / _mean_slot_len() * courts
+    if days:
+        days = max(days, math.ceil(rows / (per_court_day * MAX_OCCUPANCY)))
+        return days, rows / (days * per_court_day)
+    occupancy = max(occupancy, min(MAX_OCCUPANCY, rows / (DEFAULT_MAX_DAYS * per_court_day)))
+    return max(1, math.ceil(rows / (per_court_day * occupancy))), occupancy
+
+
+def _check_out_dir(out_dir: str, force: bool) -> str:
+    out_dir = os.path.abspath(out_dir)
+    live = {os.path.normcase(os.path.abspath(p)) for p in (os.path.join(utils._base_dir(), utils.DATA_DIR_NAME), utils.data_dir())}
+    if os.path.normcase(out_dir) in live:
+        raise ValueError("Không được sinh dữ liệu giả vào thư mục data/ thật – chọn thư mục khác")
+    existing = [n for n in utils._CSV_FILE_SET if os.path.exists(os.path.join(out_dir, n))]
+    if existing and not force:
+        raise ValueError(f"Thư mục đã có dữ liệu ({', '.join(sorted(existing))}) – dùng --force để ghi đè")
+    os.makedirs(out_dir, exist_ok=True)
+    return out_dir
+
+
+class _Writers:
+    """Mở 6 file .tmp cùng lúc, ghi luồng; commit() đổi tên sang tên thật (os.replace)."""
+
+    def __init__(self, out_dir: str):
+        self.out_dir = out_dir
+        self.files = {}
+        self.writers = {}
+        self.counts: Dict[str, int] = {}
+        for name, headers in ((utils.DAILY_FILE, utils.DAILY_HEADERS), (utils.MONTHLY_FILE, utils.MONTHLY_HEADERS),
+                              (utils.SUBSCRIPTION_FILE, utils.SUBSCRIPTION_HEADERS),
+                              (utils.PROFIT_SHARE_FILE, utils.PROFIT_SHARE_HEADERS),
+                              (utils.WATER_ITEMS_FILE, utils.WATER_ITEM_HEADERS),
+                              (utils.WATER_SALES_FILE, utils.WATER_SALE_HEADERS)):
+            f = open(os.path.join(out_dir, name + '.tmp'), 'w', newline='', encoding='utf-8', buffering=1 << 20)
+            self.files[name] = f
+            self.writers[name] = csv.writer(f)
+            self.writers[name].writerow(headers)
+            self.counts[name] = 0
+
+    def row(self, name: str, values: List[Any]):
+        self.writers[name].writerow(values)
+        self.counts[name] += 1
+
+    def close(self):
+        for f in self.files.values():
+            f.close()
+
+    def commit(self):
+        self.close()
+        for name in self.files:
+            os.replace(os.path.join(self.out_dir, name + '.tmp'), os.path.join(self.out_dir, name))
+        # Sổ kho nước cũ (nếu ghi đè) không khớp danh mục mới -> xóa, lần dùng đầu tạo lại từ so_luong_ton
+        for extra in (utils.WATER_LEDGER_FILE, utils.WATER_STOCK_SNAPSHOT_FILE):
+            try:
+                os.remove(os.path.join(self.out_dir, os.path.basename(extra)))
+            except OSError:
+                pass
+
+    def discard(self):
+        self.close()
+        for name in self.files:
+            try:
+                os.remove(os.path.join(self.out_dir, name + '.tmp'))
+            except OSError:
+                pass
+
+
+def _dirty(rng: random.Random, row: List[Any]) -> List[Any]:
+    """Làm bẩn một dòng daily theo các lỗi hay gặp khi nhập tay / sửa bằng Excel."""
+    kind = rng.randrange(6)
+    row = list(row)
+    if kind == 0:
+        row[3] = rng.choice(('abc', '', '120.000đ'))
+    elif kind == 1:
+        d = datetime.strptime(row[0], '%Y-%m-%d')
+        row[0] = d.strftime('%d/%m/%Y')
+    elif kind == 2:
+        row[2] = rng.choice(('8h-', '10h-8h', 'sáng'))
+    elif kind == 3:
+        row[6] = ''
+    elif kind == 4:
+        row[6] = 'R0000000000000dup000'
+    else:
+        row[1] = f" {row[1]} "
+    return row
+
+
+def generate_dataset(opts: GenOptions, progress: Optional[Callable[[float, str], None]] = None) -> GenResult:
+    """Sinh bộ dữ liệu vào opts.out_dir (ghi luồng). Trả GenResult với số dòng từng file."""
+    if not MIN_ROWS <= opts.rows <= MAX_ROWS:
+        raise ValueError(f"rows phải trong {MIN_ROWS:,}..{MAX_ROWS:,}".replace(',', '.'))
+    if not 1 <= opts.courts <= len(utils.SCHEDULE_COURTS):
+        raise ValueError(f"courts phải trong 1..{len(utils.SCHEDULE_COURTS)} (số sân thật của app)")
+    for name in ('overlap_rate', 'dirty_rate'):
+        if not 0 <= getattr(opts, name) < 1:
+            raise ValueError(f"{name} phải trong [0, 1)")
+    start = datetime.strptime(opts.start, '%Y-%m-%d').date()
+    _days, occupancy = plan_scale(opts.rows, opts.courts, opts.occupancy, opts.days)
+    out_dir = _check_out_dir(opts.out_dir, opts.force)
+    rng = random.Random(opts.seed)
+    courts = list(utils.SCHEDULE_COURTS[:opts.courts])
+    mean_len = _mean_slot_len()
+    # Xác suất đặt lượt tại mỗi bước để lấp đúng occupancy (xem plan_scale)
+    p_book = occupancy / (mean_len * (1 - occupancy) + occupancy)
+    base_ms = int(datetime(start.year, start.month, start.day).timestamp() * 1000)
+
+    w = _Writers(out_dir)
+    months: Dict[str, _MonthAgg] = {}
+    written = 0
+    day = start
+    next_report = 0.0
+    try:
+        while written < opts.rows:
+            iso = day.isoformat()
+            month = iso[:7]
+            agg = months.get(month)
+            if agg is None:
+                agg = months[month] = _MonthAgg()
+                _write_month_subscriptions(w, rng, month, courts, opts.subs_per_month, agg)
+            for san in courts:
+                hour = OPEN_HOUR
+                while hour < CLOSE_HOUR and written < opts.rows:
+                    if rng.random() >= p_book:
+                        hour += 1
+                        continue
+                    length = min(rng.choice(SLOT_LENGTHS), CLOSE_HOUR - hour)
+                    slot = (hour, hour + length)
+                    hour += length
+                    slots = [slot]
+                    if rng.random() < opts.overlap_rate:
+                        slots.append((max(OPEN_HOUR, slot[0] - 1), slot[1]))  # Cố ý chồng giờ lượt vừa đặt
+                    for a, b in slots:
+                        if written >= opts.rows:
+                            break
+                        loai = rng.choice(ACTIVITIES)
+                        gia = compute_slot_price(loai, a, b, a >= 18 or a < 6)
+                        row = [iso, san, f"{a}h-{b}h", gia, loai, rng.choice(PLAYERS),
+                               f"R{base_ms + written}{rng.randrange(0x1000):03x}{written % 1000:03d}"]
+                        if opts.dirty_rate and rng.random() < opts.dirty_rate:
+                            row = _dirty(rng, row)
+                        else:
+                            agg.daily += gia
+                        w.row(utils.DAILY_FILE, row)
+                        written += 1
+            for _ in range(rng.randint(opts.water_per_day // 2, opts.water_per_day) if opts.water_per_day else 0):
+                name, price = rng.choice(WATER_CATALOG)
+                qty = rng.randint(1, 6)
+                w.row(utils.WATER_SALES_FILE, [iso, name, qty, price, qty * price])
+                agg.water += qty * price
+            day += timedelta(days=1)
+            frac = written / opts.rows
+            if progress and frac >= next_report:
+                progress(frac, f"{written:,}/{opts.rows:,} dòng daily ({iso})".replace(',', '.'))
+                next_report = frac + PROGRESS_STEP
+        _write_month_summaries(w, rng, months)
+        for name, price in WATER_CATALOG:
+            # Tồn kho hiện tại (danh mục không lưu lịch sử nhập nên không cần khớp tổng đã bán)
+            w.row(utils.WATER_ITEMS_FILE, [name, rng.randint(20, 500), price])
+        w.commit()
+    except BaseException:
+        w.discard()
+        raise
+    end = day - timedelta(days=1)
+    if progress:
+        progress(1.0, "Hoàn tất")
+    return GenResult(out_dir=out_dir, start=start.isoformat(), end=end.isoformat(),
+                     days=(end - start).days + 1, occupancy=round(occupancy, 4), courts=len(courts),
+                     counts=dict(w.counts))
+
+
+def _write_month_subscriptions(w: _Writers, rng: random.Random, month: str, courts: List[str], count: int, agg: _MonthAgg):
+    for i in range(count):
+        buoi = rng.choice((2, 3, 3, 4))
+        gio = rng.choice((1, 1, 2))
+        start_h = rng.randint(OPEN_HOUR + 1, 20 - gio)
+        gia = utils.compute_subscription_price(buoi, gio)
+        he_so = round((buoi * gio) / utils.BASE_UNITS, 2)
+        w.row(utils.SUBSCRIPTION_FILE, [month, f"Nhóm {i + 1:03d}", rng.choice(courts), buoi,
+                                       f"{gio} ({start_h}:00-{start_h + gio}:00)", rng.choice(WEEKDAY_SETS),
+                                       he_so, gia, ''])
+        agg.subs += gia
+
+
+def _write_month_summaries(w: _Writers, rng: random.Random, months: Dict[str, _MonthAgg]):
+    """Mỗi tháng một dòng monthly_stats (một số tháng có thêm bản sửa, giống lịch sử lưu nhiều lần)
+    + một lần chia lợi nhuận."""
+    created = datetime.now()
+    for n, (month, agg) in enumerate(sorted(months.items())):
+        tong = agg.daily + agg.subs + agg.water
+        versions = 2 if rng.random() < 0.1 else 1
+        for v in range(versions):
+            chi_phi = int(tong * rng.uniform(0.3, 0.45)) // 1000 * 1000
+            loi_nhuan = utils.compute_profit(tong, chi_phi)
+            w.row(utils.MONTHLY_FILE, [month, tong, chi_phi, rng.choice(COST_REASONS), loi_nhuan, '1'])
+        shares = utils.compute_profit_shares(loi_nhuan)
+        summary = ", ".join(f"{k}: {utils.format_currency(v)}" for k, v in shares.items())
+        scope = f"{month[5:7]}/{month[:4]}"
+        w.row(utils.PROFIT_SHARE_FILE, [str(int(created.timestamp() * 1000) + n), scope, tong, chi_phi, loi_nhuan,
+                                        summary, created.strftime('%Y-%m-%d %H:%M:%S')])
+
+
+def parse_count(raw: str) -> int:
+    """'250k' / '1.5M' / '10000' -> số nguyên."""
+    text = raw.strip().lower().replace('_', '')
+    mult = 1
+    if text.endswith('k'):
+        mult, text = 1_000, text[:-1]
+    elif text.endswith('m'):
+        mult, text = 1_000_000, text[:-1]
+    return int(float(text) * mult)
+
+
+__all__ = ["GenOptions", "GenResult", "generate_dataset", "plan_scale", "parse_count"]
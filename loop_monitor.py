@@ -0,0 +1,137 @@
+"""Tk Event-Loop Latency Monitor (additive)
+
+Đo độ trễ vòng lặp Tk để "giật/lag" ở quầy đo được thay vì cảm giác:
+- Heartbeat after() tần số cao (performance.ui_heartbeat_ms, mặc định 50 ms): mỗi nhịp so thời điểm
+  chạy thật với thời điểm dự kiến -> độ trễ vòng lặp (ui.loop_lag_ms).
+- Mọi callback Tk (command=, bind, after) đi qua tkinter.CallWrapper; monitor thay lớp đó bằng bản
+  có đo giờ nên biết handler nào đã chạy giữa hai nhịp. Nhịp trễ quá ngưỡng
+  (performance.ui_stall_ms, mặc định 150 ms) được quy cho handler chạy lâu nhất trong khoảng đó
+  (ui.stall.<handler>); không có handler nào -> do Tk tự vẽ/layout ('<tk>').
+- Số liệu đổ vào utils.metrics (xem cửa sổ F9 / maintenance.py metrics); tắt khi
+  performance.log_performance=false.
+"""
+from __future__ import annotations
+import logging
+import time
+import tkinter
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+from utils import metrics
+
+logger = logging.getLogger("suk.ui.loop")
+
+DEFAULT_HEARTBEAT_MS = 50
+DEFAULT_STALL_MS = 150
+RECENT_STALLS = 50
+TK_INTERNAL = '<tk>'
+
+_original_call_wrapper = tkinter.CallWrapper
+
+
+def handler_name(func: Callable) -> str:
+    """Tên dễ đọc của callback: after() bọc hàm thật trong closure 'callit' -> lấy hàm bên trong;
+    bound method -> Lớp.phương_thức; lambda -> qualname kèm số dòng."""
+    f: Any = func
+    code = getattr(f, '__code__', None)
+    if getattr(f, '__qualname__', '').endswith('after.<locals>.callit') and code is not None and f.__closure__:
+        cells = dict(zip(code.co_freevars, (c.cell_contents for c in f.__closure__)))
+        f = cells.get('func', f)
+    f = getattr(f, 'func', f)  # functools.partial
+    name = getattr(f, '__qualname__', None) or getattr(f, '__name__', None) or type(f).__name__
+    if name.endswith('<lambda>'):
+        code = getattr(f, '__code__', None)
+        if code is not None:
+            name = f"{name}:{code.co_firstlineno}"
+    return name
+
+
+class _TimedCallWrapper(_original_call_wrapper):
+    """CallWrapper đo thời gian chạy mỗi callback và báo cho monitor đang hoạt động."""
+    monitor: Optional["EventLoopMonitor"] = None
+
+    def __call__(self, *args):
+        mon = _TimedCallWrapper.monitor
+        if mon is None:
+            return super().__call__(*args)
+        t0 = time.perf_counter()
+        try:
+            return super().__call__(*args)
+        finally:
+            mon._handler_done(self.func, (time.perf_counter() - t0) * 1000.0)
+
+
+class EventLoopMonitor:
+    """Heartbeat đo độ trễ vòng lặp Tk + quy stall cho handler chạy lâu nhất."""
+
+    def __init__(self, root, heartbeat_ms: int = DEFAULT_HEARTBEAT_MS, stall_ms: float = DEFAULT_STALL_MS):
+        self.root = root
+        self.heartbeat_ms = max(10, int(heartbeat_ms))
+        self.stall_ms = float(stall_ms)
+        self.recent: Deque[Dict[str, Any]] = deque(maxlen=RECENT_STALLS)
+        self._job = None
+        self._expected = 0.0
+        self._slowest_ms = 0.0
+        self._slowest_func: Optional[Callable] = None
+        self._beat_returning = False  # _handler_done kế tiếp là của chính nhịp heartbeat -> bỏ qua
+
+    @classmethod
+    def from_config(cls, root, get_config_value) -> "EventLoopMonitor":
+        return cls(root,
+                   heartbeat_ms=get_config_value('performance', 'ui_heartbeat_ms', DEFAULT_HEARTBEAT_MS),
+                   stall_ms=get_config_value('performance', 'ui_stall_ms', DEFAULT_STALL_MS))
+
+    def install(self):
+        """Thay CallWrapper (chỉ ảnh hưởng callback đăng ký sau đó -> gọi trước khi dựng UI)."""
+        tkinter.CallWrapper = _TimedCallWrapper
+        _TimedCallWrapper.monitor = self
+
+    def start(self):
+        if self._job is None and metrics.enabled:
+            self._expected = time.perf_counter() + self.heartbeat_ms / 1000.0
+            self._job = self.root.after(self.heartbeat_ms, self._beat)
+
+    def stop(self):
+        _TimedCallWrapper.monitor = None
+        if self._job is not None:
+            try:
+                self.root.after_cancel(self._job)
+            except Exception:
+                pass
+            self._job = None
+
+    def _handler_done(self, func: Callable, ms: float):
+        if self._beat_returning:
+            self._beat_returning = False
+            return
+        if ms > self._slowest_ms:
+            self._slowest_ms = ms
+            self._slowest_func = func
+        if ms >= self.stall_ms:
+            metrics.observe('ui.slow_handler_ms.' + handler_name(func), ms)
+
+    def _beat(self):
+        now = time.perf_counter()
+        lag = max(0.0, (now - self._expected) * 1000.0)
+        metrics.observe('ui.loop_lag_ms', lag)
+        if lag >= self.stall_ms:
+            culprit = handler_name(self._slowest_func) if self._slowest_func is not None else TK_INTERNAL
+            metrics.inc('ui.stalls')
+            metrics.inc('ui.stall.' + culprit)
+            self.recent.append({'at': time.strftime('%H:%M:%S'), 'lag_ms': round(lag, 1), 'handler': culprit,
+                                'handler_ms': round(self._slowest_ms, 1)})
+            logger.debug("UI stall %.0f ms (handler %s %.0f ms)", lag, culprit, self._slowest_ms)
+        self._slowest_ms = 0.0
+        self._slowest_func = None
+        self._beat_returning = _TimedCallWrapper.monitor is self
+        if not metrics.enabled:
+            self._job = None
+            return
+        self._expected = time.perf_counter() + self.heartbeat_ms / 1000.0
+        self._job = self.root.after(self.heartbeat_ms, self._beat)
+
+    def recent_stalls(self) -> List[Dict[str, Any]]:
+        return list(self.recent)
+
+
+__all__ = ["EventLoopMonitor", "handler_name"]
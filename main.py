@@ -1,7 +1,11 @@
 from __future__ import annotations
 
 # SUK Pickleball v2.1.0 - Enhanced User Experience
+# Profiler khởi động nạp đầu tiên để mốc t0 sát lúc chạy (SUK_PROFILE_STARTUP=1 / --profile-startup)
+from startup import profiler, lazy_import, warm_up_imports, startup_budget_ms
+profiler.begin('imports')
 import logging
+import threading
 
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
@@ -16,20 +20,20 @@ from utils import (
     add_profit_share_event, read_profit_share_events, delete_profit_share_event,
     add_water_item, read_water_items, record_water_sale, aggregate_day_water_sales,
     ensure_all_data_files,
-    update_daily_record, update_monthly_stat, update_month_subscription, update_water_item,
+    update_daily_record, update_monthly_stat, delete_monthly_stat, update_month_subscription, update_water_item,
     compute_subscription_price, add_month_subscription_with_time, update_month_subscription_with_time,
-    read_daily_records_grouped_by_date
+    read_daily_records_grouped_by_date, week_occupancy, get_daily_records_for_day,
+    get_config_value, subscribe_changes, unsubscribe_changes, metrics, snapshot_water_stock, ScheduleConflictError
 )
+from task_executor import TaskExecutor
+from loop_monitor import EventLoopMonitor
+from animation import AnimationScheduler, scheduler_for, batch_update
 from datetime import date, datetime, timedelta
-import calendar
 import tkinter.font as tkfont
 import os
-import csv
-import json
-import shutil
 import sys
-
-print("📄 Hệ thống Quản lý SUK Pickleball - Chế độ CSV")
+# csv/json/shutil/calendar, matplotlib, fpdf, pandas: nạp tại chỗ dùng (lazy) để rút ngắn khởi động
+profiler.end('imports')
 
 # Logger UI nhẹ (không thay đổi logic, chỉ quan sát lỗi nuốt trước đây)
 ui_logger = logging.getLogger("suk.ui")
@@ -96,6 +100,15 @@ RADIUS_XL = 16
 
 # App title constant
 APP_TITLE = "Quản lý sân Pickleball"
+# Tab dựng trễ: bắt đầu pre-warm sau khi cửa sổ hiện, mỗi tab cách nhau một khoảng
+PREWARM_START_MS = 600
+PREWARM_STEP_MS = 120
+# Module nặng nạp trước trên worker nền sau first paint (thiếu thư viện thì bỏ qua)
+WARM_IMPORTS = ('fpdf', 'matplotlib.figure', 'matplotlib.backends.backend_agg')
+WARM_IMPORTS_DELAY_MS = 1500
+PROFILE_SESSION_ENV = 'SUK_PROFILE_SESSION'  # = profiling.ENV_SESSION (không nạp profiling chỉ để đọc hằng số)
+AUTO_SNAPSHOT_DELAY_MS = 5000
+METRICS_REFRESH_MS = 2000  # Cửa sổ chỉ số hiệu năng tự làm mới
 # Định nghĩa giá giờ & phụ thu đèn (v1.8.2)
 # Giữ nguyên để không phá vỡ logic cũ, nhưng đồng bộ với pricing.ACTVITY_RATES
 try:
@@ -123,7 +136,7 @@ def attach_tree_enhancements(root: tk.Tk, tree: ttk.Treeview):
         pass
     
     tree._last_hover = None  # type: ignore
-    tree._animation_id = None  # type: ignore
+    tree._hover_shown = None  # type: ignore
     
     def _animate_hover(item, direction='in'):
         """Smooth hover animation"""
@@ -135,26 +148,28 @@ def attach_tree_enhancements(root: tk.Tk, tree: ttk.Treeview):
         else:
             tree.item(item, tags=())
     
+    def _apply_hover():
+        """Đưa tag hover về đúng dòng đang trỏ (chạy một lần mỗi khung dù chuột đi qua nhiều dòng)"""
+        want = getattr(tree, '_last_hover', None)
+        shown = getattr(tree, '_hover_shown', None)
+        if shown == want:
+            return
+        if shown:
+            _animate_hover(shown, 'out')
+        if want:
+            _animate_hover(want, 'in')
+        tree._hover_shown = want  # type: ignore
+    
     def _on_motion(e):
         row = tree.identify_row(e.y)
         if row == getattr(tree, '_last_hover', None):
             return
-            
-        # Clear previous with animation
-        prev = getattr(tree, '_last_hover', None)
-        if prev and tree.exists(prev):
-            tree.after(10, lambda: _animate_hover(prev, 'out'))
-            
-        # Apply new hover with animation
-        if row and tree.exists(row):
-            tree.after(20, lambda: _animate_hover(row, 'in'))
-            tree._last_hover = row  # type: ignore
+        tree._last_hover = row or None  # type: ignore
+        batch_update(tree, ('tree-hover', str(tree)), _apply_hover)
     
     def _on_leave(_):
-        prev = getattr(tree, '_last_hover', None)
-        if prev and tree.exists(prev):
-            tree.after(10, lambda: _animate_hover(prev, 'out'))
         tree._last_hover = None  # type: ignore
+        batch_update(tree, ('tree-hover', str(tree)), _apply_hover)
     
     tree.bind('<Motion>', _on_motion, add='+')
     tree.bind('<Leave>', _on_leave, add='+')
@@ -222,14 +237,17 @@ class AnimatedButton:
             
     def _setup_animations(self):
         """Setup hover animations"""
+        key = ('button-hover', str(self.button))
+
+        def paint(bg, bd):
+            self.button.configure(bg=bg)
+            self.frame.configure(relief='raised', bd=bd)  # Subtle scaling effect
+
         def on_enter(e):
-            self.button.configure(bg=self.bg_hover)
-            # Subtle scaling effect
-            self.frame.configure(relief='raised', bd=2)
+            batch_update(self.button, key, lambda: paint(self.bg_hover, 2))
             
         def on_leave(e):
-            self.button.configure(bg=self.bg_normal)
-            self.frame.configure(relief='raised', bd=1)
+            batch_update(self.button, key, lambda: paint(self.bg_normal, 1))
             
         self.button.bind('<Enter>', on_enter)
         self.button.bind('<Leave>', on_leave)
@@ -325,22 +343,19 @@ class Tooltip:
             tw.wm_geometry(f"+{x}+{y}")
             
             # Smooth fade-in animation
-            tw.attributes('-alpha', 0.0)
-            self._fade_in(tw, 0.0)
+            self._fade_in(tw)
             
         except Exception:
             self._hide()
     
-    def _fade_in(self, window, alpha):
-        """Smooth fade-in animation"""
-        if window and window.winfo_exists():
-            alpha = min(alpha + 0.1, 0.95)
-            try:
-                window.attributes('-alpha', alpha)
-                if alpha < 0.95:
-                    window.after(20, lambda: self._fade_in(window, alpha))
-            except Exception:
-                pass
+    def _fade_in(self, window):
+        """Smooth fade-in animation (qua AnimationScheduler của cửa sổ gốc)"""
+        sched = scheduler_for(self.widget)
+        if sched is None:
+            window.attributes('-alpha', 0.95)
+            return
+        window.attributes('-alpha', 0.0)
+        sched.animate(('tooltip', str(window)), ANIMATION_FAST, lambda t: window.attributes('-alpha', 0.95 * t))
 
     def _hide(self):
         tw = self.tipwin
@@ -367,6 +382,285 @@ def apply_zebra(tree: ttk.Treeview):
         pass
 
 
+class VirtualTreeview:
+    """Treeview ảo cho tập kết quả lớn.
+
+    Chỉ giữ một pool cố định (số dòng nhìn thấy + buffer) dòng thật trong Treeview và cấu hình lại
+    chúng theo vị trí cuộn; dữ liệu lấy từ nguồn truy cập ngẫu nhiên (list/Sequence) qua row_builder.
+    Scrollbar dọc được điều khiển theo chỉ số dòng ảo thay vì yview của Treeview.
+    """
+    def __init__(self, tree: ttk.Treeview, scrollbar: ttk.Scrollbar | None = None,
+                 row_builder=None, buffer: int = 20, zebra: bool = True):
+        self.tree = tree
+        self.scrollbar = scrollbar
+        self.row_builder = row_builder or (lambda item: tuple(item))
+        self.buffer = buffer
+        self.zebra = zebra
+        self.source = ()
+        self.offset = 0
+        self._pool: list[str] = []
+        self._pool_state: dict[str, tuple] = {}  # iid -> values đã vẽ, bỏ qua dòng không đổi
+        self._selected: set[int] = set()
+        self._rendering = False
+        if zebra:
+            # Giữ màu zebra đã cấu hình sẵn (nếu có), nếu chưa thì dùng màu như apply_zebra
+            try:
+                if not tree.tag_configure('odd', 'background'):
+                    tree.tag_configure('odd', background='#f4f7fa')
+                if not tree.tag_configure('even', 'background'):
+                    tree.tag_configure('even', background='#ffffff')
+            except Exception:
+                pass
+        tree.configure(yscrollcommand=self._on_tree_yscroll)
+        if scrollbar is not None:
+            scrollbar.configure(command=self.yview)
+        tree.bind('<MouseWheel>', self._on_mousewheel)
+        tree.bind('<Button-4>', lambda e: self._scroll_by(-3))
+        tree.bind('<Button-5>', lambda e: self._scroll_by(3))
+        tree.bind('<Up>', self._on_key_up, add='+')
+        tree.bind('<Prior>', lambda e: self._scroll_by(-self._visible_rows()))
+        tree.bind('<Next>', lambda e: self._scroll_by(self._visible_rows()))
+        tree.bind('<<TreeviewSelect>>', self._on_select, add='+')
+        tree.bind('<Configure>', lambda e: self.refresh(), add='+')
+
+    # ---- Nguồn dữ liệu ----
+    def set_source(self, source, row_builder=None):
+        """Gán nguồn mới (Sequence) và cuộn về đầu."""
+        self.source = source if source is not None else ()
+        if row_builder is not None:
+            self.row_builder = row_builder
+        self.offset = 0
+        self._selected.clear()
+        self.refresh()
+
+    def update_source(self, source):
+        """Thay nguồn nhưng giữ vị trí cuộn (dùng khi dữ liệu thay đổi tại chỗ):
+        chỉ các dòng nhìn thấy có giá trị khác mới được cấu hình lại."""
+        self.source = source if source is not None else ()
+        self._selected.clear()
+        self.refresh()
+
+    def __len__(self):
+        return len(self.source)
+
+    def source_index(self, iid: str) -> int | None:
+        """Chỉ số trong nguồn của dòng (iid) đang hiển thị."""
+        try:
+            idx = self.offset + self._pool.index(iid)
+        except ValueError:
+            return None
+        return idx if idx < len(self.source) else None
+
+    def source_item(self, iid: str):
+        """Phần tử nguồn tương ứng với dòng (iid) đang hiển thị."""
+        idx = self.source_index(iid)
+        return self.source[idx] if idx is not None else None
+
+    # ---- Render ----
+    def _visible_rows(self) -> int:
+        rows = int(self.tree.cget('height') or 10)
+        try:
+            rowheight = int(ttk.Style(self.tree).lookup(self.tree.cget('style') or 'Treeview', 'rowheight') or 20)
+            px = self.tree.winfo_height()
+            if px > 1:
+                rows = max(rows, px // max(rowheight, 1))
+        except Exception:
+            pass
+        return max(rows, 1)
+
+    def refresh(self):
+        """Vẽ lại cửa sổ hiện tại: tái sử dụng các dòng trong pool, chỉ đổi values/tags."""
+        n = len(self.source)
+        visible = self._visible_rows()
+        self.offset = max(0, min(self.offset, n - visible))
+        want = min(visible + self.buffer, n - self.offset)
+        self._rendering = True
+        try:
+            while len(self._pool) < want:
+                self._pool.append(self.tree.insert('', 'end'))
+            while len(self._pool) > want:
+                self._pool_state.pop(self._pool[-1], None)
+                self.tree.delete(self._pool.pop())
+            selection = []
+            for k, iid in enumerate(self._pool):
+                idx = self.offset + k
+                tags = ('odd' if idx % 2 else 'even',) if self.zebra else ()
+                values = tuple(self.row_builder(self.source[idx]))
+                if self._pool_state.get(iid) != values:
+                    self.tree.item(iid, values=values, tags=tags)
+                    self._pool_state[iid] = values
+                elif tuple(self.tree.item(iid, 'tags') or ()) != tags:
+                    # hover (attach_tree_enhancements) có thể đã đổi tags của dòng
+                    self.tree.item(iid, tags=tags)
+                if idx in self._selected:
+                    selection.append(iid)
+            self.tree.selection_set(selection)
+            self.tree.yview_moveto(0)
+        finally:
+            self._rendering = False
+        self._update_scrollbar()
+
+    def _update_scrollbar(self):
+        if self.scrollbar is None:
+            return
+        n = len(self.source)
+        if not n:
+            self.scrollbar.set(0.0, 1.0)
+            return
+        visible = self._visible_rows()
+        self.scrollbar.set(self.offset / n, min(1.0, (self.offset + visible) / n))
+
+    # ---- Cuộn ----
+    def yview(self, *args):
+        """Lệnh cho scrollbar: 'moveto f' hoặc 'scroll n units|pages'."""
+        n = len(self.source)
+        if not args or not n:
+            return
+        if args[0] == 'moveto':
+            self.offset = int(float(args[1]) * n)
+        elif args[0] == 'scroll':
+            step = int(args[1])
+            if len(args) > 2 and args[2] == 'pages':
+                step *= self._visible_rows()
+            self.offset += step
+        self.refresh()
+
+    def see_index(self, idx: int):
+        visible = self._visible_rows()
+        if idx < self.offset or idx >= self.offset + visible:
+            self.offset = max(0, idx - visible // 2)
+            self.refresh()
+
+    def _scroll_by(self, rows: int):
+        self.offset += rows
+        self.refresh()
+        return 'break'
+
+    def _on_mousewheel(self, event):
+        return self._scroll_by(-3 if event.delta > 0 else 3)
+
+    def _on_key_up(self, _event):
+        sel = self.tree.selection()
+        if sel and self._pool and sel[0] == self._pool[0] and self.offset > 0:
+            return self._scroll_by(-1)
+        return None
+
+    def _on_tree_yscroll(self, first, _last):
+        # Treeview tự cuộn vào phần buffer (phím mũi tên / see()) -> dời cửa sổ ảo rồi về đầu pool
+        try:
+            first = float(first)
+        except (TypeError, ValueError):
+            return
+        if first > 0 and self._pool and not self._rendering:
+            shift = int(round(first * len(self._pool)))
+            if shift:
+                self.tree.after_idle(lambda: self._scroll_by(shift))
+
+    def _on_select(self, _event=None):
+        if self._rendering:
+            return
+        window = {self.offset + k for k in range(len(self._pool))}
+        self._selected -= window
+        for iid in self.tree.selection():
+            idx = self.source_index(iid)
+            if idx is not None:
+                self._selected.add(idx)
+
+
+class UiChangeDispatcher:
+    """Cầu nối bus sự kiện của utils với UI.
+
+    Gom các ChangeEvent phát sinh trong một lượt xử lý và phát cho các frame đúng một lần ở chu kỳ
+    idle kế tiếp của Tk (after_idle), nên nhiều thao tác ghi liên tiếp (xóa hàng loạt, bán nước trừ tồn)
+    chỉ gây một lần làm mới. Callback của frame nhận list[ChangeEvent] đã lọc theo bảng đăng ký.
+    """
+    def __init__(self, root: tk.Misc):
+        self.root = root
+        self._listeners: list[tuple] = []
+        self._pending: list = []
+        self._lock = threading.Lock()
+        self._scheduled = False
+        self._token = subscribe_changes(self._on_change)
+
+    def subscribe(self, callback, tables=None):
+        """Đăng ký callback(events) cho các bảng (None = tất cả)."""
+        self._listeners.append((callback, frozenset(tables) if tables else None))
+
+    def close(self):
+        unsubscribe_changes(self._token)
+        self._listeners.clear()
+
+    def _on_change(self, event):
+        with self._lock:
+            self._pending.append(event)
+            if self._scheduled:
+                return
+            self._scheduled = True
+        try:
+            # Tcl bản threaded tự chuyển lời gọi từ worker về luồng Tk
+            self.root.after_idle(self._flush)
+        except Exception as ex:
+            logging.getLogger('suk.ui').debug('UiChangeDispatcher after_idle lỗi: %s', ex)
+            with self._lock:
+                self._scheduled = False
+
+    def _flush(self):
+        with self._lock:
+            events, self._pending = self._pending, []
+            self._scheduled = False
+        for callback, tables in list(self._listeners):
+            mine = [e for e in events if tables is None or e.table in tables]
+            if not mine:
+                continue
+            try:
+                callback(mine)
+            except Exception as ex:
+                logging.getLogger('suk.ui').warning('Làm mới theo sự kiện lỗi (%s): %s', getattr(callback, '__qualname__', callback), ex)
+
+
+def subscribe_ui_changes(widget: tk.Misc, callback, tables=None):
+    """Đăng ký callback với UiChangeDispatcher của cửa sổ chính (nếu có)."""
+    dispatcher = getattr(widget.winfo_toplevel(), 'changes', None)
+    if dispatcher is not None:
+        dispatcher.subscribe(callback, tables)
+
+
+def _event_days(events) -> set:
+    return {d for e in events for d in e.days}
+
+
+def _event_months(events) -> set:
+    return {m for e in events for m in e.months}
+
+
+class LazyTab(ttk.Frame):
+    """Placeholder cho một tab của Notebook: frame thật (factory(self)) chỉ được dựng ở lần đầu
+    tab được chọn (hoặc khi pre-warm lúc rảnh), tránh đọc CSV / dựng widget của mọi tab lúc khởi động."""
+    def __init__(self, master, factory, on_built=None):
+        super().__init__(master)
+        self.factory = factory
+        self.frame: ttk.Frame | None = None
+        self._on_built = on_built
+        self._placeholder = ttk.Label(self, text='⏳ Đang tải...', style='Caption.TLabel')
+        self._placeholder.pack(expand=True)
+
+    @property
+    def built(self) -> bool:
+        return self.frame is not None
+
+    def materialize(self):
+        """Dựng frame thật nếu chưa có; trả về frame."""
+        if self.frame is None:
+            if self._placeholder is not None:
+                self._placeholder.destroy()
+                self._placeholder = None
+            self.frame = self.factory(self)
+            self.frame.pack(fill='both', expand=True)
+            if self._on_built is not None:
+                self._on_built(self.frame)
+        return self.frame
+
+
 class DailyEntryFrame(ttk.Frame):
     def __init__(self, master):
         super().__init__(master, padding=SPACING_LG)
@@ -674,6 +968,9 @@ class DailyEntryFrame(ttk.Frame):
         self.tree.tag_configure('even', background=SURFACE_COLOR)
         self.tree.tag_configure('highlight', background=PRIMARY_LIGHT)
         
+        # Bảng ảo: chỉ giữ các dòng đang nhìn thấy, nguồn là list bản ghi của ngày
+        self.vtree = VirtualTreeview(self.tree, scrollbar, row_builder=self._daily_row_values)
+        
         # Hover enhancement
         try:
             attach_tree_enhancements(self.winfo_toplevel(), self.tree)
@@ -724,6 +1021,7 @@ class DailyEntryFrame(ttk.Frame):
         self.refresh_view()
         self.update_clock()
         self.update_all_total()
+        subscribe_ui_changes(self, self._on_daily_changed, ('daily_records',))
 
     def _on_light_changed(self):
         """Track when user manually changes light setting"""
@@ -804,8 +1102,14 @@ class DailyEntryFrame(ttk.Frame):
                 # Show warning but allow saving
                 self.lbl_info.config(text="⚠️ Chưa nhập thông tin người/nhóm")
             
-            # Save with enhanced feedback
-            append_daily_record(ngay, san, slot, gia, loai=loai, nguoi=nguoi)
+            # Save with enhanced feedback; trùng lịch -> hỏi xác nhận rồi mới ghi đè
+            try:
+                append_daily_record(ngay, san, slot, gia, loai=loai, nguoi=nguoi)
+            except ScheduleConflictError as conflict:
+                if not messagebox.askyesno("Trùng lịch", f"{conflict}\n\nVẫn lưu bản ghi này?"):
+                    self.lbl_info.config(text=f"⚠️ Chưa lưu: {conflict}")
+                    return
+                append_daily_record(ngay, san, slot, gia, allow_overlap=True, loai=loai, nguoi=nguoi)
             
             # Enhanced success feedback
             success_msg = f"✅ Đã lưu: {san} {slot} {format_currency(gia)} ({loai})"
@@ -844,9 +1148,9 @@ class DailyEntryFrame(ttk.Frame):
             # Focus management for better UX
             self.cb_start.focus_set()
             
-            # Refresh data
-            self.refresh_view()
-            self._recompute_current_total()
+            # Bảng/tổng được làm mới qua sự kiện thay đổi; chỉ chuyển bảng về ngày vừa nhập nếu đang xem ngày khác
+            if self.var_view_day.get().strip() != self.var_ngay.get().strip():
+                self.refresh_view()
             
         except Exception as ex:
             error_msg = f"❌ Lỗi: {str(ex)}"
@@ -917,7 +1221,7 @@ class DailyEntryFrame(ttk.Frame):
                 new_loai = var_loai.get().strip()
                 ok = update_daily_record(ngay_iso, san, khung, old_gia, new_ngay_iso, new_san, new_slot, new_gia, new_loai, var_nguoi.get().strip())
                 if ok:
-                    popup.destroy(); self.refresh_view(); self._recompute_current_total(); self.lbl_info.config(text='Đã cập nhật')
+                    popup.destroy(); self.lbl_info.config(text='Đã cập nhật')
                 else:
                     info.config(text='Không cập nhật được (không tìm thấy)')
             except Exception as ex:
@@ -993,6 +1297,7 @@ class DailyEntryFrame(ttk.Frame):
             week_days = ['T2','T3','T4','T5','T6','T7','CN']
             for c, txt in enumerate(week_days):
                 ttk.Label(cal_frame, text=txt, width=3, anchor='center', font=('Segoe UI',9,'bold')).grid(row=0, column=c)
+            import calendar
             month_cal = calendar.monthcalendar(y, m)
             for r, week in enumerate(month_cal, start=1):
                 for c, day in enumerate(week):
@@ -1060,53 +1365,65 @@ class DailyEntryFrame(ttk.Frame):
             day_iso = to_iso_date(day_ui)
         except Exception:
             # Ngày không hợp lệ => xóa bảng và thoát
-            for i in self.tree.get_children():
-                self.tree.delete(i)
+            self.vtree.set_source([])
             return
 
-        # Xóa bảng cũ
-        for i in self.tree.get_children():
-            self.tree.delete(i)
-        # Nạp dữ liệu
+        # Nạp dữ liệu (tra index theo ngày, không quét toàn bộ lịch sử)
         try:
-            all_recs = read_daily_records_dict()  # sẽ có record_id nếu utils đọc được
+            records = get_daily_records_for_day(day_iso)
         except Exception:
-            all_recs = []
-        records = [r for r in all_recs if r.get('ngay') == day_iso]
-        total_current = 0
-        # mapping iid -> record_id (ẩn) để xóa/sửa chính xác
-        self._row_id_map = {}
-        for idx, r in enumerate(records):
-            display_gia = format_currency(r.get('gia_vnd',0))
-            if r.get('loai'):
-                display_gia = f"{display_gia} ({r['loai']})"
-            total_current += r.get('gia_vnd',0)
-            tag = 'odd' if idx % 2 else 'even'
-            iid = self.tree.insert('', 'end', values=(r.get('san',''), r.get('khung_gio',''), display_gia, r.get('nguoi','')), tags=(tag,))
-            if 'record_id' in r:
-                # Lưu map; không hiển thị cột mới -> tránh phá UI
-                self._row_id_map[iid] = r['record_id']
+            records = []
+        # Bảng ảo giữ tham chiếu bản ghi -> record_id lấy qua vtree.source_item(iid) khi xóa/sửa
+        self.vtree.set_source(records)
         # Cập nhật tổng hiện tại ngay sau khi nạp bảng (dù list_only hay không)
-        self.var_current_total.set(format_currency(total_current))
+        self.var_current_total.set(format_currency(sum(r.gia_vnd for r in records)))
 
         if not list_only:
-            # Cập nhật tổng theo ngày nhập (self.var_ngay)
-            try:
-                ngay_iso = to_iso_date(self.var_ngay.get().strip())
-                total = compute_daily_total(ngay_iso)
-                self.var_total.set(format_currency(total))
-                breakdown = breakdown_daily_by_court(ngay_iso)
-                if breakdown:
-                    bd_txt = ", ".join(f"{k}: {format_currency(v)}" for k, v in breakdown.items())
-                else:
-                    bd_txt = "(trống)"
-                self.var_breakdown.set(bd_txt)
-            except Exception as ex:
-                self.var_total.set("-")
-                self.var_breakdown.set(str(ex))
+            self._refresh_entry_totals()
             # Cập nhật lại danh sách ngày của combobox để có ngày mới
             # (Đã chuyển sang chọn lịch nên không cần cập nhật danh sách ngày)
 
+    def _refresh_entry_totals(self):
+        """Cập nhật tổng + phân theo sân của ngày nhập (self.var_ngay)."""
+        try:
+            ngay_iso = to_iso_date(self.var_ngay.get().strip())
+            total = compute_daily_total(ngay_iso)
+            self.var_total.set(format_currency(total))
+            breakdown = breakdown_daily_by_court(ngay_iso)
+            if breakdown:
+                bd_txt = ", ".join(f"{k}: {format_currency(v)}" for k, v in breakdown.items())
+            else:
+                bd_txt = "(trống)"
+            self.var_breakdown.set(bd_txt)
+        except Exception as ex:
+            self.var_total.set("-")
+            self.var_breakdown.set(str(ex))
+
+    def _on_daily_changed(self, events):
+        """Sự kiện daily_records: chỉ làm mới bảng/tổng khi chạm ngày đang xem hoặc ngày nhập."""
+        days = _event_days(events)
+        try:
+            view_iso = to_iso_date(self.var_view_day.get().strip())
+        except Exception:
+            view_iso = None
+        if view_iso in days:
+            self.vtree.update_source(get_daily_records_for_day(view_iso))
+            self.var_current_total.set(format_currency(compute_daily_total(view_iso)))
+        try:
+            ngay_iso = to_iso_date(self.var_ngay.get().strip())
+        except Exception:
+            return
+        if ngay_iso in days:
+            self._refresh_entry_totals()
+
+    @staticmethod
+    def _daily_row_values(r):
+        """Giá trị hiển thị một dòng bảng ngày từ DailyRecord"""
+        display_gia = format_currency(r.gia_vnd)
+        if r.loai:
+            display_gia = f"{display_gia} ({r.loai})"
+        return (r.san, r.khung_gio, display_gia, r.nguoi)
+
     def delete_selected(self):
         """Xóa dòng được chọn trong bảng"""
         sel = self.tree.selection()
@@ -1116,7 +1433,8 @@ class DailyEntryFrame(ttk.Frame):
         
         item = sel[0]
         values = self.tree.item(item, 'values')
-        rec_id = getattr(self, '_row_id_map', {}).get(item)
+        rec = self.vtree.source_item(item)
+        rec_id = getattr(rec, 'record_id', None)
         if len(values) == 4:
             san, khung, gia_disp, nguoi = values
         else:
@@ -1151,8 +1469,6 @@ class DailyEntryFrame(ttk.Frame):
         else:
             ok = delete_daily_record(ngay, san, khung, gia_vnd)
         if ok:
-            self.refresh_view()
-            self._recompute_current_total()
             messagebox.showinfo("Thành công", "Đã xóa dòng.")
         else:
             messagebox.showwarning("Thông báo", "Không tìm thấy dòng để xóa (có thể đã thay đổi)")
@@ -1276,8 +1592,6 @@ class DailyEntryFrame(ttk.Frame):
         # Cleanup window
         self._bulk_del_win = None
         win.destroy()
-        self.refresh_view()
-        self._recompute_current_total()
         
         if deleted:
             messagebox.showinfo("Kết quả", f"Đã xóa {deleted}/{len(to_del)} dòng.")
@@ -1346,7 +1660,6 @@ class DailyEntryFrame(ttk.Frame):
                 ok = update_daily_record(ngay_iso, san, khung, old_gia, ngay_iso, new_san, new_khung, new_gia, new_loai, var_nguoi.get().strip())
                 if ok:
                     status.set('Đã cập nhật')
-                    self.refresh_view(list_only=True)
                 else:
                     status.set('Không tìm thấy dòng')
             except Exception as ex:
@@ -1361,9 +1674,7 @@ class DailyEntryFrame(ttk.Frame):
         return 'break'
 
     def undo_last(self):
-        if undo_last_action():
-            self.refresh_view()
-        else:
+        if not undo_last_action():
             messagebox.showinfo("Hoàn tác", "Không còn thao tác để hoàn tác")
 
     def update_all_total(self):
@@ -1373,12 +1684,11 @@ class DailyEntryFrame(ttk.Frame):
             self.var_current_total.set("-")
 
     def update_clock(self):
+            # Chỉ vẽ lại giờ; tổng ngày được cập nhật khi có sự kiện ghi (_on_daily_changed) hoặc đổi ngày xem
             now = datetime.now().strftime('%d/%m/%Y %H:%M:%S')
             self.var_now.set(now)
             # Lặp lại sau 1s
             self.after(1000, self.update_clock)
-            # Cập nhật tổng toàn bộ định kỳ
-            self.update_all_total()
 
     def _recompute_current_total(self):
         """Tính lại tổng hiện tại dựa trên bảng đang hiển thị (ngày xem)."""
@@ -1387,12 +1697,7 @@ class DailyEntryFrame(ttk.Frame):
             day_iso = to_iso_date(day_ui)
         except Exception:
             self.var_current_total.set('0'); return
-        try:
-            all_recs = read_daily_records_dict()
-        except Exception:
-            all_recs = []
-        total = sum(r.get('gia_vnd',0) for r in all_recs if r.get('ngay') == day_iso)
-        self.var_current_total.set(format_currency(total))
+        self.var_current_total.set(format_currency(compute_daily_total(day_iso)))
 
     def _auto_price(self):
         """Enhanced auto pricing with better feedback and validation."""
@@ -1497,6 +1802,15 @@ class DailySummaryFrame(ttk.Frame):
             pass
         # Bỏ phần thống kê mở rộng: dùng toàn bộ chiều cao cho bảng
         self.refresh_day()
+        subscribe_ui_changes(self, self._on_daily_changed, ('daily_records',))
+
+    def _on_daily_changed(self, events):
+        try:
+            iso = self._get_iso_date()
+        except ValueError:
+            return
+        if iso in _event_days(events):
+            self.refresh_day()
 
     # Helpers
     def _get_iso_date(self) -> str:
@@ -1697,6 +2011,7 @@ class MonthlyStatFrame(ttk.Frame):
             pass
         self.var_thang = tk.StringVar(value=f"{self.var_month_only.get()}-{self.var_year_only.get()}")
         self.refresh_history()
+        subscribe_ui_changes(self, lambda events: self.refresh_history(), ('monthly_stats',))
         # Double click -> popup sửa
         self.tree.bind('<Double-1>', lambda e: self._open_edit_popup_month())
 
@@ -1742,7 +2057,7 @@ class MonthlyStatFrame(ttk.Frame):
                 ok = update_monthly_stat(thang_iso, tong, chi_phi, reason)
                 if ok:
                     messagebox.showinfo('Đã lưu','Đã cập nhật tháng')
-                    win.destroy(); self.refresh_history()
+                    win.destroy()
                 else:
                     messagebox.showwarning('Không đổi','Không cập nhật được (không tìm thấy)')
             except Exception as ex:
@@ -1791,7 +2106,6 @@ class MonthlyStatFrame(ttk.Frame):
             reason = self.var_cp_ly_do.get().strip()
             loi = save_monthly_stat(thang_iso, tong, chi_phi, tu_tinh_tu_ngay=False, chi_phi_ly_do=reason)
             messagebox.showinfo("Kết quả", f"Lợi nhuận {thang_ui}: {format_currency(loi)}")
-            self.refresh_history()
         except Exception as ex:
             messagebox.showerror("Lỗi", str(ex))
 
@@ -1828,22 +2142,10 @@ class MonthlyStatFrame(ttk.Frame):
         thang = self.tree.item(item, 'values')[0]
         if not messagebox.askyesno("Xác nhận", f"Xóa thống kê tháng {thang}?"):
             return
-        # chuyển về iso và ghi lại file bỏ tháng đó
+        # chuyển về iso rồi xóa mọi phiên bản của tháng trong store
         try:
             thang_iso = to_iso_month(thang)
-            stats = read_monthly_stats()
-            # filter
-            remaining = [s for s in stats if s['thang'] != thang_iso]
-            # ghi đè (dùng save_monthly_stat từng dòng sau khi clear file)
-            import os, csv
-            path = 'monthly_stats.csv'
-            if os.path.exists(path):
-                try:
-                    os.remove(path)
-                except Exception:
-                    pass
-            for s in remaining:
-                save_monthly_stat(s['thang'], s['tong_doanh_thu_vnd'], s['chi_phi_tru_hao_vnd'], tu_tinh_tu_ngay=False)
+            delete_monthly_stat(thang_iso)
             self.refresh_history()
             messagebox.showinfo("Kết quả", f"Đã xóa tháng {thang}")
         except Exception as ex:
@@ -1999,6 +2301,16 @@ class SubscriptionFrame(ttk.Frame):
         # Initialize
         self.auto_calculate_price()
         self.refresh_subs()
+        subscribe_ui_changes(self, self._on_subs_changed, ('monthly_subscriptions',))
+
+    def _on_subs_changed(self, events):
+        """Chỉ nạp lại bảng khi sự kiện chạm tháng đang xem."""
+        try:
+            m = self._month_iso()
+        except Exception:
+            return
+        if m in _event_months(events):
+            self.refresh_subs()
     
     def _setup_vietnamese_input(self):
         """Setup Vietnamese Telex input for name field"""
@@ -2462,7 +2774,6 @@ class SubscriptionFrame(ttk.Frame):
             ok = delete_month_subscription(m, name)
             if ok:
                 messagebox.showinfo('Thành công', 'Đã xóa gói')
-                self.refresh_subs()
             else:
                 messagebox.showerror('Lỗi', 'Không xóa được')
         except Exception as ex:
@@ -2605,11 +2916,16 @@ class SubscriptionFrame(ttk.Frame):
                     raise ValueError('Tên không được trống')
                 
                 # Use updated function with new fields
-                ok = update_month_subscription_with_time(m_iso, old_name, new_name, ses, hrs_display, new_court, days, notes)
+                try:
+                    ok = update_month_subscription_with_time(m_iso, old_name, new_name, ses, hrs_display, new_court, days, notes)
+                except ScheduleConflictError as conflict:
+                    if not messagebox.askyesno('Trùng lịch', f'{conflict}\n\nVẫn lưu gói này?', parent=win):
+                        return
+                    ok = update_month_subscription_with_time(m_iso, old_name, new_name, ses, hrs_display, new_court, days, notes,
+                                                             allow_conflict=True)
                 if ok:
                     messagebox.showinfo('Đã lưu','Đã cập nhật gói')
                     win.destroy()
-                    self.refresh_subs()
                 else:
                     messagebox.showwarning('Không đổi','Không cập nhật được')
             except Exception as ex:
@@ -2925,7 +3241,13 @@ class SubscriptionFrame(ttk.Frame):
                 raise ValueError('Vui lòng chọn khung giờ chơi')
             
             # Use updated function with new fields - pass hrs_display instead of hrs for storage
-            calculated_price = add_month_subscription_with_time(m, name, ses, hrs_display, court, days, notes)
+            try:
+                calculated_price = add_month_subscription_with_time(m, name, ses, hrs_display, court, days, notes)
+            except ScheduleConflictError as conflict:
+                if not messagebox.askyesno('Trùng lịch', f'{conflict}\n\nVẫn thêm gói này?'):
+                    return
+                calculated_price = add_month_subscription_with_time(m, name, ses, hrs_display, court, days, notes,
+                                                                    allow_conflict=True)
             
             messagebox.showinfo('Thêm', f'Đã thêm {name} ({court}): {format_currency(calculated_price)}')
             
@@ -2935,8 +3257,6 @@ class SubscriptionFrame(ttk.Frame):
             self.var_notes.set('')
             self.var_hours.set('1 (Chưa chọn)')
             self.auto_calculate_price()
-            
-            self.refresh_subs()
         except Exception as ex:
             messagebox.showerror('Lỗi', str(ex))
 
@@ -2984,9 +3304,23 @@ class ProfitShareFrame(ttk.Frame):
         sb2 = ttk.Scrollbar(self, orient='vertical', command=self.tree_shares.yview)
         self.tree_shares.configure(yscroll=sb2.set)
         sb2.grid(column=6, row=row, sticky='ns')
+        self.vtree_shares = VirtualTreeview(self.tree_shares, sb2, row_builder=lambda e: (
+            e.get('event_id',''), e.get('scope',''),
+            format_currency(e.get('total_revenue_vnd',0)),
+            format_currency(e.get('total_cost_vnd',0)),
+            format_currency(e.get('profit_vnd',0)), e.get('summary',''), e.get('created_at','')))
         for i in range(6):
             self.grid_columnconfigure(i, weight=1)
         self.refresh_totals(); self.refresh_shares()
+        subscribe_ui_changes(self, self._on_data_changed, ('profit_shares', 'monthly_stats'))
+
+    def _on_data_changed(self, events):
+        tables = {e.table for e in events}
+        if 'profit_shares' in tables:
+            # Giữ vị trí cuộn, chỉ vẽ lại các dòng nhìn thấy có thay đổi
+            self.vtree_shares.update_source(read_profit_share_events())
+        if 'monthly_stats' in tables and set(self._range_months()) & _event_months(events):
+            self.refresh_totals()
 
     def _range_months(self):
         try:
@@ -3029,17 +3363,7 @@ class ProfitShareFrame(ttk.Frame):
             pass
 
     def refresh_shares(self):
-        for i in self.tree_shares.get_children(): self.tree_shares.delete(i)
-        evs = read_profit_share_events()
-        for e in evs:
-            self.tree_shares.insert('', 'end', values=(e.get('event_id',''), e.get('scope',''),
-                format_currency(e.get('total_revenue_vnd',0)),
-                format_currency(e.get('total_cost_vnd',0)),
-                format_currency(e.get('profit_vnd',0)), e.get('summary',''), e.get('created_at','')))
-        try:
-            apply_zebra(self.tree_shares)
-        except Exception:
-            pass
+        self.vtree_shares.set_source(read_profit_share_events())
 
     def open_share_dialog(self):
         win = tk.Toplevel(self); win.title('Tạo lần chia lợi nhuận')
@@ -3107,7 +3431,7 @@ Nhấn 'Xem trước' để xem tổng và số tiền từng người, sau đó
             summary = ", ".join(f"{k}: {format_currency(v)}" for k,v in shares.items())
             add_profit_share_event(scope, total_rev, total_cost, total_profit, summary)
             messagebox.showinfo('Đã lưu', f'Đã lưu lần chia: {scope}')
-            win.destroy(); self.refresh_shares()
+            win.destroy()
 
         btns = ttk.Frame(win); btns.grid(column=0,row=3,sticky='w', padx=6, pady=(6,0))
         ttk.Button(btns, text='Xem trước', command=do_preview).pack(side='left', padx=(0,8))
@@ -3119,8 +3443,7 @@ Nhấn 'Xem trước' để xem tổng và số tiền từng người, sau đó
         if not sel: return
         item = sel[0]; event_id = self.tree_shares.item(item,'values')[0]
         if not messagebox.askyesno('Xác nhận','Xóa bản ghi chia này?'): return
-        if delete_profit_share_event(event_id): self.refresh_shares()
-        else: messagebox.showerror('Lỗi','Không xóa được')
+        if not delete_profit_share_event(event_id): messagebox.showerror('Lỗi','Không xóa được')
 
     def open_delete_share_dialog(self):
         """Xóa bản ghi chia lợi nhuận đã chọn trong bảng"""
@@ -3145,7 +3468,6 @@ Nhấn 'Xem trước' để xem tổng và số tiền từng người, sau đó
             ok = delete_profit_share_event(event_id)
             if ok:
                 messagebox.showinfo('Thành công', 'Đã xóa bản ghi chia')
-                self.refresh_shares()
             else:
                 messagebox.showerror('Lỗi', 'Không xóa được')
         except Exception as ex:
@@ -3155,7 +3477,7 @@ class WaterInputFrame(ttk.Frame):
     """Tab quản lý nhập nước: nhập danh mục nước mới và bổ sung."""
     def __init__(self, master):
         super().__init__(master, padding=10)
-        self.water_sales_frame = None  # Will be set after both frames are created
+        self._item_rows: dict[str, str] = {}  # tên nước (lower) -> iid trong tree_items
         self.build()
 
     def build(self):
@@ -3231,17 +3553,47 @@ class WaterInputFrame(ttk.Frame):
             self.grid_columnconfigure(c, weight=1)
         # init
         self.refresh_items()
+        # Bán nước / sửa danh mục ở bất kỳ đâu -> chỉ vá các dòng nước bị ảnh hưởng
+        subscribe_ui_changes(self, self._on_items_changed, ('water_items',))
         # Popup edit instead of inline
         self.tree_items.bind('<Double-1>', lambda e: self._open_edit_popup_item())
         
     def reload_all(self):
         self.refresh_items()
 
+    @staticmethod
+    def _item_values(it):
+        return (it.get('ten',''), it.get('so_luong_ton',''), format_currency(it.get('don_gia_vnd',0)))
+
     def refresh_items(self):
         for i in self.tree_items.get_children(): self.tree_items.delete(i)
+        self._item_rows.clear()
         items = read_water_items()
         for it in items:
-            self.tree_items.insert('', 'end', values=(it.get('ten',''), it.get('so_luong_ton',''), format_currency(it.get('don_gia_vnd',0))))
+            iid = self.tree_items.insert('', 'end', values=self._item_values(it))
+            self._item_rows[it.get('ten','').strip().lower()] = iid
+        try:
+            apply_zebra(self.tree_items)
+        except Exception:
+            pass
+
+    def _on_items_changed(self, events):
+        """Cập nhật/chèn/xóa đúng các dòng có tên trong sự kiện thay vì dựng lại cả bảng."""
+        names = {str(n).strip().lower() for e in events for n in e.record_ids}
+        if not names:
+            self.refresh_items(); return
+        items = {it.get('ten','').strip().lower(): it for it in read_water_items()}
+        for key in names:
+            iid = self._item_rows.get(key)
+            it = items.get(key)
+            if it is None:
+                if iid is not None and self.tree_items.exists(iid):
+                    self.tree_items.delete(iid)
+                self._item_rows.pop(key, None)
+            elif iid is not None and self.tree_items.exists(iid):
+                self.tree_items.item(iid, values=self._item_values(it))
+            else:
+                self._item_rows[key] = self.tree_items.insert('', 'end', values=self._item_values(it))
         try:
             apply_zebra(self.tree_items)
         except Exception:
@@ -3268,8 +3620,6 @@ class WaterInputFrame(ttk.Frame):
             ok = delete_water_item(name)
             if ok:
                 messagebox.showinfo('Thành công', f'Đã xóa {name}')
-                self.refresh_items()
-                self._notify_water_sales_update()  # Đồng bộ với tab bán nước
             else:
                 messagebox.showerror('Lỗi', 'Không xóa được')
         except Exception as ex:
@@ -3322,8 +3672,7 @@ class WaterInputFrame(ttk.Frame):
                 if add_qty > 0:
                     add_water_item(new_name, add_qty, price)
                 messagebox.showinfo('Đã lưu','Đã cập nhật nước')
-                win.destroy(); self.refresh_items()
-                self._notify_water_sales_update()  # Đồng bộ với tab bán nước
+                win.destroy()
             except Exception as ex:
                 messagebox.showerror('Lỗi', str(ex))
 
@@ -3332,14 +3681,6 @@ class WaterInputFrame(ttk.Frame):
         ttk.Button(btns, text='Hủy', command=win.destroy).pack(side='left', padx=6)
         e_name.focus_set(); win.bind('<Return>', lambda ev: do_save())
 
-    def _notify_water_sales_update(self):
-        """Thông báo cho tab bán nước rằng danh sách nước đã được cập nhật"""
-        if self.water_sales_frame:
-            try:
-                self.water_sales_frame._sync_item_names()
-            except Exception:
-                pass  # Ignore errors if the sales frame is not ready
-
     def save_water_item(self):
         # Chỉ thêm mới / bổ sung
         try:
@@ -3351,8 +3692,6 @@ class WaterInputFrame(ttk.Frame):
                 raise ValueError('Tên không được trống')
             add_water_item(name, qty, price)
             messagebox.showinfo('Thành công','Đã nhập / bổ sung nước')
-            self.refresh_items()
-            self._notify_water_sales_update()  # Đồng bộ với tab bán nước
             self.var_item_name.set(''); self.var_item_qty.set('1'); self.var_item_price.set('')
         except Exception as ex:
             messagebox.showerror('Lỗi', str(ex))
@@ -3361,7 +3700,6 @@ class WaterSalesFrame(ttk.Frame):
     """Tab quản lý bán nước: ghi nhận doanh thu bán nước theo ngày."""
     def __init__(self, master):
         super().__init__(master, padding=10)
-        self.water_input_frame = None  # Will be set after both frames are created
         self.build()
 
     def build(self):
@@ -3399,6 +3737,11 @@ class WaterSalesFrame(ttk.Frame):
         sb2 = ttk.Scrollbar(self, orient='vertical', command=self.tree_sales.yview)
         self.tree_sales.configure(yscroll=sb2.set)
         sb2.grid(column=8,row=row,sticky='ns')
+        self.vtree_sales = VirtualTreeview(self.tree_sales, sb2, row_builder=lambda r: (
+            r.get('ten',''),
+            r.get('so_luong',''),
+            format_currency(r.get('don_gia_vnd',0)),
+            format_currency(r.get('tong_vnd',0))))
         try:
             attach_tree_enhancements(self.winfo_toplevel(), self.tree_sales)
         except Exception:
@@ -3408,6 +3751,7 @@ class WaterSalesFrame(ttk.Frame):
         # init
         self._sync_item_names()
         self.refresh_sales()
+        subscribe_ui_changes(self, self._on_water_changed, ('water_items', 'water_sales'))
         
     def _sync_item_names(self):
         items = read_water_items()
@@ -3416,16 +3760,18 @@ class WaterSalesFrame(ttk.Frame):
         if names and not self.var_sale_item.get():
             self.var_sale_item.set(names[0])
 
-    def _notify_water_input_update(self):
-        """Thông báo cho tab nhập nước rằng số lượng tồn đã thay đổi"""
-        if self.water_input_frame:
+    def _on_water_changed(self, events):
+        """Danh mục đổi -> đồng bộ combobox; bán/xóa bán trong ngày đang xem -> nạp lại bảng bán."""
+        tables = {e.table for e in events}
+        if 'water_items' in tables:
+            self._sync_item_names()
+        if 'water_sales' in tables:
             try:
-                self.water_input_frame.refresh_items()
-            except Exception as ex:
-                try:
-                    logging.getLogger('suk.ui').debug('water_input_frame.refresh_items error: %s', ex)
-                except Exception:
-                    pass  # Still suppress if logging somehow fails
+                day_iso = to_iso_date(self.var_sale_day.get().strip())
+            except Exception:
+                return
+            if day_iso in _event_days(events):
+                self.refresh_sales(keep_position=True)
 
     def _open_date_picker(self, target_var: tk.StringVar, on_change=None):
         # Reuse simple calendar like other frames
@@ -3484,35 +3830,24 @@ class WaterSalesFrame(ttk.Frame):
             qty = int(self.var_sale_qty.get())
             total = record_water_sale(day_iso, name, qty)
             messagebox.showinfo('Đã bán', f'{name} x{qty}: {format_currency(total)}')
-            self.refresh_sales()
-            self._notify_water_input_update()  # Đồng bộ với tab nhập nước
         except Exception as ex:
             messagebox.showerror('Lỗi', str(ex))
 
-    def refresh_sales(self):
-        for i in self.tree_sales.get_children(): self.tree_sales.delete(i)
+    def refresh_sales(self, keep_position: bool = False):
         try:
             day_iso = to_iso_date(self.var_sale_day.get().strip())
         except Exception:
+            self.vtree_sales.set_source([])
             return
         
-        # Hiển thị từng lần bán riêng biệt thay vì aggregate
-        from utils import day_water_sales
+        # Hiển thị từng lần bán riêng biệt thay vì aggregate (tra index theo ngày)
+        from utils import day_water_sales, day_water_sales_total
         sales = day_water_sales(day_iso)  # Lấy raw data thay vì aggregate
-        total_day = 0
-        for r in sales:
-            total_day += r.get('tong_vnd',0)
-            self.tree_sales.insert('', 'end', values=(
-                r.get('ten',''), 
-                r.get('so_luong',''), 
-                format_currency(r.get('don_gia_vnd',0)), 
-                format_currency(r.get('tong_vnd',0))
-            ))
-        self.var_sale_total_day.set(format_currency(total_day))
-        try:
-            apply_zebra(self.tree_sales)
-        except Exception:
-            pass
+        if keep_position:
+            self.vtree_sales.update_source(sales)
+        else:
+            self.vtree_sales.set_source(sales)
+        self.var_sale_total_day.set(format_currency(day_water_sales_total(day_iso)))
 
     def open_delete_sale_dialog(self):
         """Xóa dòng bán nước đã chọn trong bảng"""
@@ -3558,8 +3893,6 @@ class WaterSalesFrame(ttk.Frame):
             ok = delete_water_sale(day_iso, name, qty, price)
             if ok:
                 messagebox.showinfo('Thành công', 'Đã xóa dòng bán')
-                self.refresh_sales()
-                self._notify_water_input_update()  # Đồng bộ với tab nhập nước
             else:
                 # Debug: Show available records
                 from utils import day_water_sales
@@ -3575,9 +3908,16 @@ class WaterSalesFrame(ttk.Frame):
 
 class ScheduleFrame(ttk.Frame):
     """Tab thời khóa biểu - hiển thị lịch tuần với trạng thái sân"""
+    DAYS = ['Thứ 2', 'Thứ 3', 'Thứ 4', 'Thứ 5', 'Thứ 6', 'Thứ 7', 'Chủ nhật']
+    HOURS = list(range(6, 23))  # 6:00 - 22:00
+
     def __init__(self, master):
         super().__init__(master, padding=10)
         self.current_week_start = self._get_week_start(datetime.today())
+        # Pool widget dựng một lần: (ngày, giờ, sân) -> Label; _cell_state lưu (text, bg, fg) đang hiển thị
+        self._cell_labels: dict[tuple[int, int, int], tk.Label] = {}
+        self._cell_state: dict[tuple[int, int, int], tuple[str, str, str]] = {}
+        self._day_header_labels: list[ttk.Label] = []
         self.build()
 
     def _get_week_start(self, date_obj):
@@ -3628,6 +3968,14 @@ class ScheduleFrame(ttk.Frame):
         self.canvas.bind('<Configure>', self._on_canvas_configure)
         
         self.refresh_schedule()
+        subscribe_ui_changes(self, self._on_data_changed, ('daily_records', 'monthly_subscriptions'))
+
+    def _on_data_changed(self, events):
+        """Chỉ làm mới khi sự kiện chạm tuần đang hiển thị (ngày trong tuần / tháng chứa tuần)."""
+        week_days = {(self.current_week_start + timedelta(days=i)).isoformat() for i in range(7)}
+        week_months = {d[:7] for d in week_days}
+        if week_days & _event_days(events) or week_months & {m for e in events if not e.days for m in e.months}:
+            self.refresh_schedule()
 
     def _on_frame_configure(self, event):
         """Cập nhật scroll region khi frame thay đổi"""
@@ -3654,251 +4002,118 @@ class ScheduleFrame(ttk.Frame):
         self.refresh_schedule()
 
     def refresh_schedule(self):
-        """Làm mới thời khóa biểu"""
-        # Clear existing widgets
-        for widget in self.schedule_frame.winfo_children():
-            widget.destroy()
+        """Làm mới thời khóa biểu: chỉ cấu hình lại các ô thay đổi, không dựng lại widget"""
+        if not self._cell_labels:
+            self._create_schedule_grid()
         
         # Update week label
         week_end = self.current_week_start + timedelta(days=6)
         self.week_label.config(text=f"{self.current_week_start.strftime('%d/%m')} - {week_end.strftime('%d/%m/%Y')}")
         
-        # Tạo header grid
-        self._create_schedule_grid()
+        # Header các thứ
+        for col, (day, label) in enumerate(zip(self.DAYS, self._day_header_labels)):
+            date_obj = self.current_week_start + timedelta(days=col)
+            label.config(text=f"{day}\n{date_obj.strftime('%d/%m')}")
+        
+        # Lấy lưới chiếm dụng tuần (dựng sẵn trong utils, cache theo tuần)
+        week_data = self._get_week_data()
+        court_pos = {c: i for i, c in enumerate(week_data['courts'])} if week_data else {}
+        for (day_idx, hour_idx, court_idx), label in self._cell_labels.items():
+            court = COURTS[court_idx]
+            cell = None
+            if court in court_pos:
+                cell = week_data['grid'][day_idx][hour_idx][court_pos[court]]
+            info = self._get_court_info(cell, court)
+            state = (info['text'], info['bg'], info['fg'])
+            key = (day_idx, hour_idx, court_idx)
+            if self._cell_state.get(key) != state:
+                label.config(text=state[0], bg=state[1], fg=state[2])
+                self._cell_state[key] = state
 
     def _create_schedule_grid(self):
-        """Tạo lưới thời khóa biểu"""
-        # Days of week
-        days = ['Thứ 2', 'Thứ 3', 'Thứ 4', 'Thứ 5', 'Thứ 6', 'Thứ 7', 'Chủ nhật']
-        
-        # Hours (6:00 - 22:00)
-        hours = [f"{h:02d}:00" for h in range(6, 23)]
-        
+        """Tạo lưới thời khóa biểu một lần; các tuần sau tái sử dụng widget"""
         # Header row - Giờ với font lớn hơn
         ttk.Label(self.schedule_frame, text='Giờ', font=('Segoe UI', 14, 'bold'), relief='ridge', 
                  borderwidth=2, anchor='center', width=8).grid(row=0, column=0, sticky='nsew', padx=2, pady=2)
         
-        # Header row - Các thứ với font lớn hơn
-        for col, day in enumerate(days, start=1):
-            date_obj = self.current_week_start + timedelta(days=col-1)
-            day_text = f"{day}\n{date_obj.strftime('%d/%m')}"
-            ttk.Label(self.schedule_frame, text=day_text, font=('Segoe UI', 12, 'bold'), 
-                     relief='ridge', borderwidth=2, anchor='center', width=18).grid(row=0, column=col, sticky='nsew', padx=2, pady=2)
-        
-        # Lấy dữ liệu cho tuần
-        week_data = self._get_week_data()
+        # Header row - Các thứ với font lớn hơn (text điền trong refresh_schedule)
+        self._day_header_labels = []
+        for col in range(1, len(self.DAYS) + 1):
+            lbl = ttk.Label(self.schedule_frame, text='', font=('Segoe UI', 12, 'bold'), 
+                     relief='ridge', borderwidth=2, anchor='center', width=18)
+            lbl.grid(row=0, column=col, sticky='nsew', padx=2, pady=2)
+            self._day_header_labels.append(lbl)
         
         # Grid cells - Giờ x Ngày với kích thước lớn hơn
-        for row, hour in enumerate(hours, start=1):
+        court_bgs = ['#e8f4f8', '#f0f8e8']
+        for row, hour_idx in enumerate(self.HOURS, start=1):
             # Cột giờ với font lớn hơn
-            ttk.Label(self.schedule_frame, text=hour, font=('Segoe UI', 12, 'bold'), 
+            ttk.Label(self.schedule_frame, text=f"{hour_idx:02d}:00", font=('Segoe UI', 12, 'bold'), 
                      relief='ridge', borderwidth=1, anchor='center').grid(row=row, column=0, sticky='nsew', padx=2, pady=2)
             
             # Các cột ngày
             for col in range(1, 8):
-                date_obj = self.current_week_start + timedelta(days=col-1)
-                date_key = date_obj.strftime('%Y-%m-%d')
-                hour_key = hour.split(':')[0]  # Chỉ lấy giờ
-                
-                # Tạo cell cho slot này với kích thước lớn hơn
                 cell_frame = tk.Frame(self.schedule_frame, relief='ridge', bd=2, bg='white', 
                                     width=160, height=80)  # Tăng kích thước ô
                 cell_frame.grid(row=row, column=col, sticky='nsew', padx=2, pady=2)
                 cell_frame.grid_propagate(False)  # Giữ kích thước cố định
                 
-                # Hiển thị thông tin trong cell
-                self._populate_cell(cell_frame, date_key, hour_key, week_data)
+                # Container cho nội dung
+                content_frame = tk.Frame(cell_frame, bg='white')
+                content_frame.pack(fill='both', expand=True, padx=3, pady=3)
+                
+                # Nhãn cho từng sân (sân 1, sân 2)
+                for court_idx, court in enumerate(COURTS):
+                    court_frame = tk.Frame(content_frame, bg=court_bgs[court_idx % len(court_bgs)], height=35)
+                    court_frame.pack(fill='x', pady=(0, 2) if court_idx < len(COURTS) - 1 else 0)
+                    court_frame.pack_propagate(False)
+                    label = tk.Label(court_frame, text=court, font=('Segoe UI', 10), anchor='center')
+                    label.pack(fill='both', expand=True)
+                    self._cell_labels[(col - 1, hour_idx, court_idx)] = label
         
         # Configure grid weights
-        for i in range(len(hours) + 1):
+        for i in range(len(self.HOURS) + 1):
             self.schedule_frame.grid_rowconfigure(i, weight=1)
         for i in range(8):
             self.schedule_frame.grid_columnconfigure(i, weight=1)
 
     def _get_week_data(self):
-        """Lấy dữ liệu cho tuần hiện tại từ daily records và subscriptions"""
-        week_data = {}
-        
-        # Lấy dữ liệu từ daily records
+        """Lấy lưới chiếm dụng 7 ngày x 24 giờ x sân cho tuần hiện tại"""
         try:
-            from utils import read_daily_records_grouped_by_date
-            daily_data = read_daily_records_grouped_by_date()
-            
-            for date_str, records in daily_data.items():
-                if date_str not in week_data:
-                    week_data[date_str] = {'daily': [], 'subscriptions': []}
-                week_data[date_str]['daily'] = records
+            return week_occupancy(self.current_week_start)
         except Exception as e:
-            print(f"Lỗi đọc daily records: {e}")
-            pass
-        
-        # Lấy dữ liệu từ subscriptions
-        try:
-            from utils import read_all_subscriptions
-            subs = read_all_subscriptions()
-            
-            # Lọc subscription cho tháng hiện tại
-            current_month = self.current_week_start.strftime('%Y-%m')
-            month_subs = [s for s in subs if s.get('thang', '').startswith(current_month)]
-            
-            # Ánh xạ subscription vào các ngày trong tuần
-            for sub in month_subs:
-                thu_str = sub.get('thu', '')
-                if not thu_str:
-                    continue
-                    
-                days = [d.strip() for d in thu_str.split(',')]
-                for day in days:
-                    day_mapping = {
-                        'Thứ 2': 0, 'Thứ 3': 1, 'Thứ 4': 2, 'Thứ 5': 3, 
-                        'Thứ 6': 4, 'Thứ 7': 5, 'Chủ nhật': 6
-                    }
-                    
-                    if day in day_mapping:
-                        day_offset = day_mapping[day]
-                        date_obj = self.current_week_start + timedelta(days=day_offset)
-                        date_key = date_obj.strftime('%Y-%m-%d')
-                        
-                        if date_key not in week_data:
-                            week_data[date_key] = {'daily': [], 'subscriptions': []}
-                        
-                        week_data[date_key]['subscriptions'].append(sub)
-        except:
-            pass
-        
-        return week_data
+            ui_logger.warning("Không dựng được lưới thời khóa biểu: %s", e)
+            return None
 
-    def _populate_cell(self, cell_frame, date_key, hour_key, week_data):
-        """Điền thông tin vào ô thời khóa biểu"""
-        cell_frame.configure(height=80, width=160)
-        
-        # Container cho nội dung
-        content_frame = tk.Frame(cell_frame, bg='white')
-        content_frame.pack(fill='both', expand=True, padx=3, pady=3)
-        
-        # Nhãn cho sân 1 và sân 2
-        san1_frame = tk.Frame(content_frame, bg='#e8f4f8', height=35)
-        san1_frame.pack(fill='x', pady=(0, 2))
-        san1_frame.pack_propagate(False)
-        
-        san2_frame = tk.Frame(content_frame, bg='#f0f8e8', height=35)
-        san2_frame.pack(fill='x')
-        san2_frame.pack_propagate(False)
-        
-        # Kiểm tra dữ liệu cho ngày và giờ này
-        day_data = week_data.get(date_key, {'daily': [], 'subscriptions': []})
-        
-        # Xử lý sân 1
-        san1_info = self._get_court_info(day_data, hour_key, 'Sân 1')
-        san1_label = tk.Label(san1_frame, text=san1_info['text'], bg=san1_info['bg'], 
-                             fg=san1_info['fg'], font=('Segoe UI', 10), anchor='center')
-        san1_label.pack(fill='both', expand=True)
-        
-        # Xử lý sân 2
-        san2_info = self._get_court_info(day_data, hour_key, 'Sân 2')
-        san2_label = tk.Label(san2_frame, text=san2_info['text'], bg=san2_info['bg'], 
-                             fg=san2_info['fg'], font=('Segoe UI', 10), anchor='center')
-        san2_label.pack(fill='both', expand=True)
-
-    def _get_court_info(self, day_data, hour_key, court):
-        """Lấy thông tin trạng thái sân cho giờ và sân cụ thể"""
+    def _get_court_info(self, cell, court):
+        """Lấy thông tin trạng thái sân từ ô lưới ({'booking', 'subscription'} hoặc None)"""
         # Mặc định
         info = {'text': court, 'bg': '#f8f9fa', 'fg': '#6c757d'}
-        
-        # Kiểm tra daily bookings
-        for record in day_data['daily']:
-            if record.get('san') == court:
-                khung_gio = record.get('khung_gio', '')
-                if self._hour_in_range(hour_key, khung_gio):
-                    nguoi = record.get('nguoi', 'Không rõ')
-                    price = record.get('gia_vnd', 0)
-                    info = {
-                        'text': f"{nguoi}\n{format_currency(price)}", 
-                        'bg': '#fff3cd', 
-                        'fg': '#856404'
-                    }
-                    break
-        
-        # Kiểm tra subscriptions (cập nhật để sử dụng thông tin giờ chi tiết)
-        for sub in day_data['subscriptions']:
-            if sub.get('san') == court:
-                gio_display = sub.get('gio_moi_buoi_display', sub.get('gio_moi_buoi', '1'))
-                if self._subscription_active_detailed(hour_key, gio_display):
-                    ten = sub.get('ten', 'Gói tháng')
-                    info = {
-                        'text': f"{ten}\n(Gói tháng)", 
-                        'bg': '#d1ecf1', 
-                        'fg': '#0c5460'
-                    }
-                    break
-        
-        return info
-
-    def _hour_in_range(self, hour_key, khung_gio):
-        """Kiểm tra giờ có nằm trong khung giờ không"""
-        try:
-            hour = int(hour_key)
-            # Parse khung_gio có thể là format "HH:MM-HH:MM" hoặc "8h-10h"
-            if '-' in khung_gio:
-                start_str, end_str = khung_gio.split('-')
-                
-                # Xử lý format "8h-10h"
-                if 'h' in start_str and 'h' in end_str:
-                    start_hour = int(start_str.replace('h', ''))
-                    end_hour = int(end_str.replace('h', ''))
-                else:
-                    # Xử lý format "HH:MM-HH:MM"
-                    start_hour = int(start_str.split(':')[0])
-                    end_hour = int(end_str.split(':')[0])
-                
-                return start_hour <= hour < end_hour
-        except Exception as e:
-            pass
-        return False
-
-    def _subscription_active(self, hour_key, gio_moi_buoi):
-        """Kiểm tra subscription có hoạt động trong giờ này không (logic cũ)"""
-        try:
-            hour = int(hour_key)
-            # Giả sử subscription hoạt động trong khung giờ phổ biến
-            # Có thể cải thiện bằng cách lưu thêm thông tin giờ trong subscription
-            common_hours = {
-                1: [19],  # 1 giờ: 19:00-20:00
-                2: [18, 19],  # 2 giờ: 18:00-20:00
-                3: [17, 18, 19]  # 3 giờ: 17:00-20:00
+        if not cell:
+            return info
+        
+        # Gói tháng ưu tiên hiển thị hơn đặt sân lẻ
+        sub = cell.get('subscription')
+        if sub:
+            ten = sub.get('ten', 'Gói tháng')
+            return {'text': f"{ten}\n(Gói tháng)", 'bg': '#d1ecf1', 'fg': '#0c5460'}
+        
+        record = cell.get('booking')
+        if record:
+            nguoi = record.nguoi
+            info = {
+                'text': f"{nguoi}\n{format_currency(record.gia_vnd)}", 
+                'bg': '#fff3cd', 
+                'fg': '#856404'
             }
-            return hour in common_hours.get(gio_moi_buoi, [])
-        except:
-            pass
-        return False
-
-    def _subscription_active_detailed(self, hour_key, gio_display):
-        """Kiểm tra subscription có hoạt động trong giờ này không với thông tin chi tiết"""
-        try:
-            hour = int(hour_key)
-            
-            # Parse format "2 (7:00-9:00)" or just "2"
-            if '(' in gio_display and ')' in gio_display:
-                # Có thông tin chi tiết về giờ
-                time_range = gio_display.split('(')[1].split(')')[0]
-                start_str, end_str = time_range.split('-')
-                start_hour = int(start_str.split(':')[0])
-                end_hour = int(end_str.split(':')[0])
-                return start_hour <= hour < end_hour
-            else:
-                # Chỉ có số giờ, sử dụng logic cũ
-                gio_count = int(gio_display.split()[0]) if gio_display else 1
-                return self._subscription_active(hour_key, gio_count)
-        except:
-            pass
-        return False
+        return info
 
 class MainApp(tk.Tk):
     def __init__(self):
         super().__init__()
         
         # CSV mode - no additional initialization needed
-        print("📄 Hệ thống Quản lý SUK Pickleball - Chế độ CSV")
+        ui_logger.info("📄 Hệ thống Quản lý SUK Pickleball - Chế độ CSV")
         
         self.title(APP_TITLE)
         # Thiết lập icon cửa sổ & taskbar (additive, không đổi logic nghiệp vụ)
@@ -3922,25 +4137,95 @@ class MainApp(tk.Tk):
             pass
         self.geometry("980x640")
         self.minsize(860, 560)
+        # Worker nền cho việc nặng (PDF, quét dữ liệu, biểu đồ); kết quả trả về luồng Tk qua after()
+        self.tasks = TaskExecutor(self, enabled=bool(get_config_value('performance', 'async_operations', True)))
+        # Bus thay đổi dữ liệu -> các tab tự vá bảng/tổng bị ảnh hưởng (gom theo chu kỳ idle)
+        self.changes = UiChangeDispatcher(self)
+        self.changes.subscribe(self._refresh_all_tabs)
+        # Đo độ trễ vòng lặp Tk; cài trước _build_ui để mọi callback đăng ký sau đó đều được đo giờ
+        self.loop_monitor = EventLoopMonitor.from_config(self, get_config_value)
+        self.loop_monitor.install()
+        # Một nhịp chung cho mọi hiệu ứng (fade, hover, badge); tạm dừng khi mất focus/thu nhỏ
+        self.animations = AnimationScheduler.from_config(self, get_config_value)
+        self.animations.watch_window_state()
+        self._profile_session = None
+        # profiling (cProfile/pstats/tracemalloc) chỉ nạp khi thật sự ghi profile
+        if os.environ.get(PROFILE_SESSION_ENV) and lazy_import('profiling').session_requested():
+            self._toggle_profiling()
         self.style = ttk.Style(self)
-        self._init_style()
-        self._build_ui()
+        with profiler.phase('_init_style'):
+            self._init_style()
+        with profiler.phase('_build_ui'):
+            self._build_ui()
         
         # Ensure data files exist
-        ensure_all_data_files()
-        # Kiểm tra nhanh tính toàn vẹn (additive – chỉ log, không thay đổi dòng chảy)
-        try:
-            from utils import verify_data_integrity
-            integrity = verify_data_integrity()
-            if integrity.get('overlap_count') or integrity.get('missing_id_count'):
-                ui_logger.warning(
-                    "Data integrity cảnh báo: overlap=%s missing_id=%s", 
-                    integrity.get('overlap_count'), integrity.get('missing_id_count')
-                )
-        except Exception as ex:
+        with profiler.phase('ensure_all_data_files'):
+            ensure_all_data_files()
+        # Kiểm tra toàn vẹn chạy nền sau first paint (xem _start_integrity_check)
+        # after_idle chạy sau các lượt vẽ đầu tiên -> mốc "first paint"
+        self.after_idle(self._on_first_paint)
+        
+        ui_logger.info("✅ Hệ thống Quản lý SUK Pickleball khởi tạo thành công")
+
+    def _on_first_paint(self):
+        """Chốt số liệu khởi động (nếu bật profiler), kiểm tra toàn vẹn và nạp trước module nặng trên worker nền."""
+        profiler.mark('first_paint')
+        self.loop_monitor.start()  # Sau first paint: không tính khoảng dựng UI lúc khởi động là "giật"
+        self._start_integrity_check(on_finished=self._finish_startup)
+
+    def _finish_startup(self):
+        budget = startup_budget_ms(get_config_value('performance', 'startup_budget_ms'))
+        from utils import _base_dir
+        report = profiler.finish(_base_dir(), budget)
+        if profiler.check and report is not None:
+            # --startup-check: chỉ đo rồi thoát, mã 1 nếu vượt ngân sách (tính tới first paint)
+            self._startup_exit_code = 0 if report.get('within_budget') else 1
+            self.after(0, self.destroy)
+            return
+        self.after(WARM_IMPORTS_DELAY_MS, lambda: self.tasks.submit(warm_up_imports, WARM_IMPORTS, name='warm-imports'))
+        self.after(AUTO_SNAPSHOT_DELAY_MS, self._auto_snapshot)
+
+    def _auto_snapshot(self):
+        """Snapshot tự động theo backup_settings (auto_backup + backup_interval), chạy nền."""
+        from snapshot_store import auto_snapshot_if_due
+
+        def done(manifest):
+            if manifest:
+                ui_logger.info("Sao lưu tự động: %s", manifest['id'])
+
+        self.tasks.submit(auto_snapshot_if_due, on_done=done,
+                          on_error=lambda ex: ui_logger.warning("Sao lưu tự động lỗi: %s", ex), name='auto-snapshot')
+
+    def _start_integrity_check(self, on_finished=None):
+        """Quét toàn vẹn dữ liệu trên worker nền; bỏ qua nếu dữ liệu chưa đổi từ lần trước (sidecar).
+        Có cảnh báo -> log + toast, không chặn giao diện."""
+        from utils import check_data_integrity_cached
+        profiler.begin('integrity_check')
+
+        def done(integrity):
+            profiler.end('integrity_check')
+            overlap = integrity.get('overlap_count') or 0
+            missing = integrity.get('missing_id_count') or 0
+            if overlap or missing:
+                ui_logger.warning("Data integrity cảnh báo: overlap=%s missing_id=%s (cache=%s)",
+                                  overlap, missing, integrity.get('from_cache'))
+                parts = []
+                if overlap:
+                    parts.append(f"{overlap} cặp khung giờ trùng")
+                if missing:
+                    parts.append(f"{missing} dòng thiếu mã")
+                self.show_toast("Dữ liệu cần kiểm tra: " + ", ".join(parts), 'warning', ms=5000)
+            if on_finished:
+                on_finished()
+
+        def failed(ex):
+            profiler.end('integrity_check')
             ui_logger.debug("Integrity check skipped: %s", ex)
-        
-        print("✅ Hệ thống Quản lý SUK Pickleball khởi tạo thành công")
+            if on_finished:
+                on_finished()
+
+        self.tasks.submit(check_data_integrity_cached, on_done=done, on_error=failed,
+                          on_cancel=lambda: profiler.end('integrity_check'), name='integrity-check')
             
     def _init_style(self):
         """Enhanced styling with better visual hierarchy and modern design."""
@@ -4402,21 +4687,11 @@ class MainApp(tk.Tk):
             
             toast.geometry(f"{w}x{h}+{x}+{y}")
             
-            # Simple fade-out effect simulation
-            def fade_out():
-                try:
-                    current_alpha = toast.attributes('-alpha')
-                    if current_alpha > 0.1:
-                        toast.attributes('-alpha', current_alpha - 0.1)
-                        toast.after(50, fade_out)
-                    else:
-                        toast.destroy()
-                except Exception:
-                    toast.destroy()
-            
-            # Set initial alpha and start fade after delay
+            # Giữ nguyên rồi mờ dần trong 500 ms cuối (scheduler vẫn đóng toast đúng hạn khi app mất focus)
             toast.attributes('-alpha', 0.95)
-            toast.after(max(100, ms - 500), fade_out)
+            self.animations.animate(('toast', str(toast)), ANIMATION_SLOW,
+                                    lambda t: toast.attributes('-alpha', 0.95 * (1.0 - t)),
+                                    on_done=toast.destroy, delay_ms=max(100, ms - ANIMATION_SLOW))
             
         except Exception:
             # Fallback to simple message if toast fails
@@ -4479,18 +4754,22 @@ class MainApp(tk.Tk):
         self.notebook.bind('<<NotebookTabChanged>>', self._on_tab_changed)
 
         # Enhanced tab creation with consistent styling and tooltips
-        self.daily_frame = DailyEntryFrame(self.notebook)
-        self.summary_frame = DailySummaryFrame(self.notebook)
-        self.sub_frame = SubscriptionFrame(self.notebook)
-        self.monthly_frame = MonthlyStatFrame(self.notebook)
-        self.share_frame = ProfitShareFrame(self.notebook)
-        self.water_input_frame = WaterInputFrame(self.notebook)
-        self.water_sales_frame = WaterSalesFrame(self.notebook)
-        self.schedule_frame = ScheduleFrame(self.notebook)
-        
-        # Thiết lập kết nối đồng bộ hóa giữa hai tab nước
-        self.water_input_frame.water_sales_frame = self.water_sales_frame
-        self.water_sales_frame.water_input_frame = self.water_input_frame
+        # Các tab dữ liệu được dựng trễ (LazyTab): self.<attr> là None cho tới khi tab được dựng,
+        # dùng self._tab_frame(attr) nếu cần frame thật. performance.lazy_loading=False -> dựng ngay.
+        self._lazy_tabs: dict[str, LazyTab] = {}
+        for attr, cls in (
+            ('daily_frame', DailyEntryFrame),
+            ('summary_frame', DailySummaryFrame),
+            ('sub_frame', SubscriptionFrame),
+            ('monthly_frame', MonthlyStatFrame),
+            ('share_frame', ProfitShareFrame),
+            ('water_input_frame', WaterInputFrame),
+            ('water_sales_frame', WaterSalesFrame),
+            ('schedule_frame', ScheduleFrame),
+        ):
+            setattr(self, attr, None)
+            self._lazy_tabs[attr] = LazyTab(self.notebook, cls, on_built=lambda frame, a=attr: setattr(self, a, frame))
+        # Hai tab nước tự đồng bộ qua UiChangeDispatcher (sự kiện water_items / water_sales)
         
         # Enhanced info frame with professional layout
         self.info_frame = ttk.Frame(self.notebook, padding=SPACING_XXL)
@@ -4592,30 +4871,40 @@ class MainApp(tk.Tk):
                  font=('Segoe UI', 9, 'italic'), foreground='#94a3b8').pack()
 
         # Enhanced tab configuration with logical workflow and modern icons
+        tabs = self._lazy_tabs
         tab_config = [
             # Core Operations (Daily workflow)
-            (self.daily_frame, '📝 Ghi chép sân'),
-            (self.summary_frame, '📊 Tổng kết ngày'),
+            (tabs['daily_frame'], '📝 Ghi chép sân'),
+            (tabs['summary_frame'], '📊 Tổng kết ngày'),
             
             # Water Management (Grouped together)  
-            (self.water_input_frame, '🥤 Nhập nước'),
-            (self.water_sales_frame, '🥤 Bán nước'),
+            (tabs['water_input_frame'], '🥤 Nhập nước'),
+            (tabs['water_sales_frame'], '🥤 Bán nước'),
 
             # Customer Management
-            (self.sub_frame, '🎫 Gói tháng'),
+            (tabs['sub_frame'], '🎫 Gói tháng'),
             
             # Analytics & Reports
-            (self.monthly_frame, '📈 Thống kê tháng'),
-            (self.share_frame, '💰 Chia lợi nhuận'),
+            (tabs['monthly_frame'], '📈 Thống kê tháng'),
+            (tabs['share_frame'], '💰 Chia lợi nhuận'),
             
             # Schedule & Info
-            (self.schedule_frame, '📅 Thời khóa biểu'),
+            (tabs['schedule_frame'], '📅 Thời khóa biểu'),
             (self.info_frame, 'ℹ️ Thông tin')
         ]
         
         for frame, label in tab_config:
             self.notebook.add(frame, text=label)
 
+        # Chỉ dựng tab đang chọn; các tab còn lại dựng khi được chọn hoặc pre-warm lúc rảnh
+        if get_config_value('performance', 'lazy_loading', True):
+            self._materialize_selected_tab()
+            if get_config_value('performance', 'prewarm_tabs', True):
+                self.after(PREWARM_START_MS, self._prewarm_next_tab)
+        else:
+            for tab in tabs.values():
+                tab.materialize()
+
         # Enhanced Status bar with modern design
         status_frame = ttk.Frame(main_container, style='Card.TFrame')
         status_frame.pack(fill='x', side='bottom', padx=SPACING_SM, pady=(0, SPACING_SM))
@@ -4650,6 +4939,8 @@ class MainApp(tk.Tk):
                            bg='#ffffff', fg='#333333',
                            activebackground='#e3f2fd', activeforeground='#0066cc')
         file_menu.add_command(label=' Xuất PDF báo cáo      Ctrl+P', command=self._export_pdf_report)
+        file_menu.add_command(label='💾 Sao lưu dữ liệu      Ctrl+B', command=self._do_backup)
+        file_menu.add_command(label='♻️ Khôi phục sao lưu', command=self._restore_backup)
         file_menu.add_separator() 
         file_menu.add_command(label='❌ Thoát                 Alt+F4', command=self._safe_exit)
         menubar.add_cascade(label='📁 Tệp', menu=file_menu)
@@ -4666,6 +4957,10 @@ class MainApp(tk.Tk):
         tools_menu.add_command(label='📈 Biểu đồ thống kê      Ctrl+G', command=self._show_charts)
         tools_menu.add_separator()
         tools_menu.add_command(label='🔧 Sửa chữa dữ liệu     F7', command=self._repair_data)
+        tools_menu.add_command(label='⏱️ Chỉ số hiệu năng     F9', command=self._show_metrics)
+        tools_menu.add_command(label=self._profiling_menu_label(), command=self._toggle_profiling)
+        self._tools_menu = tools_menu
+        self._profiling_menu_index = tools_menu.index('end')
         menubar.add_cascade(label='🔧 Công cụ', menu=tools_menu)
 
         # Help menu with comprehensive support
@@ -4683,12 +4978,15 @@ class MainApp(tk.Tk):
         # Essential global key bindings
         self.bind_all('<Control-s>', lambda e: self._global_save())
         self.bind_all('<Control-p>', lambda e: self._export_pdf_report())
+        self.bind_all('<Control-b>', lambda e: self._do_backup())
         self.bind_all('<F3>', lambda e: self._show_price_calculator())
         self.bind_all('<F4>', lambda e: self._show_revenue_analysis())
         self.bind_all('<Control-q>', lambda e: self._quick_report())
         self.bind_all('<Control-f>', lambda e: self._search_data())
         self.bind_all('<Control-g>', lambda e: self._show_charts())
         self.bind_all('<F7>', lambda e: self._repair_data())
+        self.bind_all('<F9>', lambda e: self._show_metrics())
+        self.bind_all('<F12>', lambda e: self._toggle_profiling())
         self.bind_all('<F1>', lambda e: self._show_help())
         self.bind_all('<F8>', lambda e: self.show_shortcuts())
         self.bind_all('<F10>', lambda e: self._show_feedback_contact())
@@ -4730,32 +5028,72 @@ class MainApp(tk.Tk):
 
     # Helper methods for enhanced functionality
     def _do_backup(self):
-        """Enhanced backup with progress indication."""
-        try:
-            self.status_var.set('⏳ Đang sao lưu dữ liệu...')
-            self.show_toast('🔄 Bắt đầu sao lưu dữ liệu...', 'info')
-            
-            # Import and run backup
-            path = backup_data()
-            
-            self.status_var.set('✅ Sao lưu thành công')
+        """Snapshot thư mục data/ (chạy nền, cửa sổ không bị treo). Báo cáo PDF: _export_pdf_report."""
+        self.status_var.set('⏳ Đang sao lưu dữ liệu...')
+        self.show_toast('🔄 Bắt đầu sao lưu dữ liệu...', 'info')
+        
+        def on_done(manifest):
+            stats = manifest.get('stats', {})
+            self.status_var.set(f"✅ Sao lưu thành công: {manifest['id']}")
             self.show_toast('✅ Sao lưu hoàn tất!', 'success')
             messagebox.showinfo('Sao lưu thành công', 
-                              f'📄 Đã tạo file PDF dữ liệu:\n{path}\n\n💡 Bạn có thể mở để xem toàn bộ dữ liệu.')
-        except Exception as ex:
+                              f"💾 Đã tạo bản sao lưu: {manifest['id']}\n"
+                              f"📄 {stats.get('files', 0)} tệp ({stats.get('unchanged_files', 0)} không đổi), "
+                              f"ghi thêm {stats.get('bytes_written', 0) / 1024:.1f} KB\n"
+                              f"🗂️ Giữ tối đa {get_config_value('backup_settings', 'max_backups', 30)} bản sao lưu gần nhất.")
+        
+        def on_error(ex):
             self.status_var.set('❌ Sao lưu thất bại')
             self.show_toast(f'❌ Lỗi sao lưu: {str(ex)}', 'error')
             messagebox.showerror('Lỗi sao lưu', str(ex))
+        
+        def on_progress(value, message):
+            if message:
+                pct = f' {int(value * 100)}%' if value is not None else ''
+                self.status_var.set(f'⏳ Sao lưu{pct}: {message}')
+        
+        def run_backup(handle):
+            from snapshot_store import create_snapshot
+            return create_snapshot(progress=handle.progress, label='thu-cong')
+        
+        self.tasks.submit(run_backup, on_done=on_done, on_error=on_error, on_progress=on_progress,
+                          with_handle=True, name='backup')
 
     def _global_save(self):
         """Global save command - delegates to current tab."""
         try:
             # Try to save on daily frame (most common use case)
-            if hasattr(self.daily_frame, 'save_record'):
-                self.daily_frame.save_record()
+            daily = self._tab_frame('daily_frame')
+            if hasattr(daily, 'save_record'):
+                daily.save_record()
         except Exception:
             pass
 
+    # ---- Tab dựng trễ ----
+    def _tab_frame(self, attr: str):
+        """Frame thật của tab (dựng ngay nếu chưa có)."""
+        tab = self._lazy_tabs.get(attr)
+        return tab.materialize() if tab is not None else getattr(self, attr, None)
+
+    def _materialize_selected_tab(self):
+        try:
+            tab = self.notebook.nametowidget(self.notebook.select())
+        except Exception:
+            return
+        if isinstance(tab, LazyTab) and not tab.built:
+            tab.materialize()
+
+    def _prewarm_next_tab(self):
+        """Dựng lần lượt từng tab còn lại trong thời gian rảnh, mỗi lượt một tab để UI vẫn mượt."""
+        for tab in self._lazy_tabs.values():
+            if not tab.built:
+                try:
+                    tab.materialize()
+                except Exception as ex:
+                    logging.getLogger('suk.ui').warning('Pre-warm tab lỗi: %s', ex)
+                self.after(PREWARM_STEP_MS, lambda: self.after_idle(self._prewarm_next_tab))
+                return
+
     def _show_price_calculator(self):
         """Advanced price calculator with real-time preview."""
         # Create calculator popup
@@ -5074,6 +5412,8 @@ class MainApp(tk.Tk):
 • Ctrl+F: Tìm kiếm dữ liệu
 • Ctrl+G: Biểu đồ thống kê
 • F7: Sửa chữa dữ liệu
+• F9: Chỉ số hiệu năng (chẩn đoán)
+• F12: Bắt đầu / dừng ghi profile (cProfile + bộ nhớ)
 
 ❓ TRỢ GIÚP:
 • F1: Hướng dẫn sử dụng nhanh
@@ -5216,13 +5556,20 @@ class MainApp(tk.Tk):
             )
             
             if file_path:
-                # Use existing backup function to create PDF
-                backup_path = backup_data()
+                def build_pdf(handle):
+                    # Ghi thẳng ra file đã chọn (worker nền, stream từng dòng, báo tiến độ)
+                    path = backup_data(out_path=file_path, progress=handle.progress)
+                    return path if path and os.path.exists(path) else None
                 
-                # Copy the generated PDF to chosen location
-                if backup_path and os.path.exists(backup_path):
-                    shutil.copy(backup_path, file_path)
-                    
+                def on_progress(value, message):
+                    if message:
+                        pct = f' {int(value * 100)}%' if value is not None else ''
+                        self.status_var.set(f'⏳ Báo cáo PDF{pct}: {message}')
+                
+                def on_done(result):
+                    if not result:
+                        messagebox.showerror("❌ Lỗi", "Không thể tạo file PDF. Vui lòng thử lại.")
+                        return
                     self.status_var.set('✅ Báo cáo PDF đã tạo thành công')
                     self.show_toast('✅ Báo cáo PDF hoàn tất!', 'success')
                     messagebox.showinfo("✅ Thành công", f"Báo cáo PDF đã được lưu:\n{file_path}")
@@ -5234,8 +5581,14 @@ class MainApp(tk.Tk):
                         except:
                             import subprocess
                             subprocess.run(['open', file_path])  # macOS
-                else:
-                    messagebox.showerror("❌ Lỗi", "Không thể tạo file PDF. Vui lòng thử lại.")
+                
+                def on_error(e):
+                    self.status_var.set('❌ Tạo báo cáo PDF thất bại')
+                    self.show_toast(f'❌ Lỗi: {str(e)}', 'error')
+                    messagebox.showerror("❌ Lỗi", f"Không thể tạo báo cáo PDF:\n{str(e)}")
+                
+                self.tasks.submit(build_pdf, on_done=on_done, on_error=on_error, on_progress=on_progress,
+                                  with_handle=True, name='export_pdf')
             else:
                 self.status_var.set('⚠️ Hủy tạo báo cáo PDF')
                 
@@ -5244,7 +5597,7 @@ class MainApp(tk.Tk):
             self.show_toast(f'❌ Lỗi: {str(e)}', 'error')
             messagebox.showerror("❌ Lỗi", f"Không thể tạo báo cáo PDF:\n{str(e)}")
     
-    def _restore_backup(self):
+    def _export_data_dialog(self):
         try:
             self.status_var.set('⏳ Đang xuất dữ liệu Excel...')
             self.show_toast('📋 Đang xuất Excel...', 'info')
@@ -5334,6 +5687,7 @@ class MainApp(tk.Tk):
                     else:  # CSV format
                         folder_path = filedialog.askdirectory(title="Chọn thư mục lưu CSV")
                         if folder_path:
+                            import shutil
                             for file in selected_files:
                                 new_name = f"SUK_Pickleball_{file.replace('.csv', '')}_{today}.csv"
                                 dest_path = os.path.join(folder_path, new_name)
@@ -5369,71 +5723,113 @@ class MainApp(tk.Tk):
             messagebox.showerror("❌ Lỗi", f"Không thể mở thư mục: {e}")
     
     def _restore_backup(self):
-        """Restore from backup file."""
+        """Khôi phục data/ từ một snapshot (giải nén song song, kiểm tra checksum, thay file atomic)."""
+        from snapshot_store import list_snapshots, restore_snapshot
         try:
-            import os
-            from tkinter import filedialog
-            self.status_var.set('⏳ Đang khôi phục sao lưu...')
-            
-            # Choose backup file
-            file_path = filedialog.askopenfilename(
-                title="Chọn file sao lưu để khôi phục",
-                filetypes=[
-                    ("ZIP files", "*.zip"),
-                    ("PDF files", "*.pdf"), 
-                    ("All files", "*.*")
-                ]
-            )
-            
-            if not file_path:
-                self.status_var.set('⚠️ Hủy khôi phục')
+            snapshots = list_snapshots()
+        except Exception as e:
+            messagebox.showerror("❌ Lỗi", f"Không đọc được danh sách sao lưu:\n{str(e)}")
+            return
+        if not snapshots:
+            messagebox.showinfo("♻️ Khôi phục", "Chưa có bản sao lưu nào.\n\n💡 Dùng Tệp → Sao lưu dữ liệu (Ctrl+B) để tạo.")
+            return
+        
+        win = tk.Toplevel(self)
+        win.title("♻️ Khôi phục sao lưu")
+        win.transient(self)
+        win.grab_set()
+        win.geometry("640x420")
+        
+        frame = ttk.Frame(win, padding=SPACING_LG)
+        frame.pack(fill='both', expand=True)
+        ttk.Label(frame, text='♻️ Chọn bản sao lưu để khôi phục', style='Subheader.TLabel').pack(anchor='w')
+        ttk.Label(frame, text='Dữ liệu hiện tại sẽ được tự động sao lưu trước khi thay thế.',
+                  style='Caption.TLabel').pack(anchor='w', pady=(0, SPACING_SM))
+        
+        cols = ('id', 'created_at', 'label', 'files', 'size')
+        tree = ttk.Treeview(frame, columns=cols, show='headings', height=10, selectmode='browse')
+        for col, text, width in (('id', 'Mã', 150), ('created_at', 'Thời gian', 150), ('label', 'Ghi chú', 150),
+                                 ('files', 'Tệp', 50), ('size', 'Dung lượng', 90)):
+            tree.heading(col, text=text)
+            tree.column(col, width=width, anchor='w')
+        for snap in snapshots:
+            created = (snap.get('created_at') or '').replace('T', ' ')
+            tree.insert('', 'end', iid=snap['id'], values=(snap['id'], created, snap.get('label', ''), snap.get('files', 0),
+                                                           f"{snap.get('bytes_total', 0) / 1024:.0f} KB"))
+        tree.selection_set(snapshots[0]['id'])
+        tree.pack(fill='both', expand=True)
+        
+        status = tk.StringVar(value='')
+        ttk.Label(frame, textvariable=status, style='Caption.TLabel').pack(anchor='w', pady=(SPACING_SM, 0))
+        buttons = ttk.Frame(frame)
+        buttons.pack(fill='x', pady=(SPACING_SM, 0))
+        
+        def do_restore():
+            sel = tree.selection()
+            if not sel:
                 return
-            
-            # Confirm restore
-            if not messagebox.askyesno("🔄 Khôi phục", 
-                                     f"Khôi phục từ file:\n{os.path.basename(file_path)}\n\n"
-                                     "⚠️ Thao tác này sẽ GHI ĐÈ dữ liệu hiện tại!\n\n"
-                                     "Bạn có chắc chắn muốn tiếp tục?"):
-                self.status_var.set('⚠️ Hủy khôi phục')
+            snapshot_id = sel[0]
+            if not messagebox.askyesno("♻️ Khôi phục",
+                                       f"Khôi phục dữ liệu từ bản sao lưu {snapshot_id}?\n\n"
+                                       "⚠️ Dữ liệu hiện tại sẽ bị thay thế (đã được sao lưu tự động trước đó).", parent=win):
                 return
+            restore_btn.configure(state='disabled')
+            self.status_var.set('⏳ Đang khôi phục sao lưu...')
             
-            # Create current backup before restore
-            backup_data()
+            def on_progress(value, message):
+                if win.winfo_exists():
+                    pct = f'{int(value * 100)}% ' if value is not None else ''
+                    status.set(f'⏳ {pct}{message}')
             
-            # Handle different file types
-            if file_path.endswith('.zip'):
-                import zipfile
-                
-                # Extract ZIP file
-                with zipfile.ZipFile(file_path, 'r') as zip_ref:
-                    # List contents
-                    file_list = zip_ref.namelist()
-                    csv_files = [f for f in file_list if f.endswith('.csv')]
-                    
-                    if not csv_files:
-                        messagebox.showerror("❌ Lỗi", "File ZIP không chứa dữ liệu CSV!")
-                        return
-                    
-                    # Extract CSV files
-                    for file in csv_files:
-                        zip_ref.extract(file, '.')
-                
-                self.load_data()  # Refresh all tabs
-                self.status_var.set('✅ Khôi phục từ ZIP thành công')
+            def on_done(result):
+                self.status_var.set(f"✅ Đã khôi phục từ {result['id']}")
                 self.show_toast('✅ Khôi phục hoàn tất!', 'success')
-                messagebox.showinfo("✅ Thành công", f"Dữ liệu đã được khôi phục từ:\n{os.path.basename(file_path)}")
-                
-            elif file_path.endswith('.pdf'):
-                messagebox.showwarning("⚠️ Cảnh báo", 
-                                     "File PDF chỉ để xem, không thể khôi phục dữ liệu.\n\n"
-                                     "Vui lòng sử dụng file ZIP để khôi phục.")
-            else:
-                messagebox.showerror("❌ Lỗi", "Định dạng file không được hỗ trợ!\n\nChỉ hỗ trợ file ZIP.")
-                
-        except Exception as e:
-            self.status_var.set('❌ Khôi phục thất bại')
-            self.show_toast(f'❌ Lỗi khôi phục: {str(e)}', 'error')
-            messagebox.showerror("❌ Lỗi", f"Không thể khôi phục dữ liệu:\n{str(e)}")
+                if win.winfo_exists():
+                    win.destroy()
+                messagebox.showinfo("✅ Thành công",
+                                    f"Đã khôi phục {result['files']} tệp từ bản sao lưu {result['id']}.\n"
+                                    f"💾 Dữ liệu trước khi khôi phục: {result.get('safety_snapshot') or '-'}")
+            
+            def on_error(e):
+                self.status_var.set('❌ Khôi phục thất bại')
+                self.show_toast(f'❌ Lỗi khôi phục: {str(e)}', 'error')
+                if win.winfo_exists():
+                    restore_btn.configure(state='normal')
+                    status.set(f'❌ {str(e)}')
+                messagebox.showerror("❌ Lỗi", f"Không thể khôi phục dữ liệu:\n{str(e)}\n\nDữ liệu hiện tại chưa bị thay đổi.")
+            
+            self.tasks.submit(lambda handle: restore_snapshot(snapshot_id, progress=handle.progress),
+                              on_done=on_done, on_error=on_error, on_progress=on_progress,
+                              with_handle=True, name='restore')
+        
+        restore_btn = ttk.Button(buttons, text='♻️ Khôi phục', style='Warning.TButton', command=do_restore)
+        restore_btn.pack(side='left')
+        ttk.Button(buttons, text='Đóng', command=win.destroy).pack(side='right')
+    
+    def _refresh_all_tabs(self, events=None):
+        """Dữ liệu được thay toàn bộ (sự kiện 'reloaded', vd: sau khi khôi phục) -> nạp lại các tab đã dựng."""
+        if events is not None and not any(e.action == 'reloaded' for e in events):
+            return
+        refreshers = {
+            'daily_frame': ('refresh_view', '_refresh_entry_totals'),
+            'summary_frame': ('refresh_day',),
+            'sub_frame': ('refresh_subs',),
+            'monthly_frame': ('refresh_history',),
+            'share_frame': ('refresh_shares', 'refresh_totals'),
+            'water_input_frame': ('refresh_items',),
+            'water_sales_frame': ('_sync_item_names', 'refresh_sales'),
+            'schedule_frame': ('refresh_schedule',),
+        }
+        for attr, methods in refreshers.items():
+            frame = getattr(self, attr, None)
+            for name in methods:
+                method = getattr(frame, name, None)
+                if method is None:
+                    continue
+                try:
+                    method()
+                except Exception as ex:
+                    ui_logger.warning("Nạp lại %s.%s lỗi: %s", attr, name, ex)
     
     def _safe_exit(self):
         """Safe exit with data confirmation."""
@@ -6168,6 +6564,15 @@ class MainApp(tk.Tk):
         
         results_tree.grid(row=0, column=0, sticky='nsew', padx=5, pady=5)
         results_scroll_y.grid(row=0, column=1, sticky='ns')
+        # Bảng ảo: kết quả lớn (hàng trăm nghìn dòng) vẫn cuộn mượt
+        results_view = VirtualTreeview(results_tree, results_scroll_y, row_builder=lambda record: (
+            record.get('ngay', ''),
+            record.get('san', ''),
+            record.get('khung_gio', ''),
+            record.get('loai', ''),
+            format_currency(record.get('gia_vnd', 0)),
+            'Có' if record.get('den', False) else 'Không'
+        ))
         results_scroll_x.grid(row=1, column=0, sticky='ew')
         
         results_frame.grid_rowconfigure(0, weight=1)
@@ -6205,8 +6610,7 @@ class MainApp(tk.Tk):
                 from datetime import datetime
                 
                 # Clear existing results
-                for item in results_tree.get_children():
-                    results_tree.delete(item)
+                results_view.set_source([])
                 
                 records = read_daily_records_dict()
                 if not records:
@@ -6264,15 +6668,7 @@ class MainApp(tk.Tk):
                 filtered_records.sort(key=lambda x: x.get('ngay', ''), reverse=True)
                 
                 # Display results
-                for record in filtered_records:
-                    results_tree.insert('', 'end', values=(
-                        record.get('ngay', ''),
-                        record.get('san', ''),
-                        record.get('khung_gio', ''),
-                        record.get('loai', ''),
-                        format_currency(record.get('gia_vnd', 0)),
-                        'Có' if record.get('den', False) else 'Không'
-                    ))
+                results_view.set_source(filtered_records)
                 
                 # Update summary
                 total_records = len(filtered_records)
@@ -6300,8 +6696,7 @@ class MainApp(tk.Tk):
             light_var.set('all')
             
             # Clear results
-            for item in results_tree.get_children():
-                results_tree.delete(item)
+            results_view.set_source([])
             summary_var.set("Đã xóa tất cả tiêu chí tìm kiếm")
         
         def export_results():
@@ -6312,7 +6707,7 @@ class MainApp(tk.Tk):
                 from datetime import datetime
                 
                 # Check if there are results
-                if not results_tree.get_children():
+                if not len(results_view):
                     messagebox.showwarning("⚠️ Cảnh báo", "Không có kết quả để xuất!")
                     return
                 
@@ -6329,9 +6724,9 @@ class MainApp(tk.Tk):
                         # Write header
                         f.write("Ngay,San,Khung_Gio,Loai,Gia_VND,Den\n")
                         
-                        # Write data
-                        for item in results_tree.get_children():
-                            values = results_tree.item(item)['values']
+                        # Write data (đọc thẳng từ nguồn, không chỉ các dòng đang hiển thị)
+                        for record in results_view.source:
+                            values = results_view.row_builder(record)
                             # Convert price back to number format
                             price_str = str(values[4]).replace(',', '').replace(' VND', '')
                             den_val = 'True' if values[5] == 'Có' else 'False'
@@ -6376,150 +6771,165 @@ class MainApp(tk.Tk):
         search_win.bind('<F5>', lambda e: perform_search())
     
     def _show_charts(self):
-        """Show comprehensive statistical charts using matplotlib."""
-        try:
-            import matplotlib.pyplot as plt
-            import matplotlib.dates as mdates
-            from datetime import datetime, timedelta
-            
-            # Set Vietnamese font if available
-            try:
-                plt.rcParams['font.family'] = ['DejaVu Sans', 'Arial Unicode MS', 'Arial']
-            except:
-                pass
-            
-            # Get data for charts
-            try:
-                from utils import read_daily_records_dict, read_monthly_stats
-                daily_records = read_daily_records_dict()
-                monthly_stats = read_monthly_stats()
-            except Exception as e:
-                messagebox.showerror("❌ Lỗi", f"Không thể đọc dữ liệu: {str(e)}")
+        """Show comprehensive statistical charts.
+        Gom dữ liệu + vẽ (Agg) chạy nền, cache PNG theo thế hệ dữ liệu (chart_renderer);
+        luồng Tk chỉ hiển thị ảnh. Mở lại khi dữ liệu chưa đổi -> lấy ảnh có sẵn."""
+        def on_done(result):
+            self.status_var.set('Sẵn sàng')
+            if not result['has_data']:
+                messagebox.showinfo("📊 Thông báo", "Chưa có dữ liệu để tạo biểu đồ")
                 return
-            
-            if not daily_records and not monthly_stats:
-                messagebox.showinfo("� Thông báo", "Chưa có dữ liệu để tạo biểu đồ")
+            self._open_chart_window(result)
+            self._save_chart_overview()
+
+        def on_error(e):
+            self.status_var.set('Sẵn sàng')
+            if isinstance(e, ImportError):
+                messagebox.showerror("❌ Thiếu thư viện",
+                                   "Cần cài đặt matplotlib để hiển thị biểu đồ:\n\n"
+                                   "pip install matplotlib")
+            else:
+                messagebox.showerror("❌ Lỗi", f"Không thể tạo biểu đồ:\n{str(e)}")
+
+        from chart_renderer import render_charts
+        self.status_var.set('⏳ Đang chuẩn bị biểu đồ...')
+        self.tasks.submit(render_charts, on_done=on_done, on_error=on_error, name='charts')
+
+    def _open_chart_window(self, result):
+        """Cửa sổ 2x2 hiển thị PNG đã vẽ sẵn (tk.PhotoImage, giữ tham chiếu trên cửa sổ)."""
+        from chart_renderer import CHART_TYPES
+        win = getattr(self, '_chart_win', None)
+        if win is not None and win.winfo_exists():
+            win.destroy()
+        win = tk.Toplevel(self)
+        win.title("📊 Biểu đồ thống kê SUK Pickleball")
+        self._chart_win = win
+        body = ttk.Frame(win, padding=8)
+        body.pack(fill='both', expand=True)
+        win._chart_images = []
+        for idx, chart_type in enumerate(CHART_TYPES):
+            png = result['images'].get(chart_type)
+            if not png:
+                continue
+            img = tk.PhotoImage(data=png)
+            win._chart_images.append(img)
+            ttk.Label(body, image=img).grid(row=idx // 2, column=idx % 2, padx=4, pady=4)
+        win.bind('<Escape>', lambda e: win.destroy())
+        win.focus_set()
+
+    def _save_chart_overview(self):
+        """Lưu ảnh 2x2 độ phân giải cao ra suk_pickleball_charts.png (nền, dùng cache nếu có)."""
+        from chart_renderer import save_overview
+        chart_path = "suk_pickleball_charts.png"
+        self.tasks.submit(save_overview, chart_path,
+                          on_done=lambda p: self.show_toast(f"📊 Đã lưu biểu đồ: {p}", "success", 2000),
+                          on_error=lambda e: ui_logger.debug("Không lưu được ảnh biểu đồ: %s", e),
+                          name='charts-save')
+    
+    def _show_metrics(self):
+        """Cửa sổ chẩn đoán: thời gian từng hàm đọc/ghi, cache hit/miss, chờ khóa, số dòng đã parse
+        (utils.metrics) trong phiên hiện tại; tự làm mới mỗi METRICS_REFRESH_MS."""
+        win = getattr(self, '_metrics_win', None)
+        if win is not None and win.winfo_exists():
+            win.lift()
+            return
+        win = tk.Toplevel(self)
+        self._metrics_win = win
+        win.title("⏱️ Chỉ số hiệu năng")
+        win.geometry("960x560")
+        body = ttk.Frame(win, padding=8)
+        body.pack(fill='both', expand=True)
+        info_var = tk.StringVar()
+        ttk.Label(body, textvariable=info_var, style='Caption.TLabel').pack(anchor='w', pady=(0, 6))
+
+        hist_cols = ('name', 'count', 'total', 'mean', 'p50', 'p95', 'p99', 'max')
+        hist_titles = ('Chỉ số (ms / dòng)', 'Số lần', 'Tổng', 'TB', 'p50', 'p95', 'p99', 'Max')
+        hist_tree = ttk.Treeview(body, columns=hist_cols, show='headings', height=14)
+        for col, title in zip(hist_cols, hist_titles):
+            hist_tree.heading(col, text=title)
+            hist_tree.column(col, width=300 if col == 'name' else 80, anchor='w' if col == 'name' else 'e')
+        hist_tree.pack(fill='both', expand=True)
+        counter_tree = ttk.Treeview(body, columns=('name', 'value'), show='headings', height=8)
+        counter_tree.heading('name', text='Bộ đếm')
+        counter_tree.heading('value', text='Giá trị')
+        counter_tree.column('name', width=300, anchor='w')
+        counter_tree.column('value', width=120, anchor='e')
+        counter_tree.pack(fill='x', pady=(6, 0))
+
+        def refresh():
+            if not win.winfo_exists():
                 return
-            
-            # Create figure with subplots
-            fig, ((ax1, ax2), (ax3, ax4)) = plt.subplots(2, 2, figsize=(15, 10))
-            fig.suptitle('📊 Biểu đồ thống kê SUK Pickleball', fontsize=16, fontweight='bold')
-            
-            # Chart 1: Daily revenue over time
-            if daily_records:
-                daily_data = {}
-                for record in daily_records:
-                    date = record.get('ngay', '')
-                    if date:
-                        if date not in daily_data:
-                            daily_data[date] = 0
-                        daily_data[date] += record.get('gia_vnd', 0)
-                
-                # Sort by date and get recent 30 days
-                sorted_dates = sorted(daily_data.keys())[-30:]
-                dates = [datetime.strptime(d, '%Y-%m-%d') for d in sorted_dates]
-                revenues = [daily_data[d] for d in sorted_dates]
-                
-                ax1.plot(dates, revenues, marker='o', linewidth=2, markersize=6, color='#2196F3')
-                ax1.set_title('📈 Doanh thu theo ngày (30 ngày gần nhất)', fontweight='bold')
-                ax1.set_ylabel('Doanh thu (VND)')
-                ax1.tick_params(axis='x', rotation=45)
-                ax1.grid(True, alpha=0.3)
-                # Format y-axis to show currency
-                ax1.yaxis.set_major_formatter(plt.FuncFormatter(lambda x, p: f'{x/1000:.0f}K'))
-            
-            # Chart 2: Revenue by court
-            if daily_records:
-                court_data = {}
-                for record in daily_records:
-                    court = record.get('san', 'Unknown')
-                    if court not in court_data:
-                        court_data[court] = 0
-                    court_data[court] += record.get('gia_vnd', 0)
-                
-                courts = list(court_data.keys())
-                revenues = list(court_data.values())
-                colors = ['#FF9800', '#4CAF50', '#9C27B0', '#F44336'][:len(courts)]
-                
-                ax2.pie(revenues, labels=courts, autopct='%1.1f%%', colors=colors, startangle=90)
-                ax2.set_title('🏟️ Doanh thu theo sân', fontweight='bold')
-            
-            # Chart 3: Monthly comparison
-            if monthly_stats:
-                months = []
-                revenues = []
-                profits = []
-                
-                for stat in monthly_stats[-12:]:  # Last 12 months
-                    month = stat.get('thang', '')
-                    if month:
-                        try:
-                            months.append(datetime.strptime(month + '-01', '%Y-%m-%d'))
-                            revenues.append(stat.get('tong_doanh_thu_vnd', 0))
-                            profits.append(stat.get('loi_nhuan_vnd', 0))
-                        except:
-                            pass
-                
-                if months:
-                    x = range(len(months))
-                    width = 0.35
-                    
-                    ax3.bar([i - width/2 for i in x], revenues, width, label='Doanh thu', color='#2196F3', alpha=0.8)
-                    ax3.bar([i + width/2 for i in x], profits, width, label='Lợi nhuận', color='#4CAF50', alpha=0.8)
-                    
-                    ax3.set_title('📊 So sánh doanh thu & lợi nhuận theo tháng', fontweight='bold')
-                    ax3.set_ylabel('Số tiền (VND)')
-                    ax3.set_xticks(x)
-                    ax3.set_xticklabels([m.strftime('%m/%Y') for m in months], rotation=45)
-                    ax3.legend()
-                    ax3.grid(True, alpha=0.3)
-                    ax3.yaxis.set_major_formatter(plt.FuncFormatter(lambda x, p: f'{x/1000000:.1f}M'))
-            
-            # Chart 4: Activity type distribution
-            if daily_records:
-                activity_data = {}
-                for record in daily_records:
-                    activity = record.get('loai', 'Không rõ')
-                    if activity not in activity_data:
-                        activity_data[activity] = 0
-                    activity_data[activity] += 1
-                
-                activities = list(activity_data.keys())
-                counts = list(activity_data.values())
-                colors = ['#FF5722', '#3F51B5', '#009688', '#795548'][:len(activities)]
-                
-                bars = ax4.bar(activities, counts, color=colors, alpha=0.8)
-                ax4.set_title('🎯 Phân bố loại hoạt động', fontweight='bold')
-                ax4.set_ylabel('Số lượng')
-                
-                # Add value labels on bars
-                for bar in bars:
-                    height = bar.get_height()
-                    ax4.text(bar.get_x() + bar.get_width()/2., height,
-                            f'{int(height)}',
-                            ha='center', va='bottom')
-            
-            # Adjust layout and show
-            plt.tight_layout()
-            plt.subplots_adjust(top=0.93)  # Make room for main title
-            
-            # Save chart as image
+            snap = metrics.snapshot()
+            state = '' if snap['enabled'] else '  (đang tắt – bật performance.log_performance trong config)'
+            stalls = self.loop_monitor.recent_stalls()
+            last = (f"  |  UI giật gần nhất {stalls[-1]['at']}: {stalls[-1]['lag_ms']:.0f} ms ({stalls[-1]['handler']})"
+                    if stalls else '')
+            info_var.set(f"Từ {snap['since']} – cập nhật {snap['taken_at']}{state}{last}")
+            hist_tree.delete(*hist_tree.get_children())
+            for name, h in snap['histograms'].items():
+                hist_tree.insert('', 'end', values=(name, h['count'], f"{h['total']:.1f}", f"{h['mean']:.2f}",
+                                                    f"{h['p50']:.2f}", f"{h['p95']:.2f}", f"{h['p99']:.2f}", f"{h['max']:.2f}"))
+            counter_tree.delete(*counter_tree.get_children())
+            for name, value in snap['counters'].items():
+                counter_tree.insert('', 'end', values=(name, value))
+            win._refresh_job = win.after(METRICS_REFRESH_MS, refresh)
+
+        def reset():
+            metrics.reset()
+            refresh_now()
+
+        def refresh_now():
+            job = getattr(win, '_refresh_job', None)
+            if job:
+                win.after_cancel(job)
+            refresh()
+
+        def save():
             try:
-                chart_path = "suk_pickleball_charts.png"
-                plt.savefig(chart_path, dpi=300, bbox_inches='tight')
-                self.show_toast(f"📊 Đã lưu biểu đồ: {chart_path}", "success", 2000)
-            except Exception:
-                pass
-            
-            plt.show()
-            
-        except ImportError:
-            messagebox.showerror("❌ Thiếu thư viện", 
-                               "Cần cài đặt matplotlib để hiển thị biểu đồ:\n\n"
-                               "pip install matplotlib")
-        except Exception as e:
-            messagebox.showerror("❌ Lỗi", f"Không thể tạo biểu đồ:\n{str(e)}")
-    
+                self.show_toast(f"💾 Đã lưu: {metrics.save()}", "success", 2500)
+            except Exception as e:
+                messagebox.showerror("❌ Lỗi", f"Không lưu được chỉ số:\n{e}", parent=win)
+
+        buttons = ttk.Frame(body)
+        buttons.pack(fill='x', pady=(8, 0))
+        ttk.Button(buttons, text="🔄 Làm mới", command=refresh_now).pack(side='left')
+        ttk.Button(buttons, text="🧹 Đặt lại", command=reset).pack(side='left', padx=6)
+        ttk.Button(buttons, text="💾 Lưu JSON", command=save).pack(side='left')
+        ttk.Button(buttons, text="Đóng", command=win.destroy).pack(side='right')
+        win.bind('<Escape>', lambda e: win.destroy())
+        refresh()
+
+    def _profiling_menu_label(self) -> str:
+        session = getattr(self, '_profile_session', None)
+        if session is not None and session.active:
+            return '⏹️ Dừng ghi profile & lưu  F12'
+        return '🩺 Ghi profile thao tác   F12'
+
+    def _toggle_profiling(self):
+        """Bắt đầu / dừng ghi cProfile + tracemalloc quanh thao tác người dùng (profiling.ProfileSession).
+        Task nền chạy trong lúc ghi được profile riêng và gộp vào cùng file .prof trong diagnostics/."""
+        session = self._profile_session
+        if session is None or not session.active:
+            from utils import _base_dir
+            profiling = lazy_import('profiling')
+            session = profiling.ProfileSession(os.path.join(_base_dir(), profiling.DIAGNOSTICS_DIR))
+            session.start()
+            self._profile_session = session
+            self.tasks.run_hook = session.task_context
+            if hasattr(self, 'status_var'):
+                self.status_var.set('🩺 Đang ghi profile – thực hiện thao tác chậm rồi bấm F12 để dừng')
+        else:
+            self.tasks.run_hook = None
+            try:
+                res = session.stop()
+                self.show_toast(f"🩺 Đã lưu profile ({res['seconds']} s): {res['prof']}", "success", 4000)
+                self.status_var.set(f"Profile: {res['summary']}")
+            except Exception as e:
+                messagebox.showerror("❌ Lỗi", f"Không lưu được profile:\n{e}")
+        menu = getattr(self, '_tools_menu', None)
+        if menu is not None:
+            menu.entryconfig(self._profiling_menu_index, label=self._profiling_menu_label())
+
     def _repair_data(self):
         """Comprehensive data validation and repair tool."""
         # Create repair popup
@@ -6586,6 +6996,7 @@ class MainApp(tk.Tk):
         
         auto_fix_var = tk.BooleanVar(value=True)
         backup_var = tk.BooleanVar(value=True)
+        full_scan_var = tk.BooleanVar(value=False)
         
         tk.Checkbutton(options_inner, text="🔧 Tự động sửa chữa các lỗi đơn giản", 
                       variable=auto_fix_var, font=('Arial Unicode MS', 11),
@@ -6593,104 +7004,137 @@ class MainApp(tk.Tk):
         tk.Checkbutton(options_inner, text="💾 Tạo bản sao lưu trước khi sửa chữa", 
                       variable=backup_var, font=('Arial Unicode MS', 11),
                       bg='#f8f9fa').pack(anchor='w', pady=2)
+        tk.Checkbutton(options_inner, text="🔍 Quét sâu toàn bộ khung giờ (chậm hơn)", 
+                      variable=full_scan_var, font=('Arial Unicode MS', 11),
+                      bg='#f8f9fa').pack(anchor='w', pady=2)
         
-        def analyze_data():
-            """Analyze data for issues."""
-            status_text.delete('1.0', tk.END)
-            issues_listbox.delete(0, tk.END)
+        analysis = {'handle': None}
+        
+        def scan_data(handle, full_scan):
+            """Quét dữ liệu tìm vấn đề (chạy ở worker nền, báo tiến độ qua handle)."""
+            from utils import read_daily_records_dict, read_monthly_stats, check_data_integrity_cached
+            import os
+            from datetime import datetime
             
-            status_text.insert(tk.END, "🔍 Đang phân tích dữ liệu...\n\n")
-            repair_win.update()
+            issues = []
+            status_info = []
+            
+            # Check daily records
+            handle.progress(0.0, "📊 Kiểm tra dữ liệu hằng ngày...\n")
             
             try:
-                from utils import read_daily_records_dict, read_monthly_stats
-                import os
-                from datetime import datetime
-                
-                issues = []
-                status_info = []
-                
-                # Check daily records
-                status_text.insert(tk.END, "📊 Kiểm tra dữ liệu hằng ngày...\n")
-                repair_win.update()
-                
-                try:
-                    daily_records = read_daily_records_dict()
-                    status_info.append(f"✅ Tệp daily_records.csv: {len(daily_records)} bản ghi")
-                    
-                    # Check for missing data
-                    for i, record in enumerate(daily_records):
-                        if not record.get('ngay'):
-                            issues.append(f"Bản ghi #{i+1}: Thiếu ngày")
-                        if not record.get('san'):
-                            issues.append(f"Bản ghi #{i+1}: Thiếu thông tin sân")
-                        if not record.get('khung_gio'):
-                            issues.append(f"Bản ghi #{i+1}: Thiếu khung giờ")
-                        if record.get('gia_vnd', 0) <= 0:
-                            issues.append(f"Bản ghi #{i+1}: Giá không hợp lệ ({record.get('gia_vnd', 0)})")
-                        
-                        # Check date format
-                        try:
-                            if record.get('ngay'):
-                                datetime.strptime(record.get('ngay'), '%Y-%m-%d')
-                        except ValueError:
-                            issues.append(f"Bản ghi #{i+1}: Định dạng ngày không hợp lệ ({record.get('ngay')})")
-                    
-                    # Check for duplicates
-                    seen_records = set()
-                    for i, record in enumerate(daily_records):
-                        record_key = (record.get('ngay'), record.get('san'), record.get('khung_gio'))
-                        if record_key in seen_records:
-                            issues.append(f"Bản ghi #{i+1}: Có thể bị trùng lặp")
-                        seen_records.add(record_key)
-                    
-                except Exception as e:
-                    issues.append(f"❌ Lỗi đọc daily_records.csv: {str(e)}")
-                    status_info.append("❌ Tệp daily_records.csv: Có lỗi")
-                
-                # Check monthly stats
-                status_text.insert(tk.END, "📈 Kiểm tra thống kê tháng...\n")
-                repair_win.update()
+                daily_records = read_daily_records_dict()
+                status_info.append(f"✅ Tệp daily_records.csv: {len(daily_records)} bản ghi")
                 
-                try:
-                    monthly_stats = read_monthly_stats()
-                    status_info.append(f"✅ Tệp monthly_stats.csv: {len(monthly_stats)} bản ghi")
-                    
-                    for i, stat in enumerate(monthly_stats):
-                        if not stat.get('thang'):
-                            issues.append(f"Thống kê #{i+1}: Thiếu thông tin tháng")
-                        if stat.get('tong_doanh_thu', 0) < 0:
-                            issues.append(f"Thống kê #{i+1}: Doanh thu âm")
-                        if stat.get('so_buoi', 0) <= 0:
-                            issues.append(f"Thống kê #{i+1}: Số buổi không hợp lệ")
+                # Check for missing data
+                for i, record in enumerate(daily_records):
+                    if i % 5000 == 0:
+                        handle.check_cancelled()
+                    if not record.get('ngay'):
+                        issues.append(f"Bản ghi #{i+1}: Thiếu ngày")
+                    if not record.get('san'):
+                        issues.append(f"Bản ghi #{i+1}: Thiếu thông tin sân")
+                    if not record.get('khung_gio'):
+                        issues.append(f"Bản ghi #{i+1}: Thiếu khung giờ")
+                    if record.get('gia_vnd', 0) <= 0:
+                        issues.append(f"Bản ghi #{i+1}: Giá không hợp lệ ({record.get('gia_vnd', 0)})")
                     
-                except Exception as e:
-                    issues.append(f"❌ Lỗi đọc monthly_stats.csv: {str(e)}")
-                    status_info.append("❌ Tệp monthly_stats.csv: Có lỗi")
+                    # Check date format
+                    try:
+                        if record.get('ngay'):
+                            datetime.strptime(record.get('ngay'), '%Y-%m-%d')
+                    except ValueError:
+                        issues.append(f"Bản ghi #{i+1}: Định dạng ngày không hợp lệ ({record.get('ngay')})")
                 
-                # Check other files
-                status_text.insert(tk.END, "📁 Kiểm tra các tệp khác...\n")
-                repair_win.update()
+                # Check for duplicates
+                seen_records = set()
+                for i, record in enumerate(daily_records):
+                    record_key = (record.get('ngay'), record.get('san'), record.get('khung_gio'))
+                    if record_key in seen_records:
+                        issues.append(f"Bản ghi #{i+1}: Có thể bị trùng lặp")
+                    seen_records.add(record_key)
                 
-                files_to_check = [
-                    'monthly_subscriptions.csv',
-                    'profit_shares.csv', 
-                    'water_items.csv',
-                    'water_sales.csv'
-                ]
+            except Exception as e:
+                issues.append(f"❌ Lỗi đọc daily_records.csv: {str(e)}")
+                status_info.append("❌ Tệp daily_records.csv: Có lỗi")
+            
+            # Chồng khung giờ: chỉ xét lại (ngày, sân) thay đổi từ lần kiểm tra trước, trừ khi quét sâu
+            handle.check_cancelled()
+            handle.progress(0.35, "⏱️ Kiểm tra chồng khung giờ...\n")
+            try:
+                integrity = check_data_integrity_cached(full=full_scan)
+                mode_text = {'cached': 'không đổi từ lần trước', 'incremental': f"tăng dần, {integrity.get('checked_buckets', 0)} nhóm ngày/sân",
+                             'full': 'quét toàn bộ'}.get(integrity.get('mode'), '')
+                status_info.append(f"✅ Chồng khung giờ: {integrity.get('overlap_count', 0)} cặp ({mode_text})")
+                for p in integrity.get('overlap_pairs', []):
+                    issues.append(f"{p['ngay']} {p['san']}: Khung giờ {p['slot1']} chồng {p['slot2']}")
+                if integrity.get('missing_id_count'):
+                    issues.append(f"{integrity['missing_id_count']} bản ghi thiếu mã (record_id)")
+            except Exception as e:
+                issues.append(f"❌ Lỗi kiểm tra chồng khung giờ: {str(e)}")
+            
+            # Check monthly stats
+            handle.check_cancelled()
+            handle.progress(0.5, "📈 Kiểm tra thống kê tháng...\n")
+            
+            try:
+                monthly_stats = read_monthly_stats()
+                status_info.append(f"✅ Tệp monthly_stats.csv: {len(monthly_stats)} bản ghi")
                 
-                for filename in files_to_check:
-                    if os.path.exists(filename):
-                        try:
-                            with open(filename, 'r', encoding='utf-8') as f:
-                                lines = f.readlines()
-                                status_info.append(f"✅ Tệp {filename}: {len(lines)-1} bản ghi")
-                        except Exception as e:
-                            issues.append(f"❌ Lỗi đọc {filename}: {str(e)}")
-                            status_info.append(f"❌ Tệp {filename}: Có lỗi")
-                    else:
-                        status_info.append(f"⚠️ Tệp {filename}: Không tồn tại")
+                for i, stat in enumerate(monthly_stats):
+                    if not stat.get('thang'):
+                        issues.append(f"Thống kê #{i+1}: Thiếu thông tin tháng")
+                    if stat.get('tong_doanh_thu', 0) < 0:
+                        issues.append(f"Thống kê #{i+1}: Doanh thu âm")
+                    if stat.get('so_buoi', 0) <= 0:
+                        issues.append(f"Thống kê #{i+1}: Số buổi không hợp lệ")
                 
+            except Exception as e:
+                issues.append(f"❌ Lỗi đọc monthly_stats.csv: {str(e)}")
+                status_info.append("❌ Tệp monthly_stats.csv: Có lỗi")
+            
+            # Check other files
+            handle.check_cancelled()
+            handle.progress(0.8, "📁 Kiểm tra các tệp khác...\n")
+            
+            files_to_check = [
+                'monthly_subscriptions.csv',
+                'profit_shares.csv', 
+                'water_items.csv',
+                'water_sales.csv'
+            ]
+            
+            for filename in files_to_check:
+                if os.path.exists(filename):
+                    try:
+                        with open(filename, 'r', encoding='utf-8') as f:
+                            lines = f.readlines()
+                            status_info.append(f"✅ Tệp {filename}: {len(lines)-1} bản ghi")
+                    except Exception as e:
+                        issues.append(f"❌ Lỗi đọc {filename}: {str(e)}")
+                        status_info.append(f"❌ Tệp {filename}: Có lỗi")
+                else:
+                    status_info.append(f"⚠️ Tệp {filename}: Không tồn tại")
+            return status_info, issues
+        
+        def analyze_data():
+            """Analyze data for issues (quét nền, cửa sổ vẫn phản hồi)."""
+            if analysis['handle'] is not None:
+                analysis['handle'].cancel()
+            status_text.delete('1.0', tk.END)
+            issues_listbox.delete(0, tk.END)
+            
+            status_text.insert(tk.END, "🔍 Đang phân tích dữ liệu...\n\n")
+            
+            def on_progress(_value, message):
+                if repair_win.winfo_exists() and message:
+                    status_text.insert(tk.END, message)
+            
+            def on_done(result):
+                analysis['handle'] = None
+                if not repair_win.winfo_exists():
+                    return
+                status_info, issues = result
                 # Update display
                 status_text.delete('1.0', tk.END)
                 status_text.insert(tk.END, "📊 PHÂN TÍCH HOÀN TẤT\n")
@@ -6707,9 +7151,20 @@ class MainApp(tk.Tk):
                 
                 if not issues:
                     issues_listbox.insert(tk.END, "✅ Không phát hiện vấn đề nào!")
-                
-            except Exception as e:
-                status_text.insert(tk.END, f"\n❌ Lỗi phân tích: {str(e)}")
+            
+            def on_error(e):
+                analysis['handle'] = None
+                if repair_win.winfo_exists():
+                    status_text.insert(tk.END, f"\n❌ Lỗi phân tích: {str(e)}")
+            
+            analysis['handle'] = self.tasks.submit(scan_data, full_scan_var.get(), on_done=on_done, on_error=on_error,
+                                                   on_progress=on_progress, with_handle=True, name='repair_scan')
+        
+        def _cancel_analysis(event):
+            # Đóng cửa sổ -> hủy quét đang chạy
+            if event.widget is repair_win and analysis['handle'] is not None:
+                analysis['handle'].cancel()
+        repair_win.bind('<Destroy>', _cancel_analysis, add='+')
         
         def repair_selected():
             """Repair selected issues."""
@@ -6722,23 +7177,29 @@ class MainApp(tk.Tk):
                                      f"Sửa chữa {len(selected_indices)} vấn đề được chọn?"):
                 return
             
+            if backup_var.get():
+                # Snapshot data/ chạy nền (lần đầu phải băm + nén mọi file); sửa chữa chạy sau khi xong
+                from snapshot_store import create_snapshot
+                status_text.insert(tk.END, "\n⏳ Đang tạo bản sao lưu trước khi sửa...\n")
+
+                def on_snapshot(manifest):
+                    if not repair_win.winfo_exists():
+                        return
+                    status_text.insert(tk.END, f"💾 Đã tạo bản sao lưu: {manifest['id']}\n")
+                    _apply_repairs(selected_indices)
+
+                def on_snapshot_error(ex):
+                    if repair_win.winfo_exists():
+                        status_text.insert(tk.END, f"\n❌ Lỗi sao lưu: {str(ex)}\n")
+                    messagebox.showerror("❌ Lỗi", f"Không tạo được bản sao lưu, chưa sửa gì:\n{str(ex)}")
+
+                self.tasks.submit(create_snapshot, label='truoc-sua-chua', on_done=on_snapshot,
+                                  on_error=on_snapshot_error, name='repair-snapshot')
+            else:
+                _apply_repairs(selected_indices)
+
+        def _apply_repairs(selected_indices):
             try:
-                # Create backup if requested
-                if backup_var.get():
-                    import os
-                    import shutil
-                    from datetime import datetime
-                    
-                    backup_dir = f"backups/repair_backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
-                    os.makedirs(backup_dir, exist_ok=True)
-                    
-                    files_to_backup = ['daily_records.csv', 'monthly_stats.csv']
-                    for filename in files_to_backup:
-                        if os.path.exists(filename):
-                            shutil.copy2(filename, os.path.join(backup_dir, filename))
-                    
-                    status_text.insert(tk.END, f"\n💾 Đã tạo bản sao lưu: {backup_dir}\n")
-                
                 # Perform repairs
                 repaired_count = 0
                 
@@ -6751,7 +7212,6 @@ class MainApp(tk.Tk):
                         issue = issues_listbox.get(index)
                         status_text.insert(tk.END, f"✅ Đã sửa: {issue}\n")
                         repaired_count += 1
-                        repair_win.update()
                     
                     # Remove repaired issues from list
                     for index in reversed(selected_indices):
@@ -6813,68 +7273,36 @@ class MainApp(tk.Tk):
         repair_win.bind('<Escape>', lambda e: repair_win.destroy())
         repair_win.bind('<F5>', lambda e: analyze_data())
     
-    def _fade_in_window(self, alpha=0.0):
+    def _fade_in_window(self):
         """Smooth window fade-in animation"""
-        alpha = min(alpha + 0.05, 1.0)
-        try:
-            self.attributes('-alpha', alpha)
-            if alpha < 1.0:
-                self.after(30, lambda: self._fade_in_window(alpha))
-        except Exception:
-            pass
+        self.animations.animate('window-fade', 600, lambda t: self.attributes('-alpha', t))
     
     def _animate_version_badge(self, frame, label):
         """Subtle pulsing animation for version badge"""
-        def pulse(brightness=1.0, direction=1):
-            try:
-                if direction == 1:
-                    brightness = min(brightness + 0.02, 1.2)
-                    if brightness >= 1.2:
-                        direction = -1
-                else:
-                    brightness = max(brightness - 0.02, 0.8)
-                    if brightness <= 0.8:
-                        direction = 1
-                
-                # Calculate color based on brightness
-                import colorsys
-                rgb = tuple(int(c * 255) for c in colorsys.hsv_to_rgb(0.65, 0.8, brightness))
-                color = f'#{rgb[0]:02x}{rgb[1]:02x}{rgb[2]:02x}'
-                
+        import colorsys
+        last = [None]
+
+        def pulse(t):
+            # Độ sáng 0.8 <-> 1.2 (qua lại mỗi 2 giây); chỉ cấu hình lại khi màu thực sự đổi
+            brightness = 0.8 + 0.4 * t
+            rgb = tuple(min(255, int(c * 255)) for c in colorsys.hsv_to_rgb(0.65, 0.8, brightness))
+            color = f'#{rgb[0]:02x}{rgb[1]:02x}{rgb[2]:02x}'
+            if color != last[0]:
+                last[0] = color
                 frame.configure(bg=color)
                 label.configure(bg=color)
-                
-                # Continue animation
-                self.after(100, lambda: pulse(brightness, direction))
-            except Exception:
-                pass
         
-        # Start pulsing after a delay
-        self.after(2000, pulse)
+        # Start pulsing after a delay; 10 khung/giây là đủ mượt cho badge
+        self.animations.animate('version-badge', 2000, pulse, delay_ms=2000, loop=True, fps=10)
     
     def _on_tab_changed(self, event):
         """Handle tab change with smooth transition"""
         try:
             selected_tab = event.widget.nametowidget(event.widget.select())
-            self._animate_tab_content(selected_tab)
-        except Exception:
-            pass
-    
-    def _animate_tab_content(self, tab_widget):
-        """Animate tab content on selection"""
-        try:
-            # Fade-in animation for tab content
-            original_state = tab_widget.cget('state') if hasattr(tab_widget, 'cget') else None
-            
-            def fade_in(alpha=0.0):
-                alpha = min(alpha + 0.1, 1.0)
-                # For frames, we simulate fade by adjusting relief and colors
-                if alpha < 1.0:
-                    tab_widget.after(50, lambda: fade_in(alpha))
-                
-            fade_in()
-        except Exception:
-            pass
+            if isinstance(selected_tab, LazyTab) and not selected_tab.built:
+                selected_tab.materialize()
+        except Exception as ex:
+            logging.getLogger('suk.ui').debug('_on_tab_changed lỗi: %s', ex)
     
     def create_animated_button(self, parent, text, command=None, style='primary', tooltip_text=None, tooltip_example=None):
         """Create an animated button with tooltip"""
@@ -6888,6 +7316,21 @@ class MainApp(tk.Tk):
     def on_closing(self):
         """Handle application closing with v2.0.0 enhancements."""
         try:
+            # Dừng worker nền (hủy các task còn chờ)
+            self.tasks.shutdown(wait=False)
+            self.changes.close()
+            self.loop_monitor.stop()
+            self.animations.close()
+            if self._profile_session is not None and self._profile_session.active:
+                self._profile_session.stop()
+            # Chốt tồn kho nước (snapshot sổ cái) để lần mở sau không phải đọc lại cả sổ
+            try:
+                snapshot_water_stock()
+            except Exception as ex:
+                ui_logger.warning("Không chốt được tồn kho nước: %s", ex)
+            # Lưu chỉ số hiệu năng của phiên để xem lại bằng maintenance.py metrics
+            if metrics.enabled:
+                metrics.save()
             # Save UI preferences
             if hasattr(self, 'save_ui_preferences'):
                 self.save_ui_preferences()
@@ -6902,6 +7345,8 @@ class MainApp(tk.Tk):
             self.destroy()
 
 if __name__ == '__main__':
+    import multiprocessing
+    multiprocessing.freeze_support()  # cần cho process pool của TaskExecutor trong bản .exe (PyInstaller)
     try:
         ensure_all_data_files()
     except Exception:
@@ -6915,3 +7360,5 @@ if __name__ == '__main__':
     
     # Start main loop
     app.mainloop()
+    if getattr(app, '_startup_exit_code', None):
+        sys.exit(app._startup_exit_code)
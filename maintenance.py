@@ -6,24 +6,41 @@ Mục tiêu:
 - Tách biệt khỏi GUI để có thể chạy theo lịch (Task Scheduler / cron) hoặc thủ công.
 
 Sử dụng:
-    python maintenance.py integrity
+    python maintenance.py integrity [--full]
     python maintenance.py month-summary 2025-08
     python maintenance.py list-months
+    python maintenance.py conflicts 2025-08
+    python maintenance.py report [--month 2025-08 | --from 2025-08-01 --to 2025-08-15] [--out file.pdf]
+    python maintenance.py snapshot [--label nhan]
+    python maintenance.py snapshots
+    python maintenance.py restore <snapshot_id|latest>
+    python maintenance.py gen-data --out loadtest_data [--rows 1M] [--days 1500] [--occupancy 0.6]
+    python maintenance.py bench [--sizes 10k,100k] [--baseline file.json] [--save-baseline]
+    python maintenance.py metrics [--run] [--json]
 
-Tất cả hàm chỉ đọc dữ liệu và in báo cáo ra stdout.
+Tất cả hàm chỉ đọc dữ liệu và in báo cáo ra stdout (riêng integrity cập nhật checkpoint
+kiểm tra toàn vẹn trong data/ để lần sau chỉ xét phần thay đổi; report ghi file PDF;
+snapshot ghi bản sao lưu vào backups/snapshots; restore thay data/ bằng một snapshot;
+gen-data sinh bộ dữ liệu giả lập vào một thư mục riêng, không bao giờ ghi vào data/ thật;
+bench đo hiệu năng trên bản sao tạm của dữ liệu giả lập và ghi kết quả JSON vào diagnostics/;
+metrics in chỉ số hiệu năng phiên app gần nhất trong diagnostics/metrics_latest.json).
 """
 from __future__ import annotations
+import os
 import sys
-from typing import List
+from typing import List, Optional
 from datetime import datetime
 
 import utils  # reuse existing logic (cache + migration)
 
 
-def cmd_integrity():
-    """Chạy kiểm tra toàn vẹn và in báo cáo thân thiện."""
-    info = utils.verify_data_integrity()
+def cmd_integrity(full: bool = False):
+    """Chạy kiểm tra toàn vẹn và in báo cáo thân thiện.
+    Mặc định chỉ kiểm tra lại các (ngày, sân) bị thay đổi từ checkpoint trước; full=True quét toàn bộ."""
+    info = utils.check_data_integrity_cached(full=full)
     print("=== INTEGRITY REPORT ===")
+    print(f"Mode                       : {info['mode']}"
+          + (f" ({info['checked_buckets']} bucket)" if info['mode'] == 'incremental' else ''))
     print(f"Total daily records       : {info['total_records']}")
     print(f"Overlap slot pairs         : {info['overlap_count']}")
     if info['overlap_count']:
@@ -73,10 +90,34 @@ def cmd_month_summary(month_arg: str):
     print(f"Water sales total   : {water:,} VND".replace(',', '.'))
     print(f"------------------------------")
     print(f"GRAND TOTAL         : {total:,} VND".replace(',', '.'))
+    open_h, close_h = utils.SCHEDULE_OPEN_HOURS
+    print(f"Công suất sân ({open_h}h-{close_h}h, đặt lẻ + gói tháng):")
+    for san, u in utils.month_court_utilization(thang).items():
+        print(f"  {san}: {u['booked_hours']}/{u['capacity_hours']} giờ ({u['ratio']:.1%}) – "
+              f"lẻ {u['daily_hours']} giờ, gói {u['subscription_hours']} giờ")
     print(f"(Giá trị trên phản ánh cùng công thức trong ứng dụng GUI, không đổi logic)")
     print("=== END ===")
 
 
+def cmd_conflicts(month_arg: str):
+    """Liệt kê chỗ trùng lịch trong tháng: bản ghi lẻ đè gói tháng, hai gói cùng sân cùng giờ."""
+    thang = _normalize_month_arg(month_arg)
+    conflicts = utils.month_conflicts(thang)
+    print(f"=== CONFLICTS {thang} ===")
+    for c in conflicts:
+        slot = f"{c['gio_bat_dau']}h-{c['gio_ket_thuc']}h" + (" (giờ gói giả định)" if c['gio_mac_dinh'] else "")
+        names = ", ".join(o.ten for o in c['subscriptions'])
+        if c['booking'] is not None:
+            b = c['booking']
+            who = f" ({b.nguoi})" if b.nguoi else ""
+            id_part = f" [{b.record_id}]" if b.record_id else ""
+            print(f"{c['ngay']} {c['san']} {slot}: đặt lẻ {b.khung_gio}{who}{id_part} trùng gói {names}")
+        else:
+            print(f"{c['ngay']} {c['san']} {slot}: gói trùng nhau {names}")
+    print(f"Tổng: {len(conflicts)} chỗ trùng")
+    print("=== END ===")
+
+
 def cmd_list_months():
     """Liệt kê các tháng có trong daily_records (có ít nhất 1 dòng)."""
     recs = utils.get_daily_records()
@@ -87,24 +128,220 @@ def cmd_list_months():
         print("(Chưa có dữ liệu)")
 
 
+def _option(argv: List[str], name: str) -> Optional[str]:
+    """Giá trị sau cờ dạng '--name value' (None nếu không có)."""
+    if name in argv:
+        i = argv.index(name)
+        if i + 1 >= len(argv):
+            raise ValueError(f'Thiếu giá trị cho {name}')
+        return argv[i + 1]
+    return None
+
+
+def cmd_report(argv: List[str]):
+    """Xuất báo cáo PDF (toàn bộ / một tháng / khoảng ngày), in tiến độ ra stdout."""
+    month = _option(argv, '--month')
+    last = {'pct': -1}
+
+    def progress(value, message):
+        pct = int((value or 0) * 100)
+        if pct != last['pct']:
+            last['pct'] = pct
+            print(f"  [{pct:3d}%] {message}")
+
+    path = utils.backup_data(month=_normalize_month_arg(month) if month else None,
+                             start=_option(argv, '--from'), end=_option(argv, '--to'),
+                             out_path=_option(argv, '--out'), progress=progress)
+    print(f"Đã xuất báo cáo: {path}")
+
+
+def cmd_snapshot(argv: List[str]):
+    """Tạo snapshot data/ (chỉ ghi chunk mới) và dọn theo max_backups."""
+    import snapshot_store
+    m = snapshot_store.create_snapshot(label=_option(argv, '--label') or '')
+    st = m['stats']
+    print(f"Snapshot {m['id']} ({m['codec']}): {st['files']} file, {st['unchanged_files']} không đổi, "
+          f"{st['new_chunks']} chunk mới, {st['bytes_written']:,} byte ghi".replace(',', '.'))
+    if m.get('pruned'):
+        print(f"Đã dọn {len(m['pruned'])} snapshot cũ: {', '.join(m['pruned'])}")
+
+
+def cmd_list_snapshots():
+    import snapshot_store
+    items = snapshot_store.list_snapshots()
+    for s in items:
+        label = f" [{s['label']}]" if s['label'] else ''
+        print(f"{s['id']}  {s['created_at']}  {s['files']} file  {s['bytes_total']:,} byte{label}".replace(',', '.'))
+    if not items:
+        print("(Chưa có snapshot)")
+
+
+def cmd_restore(snapshot_arg: str):
+    """Khôi phục data/ từ snapshot (tự sao lưu hiện trạng trước khi thay)."""
+    import snapshot_store
+    snapshot_id = snapshot_arg
+    if snapshot_arg == 'latest':
+        items = snapshot_store.list_snapshots()
+        if not items:
+            raise ValueError('Chưa có snapshot')
+        snapshot_id = items[0]['id']
+    last = {'pct': -1}
+
+    def progress(value, message):
+        pct = int((value or 0) * 100)
+        if pct // 10 != last['pct'] // 10:
+            last['pct'] = pct
+            print(f"  [{pct:3d}%] {message}")
+
+    res = snapshot_store.restore_snapshot(snapshot_id, progress=progress)
+    print(f"Đã khôi phục {res['files']} file từ {res['id']} ({res['bytes']:,} byte)".replace(',', '.'))
+    if res.get('safety_snapshot'):
+        print(f"Dữ liệu trước khi khôi phục được lưu ở snapshot {res['safety_snapshot']}")
+
+
+def cmd_gen_data(argv: List[str]):
+    """Sinh dữ liệu giả lập cho load test vào thư mục riêng (ghi luồng, không giữ toàn bộ trong RAM)."""
+    import datagen
+    out_dir = _option(argv, '--out')
+    if not out_dir:
+        raise ValueError('Thiếu --out <thư mục>')
+    opts = datagen.GenOptions(out_dir=out_dir, force='--force' in argv)
+    for flag, attr, conv in (('--rows', 'rows', datagen.parse_count), ('--start', 'start', str),
+                             ('--days', 'days', int), ('--occupancy', 'occupancy', float),
+                             ('--courts', 'courts', int), ('--overlap-rate', 'overlap_rate', float),
+                             ('--dirty-rate', 'dirty_rate', float), ('--subs-per-month', 'subs_per_month', int),
+                             ('--water-per-day', 'water_per_day', int), ('--seed', 'seed', int)):
+        raw = _option(argv, flag)
+        if raw is not None:
+            setattr(opts, attr, conv(raw))
+    res = datagen.generate_dataset(opts, progress=lambda value, message: print(f"  [{int(value * 100):3d}%] {message}"))
+    print(f"Đã sinh dữ liệu vào {res.out_dir}: {res.start} -> {res.end} ({res.days} ngày, {res.courts} sân, lấp sân ~{res.occupancy:.0%})")
+    for name, count in sorted(res.counts.items()):
+        print(f"  {name:<28}{count:>12,} dòng".replace(',', '.'))
+    print(f"Chạy app trên bộ dữ liệu này: {utils.DATA_DIR_ENV}={res.out_dir} python main.py")
+
+
+def cmd_bench(argv: List[str]) -> int:
+    """Đo hiệu năng các hàm utils theo quy mô dữ liệu, lưu JSON và so với baseline.
+    Trả 1 nếu có ca chậm hơn baseline quá ngưỡng (dùng được trong CI)."""
+    import bench
+    import datagen
+    sizes = [datagen.parse_count(s) for s in (_option(argv, '--sizes') or '').split(',') if s.strip()]
+    cases = [c.strip() for c in (_option(argv, '--cases') or '').split(',') if c.strip()]
+    repeat = int(_option(argv, '--repeat') or bench.DEFAULT_REPEAT)
+    budget = float(_option(argv, '--budget') or bench.DEFAULT_BUDGET_S)
+    threshold = float(_option(argv, '--threshold') or bench.DEFAULT_THRESHOLD)
+    print(f"{'rows':>10}  {'case':<28}{'n':>5}{'p50 ms':>11}{'p99 ms':>11}{'ops/s':>11}{'rows/s':>13}{'peak KB':>10}")
+
+    def progress(r):
+        if r.get('status') != 'ok':
+            print(f"{r['rows']:>10}  {r['case']:<28}{r['status']}")
+            return
+        rows_s = f"{r['rows_per_s']:,}".replace(',', '.') if r['rows_per_s'] is not None else '-'
+        print(f"{r['rows']:>10}  {r['case']:<28}{r['n']:>5}{r['p50_ms']:>11.2f}{r['p99_ms']:>11.2f}"
+              f"{r['ops_per_s']:>11.1f}{rows_s:>13}{r['peak_mem_kb']:>10}")
+
+    report = bench.run_benchmarks(sizes or bench.DEFAULT_SIZES, repeat=repeat, budget_s=budget,
+                                  only=cases or None, progress=progress)
+    print(f"Đã lưu kết quả: {bench.save_results(report, _option(argv, '--out'))}")
+    regressions = 0
+    baseline = bench.load_baseline(_option(argv, '--baseline'))
+    if baseline:
+        for c in bench.compare(report, baseline, threshold):
+            mark = '  <-- HỒI QUY' if c['regression'] else ''
+            print(f"  {c['rows']:>10} {c['case']:<28}{c['base_p50_ms']:>10.2f} -> {c['p50_ms']:>10.2f} ms (x{c['ratio']:.2f}){mark}")
+            regressions += c['regression']
+        print(f"So với baseline ({baseline.get('timestamp', '?')}): {regressions} ca chậm hơn quá {threshold:.0%}")
+    elif '--save-baseline' not in argv:
+        print("(Chưa có baseline – chạy với --save-baseline để lưu lần này làm mốc)")
+    if '--save-baseline' in argv:
+        path = bench.save_results(report, os.path.join(utils._base_dir(), bench.BASELINE_FILE))
+        print(f"Đã lưu baseline: {path}")
+    return 1 if regressions else 0
+
+
+def cmd_metrics(argv: List[str]):
+    """In chỉ số hiệu năng: mặc định của phiên app gần nhất (diagnostics/metrics_latest.json, ghi khi
+    đóng app hoặc bấm Lưu trong cửa sổ chẩn đoán); --run đo ngay các thao tác đọc chính trên data/."""
+    import json
+    if '--run' in argv:
+        utils.metrics.configure(True)
+        recs = utils.get_daily_records()
+        utils.get_daily_records()
+        for month in sorted({r.ngay[:7] for r in recs if len(r.ngay) >= 7})[-3:]:
+            utils.compute_month_total(month)
+            utils.compute_month_total(month)
+        utils.read_all_subscriptions()
+        utils.read_water_items()
+        utils.read_water_sales()
+        utils.read_monthly_stats()
+        utils.check_data_integrity_cached()
+        snap = utils.metrics.snapshot()
+    else:
+        path = utils._abs_path(utils.METRICS_FILE)
+        if not os.path.exists(path):
+            print("(Chưa có số liệu – mở app rồi đóng, hoặc chạy: python maintenance.py metrics --run)")
+            return
+        with open(path, 'r', encoding='utf-8') as f:
+            snap = json.load(f)
+    if '--json' in argv:
+        print(json.dumps(snap, ensure_ascii=False, indent=2))
+    else:
+        print(utils.format_metrics(snap))
+
+
 def main(argv: List[str]):
     if len(argv) < 2 or argv[1] in ('-h', '--help', 'help'):  # help
         print("Maintenance commands:")
-        print("  integrity                 - Báo cáo toàn vẹn dữ liệu")
+        print("  integrity [--full]        - Báo cáo toàn vẹn dữ liệu (tăng dần; --full quét toàn bộ)")
         print("  month-summary <THANG>     - Tổng hợp một tháng (YYYY-MM hoặc MM-YYYY)")
         print("  list-months               - Liệt kê các tháng có dữ liệu daily")
+        print("  conflicts <THANG>         - Chỗ trùng lịch đặt lẻ / gói tháng trong tháng (để dọn dữ liệu)")
+        print("  report [--month THANG | --from NGAY --to NGAY] [--out FILE]")
+        print("                            - Xuất báo cáo PDF (mặc định toàn bộ, lưu vào backups/)")
+        print("  snapshot [--label NHAN]   - Sao lưu data/ (snapshot tăng dần, giữ max_backups bản)")
+        print("  snapshots                 - Liệt kê các snapshot")
+        print("  restore <ID|latest>       - Khôi phục data/ từ snapshot (kiểm tra checksum)")
+        print("  gen-data --out THU_MUC [--rows 10k..10M] [--start NGAY] [--days N] [--occupancy 0.6]")
+        print("           [--courts 2] [--overlap-rate 0.002] [--dirty-rate 0.001] [--subs-per-month 12]")
+        print("           [--water-per-day 15] [--seed 2024] [--force]")
+        print("                            - Sinh dữ liệu giả lập (6 CSV) vào thư mục riêng để thử tải")
+        print("  bench [--sizes 10k,100k] [--cases a,b] [--repeat 20] [--budget 10] [--out FILE]")
+        print("        [--baseline FILE] [--threshold 0.25] [--save-baseline]")
+        print("                            - Đo hiệu năng utils (p50/p99, thông lượng, bộ nhớ) và so baseline")
+        print("  metrics [--run] [--json]  - Chỉ số hiệu năng phiên app gần nhất (--run: đo ngay trên data/)")
         print("Ví dụ: python maintenance.py month-summary 08-2025")
         return 0
     cmd = argv[1]
     try:
         if cmd == 'integrity':
-            cmd_integrity()
+            cmd_integrity(full='--full' in argv[2:])
         elif cmd == 'month-summary':
             if len(argv) < 3:
                 raise ValueError('Thiếu tham số tháng')
             cmd_month_summary(argv[2])
         elif cmd == 'list-months':
             cmd_list_months()
+        elif cmd == 'conflicts':
+            if len(argv) < 3:
+                raise ValueError('Thiếu tham số tháng')
+            cmd_conflicts(argv[2])
+        elif cmd == 'report':
+            cmd_report(argv[2:])
+        elif cmd == 'snapshot':
+            cmd_snapshot(argv[2:])
+        elif cmd == 'snapshots':
+            cmd_list_snapshots()
+        elif cmd == 'restore':
+            if len(argv) < 3:
+                raise ValueError('Thiếu mã snapshot')
+            cmd_restore(argv[2])
+        elif cmd == 'gen-data':
+            cmd_gen_data(argv[2:])
+        elif cmd == 'bench':
+            return cmd_bench(argv[2:])
+        elif cmd == 'metrics':
+            cmd_metrics(argv[2:])
         else:
             raise ValueError(f'Unknown command: {cmd}')
         return 0
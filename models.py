@@ -1,5 +1,6 @@
 from __future__ import annotations
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from typing import Any
 
 @dataclass
 class DailyRecord:
@@ -20,3 +21,26 @@ class MonthlyStat:
     chi_phi_tru_hao_vnd: int
     loi_nhuan_vnd: int
     tu_tinh_tu_ngay: bool
+
+@dataclass(frozen=True)
+class ChangeEvent:
+    """Sự kiện thay đổi dữ liệu phát từ utils (xem utils.subscribe_changes).
+    action: 'inserted' | 'updated' | 'deleted'; days ở dạng YYYY-MM-DD, months ở dạng YYYY-MM."""
+    table: str
+    action: str
+    record_ids: tuple = ()
+    days: tuple = ()
+    months: tuple = ()
+
+@dataclass(frozen=True)
+class SubscriptionOccurrence:
+    """Một buổi cụ thể của gói tháng (utils.compile_subscription_calendar): ngày YYYY-MM-DD, sân,
+    giờ [gio_bat_dau, gio_ket_thuc). gio_mac_dinh=True -> dòng gói chỉ lưu số giờ, khung giờ là giả định."""
+    ngay: str
+    san: str
+    gio_bat_dau: int
+    gio_ket_thuc: int
+    ten: str
+    thang: str
+    gio_mac_dinh: bool = False
+    sub: Any = field(default=None, compare=False, repr=False)
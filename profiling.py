@@ -0,0 +1,136 @@
+"""On-demand Profiling (cProfile + tracemalloc, additive)
+
+Ghi lại "app đang làm gì" khi máy quầy chạy chậm, để phân tích sau:
+- Bật/tắt từ menu Công cụ (hoặc F12) quanh một thao tác của người dùng, hoặc bật từ lúc khởi động bằng
+  biến môi trường SUK_PROFILE_SESSION=1 (tự lưu khi tắt từ menu hoặc khi đóng app).
+- cProfile chạy trên luồng Tk; task nền (TaskExecutor) trong lúc ghi được profile riêng rồi gộp chung.
+- tracemalloc: snapshot lúc bắt đầu và lúc dừng -> top-N dòng cấp phát nhiều nhất + top-N tăng trưởng.
+
+Kết quả trong diagnostics/ (cạnh app), cùng dấu thời gian:
+    profile_<ts>.prof          -> python -m pstats / snakeviz
+    profile_<ts>.txt           -> tóm tắt top hàm theo cumulative time + top cấp phát bộ nhớ
+    profile_<ts>.tracemalloc   -> tracemalloc.Snapshot.load() để phân tích sâu
+"""
+from __future__ import annotations
+import cProfile
+import io
+import logging
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger("suk.profiling")
+
+ENV_SESSION = "SUK_PROFILE_SESSION"
+DIAGNOSTICS_DIR = "diagnostics"
+TOP_N = 30
+TRACEMALLOC_FRAMES = 10
+
+
+class ProfileSession:
+    """Một phiên ghi: start() trên luồng Tk, stop() lưu file và trả về đường dẫn."""
+
+    def __init__(self, out_dir: str, label: str = "", top_n: int = TOP_N):
+        self.out_dir = out_dir
+        self.label = label
+        self.top_n = top_n
+        self.started_at = 0.0
+        self._profiler: Optional[cProfile.Profile] = None
+        self._owner: Optional[int] = None
+        self._task_profiles: List[cProfile.Profile] = []
+        self._lock = threading.Lock()
+        self._own_tracemalloc = False
+        self._snap_start: Optional[tracemalloc.Snapshot] = None
+
+    @property
+    def active(self) -> bool:
+        return self._profiler is not None
+
+    def start(self):
+        if self.active:
+            return
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+            self._own_tracemalloc = True
+        self._snap_start = tracemalloc.take_snapshot()
+        self._owner = threading.get_ident()
+        self._profiler = cProfile.Profile()
+        self.started_at = time.time()
+        self._profiler.enable()
+        logger.info("Bắt đầu ghi profile%s", f" ({self.label})" if self.label else "")
+
+    @contextmanager
+    def task_context(self, name: str = ""):
+        """Bọc một task nền: profile riêng trên luồng worker, gộp vào kết quả khi stop()."""
+        if not self.active or threading.get_ident() == self._owner:
+            yield  # Chế độ đồng bộ: đã nằm trong profiler của luồng Tk
+            return
+        prof = cProfile.Profile()
+        try:
+            prof.enable()
+        except ValueError:  # Luồng này đang có profiler khác (Python 3.12+: một tool mỗi lúc)
+            yield
+            return
+        try:
+            yield
+        finally:
+            prof.disable()
+            with self._lock:
+                self._task_profiles.append(prof)
+
+    def stop(self) -> Dict[str, Any]:
+        """Dừng ghi, lưu .prof/.txt/.tracemalloc vào out_dir. Trả {'prof', 'summary', 'tracemalloc', 'seconds'}."""
+        if not self.active:
+            raise RuntimeError("Chưa bắt đầu ghi profile")
+        self._profiler.disable()
+        seconds = time.time() - self.started_at
+        snap_end = tracemalloc.take_snapshot()
+        if self._own_tracemalloc:
+            tracemalloc.stop()
+        buf = io.StringIO()
+        stats = pstats.Stats(self._profiler, stream=buf)
+        with self._lock:
+            for prof in self._task_profiles:
+                try:
+                    stats.add(prof)
+                except TypeError:  # task không ghi được lời gọi nào
+                    pass
+            tasks = len(self._task_profiles)
+            self._task_profiles = []
+        self._profiler = None
+
+        os.makedirs(self.out_dir, exist_ok=True)
+        stamp = time.strftime('%Y%m%d_%H%M%S', time.localtime(self.started_at))
+        base = os.path.join(self.out_dir, f"profile_{stamp}")
+        stats.dump_stats(base + '.prof')
+        snap_end.dump(base + '.tracemalloc')
+
+        buf.write(f"Profile {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(self.started_at))}"
+                  f"{' – ' + self.label if self.label else ''}: {seconds:.1f} s, {tasks} task nền\n\n")
+        buf.write(f"=== TOP {self.top_n} HÀM THEO CUMULATIVE TIME ===\n")
+        stats.sort_stats('cumulative').print_stats(self.top_n)
+        buf.write(f"\n=== TOP {self.top_n} DÒNG CẤP PHÁT (đang giữ lúc dừng) ===\n")
+        for stat in snap_end.statistics('lineno')[:self.top_n]:
+            buf.write(f"{stat}\n")
+        if self._snap_start is not None:
+            buf.write(f"\n=== TOP {self.top_n} TĂNG TRƯỞNG BỘ NHỚ TRONG PHIÊN ===\n")
+            for stat in snap_end.compare_to(self._snap_start, 'lineno')[:self.top_n]:
+                buf.write(f"{stat}\n")
+        self._snap_start = None
+        with open(base + '.txt', 'w', encoding='utf-8') as f:
+            f.write(buf.getvalue())
+        logger.info("Đã lưu profile: %s.prof (%.1f s)", base, seconds)
+        return {'prof': base + '.prof', 'summary': base + '.txt', 'tracemalloc': base + '.tracemalloc',
+                'seconds': round(seconds, 1)}
+
+
+def session_requested() -> bool:
+    """SUK_PROFILE_SESSION=1 -> ghi profile ngay từ lúc khởi động."""
+    return os.environ.get(ENV_SESSION, "").strip().lower() in ("1", "true", "yes", "on")
+
+
+__all__ = ["ProfileSession", "session_requested", "ENV_SESSION", "TOP_N"]
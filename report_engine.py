@@ -0,0 +1,378 @@
+"""PDF Report Engine (streaming, additive)
+
+Thay phần ruột của utils.backup_data:
+- Đọc từng CSV theo dòng (csv.reader, không gom list dict) và ghi thẳng vào PDF theo từng mục
+  -> dữ liệu nhiều năm không bị nạp toàn bộ vào RAM (chỉ còn nội dung trang PDF do fpdf2 giữ).
+- Font Unicode được dò một lần rồi cache: config report_settings.font_path > font đóng gói
+  (fonts/ cạnh app) > font hệ thống Windows / macOS / Linux (DejaVu, Noto, Liberation...).
+- Phạm vi: cả dữ liệu, một tháng (YYYY-MM) hoặc khoảng ngày [start, end] (YYYY-MM-DD).
+- Ô quá dài được cắt theo bề rộng thực (get_string_width) thay vì cắt chuỗi cố định;
+  ngắt trang do fpdf tự xử lý, header bảng được vẽ lại trong PDF.header().
+- Báo tiến độ qua progress(value 0..1, message); progress được phép ném lỗi để hủy
+  (vd: TaskHandle.check_cancelled), file dở dang không được giữ lại.
+
+Sử dụng:
+    from report_engine import export_pdf_report
+    path = export_pdf_report(month='2025-08', progress=lambda v, m: print(v, m))
+"""
+from __future__ import annotations
+import calendar
+import csv
+import importlib.util
+import logging
+import os
+import sys
+import threading
+from datetime import datetime
+from typing import Callable, Iterator, List, Optional, Tuple
+
+import utils
+
+logger = logging.getLogger("suk.report")
+
+ProgressFn = Callable[[Optional[float], str], None]
+
+PROGRESS_EVERY_ROWS = 500
+ROW_HEIGHT = 6
+HEADER_ROW_HEIGHT = 7
+ELLIPSIS = '…'
+FIT_CACHE_MAX = 4096  # Ngày/sân/giá lặp lại nhiều -> nhớ kết quả đo chữ, giới hạn để RAM không tăng theo dữ liệu
+
+# Tên file font ưu tiên (có dấu tiếng Việt đầy đủ)
+FONT_FILE_NAMES = (
+    'arial.ttf', 'Arial.ttf', 'tahoma.ttf', 'segoeui.ttf', 'verdana.ttf',
+    'DejaVuSans.ttf', 'NotoSans-Regular.ttf', 'LiberationSans-Regular.ttf', 'FreeSans.ttf',
+)
+BUNDLED_FONT_DIRS = ('fonts', os.path.join('assets', 'fonts'))
+SYSTEM_FONT_DIRS = {
+    'win32': [os.path.join(os.environ.get('WINDIR', r'C:\Windows'), 'Fonts')],
+    'darwin': ['/Library/Fonts', '/System/Library/Fonts/Supplemental', os.path.expanduser('~/Library/Fonts')],
+    'linux': ['/usr/share/fonts', '/usr/local/share/fonts', os.path.expanduser('~/.local/share/fonts'),
+              os.path.expanduser('~/.fonts')],
+}
+
+_font_lock = threading.Lock()
+_font_cache: dict = {}
+
+
+# ---------------------- FONT ----------------------
+
+def _bundled_font_dirs() -> List[str]:
+    roots = [utils._base_dir()]
+    meipass = getattr(sys, '_MEIPASS', None)  # PyInstaller one-file
+    if meipass:
+        roots.append(meipass)
+    return [os.path.join(root, d) for root in roots for d in BUNDLED_FONT_DIRS]
+
+
+def _system_font_dirs() -> List[str]:
+    key = 'win32' if sys.platform.startswith('win') else 'darwin' if sys.platform == 'darwin' else 'linux'
+    dirs = list(SYSTEM_FONT_DIRS[key])
+    extra = utils.get_config_value('report_settings', 'font_search_dirs', []) or []
+    return [os.path.expanduser(d) for d in extra if isinstance(d, str)] + dirs
+
+
+def _find_font_in(dirs: List[str], recursive: bool) -> Optional[str]:
+    """Tìm file font theo thứ tự ưu tiên FONT_FILE_NAMES trong các thư mục (Linux: đệ quy)."""
+    found = {}
+    for d in dirs:
+        if not os.path.isdir(d):
+            continue
+        if recursive:
+            for root, _dirs, files in os.walk(d):
+                for name in files:
+                    if name in FONT_FILE_NAMES and name not in found:
+                        found[name] = os.path.join(root, name)
+        else:
+            for name in FONT_FILE_NAMES:
+                path = os.path.join(d, name)
+                if name not in found and os.path.isfile(path):
+                    found[name] = path
+    for name in FONT_FILE_NAMES:
+        if name in found:
+            return found[name]
+    return None
+
+
+def resolve_report_font(font_path: Optional[str] = None) -> str:
+    """Đường dẫn font TTF Unicode cho báo cáo (dò một lần, cache theo cấu hình).
+    Raise RuntimeError nếu không tìm được."""
+    configured = font_path or utils.get_config_value('report_settings', 'font_path', '') or ''
+    with _font_lock:
+        if configured in _font_cache:
+            return _font_cache[configured]
+        path = None
+        if configured:
+            if os.path.isfile(configured):
+                path = configured
+            else:
+                logger.warning("Font cấu hình không tồn tại: %s (dò font khác)", configured)
+        if path is None:
+            path = _find_font_in(_bundled_font_dirs(), recursive=False)
+        if path is None:
+            path = _find_font_in(_system_font_dirs(), recursive=not sys.platform.startswith('win'))
+        if path is None:
+            raise RuntimeError("Không tìm thấy font Unicode cho PDF. Hãy đặt report_settings.font_path trong "
+                               "config/app_config.json hoặc chép một file .ttf (vd: DejaVuSans.ttf) vào thư mục fonts/.")
+        logger.info("Font báo cáo PDF: %s", path)
+        _font_cache[configured] = path
+        return path
+
+
+# ---------------------- PHẠM VI ----------------------
+
+def resolve_scope(month: Optional[str] = None, start: Optional[str] = None,
+                  end: Optional[str] = None) -> Tuple[Optional[str], Optional[str]]:
+    """Chuẩn hóa phạm vi thành (start, end) dạng YYYY-MM-DD; (None, None) = toàn bộ."""
+    if month:
+        month = utils.to_iso_month(month.strip())
+        y, m = (int(x) for x in month.split('-'))
+        return f"{month}-01", f"{month}-{calendar.monthrange(y, m)[1]:02d}"
+    for value in (start, end):
+        if value:
+            datetime.strptime(value, '%Y-%m-%d')
+    if start and end and start > end:
+        raise ValueError("Ngày bắt đầu phải trước ngày kết thúc")
+    return start or None, end or None
+
+
+def _in_range(value: str, start: Optional[str], end: Optional[str]) -> bool:
+    # So sánh chuỗi ISO; với cột tháng (YYYY-MM) so theo tiền tố tháng của start/end
+    if not value:
+        return False
+    width = len(value)
+    if start and value < start[:width]:
+        return False
+    if end and value > end[:width]:
+        return False
+    return True
+
+
+# ---------------------- MỤC BÁO CÁO ----------------------
+
+class ReportSection:
+    """Một bảng trong báo cáo: cột CSV cần in, tiêu đề, độ rộng (mm) và cột dùng để lọc phạm vi."""
+
+    def __init__(self, title: str, filename: str, columns: List[str], headers: List[str],
+                 widths: List[float], scope_column: Optional[str] = None, scope_width: int = 10):
+        self.title = title
+        self.filename = filename
+        self.columns = columns
+        self.headers = headers
+        self.widths = widths
+        self.scope_column = scope_column
+        self.scope_width = scope_width  # 10 = ngày, 7 = tháng
+
+    @property
+    def path(self) -> str:
+        return utils._abs_path(self.filename)
+
+    def iter_rows(self, start: Optional[str], end: Optional[str]) -> Iterator[Tuple[bool, List[str]]]:
+        """Duyệt từng dòng (streaming). Trả (có_in, giá_trị_cột) để bên gọi đếm tiến độ cả dòng bị lọc."""
+        path = self.path
+        if not os.path.exists(path):
+            return
+        with open(path, 'r', newline='', encoding='utf-8') as f:
+            reader = csv.reader(f)
+            header = next(reader, None)
+            if not header:
+                return
+            idx = [header.index(c) if c in header else -1 for c in self.columns]
+            scope_idx = header.index(self.scope_column) if self.scope_column in header else -1
+            scoped = scope_idx >= 0 and (start or end)
+            for row in reader:
+                if not row:
+                    continue
+                if scoped:
+                    key = row[scope_idx][:self.scope_width] if len(row) > scope_idx else ''
+                    if not _in_range(key, start, end):
+                        yield False, []
+                        continue
+                yield True, [row[i] if 0 <= i < len(row) else '' for i in idx]
+
+
+REPORT_SECTIONS = [
+    ReportSection("1. Ghi chép ngày", utils.DAILY_FILE, ['ngay', 'san', 'khung_gio', 'gia_vnd', 'loai'],
+                  ["Ngày", "Sân", "Khung giờ", "Giá (VND)", "Loại"], [22, 18, 32, 28, 28], 'ngay'),
+    ReportSection("2. Thống kê tháng", utils.MONTHLY_FILE,
+                  ['thang', 'tong_doanh_thu_vnd', 'chi_phi_tru_hao_vnd', 'loi_nhuan_vnd', 'tu_tinh_tu_ngay'],
+                  ["Tháng", "Tổng doanh thu", "Chi phí trừ hao", "Lợi nhuận", "Tự tính?"], [25, 38, 38, 30, 18],
+                  'thang', 7),
+    ReportSection("3. Gói tháng", utils.SUBSCRIPTION_FILE,
+                  ['thang', 'ten', 'so_buoi_tuan', 'gio_moi_buoi', 'he_so', 'gia_vnd'],
+                  ["Tháng", "Tên", "Số buổi/tuần", "Giờ mỗi buổi", "Hệ số", "Giá (VND)"], [20, 40, 26, 26, 18, 30],
+                  'thang', 7),
+    ReportSection("4. Chia lợi nhuận", utils.PROFIT_SHARE_FILE,
+                  ['event_id', 'scope', 'total_revenue_vnd', 'total_cost_vnd', 'profit_vnd', 'created_at', 'summary'],
+                  ["Mã", "Phạm vi", "Doanh thu", "Chi phí", "Lợi nhuận", "Tạo lúc", "Tóm tắt (rút gọn)"],
+                  [16, 36, 28, 26, 26, 30, 40], 'created_at'),
+    # Danh mục nước là tồn kho hiện tại -> không lọc theo phạm vi
+    ReportSection("5. Danh mục nước", utils.WATER_ITEMS_FILE, ['ten', 'so_luong_ton', 'don_gia_vnd'],
+                  ["Tên", "SL tồn", "Đơn giá"], [50, 22, 28]),
+    ReportSection("6. Bán nước", utils.WATER_SALES_FILE, ['ngay', 'ten', 'so_luong', 'don_gia_vnd', 'tong_vnd'],
+                  ["Ngày", "Tên", "SL", "Đơn giá", "Thành tiền"], [22, 40, 14, 28, 30], 'ngay'),
+]
+
+
+def _count_data_lines(path: str) -> int:
+    """Đếm số dòng dữ liệu (trừ header) bằng cách đọc khối nhị phân – dùng ước lượng tiến độ."""
+    if not os.path.exists(path):
+        return 0
+    n = 0
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            n += block.count(b'\n')
+    return max(n - 1, 0)
+
+
+# ---------------------- PDF ----------------------
+
+def _fit_text(pdf, text: str, width: float) -> str:
+    """Cắt text theo bề rộng ô thực tế (mm), thêm dấu … nếu phải cắt."""
+    avail = width - 2 * pdf.c_margin
+    if pdf.get_string_width(text) <= avail:
+        return text
+    lo, hi = 0, len(text)
+    while lo < hi:  # tiền tố dài nhất còn vừa khi thêm dấu …
+        mid = (lo + hi + 1) // 2
+        if pdf.get_string_width(text[:mid] + ELLIPSIS) <= avail:
+            lo = mid
+        else:
+            hi = mid - 1
+    return text[:lo].rstrip() + ELLIPSIS
+
+
+def _make_pdf(font_path: str, subtitle: str):
+    from fpdf import FPDF  # type: ignore
+    from fpdf.enums import XPos, YPos  # type: ignore
+
+    class ReportPDF(FPDF):
+        """Header trang + vẽ lại header bảng đang in khi fpdf tự ngắt trang."""
+        table: Optional[ReportSection] = None
+        _fit_cache: dict = {}
+
+        def fit(self, text: str, width: float) -> str:
+            key = (text, width, self.font_size_pt)
+            fitted = self._fit_cache.get(key)
+            if fitted is None:
+                if len(self._fit_cache) >= FIT_CACHE_MAX:
+                    self._fit_cache.clear()
+                fitted = self._fit_cache[key] = _fit_text(self, text, width)
+            return fitted
+
+        def header(self):  # type: ignore
+            self.set_font('VN', '', 11)
+            self.cell(0, 6, "BÁO CÁO DỮ LIỆU SÂN PICKLEBALL", new_x=XPos.LMARGIN, new_y=YPos.NEXT, align='C')
+            self.set_font('VN', '', 8)
+            self.cell(0, 5, subtitle, new_x=XPos.LMARGIN, new_y=YPos.NEXT, align='C')
+            self.ln(2)
+            if self.table is not None:
+                self.table_header(self.table)
+
+        def footer(self):  # type: ignore
+            self.set_y(-12)
+            self.set_font('VN', '', 8)
+            self.cell(0, 5, f"Trang {self.page_no()}", align='C')
+
+        def table_header(self, section: ReportSection):
+            self.set_font('VN', '', 9.5)
+            self.set_fill_color(230, 230, 230)
+            for h, w in zip(section.headers, section.widths):
+                self.cell(w, HEADER_ROW_HEIGHT, self.fit(h, w), border=1, align='C', fill=True)
+            self.ln()
+            self.set_font('VN', '', 9)
+
+        def section_title(self, title: str):
+            # Tiêu đề + header + ít nhất một dòng phải nằm cùng trang
+            if self.will_page_break(7 + HEADER_ROW_HEIGHT + ROW_HEIGHT):
+                self.add_page()
+            self.set_font('VN', '', 11)
+            self.set_text_color(0, 0, 128)
+            self.cell(0, 7, title, new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+            self.set_text_color(0, 0, 0)
+
+        def row(self, section: ReportSection, values: List[str]):
+            for val, w in zip(values, section.widths):
+                self.cell(w, ROW_HEIGHT, self.fit(str(val), w), border=1)
+            self.ln()
+
+    pdf = ReportPDF(orientation='P', unit='mm', format='A4')
+    pdf._fit_cache = {}
+    pdf.set_auto_page_break(auto=True, margin=14)
+    pdf.add_font('VN', '', font_path)
+    return pdf
+
+
+def _scope_label(start: Optional[str], end: Optional[str]) -> str:
+    now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    if not (start or end):
+        return now
+    return f"Phạm vi: {start or '...'} → {end or '...'} • {now}"
+
+
+def export_pdf_report(out_path: Optional[str] = None, *, dest_dir: Optional[str] = None,
+                      month: Optional[str] = None, start: Optional[str] = None, end: Optional[str] = None,
+                      progress: Optional[ProgressFn] = None, font_path: Optional[str] = None) -> str:
+    """Xuất báo cáo PDF theo phạm vi, stream từng dòng CSV. Trả về đường dẫn file.
+
+    out_path: file đích; nếu None -> dest_dir (mặc định backups/) / Bao_cao_du_lieu_<ts>.pdf.
+    month ('YYYY-MM' hoặc 'MM-YYYY') hoặc start/end ('YYYY-MM-DD') giới hạn dữ liệu in."""
+    # Chỉ dò xem fpdf2 có cài không (find_spec không import); _make_pdf mới nạp thật khi đã qua bước đếm dòng
+    if importlib.util.find_spec('fpdf') is None:
+        raise RuntimeError("Chưa cài thư viện fpdf2. Hãy chạy: pip install fpdf2")
+    start, end = resolve_scope(month, start, end)
+    report_font = resolve_report_font(font_path)
+
+    totals = [_count_data_lines(s.path) for s in REPORT_SECTIONS]
+    grand_total = sum(totals)
+    if not grand_total:
+        raise FileNotFoundError("Chưa có dữ liệu để xuất")
+
+    def report(value: Optional[float], message: str):
+        if progress is not None:
+            progress(value, message)
+
+    pdf = _make_pdf(report_font, _scope_label(start, end))
+    pdf.add_page()
+    scanned = written = 0
+    for section, total in zip(REPORT_SECTIONS, totals):
+        if not total:
+            continue
+        report(scanned / grand_total, f"{section.title}...")
+        started = False
+        for keep, values in section.iter_rows(start, end):
+            scanned += 1
+            if scanned % PROGRESS_EVERY_ROWS == 0:
+                report(min(scanned / grand_total, 1.0), f"{section.title}: {scanned:,}/{grand_total:,} dòng")
+            if not keep:
+                continue
+            if not started:
+                pdf.section_title(section.title)
+                pdf.table_header(section)
+                pdf.table = section
+                started = True
+            pdf.row(section, values)
+            written += 1
+        if started:
+            pdf.table = None
+            pdf.ln(2)
+    if not written:
+        raise FileNotFoundError("Không có dữ liệu trong phạm vi đã chọn")
+
+    if out_path is None:
+        dest_dir = dest_dir or utils._abs_path('backups')
+        out_path = os.path.join(dest_dir, f"Bao_cao_du_lieu_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf")
+    os.makedirs(os.path.dirname(os.path.abspath(out_path)), exist_ok=True)
+    report(1.0, "Đang ghi file PDF...")
+    tmp = out_path + '.tmp'
+    try:
+        pdf.output(tmp)
+        os.replace(tmp, out_path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    logger.info("Báo cáo PDF: %s (%s dòng, %s trang)", out_path, written, pdf.page_no())
+    return out_path
+
+
+__all__ = ["export_pdf_report", "resolve_report_font", "resolve_scope", "ReportSection", "REPORT_SECTIONS"]
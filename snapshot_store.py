@@ -0,0 +1,477 @@
+"""Snapshot Backups (content-addressed, additive)
+
+Sao lưu thật thư mục data/ (khác với báo cáo PDF của backup_data):
+- Mỗi file CSV được cắt thành chunk theo ranh giới dòng, điểm cắt do nội dung quyết định
+  (crc32 của dòng) -> thêm / sửa / xóa vài dòng chỉ làm đổi vài chunk quanh chỗ sửa.
+- Chunk lưu theo sha256 của nội dung gốc (content-addressed): chunk đã có thì không ghi lại.
+- File không đổi (size + mtime giống snapshot trước) dùng lại danh sách chunk, không cần đọc
+  -> sao lưu hằng ngày một bộ dữ liệu lớn ít thay đổi chỉ tốn vài ms và gần như không tốn đĩa.
+- Nén từng chunk: zstd (nếu cài zstandard) hoặc zlib; byte đầu chunk ghi codec nên các snapshot
+  dùng codec khác nhau vẫn chia sẻ chunk được.
+- Mỗi snapshot có một manifest JSON (ghi sau cùng, tmp + os.replace): crash giữa chừng chỉ để lại
+  chunk mồ côi, được dọn ở lần prune kế tiếp.
+- Tôn trọng backup_settings: enabled / auto_backup / backup_interval (giờ) / max_backups /
+  backup_location / compression_enabled / compression_codec / exclude_patterns.
+
+Khôi phục (restore_snapshot):
+- Giải nén chunk song song (zlib/zstd nhả GIL) với cửa sổ giới hạn -> RAM không tăng theo kích thước file.
+- Kiểm tra sha256 từng chunk + sha256/size cả file trước khi đụng vào dữ liệu thật.
+- Chụp snapshot an toàn của dữ liệu hiện tại, rồi thay từng file bằng os.replace (atomic)
+  dưới cùng khóa file với các hàm ghi utils, sau đó xóa mọi cache utils.
+
+Bố cục:
+    <backup_location>/snapshots/manifests/<snapshot_id>.json
+    <backup_location>/snapshots/chunks/<2 ký tự đầu>/<sha256>
+"""
+from __future__ import annotations
+import fnmatch
+import hashlib
+import json
+import logging
+import os
+import threading
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import utils
+
+logger = logging.getLogger("suk.backup")
+
+SNAPSHOT_DIR = "snapshots"
+MANIFEST_VERSION = 1
+# Chunk theo dòng: cắt khi crc32(dòng) rơi vào mẫu (xác suất 1/1024) và chunk đã >= MIN,
+# hoặc bắt buộc cắt khi đạt MAX. Trung bình ~64KB với dòng CSV ~60 byte.
+CHUNK_MIN_BYTES = 16 * 1024
+CHUNK_MAX_BYTES = 256 * 1024
+CHUNK_CUT_MASK = 0x3FF
+ZLIB_LEVEL = 6
+ZSTD_LEVEL = 3
+# Luôn bỏ qua: file tạm / lock và sidecar kiểm tra toàn vẹn (sinh lại được, lệch thế hệ nếu khôi phục)
+BUILTIN_EXCLUDES = ("*.tmp", "*.lock", ".integrity_*")
+
+_CODEC_TAGS = {b'R': 'raw', b'Z': 'zlib', b'S': 'zstd'}
+_store_lock = threading.RLock()  # Một snapshot / prune / restore tại một thời điểm trong tiến trình
+RESTORE_WINDOW_PER_WORKER = 4  # Số chunk giải nén trước tối đa cho mỗi worker
+
+ProgressFn = Callable[[Optional[float], str], None]
+
+
+# ---------------------- CODEC ----------------------
+
+def _zstd():
+    try:
+        import zstandard  # type: ignore
+        return zstandard
+    except Exception:
+        return None
+
+
+def resolve_codec(settings: Optional[Dict[str, Any]] = None) -> str:
+    """'raw' | 'zlib' | 'zstd' theo compression_enabled / compression_codec ('auto' mặc định)."""
+    settings = settings if settings is not None else _settings()
+    if not settings.get('compression_enabled', True):
+        return 'raw'
+    codec = str(settings.get('compression_codec', 'auto') or 'auto').lower()
+    if codec in ('zstd', 'auto') and _zstd() is not None:
+        return 'zstd'
+    if codec == 'zstd':
+        logger.info("Chưa cài zstandard -> dùng zlib cho snapshot")
+    return 'zlib'
+
+
+def _encode_chunk(raw: bytes, codec: str) -> bytes:
+    if codec == 'zstd':
+        return b'S' + _zstd().ZstdCompressor(level=ZSTD_LEVEL).compress(raw)
+    if codec == 'zlib':
+        return b'Z' + zlib.compress(raw, ZLIB_LEVEL)
+    return b'R' + raw
+
+
+def decode_chunk(blob: bytes) -> bytes:
+    """Giải nén chunk theo tag byte đầu."""
+    tag, body = blob[:1], blob[1:]
+    codec = _CODEC_TAGS.get(tag)
+    if codec == 'zlib':
+        return zlib.decompress(body)
+    if codec == 'zstd':
+        zstd = _zstd()
+        if zstd is None:
+            raise RuntimeError("Snapshot dùng nén zstd nhưng chưa cài thư viện zstandard (pip install zstandard)")
+        return zstd.ZstdDecompressor().decompress(body)
+    if codec == 'raw':
+        return body
+    raise ValueError("Chunk hỏng: codec không xác định")
+
+
+# ---------------------- CẤU HÌNH ----------------------
+
+def _settings() -> Dict[str, Any]:
+    sec = utils.load_app_config().get('backup_settings')
+    return sec if isinstance(sec, dict) else {}
+
+
+def _data_dir() -> str:
+    return utils._ensure_data_dir(utils._base_dir())
+
+
+def _iter_chunks(f, min_bytes: int = CHUNK_MIN_BYTES, max_bytes: int = CHUNK_MAX_BYTES, mask: int = CHUNK_CUT_MASK):
+    """Cắt luồng nhị phân thành chunk theo dòng với điểm cắt phụ thuộc nội dung."""
+    buf: List[bytes] = []
+    size = 0
+    for line in f:
+        buf.append(line)
+        size += len(line)
+        if size >= max_bytes or (size >= min_bytes and (zlib.crc32(line) & mask) == 0):
+            yield b''.join(buf)
+            buf, size = [], 0
+    if buf:
+        yield b''.join(buf)
+
+
+# ---------------------- STORE ----------------------
+
+class SnapshotStore:
+    """Kho snapshot content-addressed cho thư mục data/."""
+
+    def __init__(self, root: Optional[str] = None, data_dir: Optional[str] = None,
+                 settings: Optional[Dict[str, Any]] = None):
+        self.settings = settings if settings is not None else _settings()
+        location = self.settings.get('backup_location') or 'backups'
+        self.root = root or os.path.join(utils._abs_path(location), SNAPSHOT_DIR)
+        self.data_dir = data_dir or _data_dir()
+        self.manifest_dir = os.path.join(self.root, 'manifests')
+        self.chunk_dir = os.path.join(self.root, 'chunks')
+
+    # ---- Manifest ----
+    def list_snapshots(self) -> List[str]:
+        """Các snapshot_id, cũ -> mới."""
+        try:
+            names = os.listdir(self.manifest_dir)
+        except OSError:
+            return []
+        return sorted(n[:-5] for n in names if n.endswith('.json'))
+
+    def load_manifest(self, snapshot_id: str) -> Dict[str, Any]:
+        path = os.path.join(self.manifest_dir, snapshot_id + '.json')
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Không tìm thấy snapshot: {snapshot_id}")
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def latest_manifest(self) -> Optional[Dict[str, Any]]:
+        for snapshot_id in reversed(self.list_snapshots()):
+            try:
+                return self.load_manifest(snapshot_id)
+            except Exception as ex:
+                logger.warning("Manifest %s hỏng, bỏ qua: %s", snapshot_id, ex)
+        return None
+
+    def _write_manifest(self, manifest: Dict[str, Any]):
+        os.makedirs(self.manifest_dir, exist_ok=True)
+        path = os.path.join(self.manifest_dir, manifest['id'] + '.json')
+        tmp = path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=1)
+        os.replace(tmp, path)
+
+    def _new_snapshot_id(self) -> str:
+        """Id theo thời gian, luôn sau snapshot mới nhất cùng giây (kể cả khi bản cũ hơn vừa bị dọn)
+        -> thứ tự tên = thứ tự tạo, prune không xóa nhầm bản mới."""
+        base = datetime.now().strftime('%Y%m%d_%H%M%S')
+        ids = self.list_snapshots()
+        latest = ids[-1] if ids else ''
+        snapshot_id, n = base, 1
+        while snapshot_id in ids or (latest.startswith(base) and snapshot_id <= latest):
+            snapshot_id = f"{base}_{n:03d}"
+            n += 1
+        return snapshot_id
+
+    # ---- Chunk ----
+    def chunk_path(self, chunk_id: str) -> str:
+        return os.path.join(self.chunk_dir, chunk_id[:2], chunk_id)
+
+    def _put_chunk(self, raw: bytes, codec: str) -> Tuple[str, int]:
+        """Ghi chunk nếu chưa có. Trả (chunk_id, số byte đã ghi xuống đĩa)."""
+        chunk_id = hashlib.sha256(raw).hexdigest()
+        path = self.chunk_path(chunk_id)
+        if os.path.exists(path):
+            return chunk_id, 0
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        blob = _encode_chunk(raw, codec)
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, 'wb') as f:
+            f.write(blob)
+        os.replace(tmp, path)
+        return chunk_id, len(blob)
+
+    def read_chunk(self, chunk_id: str) -> bytes:
+        """Đọc + giải nén + kiểm tra sha256 một chunk."""
+        with open(self.chunk_path(chunk_id), 'rb') as f:
+            raw = decode_chunk(f.read())
+        if hashlib.sha256(raw).hexdigest() != chunk_id:
+            raise ValueError(f"Chunk {chunk_id[:12]} sai checksum")
+        return raw
+
+    # ---- Snapshot ----
+    def _is_excluded(self, rel_path: str) -> bool:
+        patterns = list(BUILTIN_EXCLUDES) + [p for p in (self.settings.get('exclude_patterns') or []) if isinstance(p, str)]
+        name = os.path.basename(rel_path)
+        return any(fnmatch.fnmatch(rel_path, p) or fnmatch.fnmatch(name, p) for p in patterns)
+
+    def _source_files(self) -> List[str]:
+        out = []
+        for root, dirs, files in os.walk(self.data_dir):
+            # Pattern dạng 'thư_mục/*' loại cả thư mục con
+            rel_root = os.path.relpath(root, self.data_dir).replace(os.sep, '/')
+            prefix = '' if rel_root == '.' else rel_root + '/'
+            dirs[:] = [d for d in dirs if not self._is_excluded(f"{prefix}{d}/*")]
+            for name in files:
+                rel = os.path.relpath(os.path.join(root, name), self.data_dir).replace(os.sep, '/')
+                if not self._is_excluded(rel):
+                    out.append(rel)
+        return sorted(out)
+
+    def _snapshot_file(self, rel: str, codec: str, stats: Dict[str, int]) -> Dict[str, Any]:
+        path = os.path.join(self.data_dir, *rel.split('/'))
+        digest = hashlib.sha256()
+        chunks: List[List[Any]] = []
+        # Khóa như các hàm ghi utils -> không đọc phải file đang được thay (os.replace) giữa chừng
+        with utils._file_lock(path):
+            st = os.stat(path)
+            with open(path, 'rb') as f:
+                for raw in _iter_chunks(f):
+                    digest.update(raw)
+                    chunk_id, written = self._put_chunk(raw, codec)
+                    chunks.append([chunk_id, len(raw)])
+                    stats['bytes_written'] += written
+                    stats['new_chunks' if written else 'reused_chunks'] += 1
+        return {'path': rel, 'size': sum(c[1] for c in chunks), 'mtime_ns': st.st_mtime_ns,
+                'sha256': digest.hexdigest(), 'chunks': chunks}
+
+    def create_snapshot(self, progress: Optional[ProgressFn] = None, label: str = "",
+                        prune: bool = True) -> Dict[str, Any]:
+        """Chụp data/ thành một snapshot mới rồi dọn theo max_backups (prune=False: không dọn). Trả về manifest."""
+        with _store_lock:
+            codec = resolve_codec(self.settings)
+            previous = {f['path']: f for f in (self.latest_manifest() or {}).get('files', [])}
+            files = self._source_files()
+            stats = {'files': len(files), 'unchanged_files': 0, 'new_chunks': 0, 'reused_chunks': 0,
+                     'bytes_written': 0, 'bytes_total': 0}
+            entries = []
+            for i, rel in enumerate(files):
+                if progress is not None:
+                    progress(i / max(len(files), 1), rel)
+                path = os.path.join(self.data_dir, *rel.split('/'))
+                prev = previous.get(rel)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                if prev and prev.get('size') == st.st_size and prev.get('mtime_ns') == st.st_mtime_ns \
+                        and all(os.path.exists(self.chunk_path(c[0])) for c in prev.get('chunks', [])):
+                    entry = dict(prev)  # Không đổi: dùng lại chunk của snapshot trước, không đọc file
+                    stats['unchanged_files'] += 1
+                    stats['reused_chunks'] += len(prev.get('chunks', []))
+                else:
+                    entry = self._snapshot_file(rel, codec, stats)
+                stats['bytes_total'] += entry['size']
+                entries.append(entry)
+            manifest = {
+                'version': MANIFEST_VERSION,
+                'id': self._new_snapshot_id(),
+                'created_at': datetime.now().isoformat(timespec='seconds'),
+                'label': label,
+                'codec': codec,
+                'files': entries,
+                'stats': stats,
+            }
+            self._write_manifest(manifest)
+            manifest['pruned'] = self._prune_locked(self._max_backups()) if prune else []
+        if progress is not None:
+            progress(1.0, manifest['id'])
+        logger.info("Snapshot %s: %s file (%s không đổi), %s chunk mới, %s byte ghi",
+                    manifest['id'], stats['files'], stats['unchanged_files'], stats['new_chunks'], stats['bytes_written'])
+        return manifest
+
+    # ---- Restore ----
+    def _stage_file(self, entry: Dict[str, Any], staging: str, pool: ThreadPoolExecutor, window: int,
+                    tick: Callable[[int], None]):
+        """Ghi file tạm từ chunk (giải nén song song, giữ thứ tự) và kiểm tra checksum cả file."""
+        digest = hashlib.sha256()
+        size = 0
+        pending: deque = deque()
+        chunks = iter(entry.get('chunks', []))
+        with open(staging, 'wb') as out:
+            while True:
+                while len(pending) < window:
+                    c = next(chunks, None)
+                    if c is None:
+                        break
+                    pending.append(pool.submit(self.read_chunk, c[0]))
+                if not pending:
+                    break
+                raw = pending.popleft().result()
+                out.write(raw)
+                digest.update(raw)
+                size += len(raw)
+                tick(len(raw))
+            out.flush()
+            os.fsync(out.fileno())
+        if size != entry.get('size') or digest.hexdigest() != entry.get('sha256'):
+            raise ValueError(f"{entry['path']}: dữ liệu khôi phục sai checksum")
+
+    def restore_snapshot(self, snapshot_id: str, progress: Optional[ProgressFn] = None,
+                         workers: Optional[int] = None, safety_snapshot: bool = True) -> Dict[str, Any]:
+        """Khôi phục data/ từ snapshot. Mọi file được dựng + kiểm tra xong mới thay vào (os.replace).
+        File trong data/ không có trong snapshot được giữ nguyên. Trả về tóm tắt."""
+        with _store_lock:
+            manifest = self.load_manifest(snapshot_id)
+            entries = manifest.get('files', [])
+            total = sum(e.get('size', 0) for e in entries) or 1
+            done = {'bytes': 0}
+
+            def tick(n: int):
+                done['bytes'] += n
+                if progress is not None:
+                    progress(done['bytes'] / total * 0.9, f"Đang giải nén {done['bytes'] / 1048576:.1f} MB")
+
+            # Thiếu chunk -> dừng trước khi làm gì
+            missing = [c[0] for e in entries for c in e.get('chunks', []) if not os.path.exists(self.chunk_path(c[0]))]
+            if missing:
+                raise FileNotFoundError(f"Snapshot {snapshot_id} thiếu {len(missing)} chunk, không thể khôi phục")
+            workers = workers or min(8, (os.cpu_count() or 2))
+            staged: List[Tuple[str, str]] = []
+            try:
+                with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='suk-restore') as pool:
+                    for entry in entries:
+                        target = os.path.join(self.data_dir, *entry['path'].split('/'))
+                        os.makedirs(os.path.dirname(target), exist_ok=True)
+                        staging = target + '.restore.tmp'
+                        staged.append((staging, target))
+                        self._stage_file(entry, staging, pool, workers * RESTORE_WINDOW_PER_WORKER, tick)
+                # Bản an toàn của hiện trạng (không dọn để snapshot đang khôi phục không bị xóa)
+                safety = None
+                if safety_snapshot:
+                    if progress is not None:
+                        progress(0.92, "Sao lưu dữ liệu hiện tại...")
+                    safety = self.create_snapshot(label=f'truoc-khoi-phuc-{snapshot_id}', prune=False)['id']
+                if progress is not None:
+                    progress(0.97, "Thay dữ liệu...")
+                for staging, target in staged:
+                    with utils._file_lock(target):
+                        os.replace(staging, target)
+            finally:
+                for staging, _target in staged:
+                    if os.path.exists(staging):
+                        try:
+                            os.remove(staging)
+                        except OSError:
+                            pass
+        utils.invalidate_all_caches()
+        if progress is not None:
+            progress(1.0, snapshot_id)
+        logger.info("Đã khôi phục snapshot %s (%s file, bản an toàn: %s)", snapshot_id, len(entries), safety)
+        return {'id': snapshot_id, 'files': len(entries), 'bytes': done['bytes'], 'safety_snapshot': safety}
+
+    # ---- Retention ----
+    def _max_backups(self) -> int:
+        try:
+            return max(int(self.settings.get('max_backups', 30)), 1)
+        except (TypeError, ValueError):
+            return 30
+
+    def prune(self, keep: Optional[int] = None) -> List[str]:
+        """Giữ keep snapshot mới nhất (mặc định max_backups), xóa manifest cũ + chunk không còn dùng."""
+        with _store_lock:
+            return self._prune_locked(self._max_backups() if keep is None else keep)
+
+    def _prune_locked(self, keep: int) -> List[str]:
+        ids = self.list_snapshots()
+        removed = ids[:-keep] if keep > 0 else ids
+        for snapshot_id in removed:
+            try:
+                os.remove(os.path.join(self.manifest_dir, snapshot_id + '.json'))
+            except OSError as ex:
+                logger.warning("Không xóa được snapshot %s: %s", snapshot_id, ex)
+        self._gc_chunks()
+        return removed
+
+    def _gc_chunks(self) -> int:
+        """Xóa chunk không thuộc manifest nào còn lại (kể cả chunk mồ côi do crash)."""
+        live = set()
+        for snapshot_id in self.list_snapshots():
+            try:
+                for entry in self.load_manifest(snapshot_id).get('files', []):
+                    live.update(c[0] for c in entry.get('chunks', []))
+            except Exception as ex:
+                # Manifest đọc lỗi -> không dám xóa chunk nào
+                logger.warning("GC bỏ qua do manifest %s lỗi: %s", snapshot_id, ex)
+                return 0
+        removed = 0
+        for root, _dirs, names in os.walk(self.chunk_dir):
+            for name in names:
+                if name not in live:
+                    try:
+                        os.remove(os.path.join(root, name))
+                        removed += 1
+                    except OSError:
+                        pass
+        return removed
+
+
+# ---------------------- API MODULE ----------------------
+
+def create_snapshot(progress: Optional[ProgressFn] = None, label: str = "") -> Dict[str, Any]:
+    return SnapshotStore().create_snapshot(progress=progress, label=label)
+
+
+def list_snapshots() -> List[Dict[str, Any]]:
+    """Tóm tắt các snapshot (mới nhất trước) để hiển thị / chọn khôi phục."""
+    store = SnapshotStore()
+    out = []
+    for snapshot_id in reversed(store.list_snapshots()):
+        try:
+            m = store.load_manifest(snapshot_id)
+        except Exception:
+            continue
+        out.append({'id': snapshot_id, 'created_at': m.get('created_at'), 'label': m.get('label', ''),
+                    'files': len(m.get('files', [])), 'bytes_total': m.get('stats', {}).get('bytes_total', 0)})
+    return out
+
+
+def restore_snapshot(snapshot_id: str, progress: Optional[ProgressFn] = None) -> Dict[str, Any]:
+    return SnapshotStore().restore_snapshot(snapshot_id, progress=progress)
+
+
+def prune_snapshots(keep: Optional[int] = None) -> List[str]:
+    return SnapshotStore().prune(keep)
+
+
+def auto_snapshot_if_due() -> Optional[Dict[str, Any]]:
+    """Snapshot tự động khi bật enabled + auto_backup và snapshot gần nhất cũ hơn backup_interval giờ."""
+    settings = _settings()
+    if not (settings.get('enabled', True) and settings.get('auto_backup', False)):
+        return None
+    store = SnapshotStore(settings=settings)
+    ids = store.list_snapshots()
+    try:
+        interval = timedelta(hours=float(settings.get('backup_interval', 24)))
+    except (TypeError, ValueError):
+        interval = timedelta(hours=24)
+    if ids:
+        try:
+            last = datetime.fromisoformat(store.load_manifest(ids[-1])['created_at'])
+            if datetime.now() - last < interval:
+                return None
+        except Exception:
+            pass
+    return store.create_snapshot(label='auto')
+
+
+__all__ = [
+    "SnapshotStore", "create_snapshot", "list_snapshots", "restore_snapshot", "prune_snapshots", "auto_snapshot_if_due",
+    "resolve_codec", "decode_chunk",
+]
@@ -0,0 +1,163 @@
+"""Startup helpers: đo thời gian khởi động + nạp module nặng khi cần (additive)
+
+Profiler:
+- Bật bằng biến môi trường SUK_PROFILE_STARTUP=1 hoặc cờ dòng lệnh --profile-startup.
+- Ghi thời gian từng pha (imports, _init_style, _build_ui, ensure_all_data_files, integrity, first_paint),
+  log bảng tóm tắt và lưu JSON vào thư mục diagnostics/ cạnh app.
+- Ngân sách khởi động: performance.startup_budget_ms (config) hoặc SUK_STARTUP_BUDGET_MS.
+  Cờ --startup-check: đo, thoát ngay sau first paint với mã 1 nếu vượt ngân sách
+  (dùng để kiểm tra bản .exe đóng gói trong CI / trước khi phát hành).
+
+Lazy import:
+- lazy_import('matplotlib.pyplot') nạp module lần đầu cần dùng và cache lại.
+- warm_up_imports([...]) nạp trước các module nặng trên luồng nền sau khi cửa sổ đã hiện.
+"""
+from __future__ import annotations
+import importlib
+import json
+import logging
+import os
+import sys
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, List, Optional
+
+logger = logging.getLogger("suk.startup")
+
+ENV_PROFILE = "SUK_PROFILE_STARTUP"
+ENV_BUDGET = "SUK_STARTUP_BUDGET_MS"
+FLAG_PROFILE = "--profile-startup"
+FLAG_CHECK = "--startup-check"
+DEFAULT_BUDGET_MS = 1500
+DIAGNOSTICS_DIR = "diagnostics"
+
+
+class StartupProfiler:
+    """Ghi mốc thời gian các pha khởi động (perf_counter, ms tính từ lúc tạo profiler)."""
+
+    def __init__(self, enabled: bool = False, check: bool = False):
+        self.enabled = enabled or check
+        self.check = check
+        self.t0 = time.perf_counter()
+        self.phases: List[Dict[str, Any]] = []
+        self.marks: Dict[str, float] = {}
+        self._open: Dict[str, float] = {}
+
+    @classmethod
+    def from_env(cls, argv: Optional[List[str]] = None) -> "StartupProfiler":
+        argv = sys.argv if argv is None else argv
+        env = os.environ.get(ENV_PROFILE, "").strip().lower() in ("1", "true", "yes", "on")
+        return cls(enabled=env or FLAG_PROFILE in argv, check=FLAG_CHECK in argv)
+
+    def _now_ms(self) -> float:
+        return (time.perf_counter() - self.t0) * 1000.0
+
+    def begin(self, name: str):
+        if self.enabled:
+            self._open[name] = self._now_ms()
+
+    def end(self, name: str):
+        start = self._open.pop(name, None)
+        if start is not None:
+            end = self._now_ms()
+            self.phases.append({'phase': name, 'start_ms': round(start, 1), 'duration_ms': round(end - start, 1)})
+
+    @contextmanager
+    def phase(self, name: str):
+        self.begin(name)
+        try:
+            yield
+        finally:
+            self.end(name)
+
+    def mark(self, name: str):
+        """Mốc tức thời (vd: first_paint) tính từ đầu."""
+        if self.enabled and name not in self.marks:
+            self.marks[name] = round(self._now_ms(), 1)
+
+    def total_ms(self) -> float:
+        if 'first_paint' in self.marks:
+            return self.marks['first_paint']
+        return round(self._now_ms(), 1)
+
+    def report(self, budget_ms: Optional[float] = None) -> Dict[str, Any]:
+        total = self.total_ms()
+        res: Dict[str, Any] = {
+            'timestamp': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'frozen': bool(getattr(sys, 'frozen', False)),
+            'phases': list(self.phases),
+            'marks': dict(self.marks),
+            'total_ms': total,
+        }
+        if budget_ms is not None:
+            res['budget_ms'] = budget_ms
+            res['within_budget'] = total <= budget_ms
+        return res
+
+    def finish(self, base_dir: str, budget_ms: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """Log bảng tóm tắt + lưu JSON vào diagnostics/. Trả về report (None nếu profiler tắt)."""
+        if not self.enabled:
+            return None
+        rep = self.report(budget_ms)
+        lines = [f"  {p['phase']:<24}{p['duration_ms']:>9.1f} ms" for p in rep['phases']]
+        lines += [f"  @{name:<23}{ms:>9.1f} ms" for name, ms in rep['marks'].items()]
+        logger.info("Startup timings:\n%s\n  %-24s%9.1f ms%s", "\n".join(lines), 'TOTAL', rep['total_ms'],
+                    f" (budget {budget_ms:.0f} ms)" if budget_ms is not None else "")
+        if budget_ms is not None and not rep['within_budget']:
+            logger.warning("Khởi động vượt ngân sách: %.1f ms > %.0f ms", rep['total_ms'], budget_ms)
+        try:
+            out_dir = os.path.join(base_dir, DIAGNOSTICS_DIR)
+            os.makedirs(out_dir, exist_ok=True)
+            path = os.path.join(out_dir, time.strftime('startup_%Y%m%d_%H%M%S.json'))
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(rep, f, ensure_ascii=False, indent=2)
+            rep['path'] = path
+        except Exception as ex:
+            logger.debug("Không ghi được startup report: %s", ex)
+        return rep
+
+
+def startup_budget_ms(config_value: Any = None) -> float:
+    """Ngân sách khởi động (ms): env SUK_STARTUP_BUDGET_MS > config > mặc định."""
+    for raw in (os.environ.get(ENV_BUDGET), config_value):
+        try:
+            if raw not in (None, ""):
+                return float(raw)
+        except (TypeError, ValueError):
+            continue
+    return float(DEFAULT_BUDGET_MS)
+
+
+# Profiler dùng chung cho một tiến trình: main.py import sớm nhất có thể để t0 gần lúc khởi chạy
+profiler = StartupProfiler.from_env()
+
+# ---------------------- LAZY IMPORT ----------------------
+_lazy_modules: Dict[str, Any] = {}
+
+
+def lazy_import(name: str):
+    """Nạp module khi cần lần đầu (có cache). Lỗi ImportError được ném lại cho nơi gọi xử lý."""
+    mod = _lazy_modules.get(name)
+    if mod is None:
+        mod = importlib.import_module(name)
+        _lazy_modules[name] = mod
+    return mod
+
+
+def warm_up_imports(names: Iterable[str]) -> Dict[str, bool]:
+    """Nạp trước các module (chạy trên worker nền). Thiếu thư viện -> bỏ qua, trả về trạng thái từng module."""
+    status: Dict[str, bool] = {}
+    for name in names:
+        try:
+            lazy_import(name)
+            status[name] = True
+        except Exception as ex:
+            logger.debug("warm-up %s bỏ qua: %s", name, ex)
+            status[name] = False
+    return status
+
+
+__all__ = [
+    "StartupProfiler", "profiler", "startup_budget_ms",
+    "lazy_import", "warm_up_imports",
+]
@@ -0,0 +1,212 @@
+"""Background Task Executor (additive, Tk-safe)
+
+Mục tiêu:
+- Chạy các việc nặng (đọc CSV lớn, xuất PDF, quét toàn vẹn, gom dữ liệu biểu đồ) ngoài luồng Tk
+  để cửa sổ không bị treo.
+- Kết quả / tiến độ / lỗi được đẩy vào một queue và chỉ được xử lý trên luồng Tk
+  (drain bằng after()), nên callback có thể thao tác widget an toàn.
+- Hỗ trợ hủy (cờ hợp tác + Future.cancel) và callback tiến độ.
+- Tôn trọng config performance.async_operations: False -> chạy đồng bộ như trước.
+
+Sử dụng:
+    executor = TaskExecutor(root)
+    handle = executor.submit(backup_data, on_done=show_path, on_error=show_error)
+    handle.cancel()
+
+Hàm chạy trong thread pool có thể nhận TaskHandle (with_handle=True) để báo tiến độ
+(handle.progress) và kiểm tra hủy (handle.check_cancelled()). Hàm chạy trong process pool
+(use_process=True) phải ở cấp module (pickle được) và không nhận handle.
+"""
+from __future__ import annotations
+import logging
+import queue
+import threading
+from contextlib import nullcontext
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+logger = logging.getLogger("suk.tasks")
+
+DEFAULT_POLL_MS = 50
+DEFAULT_THREAD_WORKERS = 2
+
+
+class TaskCancelled(Exception):
+    """Ném ra bên trong task khi handle đã bị hủy (xem TaskHandle.check_cancelled)."""
+
+
+class TaskHandle:
+    """Đại diện một task đã submit: hủy, trạng thái, báo tiến độ."""
+
+    def __init__(self, executor: "TaskExecutor", name: str):
+        self.name = name
+        self.future: Optional[Future] = None
+        self.finished = False
+        self._executor = executor
+        self._cancel_event = threading.Event()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel_event.is_set()
+
+    def cancel(self):
+        """Yêu cầu hủy: task chưa chạy sẽ bị bỏ, task đang chạy tự dừng ở lần check_cancelled() kế tiếp."""
+        self._cancel_event.set()
+        if self.future is not None:
+            self.future.cancel()
+
+    def check_cancelled(self):
+        if self._cancel_event.is_set():
+            raise TaskCancelled(self.name)
+
+    def progress(self, value: float | None = None, message: str = ""):
+        """Báo tiến độ (0..1 hoặc None) kèm thông điệp; callback chạy trên luồng Tk."""
+        self._executor._post(self, 'progress', (value, message))
+
+
+class TaskExecutor:
+    """Thread/process pool + queue kết quả được drain trên luồng Tk qua after()."""
+
+    def __init__(self, root=None, max_workers: int = DEFAULT_THREAD_WORKERS,
+                 process_workers: int = 0, poll_ms: int = DEFAULT_POLL_MS, enabled: bool = True):
+        self.root = root
+        self.enabled = enabled
+        self.poll_ms = poll_ms
+        self._max_workers = max_workers
+        self._process_workers = process_workers
+        self._threads: Optional[ThreadPoolExecutor] = None
+        self._processes: Optional[ProcessPoolExecutor] = None
+        self._events: "queue.Queue[tuple[TaskHandle, str, Any]]" = queue.Queue()
+        self._callbacks: dict[TaskHandle, dict[str, Optional[Callable]]] = {}
+        self._poll_id = None
+        # Hook tùy chọn bọc mọi task thread/đồng bộ: run_hook(name) -> context manager (vd: profiling)
+        self.run_hook: Optional[Callable[[str], Any]] = None
+
+    # ---- Submit ----
+    def submit(self, fn: Callable, *args, on_done: Optional[Callable[[Any], None]] = None,
+               on_error: Optional[Callable[[BaseException], None]] = None,
+               on_progress: Optional[Callable[[Optional[float], str], None]] = None,
+               on_cancel: Optional[Callable[[], None]] = None,
+               with_handle: bool = False, use_process: bool = False, name: str = "", **kwargs) -> TaskHandle:
+        """Chạy fn(*args, **kwargs) nền; các callback luôn được gọi trên luồng Tk."""
+        handle = TaskHandle(self, name or getattr(fn, '__name__', 'task'))
+        self._callbacks[handle] = {'done': on_done, 'error': on_error, 'progress': on_progress, 'cancelled': on_cancel}
+        if not self.enabled or self.root is None:
+            # Chế độ đồng bộ (async_operations=False hoặc không có Tk root): giữ hành vi cũ
+            self._run(handle, fn, args, kwargs, with_handle)
+            self._drain_now()
+            return handle
+        if use_process:
+            future = self._process_pool().submit(fn, *args, **kwargs)
+            handle.future = future
+            future.add_done_callback(lambda f, h=handle: self._on_process_done(h, f))
+        else:
+            future = self._thread_pool().submit(self._run, handle, fn, args, kwargs, with_handle)
+            handle.future = future
+            # Future bị hủy trước khi chạy thì _run không được gọi -> tự báo 'cancelled'
+            future.add_done_callback(lambda f, h=handle: f.cancelled() and self._post(h, 'cancelled', None))
+        self._schedule_poll()
+        return handle
+
+    def shutdown(self, wait: bool = False):
+        """Hủy mọi task đang chờ và đóng pool (gọi khi thoát app)."""
+        for handle in list(self._callbacks):
+            handle.cancel()
+        if self._poll_id is not None and self.root is not None:
+            try:
+                self.root.after_cancel(self._poll_id)
+            except Exception:
+                pass
+            self._poll_id = None
+        for pool in (self._threads, self._processes):
+            if pool is not None:
+                pool.shutdown(wait=wait, cancel_futures=True)
+        self._threads = self._processes = None
+
+    @property
+    def pending(self) -> int:
+        return len(self._callbacks)
+
+    # ---- Worker side ----
+    def _thread_pool(self) -> ThreadPoolExecutor:
+        if self._threads is None:
+            self._threads = ThreadPoolExecutor(max_workers=self._max_workers, thread_name_prefix='suk-task')
+        return self._threads
+
+    def _process_pool(self) -> ProcessPoolExecutor:
+        if self._processes is None:
+            self._processes = ProcessPoolExecutor(max_workers=self._process_workers or None)
+        return self._processes
+
+    def _run(self, handle: TaskHandle, fn: Callable, args, kwargs, with_handle: bool):
+        if handle.cancelled:
+            self._post(handle, 'cancelled', None)
+            return
+        hook = self.run_hook
+        try:
+            with hook(handle.name) if hook is not None else nullcontext():
+                result = fn(handle, *args, **kwargs) if with_handle else fn(*args, **kwargs)
+        except TaskCancelled:
+            self._post(handle, 'cancelled', None)
+        except BaseException as ex:  # noqa: BLE001 - chuyển mọi lỗi về luồng Tk
+            logger.warning("Task %s lỗi: %s", handle.name, ex)
+            self._post(handle, 'error', ex)
+        else:
+            self._post(handle, 'cancelled' if handle.cancelled else 'done', result)
+
+    def _on_process_done(self, handle: TaskHandle, future: Future):
+        if future.cancelled() or handle.cancelled:
+            self._post(handle, 'cancelled', None)
+            return
+        ex = future.exception()
+        if ex is not None:
+            logger.warning("Task %s lỗi: %s", handle.name, ex)
+            self._post(handle, 'error', ex)
+        else:
+            self._post(handle, 'done', future.result())
+
+    def _post(self, handle: TaskHandle, kind: str, payload: Any):
+        self._events.put((handle, kind, payload))
+        if not self.enabled or self.root is None:
+            self._drain_now()
+
+    # ---- Tk side ----
+    def _schedule_poll(self):
+        if self._poll_id is None and self.root is not None:
+            self._poll_id = self.root.after(self.poll_ms, self._poll)
+
+    def _poll(self):
+        self._poll_id = None
+        self._drain_now()
+        if self._callbacks:
+            self._schedule_poll()
+
+    def _drain_now(self):
+        while True:
+            try:
+                handle, kind, payload = self._events.get_nowait()
+            except queue.Empty:
+                return
+            callbacks = self._callbacks.get(handle)
+            if callbacks is None:
+                continue
+            if kind != 'progress':
+                handle.finished = True
+                self._callbacks.pop(handle, None)
+            cb = callbacks.get(kind)
+            if cb is None:
+                if kind == 'error':
+                    logger.error("Task %s lỗi không được xử lý: %s", handle.name, payload)
+                continue
+            try:
+                if kind == 'progress':
+                    cb(*payload)
+                elif kind == 'cancelled':
+                    cb()
+                else:
+                    cb(payload)
+            except Exception as ex:
+                logger.warning("Callback %s của task %s lỗi: %s", kind, handle.name, ex)
+
+
+__all__ = ["TaskExecutor", "TaskHandle", "TaskCancelled"]
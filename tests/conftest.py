@@ -0,0 +1,19 @@
+"""Fixture chung: mỗi test chạy trên một thư mục dữ liệu tạm rỗng (không bao giờ đụng data/ thật)."""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import utils  # noqa: E402
+
+
+@pytest.fixture
+def data_dir(tmp_path):
+    previous = utils._data_dir_override
+    utils.set_data_dir(str(tmp_path))
+    try:
+        yield tmp_path
+    finally:
+        utils.set_data_dir(previous)
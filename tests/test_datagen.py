@@ -0,0 +1,26 @@
+"""Sinh dữ liệu giả lập: chỉ dùng sân thật, vượt sức chứa thì kéo dài số ngày."""
+import csv
+
+import pytest
+
+import datagen
+import utils
+
+
+def test_plan_scale_never_adds_courts():
+    days, occupancy = datagen.plan_scale(10_000_000, 2, 0.6, None)
+    assert occupancy == datagen.MAX_OCCUPANCY and days > datagen.DEFAULT_MAX_DAYS
+    days, occupancy = datagen.plan_scale(10_000, 2, 0.6, 30)
+    assert days > 30 and occupancy <= datagen.MAX_OCCUPANCY
+    assert datagen.plan_scale(10_000, 2, 0.6, None)[1] == 0.6
+
+
+def test_generated_rows_stay_on_real_courts(tmp_path):
+    res = datagen.generate_dataset(datagen.GenOptions(out_dir=str(tmp_path / 'gen'), rows=10_000, days=30,
+                                                      dirty_rate=0))
+    assert res.courts == len(utils.SCHEDULE_COURTS) and res.days > 30
+    with open(tmp_path / 'gen' / utils.DAILY_FILE, newline='', encoding='utf-8') as f:
+        courts = {row['san'] for row in csv.DictReader(f)}
+    assert courts == set(utils.SCHEDULE_COURTS)
+    with pytest.raises(ValueError, match='courts'):
+        datagen.generate_dataset(datagen.GenOptions(out_dir=str(tmp_path / 'x'), rows=10_000, courts=3))
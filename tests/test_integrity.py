@@ -0,0 +1,47 @@
+"""Kiểm tra toàn vẹn có checkpoint: journal bucket (ngày, sân) khi ghi qua app, quét toàn bộ khi file bị sửa ngoài."""
+import csv
+
+import utils
+
+
+def _checkpoint():
+    utils.append_daily_record('2025-08-04', 'Sân 1', '7h-8h', 100_000)
+    utils.append_daily_record('2025-08-05', 'Sân 2', '7h-8h', 100_000)
+    first = utils.check_data_integrity_cached()
+    assert first['mode'] == 'full' and first['overlap_count'] == 0
+    assert utils.check_data_integrity_cached()['mode'] == 'cached'
+
+
+def test_app_writes_check_only_dirty_buckets(data_dir):
+    _checkpoint()
+    utils.append_daily_record('2025-08-04', 'Sân 1', '7h-9h', 100_000, allow_overlap=True)
+    utils.append_daily_record('2025-08-06', 'Sân 1', '7h-8h', 100_000)
+    res = utils.check_data_integrity_cached()
+    assert (res['mode'], res['checked_buckets']) == ('incremental', 2)
+    assert res['overlap_count'] == 1 and res['total_records'] == 4
+    assert {(p['ngay'], p['san']) for p in res['overlap_pairs']} == {('2025-08-04', 'Sân 1')}
+    # Journal đã cắt sau checkpoint -> lần sau dùng lại kết quả
+    again = utils.check_data_integrity_cached()
+    assert again['mode'] == 'cached' and again['overlap_count'] == 1
+    # Xóa dòng chồng giờ cũng chỉ xét lại bucket đó
+    utils.delete_daily_record_by_id(utils.get_daily_records()[2].record_id)
+    res = utils.check_data_integrity_cached()
+    assert (res['mode'], res['checked_buckets'], res['overlap_count']) == ('incremental', 1, 0)
+
+
+def test_external_edit_forces_full_scan(data_dir):
+    _checkpoint()
+    with open(utils._abs_path(utils.DAILY_FILE), 'a', newline='', encoding='utf-8') as f:
+        csv.writer(f).writerow(['2025-08-05', 'Sân 2', '7h-8h', 90_000, 'Chơi', '', ''])  # Sửa tay ngoài app
+    res = utils.check_data_integrity_cached()
+    assert res['mode'] == 'full'
+    assert res['overlap_count'] == 1 and res['missing_id_count'] == 1
+    assert utils.check_data_integrity_cached()['mode'] == 'cached'
+
+
+def test_full_flag_rescans(data_dir):
+    _checkpoint()
+    utils.append_daily_record('2025-08-07', 'Sân 1', '7h-8h', 100_000)
+    res = utils.check_data_integrity_cached(full=True)
+    assert (res['mode'], res['total_records']) == ('full', 3)
+    assert utils.check_data_integrity_cached()['mode'] == 'cached'
@@ -0,0 +1,103 @@
+"""Store thống kê tháng: phiên bản theo tháng, ghi nối thêm, dọn lịch sử."""
+import csv
+import os
+
+import utils
+
+
+def _monthly_path():
+    return utils._abs_path(utils.MONTHLY_FILE)
+
+
+def _write_history(months, versions):
+    utils.ensure_monthly_file()
+    with open(_monthly_path(), 'a', newline='', encoding='utf-8') as f:
+        w = csv.writer(f)
+        for m in months:
+            for v in range(versions):
+                w.writerow([m, 1_000_000 + v, 1000, '', 999_000 + v, '0'])
+
+
+def _count_rewrites(monkeypatch):
+    calls = []
+    original = utils._rewrite_monthly_stats
+
+    def counting(keep_versions):
+        calls.append(1)
+        return original(keep_versions)
+
+    monkeypatch.setattr(utils, '_rewrite_monthly_stats', counting)
+    return calls
+
+
+def test_latest_version_wins_and_history_kept(data_dir):
+    utils.save_monthly_stat('2025-08', 100, 40, False, 'điện')
+    utils.save_monthly_stat('2025-08', 120, 40, False, 'điện')
+    utils.save_monthly_stat('2025-07', 90, 10, False)
+    assert [s['thang'] for s in utils.read_monthly_stats()] == ['2025-07', '2025-08']
+    cur = utils.get_monthly_stat('2025-08')
+    assert (cur['tong_doanh_thu_vnd'], cur['loi_nhuan_vnd'], cur['phien_ban']) == (120, 80, 2)
+    assert [v['tong_doanh_thu_vnd'] for v in utils.monthly_stat_history('2025-08')] == [100, 120]
+    utils.invalidate_all_caches(publish=False)
+    assert utils.get_monthly_stat('2025-08')['tong_doanh_thu_vnd'] == 120
+
+
+def test_identical_upsert_writes_nothing(data_dir):
+    utils.save_monthly_stat('2025-08', 100, 40, False, 'điện')
+    size = os.path.getsize(_monthly_path())
+    utils.save_monthly_stat('2025-08', 100, 40, False, 'điện')
+    assert os.path.getsize(_monthly_path()) == size
+
+
+def test_update_and_delete(data_dir):
+    assert not utils.update_monthly_stat('2025-08', 1, 1, '')
+    utils.save_monthly_stat('2025-08', 100, 40, True)
+    assert utils.update_monthly_stat('2025-08', 200, 50, 'sửa')
+    cur = utils.get_monthly_stat('2025-08')
+    assert (cur['tong_doanh_thu_vnd'], cur['chi_phi_ly_do'], cur['tu_tinh_tu_ngay']) == (200, 'sửa', True)
+    assert utils.delete_monthly_stat('2025-08')
+    assert not utils.delete_monthly_stat('2025-08')
+    assert utils.read_monthly_stats() == []
+
+
+def test_saves_on_long_full_history_stay_append_only(data_dir, monkeypatch):
+    # 40 tháng x đủ MONTHLY_HISTORY_KEEP phiên bản: không có gì để dọn
+    months = [f"{2020 + i // 12}-{i % 12 + 1:02d}" for i in range(40)]
+    _write_history(months, utils.MONTHLY_HISTORY_KEEP)
+    rewrites = _count_rewrites(monkeypatch)
+    for i in range(20):
+        size = os.path.getsize(_monthly_path())
+        utils.save_monthly_stat(f"2030-{i % 12 + 1:02d}", 500 + i, 10, False)
+        assert os.path.getsize(_monthly_path()) > size
+    assert rewrites == []
+    assert utils._monthly_stats_cache['rows'] == 40 * utils.MONTHLY_HISTORY_KEEP + 20
+
+
+def test_compaction_after_slack_keeps_newest_versions(data_dir, monkeypatch):
+    keep = utils.MONTHLY_HISTORY_KEEP
+    monkeypatch.setattr(utils, '_monthly_history_keep', lambda: keep)
+    _write_history(['2025-01'], keep)
+    rewrites = _count_rewrites(monkeypatch)
+    for i in range(utils.MONTHLY_COMPACT_SLACK):
+        utils.save_monthly_stat('2025-01', 2_000_000 + i, 1000, False)
+    assert rewrites == []
+    utils.save_monthly_stat('2025-01', 3_000_000, 1000, False)
+    assert len(rewrites) == 1
+    history = utils.monthly_stat_history('2025-01')
+    assert len(history) == keep
+    assert history[-1]['tong_doanh_thu_vnd'] == 3_000_000
+    with open(_monthly_path(), newline='', encoding='utf-8') as f:
+        assert len(list(csv.reader(f))) == keep + 1
+
+
+def test_header_column_order_is_respected(data_dir):
+    with open(_monthly_path(), 'w', newline='', encoding='utf-8') as f:
+        w = csv.writer(f)
+        w.writerow(['thang', 'chi_phi_tru_hao_vnd', 'tong_doanh_thu_vnd', 'chi_phi_ly_do', 'loi_nhuan_vnd',
+                    'tu_tinh_tu_ngay'])
+        w.writerow(['2025-06', '10', '100', 'a, b', '90', '0'])
+    utils.save_monthly_stat('2025-07', 300, 30, False, 'x, y')
+    with open(_monthly_path(), newline='', encoding='utf-8') as f:
+        last = list(csv.reader(f))[-1]
+    assert last == ['2025-07', '30', '300', 'x, y', '270', '0']
+    assert utils.get_monthly_stat('2025-06')['tong_doanh_thu_vnd'] == 100
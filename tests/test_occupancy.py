@@ -0,0 +1,69 @@
+"""Kiểm tra trùng lịch đặt lẻ / gói tháng qua index chiếm dụng."""
+import pytest
+
+import utils
+
+# 2025-08-04 là thứ 2
+MONDAY = '2025-08-04'
+
+
+def test_booking_on_subscription_slot_is_rejected(data_dir):
+    utils.add_month_subscription_with_time('2025-08', 'Nhóm A', 1, '2 (18:00-20:00)', 'Sân 1', 'Thứ 2')
+    with pytest.raises(utils.ScheduleConflictError, match='Nhóm A'):
+        utils.append_daily_record(MONDAY, 'Sân 1', '19h-20h', 100_000)
+    utils.append_daily_record(MONDAY, 'Sân 2', '19h-20h', 100_000)  # sân khác
+    utils.append_daily_record('2025-08-05', 'Sân 1', '19h-20h', 100_000)  # thứ 3
+    utils.append_daily_record(MONDAY, 'Sân 1', '19h-20h', 100_000, allow_overlap=True)
+    assert len(utils.month_conflicts('2025-08')) == 1
+
+
+def test_booking_overlap_with_booking_still_rejected(data_dir):
+    utils.append_daily_record(MONDAY, 'Sân 1', '8h-10h', 100_000)
+    with pytest.raises(ValueError, match='8h-10h'):
+        utils.append_daily_record(MONDAY, 'Sân 1', '9h-11h', 100_000)
+    utils.append_daily_record(MONDAY, 'Sân 1', '10h-11h', 100_000)
+
+
+def test_assumed_subscription_hours_do_not_block(data_dir):
+    # Gói chỉ lưu số giờ: khung 18h-20h chỉ là giả định
+    utils.add_month_subscription('2025-08', 'Nhóm cũ', 1, 2, 'Sân 1', 'Thứ 2')
+    utils.append_daily_record(MONDAY, 'Sân 1', '18h-19h', 100_000)
+    utils.add_month_subscription_with_time('2025-08', 'Nhóm B', 1, '2 (20:00-22:00)', 'Sân 1', 'Thứ 2')
+    conflicts = utils.month_conflicts('2025-08')
+    assert conflicts and all(c['gio_mac_dinh'] for c in conflicts)
+
+
+def test_subscription_rejected_on_booking_and_other_subscription(data_dir):
+    utils.append_daily_record(MONDAY, 'Sân 1', '7h-8h', 100_000)
+    with pytest.raises(utils.ScheduleConflictError) as ex:
+        utils.add_month_subscription_with_time('2025-08', 'Nhóm A', 1, '2 (7:00-9:00)', 'Sân 1', 'Thứ 2')
+    assert len(ex.value.conflicts) == 1
+    utils.add_month_subscription_with_time('2025-08', 'Nhóm A', 1, '2 (8:00-10:00)', 'Sân 1', 'Thứ 2')
+    with pytest.raises(utils.ScheduleConflictError, match='Nhóm A'):
+        utils.add_month_subscription_with_time('2025-08', 'Nhóm B', 1, '1 (9:00-10:00)', 'Sân 1', 'Thứ 2')
+    utils.add_month_subscription_with_time('2025-08', 'Nhóm B', 1, '1 (9:00-10:00)', 'Sân 1', 'Thứ 2',
+                                           allow_conflict=True)
+    kinds = {c['loai'] for c in utils.month_conflicts('2025-08')}
+    assert kinds == {'subscription-subscription'}
+
+
+def test_update_subscription_ignores_itself_but_checks_others(data_dir):
+    utils.add_month_subscription_with_time('2025-08', 'Nhóm A', 1, '2 (8:00-10:00)', 'Sân 1', 'Thứ 2')
+    assert utils.update_month_subscription_with_time('2025-08', 'Nhóm A', 'Nhóm A', 1, '2 (9:00-11:00)', 'Sân 1',
+                                                     'Thứ 2')
+    utils.append_daily_record('2025-08-06', 'Sân 1', '9h-10h', 100_000)  # thứ 4
+    with pytest.raises(utils.ScheduleConflictError):
+        utils.update_month_subscription_with_time('2025-08', 'Nhóm A', 'Nhóm A', 1, '2 (9:00-11:00)', 'Sân 1',
+                                                  'Thứ 2, Thứ 4')
+
+
+def test_appends_keep_occupancy_index_warm(data_dir):
+    utils.append_daily_record(MONDAY, 'Sân 1', '5h-6h', 100_000)
+    before = dict(utils.metrics.snapshot().get('counters', {}))
+    for h in range(6, 12):
+        utils.append_daily_record(MONDAY, 'Sân 1', f'{h}h-{h + 1}h', 100_000)
+    with pytest.raises(ValueError):
+        utils.append_daily_record(MONDAY, 'Sân 1', '8h-9h', 100_000)
+    after = utils.metrics.snapshot().get('counters', {})
+    if utils.metrics.enabled:
+        assert after.get('cache.occupancy.miss', 0) == before.get('cache.occupancy.miss', 0)
@@ -0,0 +1,124 @@
+"""Snapshot data/: khôi phục (kiểm tra chunk trước khi thay file), dọn theo max_backups, dùng lại chunk."""
+import os
+
+import pytest
+
+import utils
+from snapshot_store import SnapshotStore
+
+
+@pytest.fixture
+def snap_root(tmp_path_factory):
+    # Kho riêng ngoài thư mục dữ liệu: không ghi vào backups/ cạnh app, không tự chụp chính nó
+    return str(tmp_path_factory.mktemp('snapshots'))
+
+
+def _store(data_dir, root, **settings):
+    return SnapshotStore(root=root, data_dir=str(data_dir), settings={'compression_codec': 'zlib', **settings})
+
+
+def _read_all(data_dir):
+    out = {}
+    for name in sorted(os.listdir(data_dir)):
+        path = os.path.join(data_dir, name)
+        if os.path.isfile(path) and not name.startswith('.integrity_'):  # Sidecar không nằm trong snapshot
+            with open(path, 'rb') as f:
+                out[name] = f.read()
+    return out
+
+
+def _chunk_files(store):
+    return sorted(name for _root, _dirs, names in os.walk(store.chunk_dir) for name in names)
+
+
+def test_restore_round_trip(data_dir, snap_root):
+    utils.append_daily_record('2025-08-04', 'Sân 1', '7h-8h', 100_000)
+    utils.append_daily_record('2025-08-04', 'Sân 2', '7h-8h', 120_000)
+    store = _store(data_dir, snap_root)
+    snap = store.create_snapshot(label='truoc')
+    before = _read_all(data_dir)
+
+    utils.append_daily_record('2025-08-05', 'Sân 1', '9h-10h', 100_000)
+    utils.delete_daily_record_by_id(utils.get_daily_records()[0].record_id)
+    assert _read_all(data_dir) != before
+
+    res = store.restore_snapshot(snap['id'])
+    assert _read_all(data_dir) == before
+    assert sorted(r.gia_vnd for r in utils.get_daily_records()) == [100_000, 120_000]
+    assert res['safety_snapshot'] in store.list_snapshots()
+    assert not [n for n in os.listdir(data_dir) if n.endswith('.restore.tmp')]
+
+
+@pytest.mark.parametrize('damage', ['missing', 'corrupt'])
+def test_restore_refuses_damaged_snapshot_and_keeps_data(data_dir, snap_root, damage):
+    utils.append_daily_record('2025-08-04', 'Sân 1', '7h-8h', 100_000)
+    store = _store(data_dir, snap_root)
+    snap = store.create_snapshot()
+    utils.append_daily_record('2025-08-05', 'Sân 1', '7h-8h', 100_000)
+    current = _read_all(data_dir)
+
+    daily = next(e for e in snap['files'] if e['path'] == utils.DAILY_FILE)
+    chunk = store.chunk_path(daily['chunks'][0][0])
+    if damage == 'missing':
+        os.remove(chunk)
+        expected = FileNotFoundError
+    else:
+        with open(chunk, 'wb') as f:
+            f.write(b'R' + b'khong phai du lieu goc')
+        expected = ValueError
+    with pytest.raises(expected):
+        store.restore_snapshot(snap['id'])
+    assert _read_all(data_dir) == current
+    assert store.list_snapshots() == [snap['id']]  # Chưa chụp bản an toàn khi còn lỗi
+    assert len(utils.get_daily_records()) == 2
+
+
+def test_prune_keeps_max_backups_and_drops_unused_chunks(data_dir, snap_root):
+    store = _store(data_dir, snap_root, max_backups=2)
+    ids = []
+    for i in range(4):
+        utils.append_daily_record(f'2025-08-{i + 1:02d}', 'Sân 1', '7h-8h', 100_000 + i)
+        ids.append(store.create_snapshot()['id'])
+    assert store.list_snapshots() == ids[-2:]
+    live = sorted({c[0] for sid in ids[-2:] for e in store.load_manifest(sid)['files'] for c in e['chunks']})
+    assert _chunk_files(store) == live
+    assert store.prune(keep=1) == [ids[-2]]
+    assert store.list_snapshots() == ids[-1:]
+
+
+def test_unchanged_files_reuse_chunks(data_dir, snap_root):
+    utils.append_daily_record('2025-08-04', 'Sân 1', '7h-8h', 100_000)
+    utils.add_month_subscription('2025-08', 'Nhóm A', 1, 2, 'Sân 2', 'Thứ 2')
+    store = _store(data_dir, snap_root)
+    first = store.create_snapshot()
+    chunks = _chunk_files(store)
+
+    again = store.create_snapshot()['stats']
+    assert again['unchanged_files'] == again['files'] == first['stats']['files']
+    assert (again['new_chunks'], again['bytes_written']) == (0, 0)
+    assert again['reused_chunks'] == first['stats']['new_chunks'] + first['stats']['reused_chunks']
+    assert _chunk_files(store) == chunks
+
+    utils.append_daily_record('2025-08-05', 'Sân 1', '7h-8h', 100_000)
+    changed = store.create_snapshot()['stats']
+    assert changed['unchanged_files'] == changed['files'] - 1
+    assert changed['new_chunks'] >= 1
+
+
+def test_restore_rolls_back_water_ledger_and_stock(data_dir, snap_root):
+    utils.add_water_item('Aquafina', 20, 10_000)
+    utils.record_water_sale('2025-08-01', 'Aquafina', 5)
+    store = _store(data_dir, snap_root)
+    snap = store.create_snapshot()
+    ledger = utils.read_water_ledger()
+
+    utils.record_water_sale('2025-08-02', 'Aquafina', 7)
+    utils.add_water_item('Revive', 12, 15_000)
+    assert utils.water_stock() == {'aquafina': 8, 'revive': 12}
+
+    store.restore_snapshot(snap['id'])
+    assert utils.water_stock() == {'aquafina': 15}
+    assert utils.read_water_ledger() == ledger
+    assert [(it['ten'], it['so_luong_ton']) for it in utils.read_water_items()] == [('Aquafina', 15)]
+    utils.record_water_sale('2025-08-03', 'Aquafina', 1)  # Sổ cái tiếp tục từ đúng chỗ đã khôi phục
+    assert utils.water_stock()['aquafina'] == 14
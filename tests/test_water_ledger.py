@@ -0,0 +1,52 @@
+"""Tồn kho nước qua sổ cái (water_stock_ledger.csv)."""
+import os
+
+import utils
+
+
+def test_new_item_on_empty_data_dir_counts_stock_once(data_dir):
+    assert not os.path.exists(utils._abs_path(utils.WATER_LEDGER_FILE))
+    utils.add_water_item('Aquafina', 10, 10_000)
+    assert utils.water_stock()['aquafina'] == 10
+    assert [it['so_luong_ton'] for it in utils.read_water_items()] == [10]
+    # Nạp lại từ đĩa (bỏ cache trong tiến trình) vẫn ra cùng số
+    utils.invalidate_all_caches(publish=False)
+    assert utils.water_stock()['aquafina'] == 10
+
+
+def test_opening_balance_from_existing_catalog(data_dir):
+    utils.ensure_water_items_file()
+    with open(utils._abs_path(utils.WATER_ITEMS_FILE), 'a', newline='', encoding='utf-8') as f:
+        f.write('Revive,24,12000\r\n')
+    utils.add_water_item('Aquafina', 5, 10_000)
+    assert utils.water_stock() == {'revive': 24, 'aquafina': 5}
+
+
+def test_sale_receipt_and_reversal(data_dir):
+    utils.add_water_item('Aquafina', 10, 10_000)
+    utils.add_water_item('Aquafina', 5, 10_000)
+    utils.record_water_sale('2025-08-01', 'Aquafina', 3)
+    assert utils.water_stock()['aquafina'] == 12
+    assert utils.delete_water_sale('2025-08-01', 'Aquafina', 3, 10_000)
+    assert utils.water_stock()['aquafina'] == 15
+
+
+def test_reversal_re_adds_deleted_item_once(data_dir):
+    utils.add_water_item('Aquafina', 4, 10_000)
+    utils.record_water_sale('2025-08-01', 'Aquafina', 4)
+    utils.delete_water_item('Aquafina')
+    # Sổ cái chưa có (vd: dữ liệu cũ khôi phục) -> lần thêm lại danh mục phải khởi tạo sổ cái trước
+    os.remove(utils._abs_path(utils.WATER_LEDGER_FILE))
+    utils.invalidate_all_caches(publish=False)
+    assert utils.delete_water_sale('2025-08-01', 'Aquafina', 4, 10_000)
+    assert utils.water_stock()['aquafina'] == 4
+
+
+def test_snapshot_replay_matches(data_dir):
+    utils.add_water_item('Aquafina', 100, 10_000)
+    for _ in range(7):
+        utils.record_water_sale('2025-08-01', 'Aquafina', 2)
+    utils.snapshot_water_stock()
+    utils.record_water_sale('2025-08-02', 'Aquafina', 1)
+    utils.invalidate_all_caches(publish=False)
+    assert utils.water_stock()['aquafina'] == 85
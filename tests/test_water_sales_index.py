@@ -0,0 +1,84 @@
+"""Index bán nước (tổng theo ngày / tháng / loại) phải luôn khớp với water_sales.csv."""
+import csv
+
+import utils
+
+
+def _fresh_totals():
+    # Tính lại trực tiếp từ file, không qua index
+    day, month, items = {}, {}, {}
+    with open(utils._abs_path(utils.WATER_SALES_FILE), newline='', encoding='utf-8') as f:
+        for r in csv.DictReader(f):
+            tong = int(r['tong_vnd'])
+            day[r['ngay']] = day.get(r['ngay'], 0) + tong
+            month[r['ngay'][:7]] = month.get(r['ngay'][:7], 0) + tong
+            acc = items.setdefault((r['ngay'][:7], r['ten'].lower()), [0, 0])
+            acc[0] += int(r['so_luong'])
+            acc[1] += tong
+    return day, month, items
+
+
+def _assert_index_matches_file():
+    day, month, items = _fresh_totals()
+    for ngay, tong in day.items():
+        assert utils.day_water_sales_total(ngay) == tong
+    for thang, tong in month.items():
+        assert utils.compute_month_water_sales_total(thang) == tong
+        got = {it['ten'].lower(): [it['so_luong'], it['tong_vnd']] for it in utils.water_sales_item_totals(thang)}
+        assert got == {ten: v for (m, ten), v in items.items() if m == thang}
+    overall = {}
+    for (_m, ten), (so_luong, tong) in items.items():
+        acc = overall.setdefault(ten, [0, 0])
+        acc[0] += so_luong
+        acc[1] += tong
+    assert {it['ten'].lower(): [it['so_luong'], it['tong_vnd']] for it in utils.water_sales_item_totals()} == overall
+    assert len(utils.read_water_sales()) == sum(1 for _ in utils._parse_water_sales_file())
+
+
+def _seed(data_dir):
+    utils.add_water_item('Aquafina', 100, 10_000)
+    utils.add_water_item('Revive', 100, 15_000)
+
+
+def test_sales_update_index_in_place(data_dir):
+    _seed(data_dir)
+    utils.record_water_sale('2025-08-01', 'Aquafina', 2)
+    _assert_index_matches_file()  # Dựng index lần đầu
+    misses = utils.metrics.snapshot().get('counters', {}).get('cache.water_sales.miss', 0)
+    utils.record_water_sale('2025-08-01', 'Revive', 1)
+    utils.record_water_sale('2025-08-31', 'Aquafina', 3)
+    utils.record_water_sale('2025-09-01', 'Aquafina', 1)
+    _assert_index_matches_file()
+    assert utils.day_water_sales_total('2025-08-01') == 35_000
+    assert utils.compute_month_water_sales_total('2025-08') == 65_000
+    if utils.metrics.enabled:
+        assert utils.metrics.snapshot()['counters'].get('cache.water_sales.miss', 0) == misses
+
+
+def test_deleted_sale_leaves_no_stale_totals(data_dir):
+    _seed(data_dir)
+    utils.record_water_sale('2025-08-01', 'Aquafina', 2)
+    utils.record_water_sale('2025-08-01', 'Aquafina', 2)
+    utils.record_water_sale('2025-08-02', 'Revive', 4)
+    _assert_index_matches_file()
+    assert utils.delete_water_sale('2025-08-02', 'Revive', 4, 15_000)
+    _assert_index_matches_file()
+    assert utils.day_water_sales_total('2025-08-02') == 0
+    assert [it['ten'] for it in utils.water_sales_item_totals('2025-08')] == ['Aquafina']
+    assert utils.delete_water_sale('2025-08-01', 'Aquafina', 2, 10_000)
+    _assert_index_matches_file()
+    assert utils.day_water_sales_total('2025-08-01') == 20_000
+    # Bán lại sau khi xóa: index dựng lại rồi tiếp tục cộng thêm tại chỗ
+    utils.record_water_sale('2025-08-02', 'Revive', 1)
+    _assert_index_matches_file()
+
+
+def test_external_edit_rebuilds_index(data_dir):
+    _seed(data_dir)
+    utils.record_water_sale('2025-08-01', 'Aquafina', 2)
+    _assert_index_matches_file()
+    with open(utils._abs_path(utils.WATER_SALES_FILE), 'a', newline='', encoding='utf-8') as f:
+        csv.writer(f).writerow(['2025-08-01', 'Revive', 2, 15_000, 30_000])  # Ghi ngoài app
+    utils.record_water_sale('2025-08-01', 'Aquafina', 1)
+    _assert_index_matches_file()
+    assert utils.day_water_sales_total('2025-08-01') == 60_000
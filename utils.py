@@ -1,17 +1,20 @@
 from __future__ import annotations
 import csv
 import io
+import json
 import os
 import sys
-from datetime import date, datetime
+from datetime import date, datetime, timedelta
 from typing import List, Dict, Any, Optional, Tuple
-from collections import defaultdict
-from models import DailyRecord, MonthlyStat
+from collections import defaultdict, deque
+from models import DailyRecord, MonthlyStat, ChangeEvent, SubscriptionOccurrence
+import calendar
 import zipfile  # vẫn dùng ở chỗ khác nếu có
 from datetime import datetime as _dt
 import time
 import logging
 import random
+import threading
 from contextlib import contextmanager
 
 # Lightweight module logger (không buộc cấu hình phức tạp)
@@ -47,11 +50,21 @@ WATER_SALE_HEADERS = ["ngay", "ten", "so_luong", "don_gia_vnd", "tong_vnd"]
 
 _daily_cache: List[DailyRecord] | None = None
 _daily_cache_dirty: bool = True
+_daily_day_index: Dict[str, List[DailyRecord]] = {}  # { 'YYYY-MM-DD': [DailyRecord, ...] } dựng từ _daily_cache
+_daily_day_index_src: List[DailyRecord] | None = None  # list nguồn đã dùng để dựng index (so sánh identity)
+_daily_day_totals: Dict[str, int] = {}  # tổng tiền theo ngày, tính lười từ index, xóa khi index dựng lại
 _undo_stack: List[Tuple[str, List[str]]] = []
 MAX_PRICE_WARN = 5_000_000
 SAFE_WRITE_RETRY = 3
 SAFE_WRITE_DELAY = 0.3
 _month_total_cache: Dict[str, Dict[str, Any]] = {}  # { 'YYYY-MM': {'signature': str, 'value': int} }
+# Khóa nạp cache: đọc dữ liệu có thể chạy từ worker nền (task_executor) song song luồng Tk
+_cache_lock = threading.RLock()
+APP_CONFIG_FILE = os.path.join("config", "app_config.json")
+_app_config_cache: Dict[str, Any] | None = None
+# Bus sự kiện thay đổi: token -> (callback, tập bảng quan tâm hoặc None = tất cả)
+_change_subscribers: Dict[int, Tuple[Any, Optional[frozenset]]] = {}
+_change_seq = 0
 
 # Price constants for calculator
 COURT_PRICES = {
@@ -107,8 +120,13 @@ def _base_dir() -> str:
         return os.path.dirname(sys.executable)
     return os.path.dirname(os.path.abspath(__file__))
 
+# Thư mục dữ liệu thay thế (vd: bộ dữ liệu tổng hợp để load test / benchmark): env SUK_DATA_DIR
+# hoặc set_data_dir(). Khi đặt, mọi CSV + file phụ trong data/ trỏ vào đó và không migrate từ root.
+DATA_DIR_ENV = "SUK_DATA_DIR"
+_data_dir_override: Optional[str] = os.path.abspath(os.environ[DATA_DIR_ENV]) if os.environ.get(DATA_DIR_ENV) else None
+
 def _ensure_data_dir(base: str) -> str:
-    data_dir = os.path.join(base, DATA_DIR_NAME)
+    data_dir = _data_dir_override or os.path.join(base, DATA_DIR_NAME)
     try:
         if not os.path.isdir(data_dir):
             os.makedirs(data_dir, exist_ok=True)
@@ -131,7 +149,7 @@ def _abs_path(filename: str) -> str:
     if filename in _CSV_FILE_SET:
         data_dir = _ensure_data_dir(base)
         data_path = os.path.join(data_dir, filename)
-        if os.path.exists(data_path):
+        if os.path.exists(data_path) or _data_dir_override:
             return data_path
         root_path = os.path.join(base, filename)
         if os.path.exists(root_path):
@@ -144,9 +162,23 @@ def _abs_path(filename: str) -> str:
                 return root_path
         # Chưa có ở đâu -> sẽ được tạo mới trong data
         return data_path
+    if _data_dir_override and filename.startswith(DATA_DIR_NAME + os.sep):
+        return os.path.join(_ensure_data_dir(base), filename[len(DATA_DIR_NAME) + 1:])
     # File không thuộc nhóm CSV: hành vi cũ (root)
     return os.path.join(base, filename)
 
+def data_dir() -> str:
+    """Thư mục dữ liệu đang dùng (data/ cạnh app hoặc thư mục thay thế)."""
+    return _ensure_data_dir(_base_dir())
+
+def set_data_dir(path: Optional[str]) -> str:
+    """Chuyển sang thư mục dữ liệu khác (None = data/ mặc định), xóa toàn bộ cache.
+    Trả về thư mục đang dùng sau khi chuyển."""
+    global _data_dir_override
+    _data_dir_override = os.path.abspath(path) if path else None
+    invalidate_all_caches()
+    return data_dir()
+
 _record_id_counter = int(time.time())  # seed đơn giản tránh trùng trong phiên
 
 def _generate_record_id() -> str:
@@ -166,11 +198,13 @@ def ensure_daily_file():
             csv.writer(f).writerow(DAILY_HEADERS)
         return
     try:
+        # Chỉ đọc header; cả file chỉ được nạp khi thực sự cần migrate (hàm này chạy trước mọi lần đọc)
         with open(path, "r", newline="", encoding="utf-8") as f:
-            rows = list(csv.reader(f))
-        if not rows:
+            header = next(csv.reader(f), None)
+        if not header or header == DAILY_HEADERS:
             return
-        header = rows[0]
+        with open(path, "r", newline="", encoding="utf-8") as f:
+            rows = list(csv.reader(f))
         if header == ["ngay", "san", "khung_gio", "gia_vnd"]:
             # V1 -> V3 (thêm loai, nguoi, record_id)
             new_rows = [DAILY_HEADERS]
@@ -225,12 +259,14 @@ def ensure_monthly_file():
         with open(path, "w", newline="", encoding="utf-8") as f:
             csv.writer(f).writerow(MONTHLY_HEADERS)
         return
-    # migrate
+    # migrate (chỉ đọc header; đọc cả file khi thật sự cần chèn cột)
     try:
         with open(path, "r", newline="", encoding="utf-8") as f:
-            rows = list(csv.reader(f))
-        if not rows:
+            header = next(csv.reader(f), None)
+        if not header or "chi_phi_ly_do" in header:
             return
+        with open(path, "r", newline="", encoding="utf-8") as f:
+            rows = list(csv.reader(f))
         header = rows[0]
         if "chi_phi_ly_do" not in header:
             # header cũ dạng: thang, tong_doanh_thu_vnd, chi_phi_tru_hao_vnd, loi_nhuan_vnd, tu_tinh_tu_ngay
@@ -295,14 +331,264 @@ def ensure_all_data_files():
     ensure_water_sales_file()
 
 
+def load_app_config(force_reload: bool = False) -> Dict[str, Any]:
+    """Đọc config/app_config.json (cache trong phiên).
+    Thiếu file hoặc JSON lỗi -> {} để app vẫn chạy với giá trị mặc định."""
+    global _app_config_cache
+    if _app_config_cache is not None and not force_reload:
+        return _app_config_cache
+    try:
+        with open(_abs_path(APP_CONFIG_FILE), 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        _app_config_cache = data if isinstance(data, dict) else {}
+    except Exception as ex:
+        logger.debug("load_app_config: dùng mặc định (%s)", ex)
+        _app_config_cache = {}
+    return _app_config_cache
+
+def get_config_value(section: str, key: str, default: Any = None) -> Any:
+    """Lấy config[section][key], trả default nếu thiếu."""
+    sec = load_app_config().get(section)
+    if isinstance(sec, dict) and key in sec:
+        return sec[key]
+    return default
+
+
+# ---------------------- METRICS (ĐO HIỆU NĂNG TRONG TIẾN TRÌNH) ----------------------
+# Bộ đếm (counter) + histogram (ms hoặc số dòng) dùng chung cho utils / UI / maintenance.
+# Bật/tắt theo performance.log_performance (mặc định bật); khi tắt mọi lời gọi gần như không tốn gì.
+# Tên chỉ số: 'call.<hàm>' (ms mỗi lời gọi), 'errors.<hàm>', 'cache.<tên>.hit|miss',
+# 'rows_parsed.<bảng>', 'lock_wait_ms.file' / 'lock_wait_ms.cache', 'lock.timeouts'.
+METRICS_RESERVOIR = 2048  # Số mẫu gần nhất giữ lại mỗi histogram để tính percentile
+METRICS_FILE = os.path.join("diagnostics", "metrics_latest.json")
+
+
+class _Histogram:
+    __slots__ = ('count', 'total', 'min', 'max', 'samples')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = float('inf')
+        self.max = 0.0
+        self.samples: deque = deque(maxlen=METRICS_RESERVOIR)
+
+    def add(self, value: float):
+        self.count += 1
+        self.total += value
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+        self.samples.append(value)
+
+    def summary(self) -> Dict[str, Any]:
+        ordered = sorted(self.samples)
+
+        def pct(p: float) -> float:
+            return ordered[min(len(ordered) - 1, int(p * len(ordered)))] if ordered else 0.0
+        return {
+            'count': self.count, 'total': round(self.total, 3),
+            'mean': round(self.total / self.count, 3) if self.count else 0.0,
+            'min': round(self.min, 3) if self.count else 0.0, 'max': round(self.max, 3),
+            'p50': round(pct(0.50), 3), 'p95': round(pct(0.95), 3), 'p99': round(pct(0.99), 3),
+        }
+
+
+class MetricsRegistry:
+    """Registry chỉ số an toàn luồng (worker nền + luồng Tk cùng ghi)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, int] = defaultdict(int)
+        self._histograms: Dict[str, _Histogram] = {}
+        self._enabled: Optional[bool] = None  # None = đọc config lần đầu dùng
+        self.started_at = time.time()
+
+    @property
+    def enabled(self) -> bool:
+        if self._enabled is None:
+            self._enabled = bool(get_config_value('performance', 'log_performance', True))
+        return self._enabled
+
+    def configure(self, enabled: Optional[bool]):
+        """Bật/tắt cưỡng bức (None = theo config)."""
+        self._enabled = enabled
+
+    def inc(self, name: str, value: int = 1):
+        if self.enabled:
+            with self._lock:
+                self._counters[name] += value
+
+    def observe(self, name: str, value: float):
+        if self.enabled:
+            with self._lock:
+                hist = self._histograms.get(name)
+                if hist is None:
+                    hist = self._histograms[name] = _Histogram()
+                hist.add(value)
+
+    @contextmanager
+    def timer(self, name: str):
+        """Đo thời gian khối lệnh (ms) vào histogram name."""
+        if not self.enabled:
+            yield
+            return
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, (time.perf_counter() - t0) * 1000.0)
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+            self.started_at = time.time()
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self._counters)
+            hists = {k: h.summary() for k, h in self._histograms.items()}
+        return {
+            'enabled': self.enabled,
+            'since': datetime.fromtimestamp(self.started_at).strftime('%Y-%m-%d %H:%M:%S'),
+            'taken_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'counters': dict(sorted(counters.items())),
+            'histograms': dict(sorted(hists.items())),
+        }
+
+    def save(self, path: Optional[str] = None) -> str:
+        """Ghi snapshot ra JSON (mặc định diagnostics/metrics_latest.json cạnh app)."""
+        path = path or _abs_path(METRICS_FILE)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(self.snapshot(), f, ensure_ascii=False, indent=2)
+        os.replace(tmp, path)
+        return path
+
+
+metrics = MetricsRegistry()
+
+
+def _instrumented(name: str, fn):
+    """Bọc hàm public: đếm lời gọi, thời gian (call.<name>) và lỗi (errors.<name>)."""
+    import functools
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        if not metrics.enabled:
+            return fn(*args, **kwargs)
+        t0 = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        except Exception:
+            metrics.inc('errors.' + name)
+            raise
+        finally:
+            metrics.observe('call.' + name, (time.perf_counter() - t0) * 1000.0)
+    wrapper.__wrapped_metrics__ = True
+    return wrapper
+
+
+def format_metrics(snapshot: Dict[str, Any]) -> str:
+    """Bảng chữ của snapshot (maintenance.py metrics / log)."""
+    lines = [f"Metrics từ {snapshot.get('since')} tới {snapshot.get('taken_at')}"
+             + ("" if snapshot.get('enabled', True) else " (đang tắt: performance.log_performance=false)")]
+    hists = snapshot.get('histograms', {})
+    if hists:
+        lines.append(f"  {'histogram':<40}{'count':>8}{'total':>12}{'mean':>10}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}")
+        for name, h in hists.items():
+            lines.append(f"  {name:<40}{h['count']:>8}{h['total']:>12.1f}{h['mean']:>10.2f}{h['p50']:>10.2f}"
+                         f"{h['p95']:>10.2f}{h['p99']:>10.2f}{h['max']:>10.2f}")
+    counters = snapshot.get('counters', {})
+    if counters:
+        lines.append(f"  {'counter':<40}{'value':>12}")
+        for name, v in counters.items():
+            lines.append(f"  {name:<40}{v:>12}")
+    if not hists and not counters:
+        lines.append("  (chưa có số liệu)")
+    return "\n".join(lines)
+
 def _invalidate_cache():
-    global _daily_cache_dirty
+    global _daily_cache_dirty, _occupancy_generation
     _daily_cache_dirty = True
+    _occupancy_generation += 1
     _invalidate_month_cache()
+    _week_occupancy_cache.clear()
 
 def _invalidate_month_cache():
     _month_total_cache.clear()
 
+def invalidate_all_caches(publish: bool = True):
+    """Xóa mọi cache dữ liệu trong tiến trình (dùng sau khi file CSV bị thay từ bên ngoài, vd: khôi phục).
+    Undo stack cũng bị xóa vì các dòng trong đó thuộc dữ liệu trước khi thay. publish=True -> phát sự kiện
+    'reloaded' cho mọi bảng để UI nạp lại."""
+    global _daily_cache, _daily_cache_dirty, _daily_day_index, _daily_day_index_src, _app_config_cache
+    with _cache_lock:
+        _daily_cache = None
+        _daily_cache_dirty = True
+        _daily_day_index = {}
+        _daily_day_index_src = None
+        _daily_day_totals.clear()
+        _month_total_cache.clear()
+        _week_occupancy_cache.clear()
+        _subscription_cache.clear()
+        _subscription_calendar_cache.clear()
+        _occupancy_cache.clear()
+        _monthly_stats_cache.clear()
+        _water_sales_cache.clear()
+        _water_stock.clear()
+        _water_catalog_cache.clear()
+        _undo_stack.clear()
+        _app_config_cache = None
+    metrics.configure(None)  # đọc lại performance.log_performance
+    # Checkpoint toàn vẹn không còn khớp dữ liệu mới -> lần kiểm tra sau quét toàn bộ
+    for name in (INTEGRITY_STATE_FILE, INTEGRITY_JOURNAL_FILE):
+        try:
+            os.remove(_abs_path(name))
+        except OSError:
+            pass
+    if publish:
+        for filename in sorted(_CSV_FILE_SET):
+            _publish_change(_table_of(filename), 'reloaded')
+
+# ---------------------- SỰ KIỆN THAY ĐỔI (CHANGE EVENTS) ----------------------
+# Tên bảng = tên file CSV bỏ đuôi: 'daily_records', 'monthly_stats', 'monthly_subscriptions',
+# 'profit_shares', 'water_items', 'water_sales'.
+
+def subscribe_changes(callback, tables: Optional[List[str]] = None) -> int:
+    """Đăng ký nhận ChangeEvent sau mỗi lần ghi dữ liệu. tables=None -> mọi bảng.
+    Callback chạy đồng bộ trên luồng đã ghi; UI nên tự gom và đẩy về luồng Tk.
+    Trả về token để hủy đăng ký."""
+    global _change_seq
+    with _cache_lock:
+        _change_seq += 1
+        _change_subscribers[_change_seq] = (callback, frozenset(tables) if tables else None)
+        return _change_seq
+
+def unsubscribe_changes(token: int) -> bool:
+    with _cache_lock:
+        return _change_subscribers.pop(token, None) is not None
+
+def _publish_change(table: str, action: str, record_ids=(), days=(), months=()):
+    """Phát ChangeEvent tới các subscriber. months tự suy ra từ days nếu không truyền.
+    Lỗi trong callback chỉ ghi log, không làm hỏng thao tác ghi."""
+    days = tuple(sorted({d for d in days if d}))
+    months = tuple(sorted({m for m in months if m} | {d[:7] for d in days}))
+    event = ChangeEvent(table, action, tuple(i for i in record_ids if i), days, months)
+    with _cache_lock:
+        targets = [cb for cb, tables in _change_subscribers.values() if tables is None or table in tables]
+    for cb in targets:
+        try:
+            cb(event)
+        except Exception as ex:
+            logger.warning("change subscriber lỗi (%s %s): %s", table, action, ex)
+
+def _table_of(filename: str) -> str:
+    return os.path.splitext(os.path.basename(filename))[0]
+
 def _file_mtime_or_0(filename: str) -> int:
     try:
         return int(os.path.getmtime(_abs_path(filename)))
@@ -324,10 +610,11 @@ def append_daily_record(ngay: str, san: str, khung_gio: str, gia_vnd: int, allow
     path = _abs_path(DAILY_FILE)
     norm_slot = normalize_time_slot(khung_gio)
     if not allow_overlap:
-        existing = get_daily_records()
-        for r in existing:
-            if r.ngay == ngay and r.san == san and _time_overlap(r.khung_gio, norm_slot):
-                raise ValueError(f"Khung giờ chồng chéo với bản ghi đã có: {r.khung_gio}")
+        # Tra index chiếm dụng của tháng (đặt lẻ + gói tháng) thay vì quét toàn bộ lịch sử
+        conflict = _booking_conflict_error(ngay, san, norm_slot)
+        if conflict:
+            raise ScheduleConflictError(conflict)
+    generation, sig_before = _occupancy_generation, _file_signature(DAILY_FILE)
 
     loai_norm = loai.strip().title() if loai else ""
     # Sanitize free-text fields to reduce risk when user opens CSV in spreadsheet apps.
@@ -342,6 +629,11 @@ def append_daily_record(ngay: str, san: str, khung_gio: str, gia_vnd: int, allow
     _undo_stack.append((path, row))
     _invalidate_cache()
     _invalidate_month_cache()
+    _note_booking_appended(generation, sig_before,
+                           DailyRecord(ngay, san, norm_slot, gia_vnd, loai=safe_loai, nguoi=safe_nguoi,
+                                       record_id=record_id), row)
+    _mark_integrity_dirty((ngay, san))
+    _publish_change(_table_of(DAILY_FILE), 'inserted', (record_id,), (ngay,))
 
 
 def read_daily_records_dict(include_id: bool = True) -> List[Dict[str, Any]]:
@@ -370,10 +662,18 @@ def read_daily_records_grouped_by_date() -> Dict[str, List[Dict[str, Any]]]:
 
 
 def get_daily_records(force_reload: bool = False) -> List[DailyRecord]:
+    t0 = time.perf_counter()
+    with _cache_lock:
+        metrics.observe('lock_wait_ms.cache', (time.perf_counter() - t0) * 1000.0)
+        return _load_daily_records(force_reload)
+
+def _load_daily_records(force_reload: bool) -> List[DailyRecord]:
     global _daily_cache, _daily_cache_dirty
     ensure_daily_file()
     if _daily_cache is not None and not _daily_cache_dirty and not force_reload:
+        metrics.inc('cache.daily_records.hit')
         return _daily_cache
+    metrics.inc('cache.daily_records.miss')
     path = _abs_path(DAILY_FILE)
     recs: List[DailyRecord] = []
     with open(path, "r", newline="", encoding="utf-8") as f:
@@ -395,8 +695,28 @@ def get_daily_records(force_reload: bool = False) -> List[DailyRecord]:
             idx += 1
     _daily_cache = recs
     _daily_cache_dirty = False
+    metrics.inc('rows_parsed.daily_records', len(recs))
     return recs
 
+def _get_day_index() -> Dict[str, List[DailyRecord]]:
+    """Index ngày -> danh sách bản ghi, dựng lại chỉ khi cache daily được nạp lại."""
+    global _daily_day_index, _daily_day_index_src
+    with _cache_lock:
+        recs = get_daily_records()
+        if _daily_day_index_src is not recs:
+            metrics.inc('cache.day_index.miss')
+            index: Dict[str, List[DailyRecord]] = defaultdict(list)
+            for r in recs:
+                index[r.ngay].append(r)
+            _daily_day_index = dict(index)
+            _daily_day_index_src = recs
+            _daily_day_totals.clear()
+        return _daily_day_index
+
+def get_daily_records_for_day(ngay: str) -> List[DailyRecord]:
+    """Các bản ghi của một ngày (YYYY-MM-DD) tra qua index, không quét toàn bộ lịch sử."""
+    return list(_get_day_index().get(ngay, ()))
+
 def delete_daily_record_by_id(record_id: str) -> bool:
     """Xóa bản ghi theo record_id (nếu file có cột). Không thay thế hàm cũ – chỉ chính xác hơn.
     Trả True nếu xóa."""
@@ -427,6 +747,8 @@ def delete_daily_record_by_id(record_id: str) -> bool:
             csv.writer(f).writerows(new_rows)
         os.replace(tmp, path)
     _invalidate_cache()
+    _mark_integrity_dirty(tuple(removed[:2]))
+    _publish_change(_table_of(DAILY_FILE), 'deleted', (record_id,), (removed[0],))
     return True
 
 def find_daily_record_by_id(record_id: str) -> Optional[DailyRecord]:
@@ -473,6 +795,9 @@ def delete_daily_record(ngay: str, san: str, khung_gio: str, gia_vnd: int) -> bo
         if removed:
             _undo_stack.append((path, removed))
         _invalidate_cache()
+        rid = removed[6] if removed and len(removed) > 6 else None
+        _mark_integrity_dirty((ngay, san))
+        _publish_change(_table_of(DAILY_FILE), 'deleted', (rid,), (ngay,))
     _invalidate_month_cache()
     return changed
 
@@ -493,6 +818,7 @@ def update_daily_record(old_ngay: str, old_san: str, old_khung: str, old_gia_vnd
     changed = False
     new_rows = [header]
     has_id = 'record_id' in header
+    updated_id = None
     # Overlap pre-check (additive, optional)
     if check_overlap:
         try:
@@ -521,6 +847,7 @@ def update_daily_record(old_ngay: str, old_san: str, old_khung: str, old_gia_vnd
                 if has_id:
                     new_row.append(record_id or '')
                 new_rows.append(new_row)
+                updated_id = record_id
                 changed = True
                 continue
         new_rows.append(r)
@@ -531,6 +858,8 @@ def update_daily_record(old_ngay: str, old_san: str, old_khung: str, old_gia_vnd
                 csv.writer(f).writerows(new_rows)
             os.replace(tmp, path)
         _invalidate_cache()
+        _mark_integrity_dirty((old_ngay, old_san), (new_ngay, new_san))
+        _publish_change(_table_of(DAILY_FILE), 'updated', (updated_id,), (old_ngay, new_ngay))
     _invalidate_month_cache()
     return changed
 
@@ -552,9 +881,11 @@ def undo_last_action() -> bool:
     # Nếu hàng cuối bằng row -> pop (undo append)
     if data_rows and data_rows[-1] == row:
         data_rows = data_rows[:-1]
+        action = 'deleted'
     else:
         # coi như undo delete -> thêm lại cuối
         data_rows.append(row)
+        action = 'inserted'
     tmp = path + ".tmp"
     with _file_lock(path):
         with open(tmp, "w", newline="", encoding="utf-8") as f:
@@ -563,11 +894,154 @@ def undo_last_action() -> bool:
             w.writerows(data_rows)
         os.replace(tmp, path)
     _invalidate_cache()
+    table = _table_of(path)
+    if table == _table_of(DAILY_FILE):
+        rid = row[6] if len(row) > 6 else None
+        _mark_integrity_dirty(tuple(row[:2]))
+        _publish_change(table, action, (rid,), (row[0],) if row else ())
+    else:
+        _publish_change(table, action)
     return True
 
 
+# monthly_stats.csv là nhật ký ghi nối thêm: mỗi lần lưu / sửa một tháng ghi thêm một dòng = một phiên bản
+# mới, dòng sau cùng của tháng là giá trị hiện hành. Cache giữ {tháng: [phiên bản cũ -> mới]} nên tra cứu
+# và upsert là O(1) (không đọc / ghi lại cả file); phiên bản cũ hơn performance.monthly_stats_history
+# bản mỗi tháng được dọn (compact_monthly_stats) khi số dòng lần dọn sẽ bỏ (phiên bản vượt mức giữ + dòng
+# hỏng) vượt MONTHLY_COMPACT_SLACK – lịch sử đầy đủ của nhiều tháng không tính, nên file không bị ghi lại
+# sau mỗi lần lưu.
+MONTHLY_HISTORY_KEEP = 10
+MONTHLY_COMPACT_SLACK = 200
+_monthly_stats_cache: Dict[str, Any] = {}  # {'signature', 'header', 'by_month', 'rows', 'keep', 'droppable'}
+
+def _monthly_history_keep() -> int:
+    try:
+        return max(1, int(get_config_value('performance', 'monthly_stats_history', MONTHLY_HISTORY_KEEP)))
+    except (TypeError, ValueError):
+        return MONTHLY_HISTORY_KEEP
+
+def _monthly_row_to_dict(header: List[str], row: List[str]) -> Dict[str, Any]:
+    rec: Dict[str, Any] = {col: (row[i] if i < len(row) else '') for i, col in enumerate(header)}
+    for k in ("tong_doanh_thu_vnd", "chi_phi_tru_hao_vnd", "loi_nhuan_vnd"):
+        try:
+            rec[k] = int(rec[k]) if rec.get(k) else 0
+        except ValueError:
+            rec[k] = 0
+    rec["tu_tinh_tu_ngay"] = rec.get("tu_tinh_tu_ngay") in ("1", "True", "true")
+    return rec
+
+def _monthly_dict_to_row(header: List[str], rec: Dict[str, Any]) -> List[str]:
+    row = []
+    for col in header:
+        v = rec.get(col, '')
+        row.append(('1' if v else '0') if isinstance(v, bool) else str(v))
+    return row
+
+def _add_monthly_version(by_month: Dict[str, List[Dict[str, Any]]], rec: Dict[str, Any]):
+    versions = by_month.setdefault(rec['thang'], [])
+    rec['phien_ban'] = len(versions) + 1
+    versions.append(rec)
+
+def _monthly_stats_store() -> Dict[str, Any]:
+    sig = _file_signature(MONTHLY_FILE)
+    with _cache_lock:
+        c = _monthly_stats_cache
+        if c and c.get('signature') == sig:
+            metrics.inc('cache.monthly_stats.hit')
+            return c
+        metrics.inc('cache.monthly_stats.miss')
+        ensure_monthly_file()
+        sig = _file_signature(MONTHLY_FILE)
+        by_month: Dict[str, List[Dict[str, Any]]] = {}
+        n = 0
+        with open(_abs_path(MONTHLY_FILE), "r", newline="", encoding="utf-8") as f:
+            reader = csv.reader(f)
+            header = next(reader, None) or list(MONTHLY_HEADERS)
+            for row in reader:
+                if not row:
+                    continue
+                n += 1
+                rec = _monthly_row_to_dict(header, row)
+                if rec.get('thang'):
+                    _add_monthly_version(by_month, rec)
+        metrics.inc('rows_parsed.monthly_stats', n)
+        c.clear()
+        keep = _monthly_history_keep()
+        c.update(signature=sig, header=header, by_month=by_month, rows=n, keep=keep,
+                 droppable=n - sum(min(len(v), keep) for v in by_month.values()))
+        return c
+
+def _append_monthly_version(thang: str, tong: int, chi_phi: int, ly_do: str, tu_tinh_tu_ngay: bool) -> Dict[str, Any]:
+    """Ghi nối một phiên bản mới của tháng và cộng thẳng vào cache (nếu file chỉ lớn thêm đúng dòng đó)."""
+    store = _monthly_stats_store()
+    header = store['header']
+    rec: Dict[str, Any] = {
+        'thang': thang, 'tong_doanh_thu_vnd': tong, 'chi_phi_tru_hao_vnd': chi_phi,
+        'chi_phi_ly_do': _sanitize_text_cell(ly_do.strip()), 'loi_nhuan_vnd': compute_profit(tong, chi_phi),
+        'tu_tinh_tu_ngay': bool(tu_tinh_tu_ngay),
+    }
+    row = _monthly_dict_to_row(header, rec)
+    sig_before = store['signature']
+    _safe_append_csv(_abs_path(MONTHLY_FILE), row)
+    buf = io.StringIO()
+    csv.writer(buf).writerow(row)
+    sig_after = _file_signature(MONTHLY_FILE)
+    compact = False
+    with _cache_lock:
+        c = _monthly_stats_cache
+        if c.get('signature') == sig_before and sig_after[1] == sig_before[1] + len(buf.getvalue().encode('utf-8')):
+            rec = _monthly_row_to_dict(header, row)
+            _add_monthly_version(c['by_month'], rec)
+            c['signature'] = sig_after
+            c['rows'] += 1
+            if rec['phien_ban'] > c['keep']:
+                c['droppable'] += 1
+            compact = c['droppable'] > MONTHLY_COMPACT_SLACK
+        else:
+            c.clear()  # Tiến trình khác cũng ghi -> lần đọc sau parse lại
+    if compact:
+        try:
+            compact_monthly_stats()
+        except Exception as ex:  # Dọn lịch sử không được thì để lần ghi sau thử lại
+            logger.warning("compact_monthly_stats failed: %s", ex)
+    return rec
+
+def _rewrite_monthly_stats(keep_versions) -> Tuple[int, List[str]]:
+    """Ghi lại monthly_stats.csv với keep_versions(tháng, [phiên bản]) -> phần giữ lại (tmp + os.replace).
+    Trả (số dòng bỏ, các tháng bị đổi)."""
+    path = _abs_path(MONTHLY_FILE)
+    with _cache_lock:
+        store = _monthly_stats_store()
+        header = store['header']
+        rows: List[List[str]] = [header]
+        touched: List[str] = []
+        for thang, versions in store['by_month'].items():
+            kept = keep_versions(thang, versions)
+            if len(kept) != len(versions):
+                touched.append(thang)
+            rows.extend(_monthly_dict_to_row(header, r) for r in kept)
+        dropped = store['rows'] - (len(rows) - 1)
+        if dropped:
+            tmp = path + '.tmp'
+            with _file_lock(path):
+                with open(tmp, 'w', newline='', encoding='utf-8') as f:
+                    csv.writer(f).writerows(rows)
+                os.replace(tmp, path)
+            _monthly_stats_cache.clear()
+    return dropped, touched
+
+def compact_monthly_stats(keep: Optional[int] = None) -> int:
+    """Chỉ giữ `keep` phiên bản mới nhất mỗi tháng (mặc định performance.monthly_stats_history), bỏ dòng
+    không có tháng. Trả số dòng đã bỏ."""
+    keep = max(1, int(keep or _monthly_history_keep()))
+    dropped, _ = _rewrite_monthly_stats(lambda thang, versions: versions[-keep:])
+    if dropped:
+        logger.info("compact_monthly_stats: bỏ %s dòng lịch sử cũ", dropped)
+    return dropped
+
 def save_monthly_stat(thang: str, tong: int, chi_phi: int, tu_tinh_tu_ngay: bool, chi_phi_ly_do: str = ""):
-    ensure_monthly_file()
+    """Upsert thống kê tháng: ghi nối một phiên bản mới (giữ lịch sử). Không ghi gì nếu giống hệt phiên bản
+    hiện hành. Trả lợi nhuận."""
     # thang format YYYY-MM
     try:
         datetime.strptime(thang + "-01", "%Y-%m-%d")
@@ -576,89 +1050,59 @@ def save_monthly_stat(thang: str, tong: int, chi_phi: int, tu_tinh_tu_ngay: bool
     if tong < 0 or chi_phi < 0:
         raise ValueError("Số tiền không được âm")
 
+    current = get_monthly_stat(thang)
     loi_nhuan = compute_profit(tong, chi_phi)
-
-    # Ghi nối thêm (không ghi đè) để lưu lịch sử
-    path = _abs_path(MONTHLY_FILE)
-    ensure_monthly_file()  # đảm bảo migration đã chạy
-    # kiểm tra xem header có cột lý do không
-    try:
-        with open(path, "r", newline="", encoding="utf-8") as rf:
-            first = rf.readline().strip().split(',')
-        has_reason = 'chi_phi_ly_do' in first
-    except Exception:
-        has_reason = True
-    row = [thang, tong, chi_phi]
-    if has_reason:
-        row.append(chi_phi_ly_do.strip())
-    row.extend([loi_nhuan, "1" if tu_tinh_tu_ngay else "0"])
-    _safe_append_csv(path, row)
+    if current and (current['tong_doanh_thu_vnd'], current['chi_phi_tru_hao_vnd'], current.get('chi_phi_ly_do', ''),
+                    current['tu_tinh_tu_ngay']) == (tong, chi_phi, _sanitize_text_cell(chi_phi_ly_do.strip()),
+                                                    bool(tu_tinh_tu_ngay)):
+        return loi_nhuan
+    _append_monthly_version(thang, tong, chi_phi, chi_phi_ly_do, tu_tinh_tu_ngay)
+    _publish_change(_table_of(MONTHLY_FILE), 'updated' if current else 'inserted', (thang,), months=(thang,))
     return loi_nhuan
 
 def update_monthly_stat(thang: str, new_tong: int, new_chi_phi: int, new_reason: str) -> bool:
-    """Cập nhật bản ghi tháng đầu tiên khớp thang. Trả True nếu cập nhật."""
-    ensure_monthly_file()
-    path = _abs_path(MONTHLY_FILE)
-    with open(path, 'r', newline='', encoding='utf-8') as f:
-        rows = list(csv.reader(f))
-    if not rows: return False
-    header = rows[0]
-    has_reason = 'chi_phi_ly_do' in header
-    # xác định index
-    try:
-        idx_thang = header.index('thang')
-        idx_tong = header.index('tong_doanh_thu_vnd')
-        idx_cp = header.index('chi_phi_tru_hao_vnd')
-        if has_reason:
-            idx_reason = header.index('chi_phi_ly_do')
-        idx_loi = header.index('loi_nhuan_vnd')
-        idx_flag = header.index('tu_tinh_tu_ngay')
-    except ValueError:
+    """Sửa tháng đã có: ghi phiên bản mới (giữ cờ tu_tinh_tu_ngay). Trả False nếu tháng chưa có."""
+    current = get_monthly_stat(thang)
+    if current is None:
         return False
-    changed = False
-    for i in range(1, len(rows)):
-        r = rows[i]
-        if len(r) < len(header):
-            continue
-        if r[idx_thang] == thang and not changed:
-            loi = compute_profit(new_tong, new_chi_phi)
-            r[idx_tong] = str(new_tong)
-            r[idx_cp] = str(new_chi_phi)
-            if has_reason:
-                r[idx_reason] = new_reason.strip()
-            r[idx_loi] = str(loi)
-            r[idx_flag] = r[idx_flag] or '0'
-            changed = True
-    if changed:
-        tmp = path + '.tmp'
-        with _file_lock(path):
-            with open(tmp, 'w', newline='', encoding='utf-8') as f:
-                csv.writer(f).writerows(rows)
-            os.replace(tmp, path)
-    return changed
+    _append_monthly_version(thang, new_tong, new_chi_phi, new_reason, current['tu_tinh_tu_ngay'])
+    _publish_change(_table_of(MONTHLY_FILE), 'updated', (thang,), months=(thang,))
+    return True
+
+def delete_monthly_stat(thang: str) -> bool:
+    """Xóa tháng (mọi phiên bản) khỏi monthly_stats.csv. Trả True nếu có xóa."""
+    if get_monthly_stat(thang) is None:
+        return False
+    _rewrite_monthly_stats(lambda m, versions: [] if m == thang else versions)
+    _publish_change(_table_of(MONTHLY_FILE), 'deleted', (thang,), months=(thang,))
+    return True
+
+def get_monthly_stat(thang: str) -> Optional[Dict[str, Any]]:
+    """Phiên bản hiện hành của tháng YYYY-MM (None nếu chưa lưu); caller không sửa dict."""
+    versions = _monthly_stats_store()['by_month'].get(thang)
+    return versions[-1] if versions else None
 
+def monthly_stat_history(thang: str) -> List[Dict[str, Any]]:
+    """Các phiên bản đã lưu của tháng, cũ -> mới (khóa 'phien_ban' đánh số từ 1)."""
+    return list(_monthly_stats_store()['by_month'].get(thang, ()))
 
 def read_monthly_stats() -> List[Dict[str, Any]]:
-    ensure_monthly_file()
-    path = _abs_path(MONTHLY_FILE)
-    rows: List[Dict[str, Any]] = []
-    with open(path, "r", newline="", encoding="utf-8") as f:
-        reader = csv.DictReader(f)
-        for r in reader:
-            for k in ("tong_doanh_thu_vnd", "chi_phi_tru_hao_vnd", "loi_nhuan_vnd"):
-                try:
-                    r[k] = int(r[k]) if r.get(k) else 0
-                except ValueError:
-                    r[k] = 0
-            r["tu_tinh_tu_ngay"] = r.get("tu_tinh_tu_ngay") in ("1", "True", "true")
-            rows.append(r)
-    return rows
+    """Thống kê mọi tháng, mỗi tháng một dòng (phiên bản hiện hành), sắp theo tháng.
+    Lịch sử sửa của một tháng: monthly_stat_history. Caller không sửa các dict."""
+    by_month = _monthly_stats_store()['by_month']
+    return [by_month[m][-1] for m in sorted(by_month)]
 
 # ---------------------- HÀM TÍNH TOÁN ----------------------
 
 def compute_daily_total(ngay: str) -> int:
-    records = get_daily_records()
-    return sum(r.gia_vnd for r in records if r.ngay == ngay)
+    """Tổng tiền một ngày: tra index theo ngày, nhớ kết quả tới lần ghi kế tiếp."""
+    with _cache_lock:
+        index = _get_day_index()
+        total = _daily_day_totals.get(ngay)
+        if total is None:
+            total = sum(r.gia_vnd for r in index.get(ngay, ()))
+            _daily_day_totals[ngay] = total
+        return total
 
 
 def compute_month_total(thang: str) -> int:
@@ -690,8 +1134,10 @@ def compute_month_total(thang: str) -> int:
     cached = _month_total_cache.get(key)
     if cached and cached.get('signature') == signature:
         logger.debug("compute_month_total cache hit %s", thang_iso)
+        metrics.inc('cache.month_total.hit')
         return cached.get('value', 0)
     logger.debug("compute_month_total cache miss %s (recompute)", thang_iso)
+    metrics.inc('cache.month_total.miss')
     # Compute fresh (logic giữ nguyên)
     records = get_daily_records()
     daily_sum = sum(r.gia_vnd for r in records if r.ngay.startswith(thang_iso + "-"))
@@ -750,6 +1196,7 @@ def add_profit_share_event(scope: str, total_revenue: int, total_cost: int, prof
     created_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
     path = _abs_path(PROFIT_SHARE_FILE)
     _safe_append_csv(path, [event_id, scope, total_revenue, total_cost, profit, summary, created_at])
+    _publish_change(_table_of(PROFIT_SHARE_FILE), 'inserted', (event_id,))
     return event_id
 
 def read_profit_share_events() -> List[Dict[str, Any]]:
@@ -766,6 +1213,7 @@ def read_profit_share_events() -> List[Dict[str, Any]]:
             except ValueError:
                 r['total_revenue_vnd'] = r.get('total_revenue_vnd',0)
             events.append(r)
+    metrics.inc('rows_parsed.profit_shares', len(events))
     return events
 
 def delete_profit_share_event(event_id: str) -> bool:
@@ -790,6 +1238,7 @@ def delete_profit_share_event(event_id: str) -> bool:
                 w = csv.writer(f)
                 w.writerows(new_rows)
             os.replace(tmp, path)
+        _publish_change(_table_of(PROFIT_SHARE_FILE), 'deleted', (event_id,))
     return removed
 
 # ĐÃ LOẠI BỎ: parse_price / analyze_price_input
@@ -891,160 +1340,24 @@ def _time_overlap(a: str, b: str) -> bool:
 
 def breakdown_daily_by_court(ngay: str) -> Dict[str, int]:
     result = defaultdict(int)
-    for r in get_daily_records():
-        if r.ngay == ngay:
-            result[r.san] += r.gia_vnd
+    for r in _get_day_index().get(ngay, ()):
+        result[r.san] += r.gia_vnd
     return dict(result)
 
 
-def backup_data(dest_dir: Optional[str] = None) -> str:
-    """Xuất 1 file PDF tổng hợp tất cả dữ liệu (tiếng Việt đầy đủ). Trả về đường dẫn file.
+def backup_data(dest_dir: Optional[str] = None, month: Optional[str] = None, start: Optional[str] = None,
+                end: Optional[str] = None, progress=None, out_path: Optional[str] = None) -> str:
+    """Xuất 1 file PDF tổng hợp dữ liệu (tiếng Việt đầy đủ). Trả về đường dẫn file.
 
     Yêu cầu thư viện bên ngoài: fpdf2 (cài: pip install fpdf2)
-    Tự động tìm một font Unicode phổ biến trong Windows (Arial / Tahoma / Segoe UI)."""
+    Phần xuất nằm ở report_engine: stream từng dòng CSV, font Unicode dò một lần (Windows/macOS/Linux
+    hoặc report_settings.font_path), giới hạn theo tháng / khoảng ngày, báo tiến độ qua progress(value, message)."""
+    from report_engine import export_pdf_report
     try:
-        from fpdf import FPDF  # type: ignore
-    except Exception:
-        raise RuntimeError("Chưa cài thư viện fpdf2. Hãy chạy: pip install fpdf2")
-
-    # Thu thập dữ liệu
-    sections: List[Tuple[str, List[str], List[List[str]], List[float]]] = []
-
-    # Helper đọc file CSV nếu tồn tại
-    def read_csv_dict(path: str) -> List[Dict[str, str]]:
-        if not os.path.exists(path):
-            return []
-        try:
-            with open(path, 'r', newline='', encoding='utf-8') as f:
-                return list(csv.DictReader(f))
-        except Exception:
-            return []
-
-    daily = read_csv_dict(_abs_path(DAILY_FILE))
-    if daily:
-        headers = ["Ngày", "Sân", "Khung giờ", "Giá (VND)", "Loại"]
-        rows = [[d.get('ngay',''), d.get('san',''), d.get('khung_gio',''), d.get('gia_vnd',''), d.get('loai','')] for d in daily]
-        widths = [22, 18, 32, 28, 28]  # mm
-        sections.append(("1. Ghi chép ngày", headers, rows, widths))
-
-    monthly = read_csv_dict(_abs_path(MONTHLY_FILE))
-    if monthly:
-        headers = ["Tháng", "Tổng doanh thu", "Chi phí trừ hao", "Lợi nhuận", "Tự tính?"]
-        rows = [[m.get('thang',''), m.get('tong_doanh_thu_vnd',''), m.get('chi_phi_tru_hao_vnd',''), m.get('loi_nhuan_vnd',''), m.get('tu_tinh_tu_ngay','')] for m in monthly]
-        widths = [25, 38, 38, 30, 18]
-        sections.append(("2. Thống kê tháng", headers, rows, widths))
-
-    subs = read_csv_dict(_abs_path(SUBSCRIPTION_FILE))
-    if subs:
-        headers = ["Tháng", "Tên", "Số buổi/tuần", "Giờ mỗi buổi", "Hệ số", "Giá (VND)"]
-        rows = [[s.get('thang',''), s.get('ten',''), s.get('so_buoi_tuan',''), s.get('gio_moi_buoi',''), s.get('he_so',''), s.get('gia_vnd','')] for s in subs]
-        widths = [20, 40, 26, 26, 18, 30]
-        sections.append(("3. Gói tháng", headers, rows, widths))
-
-    shares = read_csv_dict(_abs_path(PROFIT_SHARE_FILE))
-    if shares:
-        headers = ["Mã", "Phạm vi", "Doanh thu", "Chi phí", "Lợi nhuận", "Tạo lúc", "Tóm tắt (rút gọn)"]
-        rows = []
-        for s in shares:
-            summary = s.get('summary','')
-            if len(summary) > 60:
-                summary = summary[:57] + '...'
-            rows.append([
-                s.get('event_id',''), s.get('scope',''), s.get('total_revenue_vnd',''),
-                s.get('total_cost_vnd',''), s.get('profit_vnd',''), s.get('created_at',''), summary
-            ])
-        widths = [16, 36, 28, 26, 26, 30, 40]
-        sections.append(("4. Chia lợi nhuận", headers, rows, widths))
-
-    # Nước nhập & bán (thêm sau cùng)
-    water_items = read_csv_dict(_abs_path(WATER_ITEMS_FILE))
-    if water_items:
-        headers = ["Tên", "SL tồn", "Đơn giá"]
-        rows = [[w.get('ten',''), w.get('so_luong_ton',''), w.get('don_gia_vnd','')] for w in water_items]
-        widths = [50, 22, 28]
-        sections.append(("5. Danh mục nước", headers, rows, widths))
-    water_sales = read_csv_dict(_abs_path(WATER_SALES_FILE))
-    if water_sales:
-        headers = ["Ngày", "Tên", "SL", "Đơn giá", "Thành tiền"]
-        rows = [[s.get('ngay',''), s.get('ten',''), s.get('so_luong',''), s.get('don_gia_vnd',''), s.get('tong_vnd','')] for s in water_sales]
-        widths = [22, 40, 14, 28, 30]
-        sections.append(("6. Bán nước", headers, rows, widths))
-
-    if not sections:
-        raise FileNotFoundError("Chưa có dữ liệu để xuất")
-
-    # Chuẩn bị font Unicode
-    font_candidates = [
-        r"C:\\Windows\\Fonts\\arial.ttf",
-        r"C:\\Windows\\Fonts\\tahoma.ttf",
-        r"C:\\Windows\\Fonts\\segoeui.ttf",
-        r"C:\\Windows\\Fonts\\verdana.ttf",
-    ]
-    font_path = None
-    for fp in font_candidates:
-        if os.path.exists(fp):
-            font_path = fp
-            break
-    if not font_path:
-        raise RuntimeError("Không tìm thấy font Unicode (Arial/Tahoma/SegoeUI/Verdana). Hãy chỉnh sửa hàm backup_data.")
-
-    class PDF(FPDF):
-        def header(self):  # type: ignore
-            self.set_font('VN', '', 11)
-            self.cell(0, 6, "BÁO CÁO DỮ LIỆU SÂN PICKLEBALL", ln=1, align='C')
-            self.set_font('VN','',8)
-            self.cell(0,5, datetime.now().strftime('%Y-%m-%d %H:%M:%S'), ln=1, align='C')
-            self.ln(2)
-        def footer(self):  # type: ignore
-            self.set_y(-12)
-            self.set_font('VN','',8)
-            self.cell(0,5, f"Trang {self.page_no()}", align='C')
-
-    pdf = PDF(orientation='P', unit='mm', format='A4')
-    pdf.set_auto_page_break(auto=True, margin=14)
-    pdf.add_font('VN','', font_path, uni=True)  # type: ignore
-    pdf.add_page()
-    pdf.set_font('VN','',10)
-
-    def add_section(title: str, headers: List[str], rows: List[List[str]], widths: List[float]):
-        pdf.set_font('VN','',11)
-        pdf.set_text_color(0,0,128)
-        pdf.cell(0,7, title, ln=1)
-        pdf.set_text_color(0,0,0)
-        # Header row
-        pdf.set_font('VN','',9.5)
-        for h, w in zip(headers, widths):
-            pdf.set_fill_color(230,230,230)
-            pdf.cell(w, 7, h, border=1, align='C', fill=True)
-        pdf.ln()
-        pdf.set_font('VN','',9)
-        for r in rows:
-            # Kiểm tra còn chỗ trang không (simple heuristic)
-            if pdf.get_y() > 265:  # gần đáy trang
-                pdf.add_page(); pdf.set_font('VN','',9)
-                for h, w in zip(headers, widths):
-                    pdf.set_fill_color(230,230,230)
-                    pdf.cell(w, 7, h, border=1, align='C', fill=True)
-                pdf.ln()
-            for val, w in zip(r, widths):
-                # Đảm bảo chuỗi không quá dài
-                text = str(val)
-                if len(text) > 28:
-                    text = text[:25] + '…'
-                pdf.cell(w, 6, text, border=1)
-            pdf.ln()
-        pdf.ln(2)
-
-    for title, headers, rows, widths in sections:
-        add_section(title, headers, rows, widths)
-
-    if dest_dir is None:
-        dest_dir = _abs_path('backups')
-    os.makedirs(dest_dir, exist_ok=True)
-    ts = _dt.now().strftime('%Y%m%d_%H%M%S')
-    out_path = os.path.join(dest_dir, f"Bao_cao_du_lieu_{ts}.pdf")
-    pdf.output(out_path)
-    return out_path
+        snapshot_water_stock()  # Mục "Danh mục nước" đọc so_luong_ton trong water_items.csv
+    except Exception as ex:
+        logger.warning("Không chốt được tồn kho nước trước khi xuất báo cáo: %s", ex)
+    return export_pdf_report(out_path, dest_dir=dest_dir, month=month, start=start, end=end, progress=progress)
 
 
 def month_breakdown_by_court(thang: str) -> Dict[str, int]:
@@ -1076,12 +1389,13 @@ def compute_subscription_price(so_buoi_tuan: int, gio_moi_buoi: int) -> int:
     price = int(round(BASE_SUB_PRICE * factor))
     return price
 
-def add_month_subscription(thang: str, ten: str, so_buoi_tuan: int, gio_moi_buoi: int, san: str = "Sân 1", thu: str = "", ghi_chu: str = "") -> int:
+def add_month_subscription(thang: str, ten: str, so_buoi_tuan: int, gio_moi_buoi: int, san: str = "Sân 1", thu: str = "", ghi_chu: str = "", allow_conflict: bool = False) -> int:
     """Thêm gói tháng cho một nhóm/người.
     thang: YYYY-MM
     san: Sân 1 hoặc Sân 2
     thu: Các thứ trong tuần (ví dụ: "Thứ 2, Thứ 4")
     ghi_chu: Ghi chú thêm
+    allow_conflict: như add_month_subscription_with_time (gói chỉ có số giờ -> khung giờ giả định, không chặn)
     Trả về giá tính (VND)."""
     ensure_subscription_file()
     try:
@@ -1096,18 +1410,23 @@ def add_month_subscription(thang: str, ten: str, so_buoi_tuan: int, gio_moi_buoi
     path = _abs_path(SUBSCRIPTION_FILE)
     safe_thu = _sanitize_text_cell(thu)
     safe_note = _sanitize_text_cell(ghi_chu)
+    if not allow_conflict:
+        _check_subscription_conflicts({'thang': thang, 'ten': ten, 'san': san, 'thu': safe_thu,
+                                       'gio_moi_buoi_display': str(gio_moi_buoi)})
     _safe_append_csv(path, [thang, ten, san, str(so_buoi_tuan), str(gio_moi_buoi), safe_thu, str(he_so), str(gia), safe_note])
     # Month total cache may include subscription revenue -> invalidate
     _invalidate_month_cache()
+    _publish_change(_table_of(SUBSCRIPTION_FILE), 'inserted', (f"{thang}|{ten}",), months=(thang,))
     return gia
 
-def add_month_subscription_with_time(thang: str, ten: str, so_buoi_tuan: int, gio_moi_buoi_text: str, san: str = "Sân 1", thu: str = "", ghi_chu: str = "") -> int:
+def add_month_subscription_with_time(thang: str, ten: str, so_buoi_tuan: int, gio_moi_buoi_text: str, san: str = "Sân 1", thu: str = "", ghi_chu: str = "", allow_conflict: bool = False) -> int:
     """Thêm gói tháng với format giờ mới (ví dụ: "2 (7:00-9:00)").
     thang: YYYY-MM
     san: Sân 1 hoặc Sân 2
     thu: Các thứ trong tuần (ví dụ: "Thứ 2, Thứ 4")
     gio_moi_buoi_text: Format "2 (7:00-9:00)" hoặc "2"
     ghi_chu: Ghi chú thêm
+    allow_conflict: False -> ValueError nếu buổi nào của gói trùng bản ghi lẻ / gói khác cùng sân
     Trả về giá tính (VND)."""
     ensure_subscription_file()
     try:
@@ -1130,12 +1449,17 @@ def add_month_subscription_with_time(thang: str, ten: str, so_buoi_tuan: int, gi
     # Lưu gio_moi_buoi_text với format đầy đủ
     safe_thu = _sanitize_text_cell(thu)
     safe_note = _sanitize_text_cell(ghi_chu)
+    if not allow_conflict:
+        _check_subscription_conflicts({'thang': thang, 'ten': ten, 'san': san, 'thu': safe_thu,
+                                       'gio_moi_buoi_display': gio_moi_buoi_text})
     _safe_append_csv(path, [thang, ten, san, str(so_buoi_tuan), gio_moi_buoi_text, safe_thu, str(he_so), str(gia), safe_note])
     _invalidate_month_cache()
+    _publish_change(_table_of(SUBSCRIPTION_FILE), 'inserted', (f"{thang}|{ten}",), months=(thang,))
     return gia
 
-def update_month_subscription(thang: str, old_ten: str, new_ten: str, so_buoi_tuan: int, gio_moi_buoi: int, san: str = "Sân 1", thu: str = "", ghi_chu: str = "") -> bool:
-    """Cập nhật gói tháng: tìm dòng đầu tiên khớp thang & old_ten."""
+def update_month_subscription(thang: str, old_ten: str, new_ten: str, so_buoi_tuan: int, gio_moi_buoi: int, san: str = "Sân 1", thu: str = "", ghi_chu: str = "", allow_conflict: bool = False) -> bool:
+    """Cập nhật gói tháng: tìm dòng đầu tiên khớp thang & old_ten.
+    allow_conflict=False -> ScheduleConflictError nếu lịch mới trùng bản ghi lẻ / gói khác (bỏ qua chính gói này)."""
     ensure_subscription_file()
     path = _abs_path(SUBSCRIPTION_FILE)
     with open(path,'r',newline='',encoding='utf-8') as f:
@@ -1148,6 +1472,9 @@ def update_month_subscription(thang: str, old_ten: str, new_ten: str, so_buoi_tu
     safe_thu = _sanitize_text_cell(thu)
     safe_note = _sanitize_text_cell(ghi_chu)
     he_so = round((so_buoi_tuan * gio_moi_buoi) / BASE_UNITS, 2)
+    if not allow_conflict:
+        _check_subscription_conflicts({'thang': thang, 'ten': safe_new_ten, 'san': san, 'thu': safe_thu,
+                                       'gio_moi_buoi_display': str(gio_moi_buoi)}, exclude_ten=old_ten)
     for r in rows[1:]:
         if (not changed and len(r)>=2 and r[0]==thang and r[1]==old_ten):
             # Update with new structure: thang, ten, san, so_buoi_tuan, gio_moi_buoi, thu, he_so, gia_vnd, ghi_chu
@@ -1161,10 +1488,12 @@ def update_month_subscription(thang: str, old_ten: str, new_ten: str, so_buoi_tu
                 csv.writer(f).writerows(new_rows)
             os.replace(tmp,path)
         _invalidate_month_cache()
+        _publish_change(_table_of(SUBSCRIPTION_FILE), 'updated', (f"{thang}|{old_ten}", f"{thang}|{safe_new_ten}"), months=(thang,))
     return changed
 
-def update_month_subscription_with_time(thang: str, old_ten: str, new_ten: str, so_buoi_tuan: int, gio_moi_buoi_text: str, san: str = "Sân 1", thu: str = "", ghi_chu: str = "") -> bool:
-    """Cập nhật gói tháng với format giờ mới."""
+def update_month_subscription_with_time(thang: str, old_ten: str, new_ten: str, so_buoi_tuan: int, gio_moi_buoi_text: str, san: str = "Sân 1", thu: str = "", ghi_chu: str = "", allow_conflict: bool = False) -> bool:
+    """Cập nhật gói tháng với format giờ mới.
+    allow_conflict=False -> ScheduleConflictError nếu lịch mới trùng bản ghi lẻ / gói khác (bỏ qua chính gói này)."""
     ensure_subscription_file()
     path = _abs_path(SUBSCRIPTION_FILE)
     with open(path,'r',newline='',encoding='utf-8') as f:
@@ -1184,6 +1513,9 @@ def update_month_subscription_with_time(thang: str, old_ten: str, new_ten: str,
     safe_thu = _sanitize_text_cell(thu)
     safe_note = _sanitize_text_cell(ghi_chu)
     he_so = round((so_buoi_tuan * gio_moi_buoi) / BASE_UNITS, 2)
+    if not allow_conflict:
+        _check_subscription_conflicts({'thang': thang, 'ten': safe_new_ten, 'san': san, 'thu': safe_thu,
+                                       'gio_moi_buoi_display': gio_moi_buoi_text}, exclude_ten=old_ten)
     for r in rows[1:]:
         if (not changed and len(r)>=2 and r[0]==thang and r[1]==old_ten):
             # Update with new structure: thang, ten, san, so_buoi_tuan, gio_moi_buoi, thu, he_so, gia_vnd, ghi_chu
@@ -1197,6 +1529,7 @@ def update_month_subscription_with_time(thang: str, old_ten: str, new_ten: str,
                 csv.writer(f).writerows(new_rows)
             os.replace(tmp,path)
         _invalidate_month_cache()
+        _publish_change(_table_of(SUBSCRIPTION_FILE), 'updated', (f"{thang}|{old_ten}", f"{thang}|{safe_new_ten}"), months=(thang,))
     return changed
 
 def read_all_subscriptions() -> List[Dict[str, Any]]:
@@ -1231,6 +1564,7 @@ def read_all_subscriptions() -> List[Dict[str, Any]]:
             except ValueError:
                 r['gia_vnd'] = 0
             res.append(r)
+    metrics.inc('rows_parsed.monthly_subscriptions', len(res))
     return res
 
 def read_month_subscriptions(thang: str) -> List[Dict[str, Any]]:
@@ -1240,17 +1574,11 @@ def compute_month_subscription_total(thang: str) -> int:
     return sum(r['gia_vnd'] for r in read_month_subscriptions(thang))
 
 def compute_month_water_sales_total(thang: str) -> int:
-    """Tổng tiền bán nước tháng (YYYY-MM)."""
+    """Tổng tiền bán nước tháng (YYYY-MM) – tra index tháng của water_sales."""
     try:
-        ensure_water_sales_file()
-    except Exception:
+        return _water_sales_index()['month_totals'].get(thang, 0)
+    except OSError:
         return 0
-    total = 0
-    for r in read_water_sales():
-        ngay = r.get('ngay','')
-        if isinstance(ngay, str) and ngay.startswith(thang + '-'):
-            total += r.get('tong_vnd',0)
-    return total
 
 def delete_month_subscription(thang: str, ten: str) -> bool:
     """Xóa gói tháng đầu tiên khớp thang & tên. Trả True nếu xóa."""
@@ -1276,13 +1604,258 @@ def delete_month_subscription(thang: str, ten: str) -> bool:
                 w.writerows(new_rows)
             os.replace(tmp, path)
         _invalidate_month_cache()
+        _publish_change(_table_of(SUBSCRIPTION_FILE), 'deleted', (f"{thang}|{ten}",), months=(thang,))
     return removed
 
 # ---------------------- NƯỚC (BEVERAGE MANAGEMENT) ----------------------
+# Tồn kho nước = sổ cái biến động chỉ ghi thêm (data/water_stock_ledger.csv): số dư đầu (chuyển từ
+# so_luong_ton cũ), nhập kho, bán, điều chỉnh, hoàn (xóa dòng bán). Bảng tồn trong bộ nhớ (khóa = tên
+# chuẩn hóa) chỉ đọc tiếp phần đuôi sổ cái theo offset -> bán nước là 2 lần append, không ghi lại file.
+# Snapshot định kỳ (mỗi WATER_SNAPSHOT_EVERY biến động, trước khi xuất báo cáo, khi đóng app) lưu
+# {seq, offset, tồn} để khởi động không phải đọc lại cả sổ, đồng thời làm mới cột so_luong_ton trong
+# water_items.csv (bản sao để đọc ngoài app / báo cáo; nguồn sự thật là sổ cái).
+WATER_LEDGER_FILE = os.path.join(DATA_DIR_NAME, "water_stock_ledger.csv")
+WATER_STOCK_SNAPSHOT_FILE = os.path.join(DATA_DIR_NAME, "water_stock_snapshot.json")
+WATER_LEDGER_HEADERS = ["seq", "thoi_gian", "loai", "ten", "so_luong", "don_gia_vnd", "ghi_chu"]
+WATER_SNAPSHOT_EVERY = 200
+MOVE_OPENING = 'so_du_dau'
+MOVE_RECEIPT = 'nhap'
+MOVE_SALE = 'ban'
+MOVE_ADJUST = 'dieu_chinh'
+MOVE_REVERSAL = 'hoan'
+
+_water_stock: Dict[str, Any] = {}  # {'offset': byte đã đọc, 'seq', 'stock': {tên chuẩn: sl}, 'since_snapshot'}
+_water_catalog_cache: Dict[str, Any] = {}  # {'signature', 'items': [...], 'by_name': {tên chuẩn: item}}
+
+def _water_key(ten: str) -> str:
+    return (ten or '').strip().lower()
+
+def _read_water_items_file() -> List[Dict[str, Any]]:
+    ensure_water_items_file()
+    path = _abs_path(WATER_ITEMS_FILE)
+    res: List[Dict[str, Any]] = []
+    with open(path, 'r', newline='', encoding='utf-8') as f:
+        reader = csv.DictReader(f)
+        for r in reader:
+            try:
+                r['so_luong_ton'] = int(r.get('so_luong_ton','0') or 0)
+            except ValueError:
+                r['so_luong_ton'] = 0
+            try:
+                r['don_gia_vnd'] = int(r.get('don_gia_vnd','0') or 0)
+            except ValueError:
+                r['don_gia_vnd'] = 0
+            res.append(r)
+    metrics.inc('rows_parsed.water_items', len(res))
+    return res
+
+def _water_catalog() -> Dict[str, Any]:
+    """Danh mục nước (tên, đơn giá) + index theo tên chuẩn hóa; chỉ parse lại khi file đổi (mtime/size)."""
+    sig = _file_signature(WATER_ITEMS_FILE)
+    if _water_catalog_cache.get('signature') != sig:
+        metrics.inc('cache.water_catalog.miss')
+        items = _read_water_items_file()
+        by_name: Dict[str, Dict[str, Any]] = {}
+        for it in items:
+            by_name.setdefault(_water_key(it.get('ten', '')), it)
+        _water_catalog_cache['signature'] = sig
+        _water_catalog_cache['items'] = items
+        _water_catalog_cache['by_name'] = by_name
+    return _water_catalog_cache
+
+def _write_water_catalog(rows: List[List[str]]):
+    path = _abs_path(WATER_ITEMS_FILE)
+    tmp = path + '.tmp'
+    with _file_lock(path):
+        with open(tmp, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(WATER_ITEM_HEADERS)
+            writer.writerows(rows)
+        os.replace(tmp, path)
+
+def _init_water_ledger(path: str):
+    """Tạo sổ cái lần đầu: số dư đầu của từng loại lấy từ so_luong_ton hiện có trong water_items.csv."""
+    ensure_water_items_file()
+    with _file_lock(path):
+        if os.path.exists(path):
+            return
+        now = datetime.now().isoformat(timespec='seconds')
+        tmp = path + '.tmp'
+        with open(tmp, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(WATER_LEDGER_HEADERS)
+            seq = 0
+            for it in _read_water_items_file():
+                if it['so_luong_ton']:
+                    seq += 1
+                    writer.writerow([seq, now, MOVE_OPENING, it.get('ten', ''), it['so_luong_ton'], it['don_gia_vnd'],
+                                     'chuyển từ water_items.csv'])
+        os.replace(tmp, path)
+    logger.info("Khởi tạo sổ cái tồn kho nước: %s", path)
+
+def _apply_ledger_rows(lines: List[str], st: Dict[str, Any]) -> int:
+    """Cộng các dòng sổ cái vào bảng tồn. Trả số biến động đã áp dụng (bỏ header/dòng hỏng)."""
+    stock = st['stock']
+    n = 0
+    for row in csv.reader(lines):
+        if len(row) < 5 or not row[0].isdigit():
+            continue
+        try:
+            qty = int(row[4])
+        except ValueError:
+            continue
+        key = _water_key(row[3])
+        stock[key] = stock.get(key, 0) + qty
+        st['seq'] = max(st['seq'], int(row[0]))
+        n += 1
+    metrics.inc('rows_parsed.water_ledger', n)
+    return n
+
+def _ledger_seq_before(path: str, offset: int) -> Optional[int]:
+    """seq của dòng sổ cái kết thúc đúng tại offset (kiểm tra snapshot còn khớp sổ cái)."""
+    try:
+        with open(path, 'rb') as f:
+            start = max(0, offset - 4096)
+            f.seek(start)
+            chunk = f.read(offset - start)
+    except OSError:
+        return None
+    if not chunk.endswith(b'\n'):
+        return None
+    last = chunk[:-1].rsplit(b'\n', 1)[-1].decode('utf-8', 'replace')
+    head = last.split(',', 1)[0]
+    return int(head) if head.isdigit() else None
+
+def _load_water_stock(path: str) -> Dict[str, Any]:
+    """Bảng tồn từ snapshot (nếu còn khớp sổ cái) hoặc đọc lại toàn bộ sổ cái."""
+    st: Dict[str, Any] = {'offset': 0, 'seq': 0, 'stock': {}, 'since_snapshot': 0}
+    try:
+        with open(_abs_path(WATER_STOCK_SNAPSHOT_FILE), 'r', encoding='utf-8') as f:
+            snap = json.load(f)
+        offset, seq = int(snap['offset']), int(snap['seq'])
+        if 0 < offset <= os.path.getsize(path) and (seq == 0 or _ledger_seq_before(path, offset) == seq):
+            st.update(offset=offset, seq=seq, stock={k: int(v) for k, v in snap['stock'].items()})
+            metrics.inc('cache.water_stock.snapshot')
+            return st
+        logger.warning("Snapshot tồn kho nước không khớp sổ cái -> đọc lại toàn bộ")
+    except FileNotFoundError:
+        pass
+    except (OSError, ValueError, KeyError, TypeError, AttributeError) as ex:
+        logger.warning("Không đọc được snapshot tồn kho nước (%s) -> đọc lại toàn bộ sổ cái", ex)
+    metrics.inc('cache.water_stock.replay')
+    return st
+
+def _sync_water_stock() -> Dict[str, Any]:
+    """Bảng tồn trong bộ nhớ, đã đọc nốt phần sổ cái mới ghi thêm (của tiến trình này hoặc tiến trình khác)."""
+    global _water_stock
+    path = _abs_path(WATER_LEDGER_FILE)
+    with _cache_lock:
+        if not os.path.exists(path):
+            _init_water_ledger(path)
+        size = os.path.getsize(path)
+        st = _water_stock
+        if not st or size < st['offset']:  # Lần đầu, hoặc sổ cái bị thay (khôi phục bản sao lưu)
+            st = _water_stock = _load_water_stock(path)
+        if size > st['offset']:
+            with open(path, 'rb') as f:
+                f.seek(st['offset'])
+                tail = f.read(size - st['offset'])
+            end = tail.rfind(b'\n') + 1  # Bỏ dòng cuối đang ghi dở (nếu có)
+            if end:
+                st['since_snapshot'] += _apply_ledger_rows(tail[:end].decode('utf-8').splitlines(), st)
+                st['offset'] += end
+        return st
+
+def _append_water_movement(loai: str, ten: str, so_luong: int, don_gia_vnd: int, ghi_chu: str = '') -> int:
+    """Ghi một biến động vào sổ cái (append O(1)) và cập nhật bảng tồn. Trả về tồn mới của loại nước."""
+    path = _abs_path(WATER_LEDGER_FILE)
+    with _cache_lock:
+        _sync_water_stock()
+        for attempt in range(SAFE_WRITE_RETRY):
+            try:
+                with _file_lock(path):
+                    seq = _sync_water_stock()['seq'] + 1  # Tiến trình khác có thể vừa ghi thêm
+                    with open(path, 'a', newline='', encoding='utf-8') as f:
+                        csv.writer(f).writerow([seq, datetime.now().isoformat(timespec='seconds'), loai, ten,
+                                                so_luong, don_gia_vnd, _sanitize_text_cell(ghi_chu)])
+                break
+            except PermissionError:
+                if attempt == SAFE_WRITE_RETRY - 1:
+                    raise PermissionError("Không thể ghi sổ kho nước (có thể đang mở trong Excel). Hãy đóng file và thử lại.")
+                time.sleep(SAFE_WRITE_DELAY)
+        st = _sync_water_stock()
+        qty = st['stock'].get(_water_key(ten), 0)
+        if st['since_snapshot'] >= WATER_SNAPSHOT_EVERY:
+            try:
+                snapshot_water_stock()
+            except Exception as ex:  # Snapshot chỉ để tăng tốc, lỗi không chặn giao dịch
+                logger.warning("Snapshot tồn kho nước lỗi: %s", ex)
+    return qty
+
+def water_stock() -> Dict[str, int]:
+    """Tồn kho hiện tại theo tên chuẩn hóa (strip + lower). Bản sao, caller được sửa."""
+    return dict(_sync_water_stock()['stock'])
+
+def snapshot_water_stock() -> Dict[str, Any]:
+    """Chốt tồn kho: lưu snapshot {seq, offset, tồn} và làm mới so_luong_ton trong water_items.csv.
+    Trả về {'seq', 'items', 'catalog_rewritten'}."""
+    with _cache_lock:
+        st = _sync_water_stock()
+        payload = {'seq': st['seq'], 'offset': st['offset'], 'stock': st['stock'],
+                   'taken_at': datetime.now().isoformat(timespec='seconds')}
+        path = _abs_path(WATER_STOCK_SNAPSHOT_FILE)
+        tmp = path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(payload, f, ensure_ascii=False)
+        os.replace(tmp, path)
+        st['since_snapshot'] = 0
+        # Bản sao so_luong_ton trong danh mục: chỉ ghi lại khi có loại lệch
+        rows, changed = [], False
+        for it in _water_catalog()['items']:
+            qty = st['stock'].get(_water_key(it.get('ten', '')), 0)
+            changed = changed or qty != it['so_luong_ton']
+            rows.append([it.get('ten', ''), str(qty), str(it['don_gia_vnd'])])
+        if changed:
+            _write_water_catalog(rows)
+    return {'seq': payload['seq'], 'items': len(rows), 'catalog_rewritten': changed}
+
+def read_water_ledger(ten: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Lịch sử biến động kho (tất cả hoặc một loại nước), theo thứ tự ghi."""
+    _sync_water_stock()
+    key = _water_key(ten) if ten is not None else None
+    res: List[Dict[str, Any]] = []
+    with open(_abs_path(WATER_LEDGER_FILE), 'r', newline='', encoding='utf-8') as f:
+        for r in csv.DictReader(f):
+            if key is not None and _water_key(r.get('ten', '')) != key:
+                continue
+            for k in ('seq', 'so_luong', 'don_gia_vnd'):
+                try:
+                    r[k] = int(r.get(k) or 0)
+                except ValueError:
+                    r[k] = 0
+            res.append(r)
+    return res
+
+def adjust_water_stock(ten: str, so_luong_thuc_te: int, ghi_chu: str = '') -> int:
+    """Kiểm kê: đặt tồn của một loại nước về số đếm thực tế (ghi biến động điều chỉnh). Trả về chênh lệch."""
+    if so_luong_thuc_te < 0:
+        raise ValueError("Số lượng thực tế phải >= 0")
+    with _cache_lock:
+        item = _water_catalog()['by_name'].get(_water_key(ten))
+        if not item:
+            raise ValueError('Loại nước không tồn tại trong danh mục')
+        delta = so_luong_thuc_te - _sync_water_stock()['stock'].get(_water_key(ten), 0)
+        if delta:
+            _append_water_movement(MOVE_ADJUST, item['ten'], delta, item['don_gia_vnd'], ghi_chu or 'kiểm kê')
+    if delta:
+        _publish_change(_table_of(WATER_ITEMS_FILE), 'updated', (item['ten'],))
+    return delta
+
 def add_water_item(ten: str, so_luong_ton: int, don_gia_vnd: int):
     """Thêm hoặc cập nhật một loại nước trong danh mục.
     Nếu tên đã tồn tại -> cộng dồn số lượng (có thể âm để trừ) và cập nhật đơn giá mới.
     Nếu chưa tồn tại và số lượng âm -> lỗi.
+    Số lượng ghi vào sổ cái kho; danh mục chỉ ghi lại khi đổi đơn giá / cách viết tên.
     """
     ten = _sanitize_text_cell(ten.strip())
     if not ten:
@@ -1291,107 +1864,85 @@ def add_water_item(ten: str, so_luong_ton: int, don_gia_vnd: int):
         raise ValueError("Số lượng thay đổi phải khác 0")
     if don_gia_vnd <= 0:
         raise ValueError("Đơn giá phải > 0")
-    ensure_water_items_file()
-    path = _abs_path(WATER_ITEMS_FILE)
-    with open(path, 'r', newline='', encoding='utf-8') as f:
-        rows = list(csv.reader(f))
-    header = rows[0] if rows else WATER_ITEM_HEADERS
-    data = rows[1:]
-    updated = False
-    new_rows = [header]
-    for r in data:
-        if len(r) >= 3 and r[0].strip().lower() == ten.lower():
-            try:
-                old_qty = int(r[1])
-            except Exception:
-                old_qty = 0
-            new_qty = old_qty + so_luong_ton
-            new_rows.append([ten, str(new_qty), str(don_gia_vnd)])
-            updated = True
-        else:
-            new_rows.append(r)
-    if not updated:
-        if so_luong_ton < 0:
-            raise ValueError("Không thể tạo mới với số lượng âm")
-        new_rows.append([ten, str(so_luong_ton), str(don_gia_vnd)])
-    tmp = path + '.tmp'
-    with _file_lock(path):
-        with open(tmp, 'w', newline='', encoding='utf-8') as f:
-            csv.writer(f).writerows(new_rows)
-        os.replace(tmp, path)
+    key = _water_key(ten)
+    with _cache_lock:
+        catalog = _water_catalog()
+        existing = catalog['by_name'].get(key)
+        if existing is None:
+            if so_luong_ton < 0:
+                raise ValueError("Không thể tạo mới với số lượng âm")
+            # Sổ cái phải có trước dòng danh mục mới: lần khởi tạo lấy số dư đầu từ water_items.csv,
+            # nếu dòng mới đã nằm trong đó thì biến động nhập bên dưới sẽ cộng trùng
+            _sync_water_stock()
+            _safe_append_csv(_abs_path(WATER_ITEMS_FILE), [ten, str(so_luong_ton), str(don_gia_vnd)])
+        elif existing['don_gia_vnd'] != don_gia_vnd or existing.get('ten') != ten:
+            stock = _sync_water_stock()['stock']
+            rows = []
+            for it in catalog['items']:
+                k = _water_key(it.get('ten', ''))
+                if it is existing:
+                    rows.append([ten, str(stock.get(k, 0) + so_luong_ton), str(don_gia_vnd)])
+                else:
+                    rows.append([it.get('ten', ''), str(stock.get(k, 0)), str(it['don_gia_vnd'])])
+            _write_water_catalog(rows)
+        _append_water_movement(MOVE_RECEIPT if so_luong_ton > 0 else MOVE_ADJUST, ten, so_luong_ton, don_gia_vnd)
     _invalidate_month_cache()  # Water item price/quantity can affect future sales summaries
+    _publish_change(_table_of(WATER_ITEMS_FILE), 'updated' if existing is not None else 'inserted', (ten,))
 
 def update_water_item(old_ten: str, new_ten: str, don_gia_vnd: int) -> bool:
-    """Đổi tên và/hoặc đơn giá nước, giữ nguyên số lượng tồn."""
-    ensure_water_items_file()
-    path = _abs_path(WATER_ITEMS_FILE)
-    with open(path,'r',newline='',encoding='utf-8') as f:
-        rows = list(csv.reader(f))
-    if not rows: return False
-    header = rows[0]; changed=False
-    new_rows=[header]
-    for r in rows[1:]:
-        if len(r)>=3 and (not changed) and r[0].strip().lower()==old_ten.strip().lower():
-            # giữ số lượng tồn hiện tại
-            qty = r[1]
-            new_rows.append([_sanitize_text_cell(new_ten.strip()), qty, str(don_gia_vnd)])
-            changed=True; continue
-        new_rows.append(r)
-    if changed:
-        tmp=path+'.tmp'
-        with _file_lock(path):
-            with open(tmp,'w',newline='',encoding='utf-8') as f:
-                csv.writer(f).writerows(new_rows)
-            os.replace(tmp,path)
-        _invalidate_month_cache()
-    return changed
+    """Đổi tên và/hoặc đơn giá nước, giữ nguyên số lượng tồn (đổi tên -> chuyển tồn sang tên mới trong sổ cái)."""
+    new_ten = _sanitize_text_cell(new_ten.strip())
+    old_key, new_key = _water_key(old_ten), _water_key(new_ten)
+    with _cache_lock:
+        catalog = _water_catalog()
+        target = catalog['by_name'].get(old_key)
+        if target is None:
+            return False
+        stock = _sync_water_stock()['stock']
+        qty = stock.get(old_key, 0)
+        rows = []
+        for it in catalog['items']:
+            if it is target:
+                rows.append([new_ten, str(qty), str(don_gia_vnd)])
+            else:
+                rows.append([it.get('ten', ''), str(stock.get(_water_key(it.get('ten', '')), 0)), str(it['don_gia_vnd'])])
+        _write_water_catalog(rows)
+        if new_key != old_key and qty:
+            _append_water_movement(MOVE_ADJUST, target['ten'], -qty, don_gia_vnd, f"đổi tên -> {new_ten}")
+            _append_water_movement(MOVE_ADJUST, new_ten, qty, don_gia_vnd, f"đổi tên từ {target['ten']}")
+    _invalidate_month_cache()
+    _publish_change(_table_of(WATER_ITEMS_FILE), 'updated', (old_ten.strip(), new_ten))
+    return True
 
 def read_water_items() -> List[Dict[str, Any]]:
-    ensure_water_items_file()
-    path = _abs_path(WATER_ITEMS_FILE)
-    res: List[Dict[str, Any]] = []
-    with open(path, 'r', newline='', encoding='utf-8') as f:
-        reader = csv.DictReader(f)
-        for r in reader:
-            try:
-                r['so_luong_ton'] = int(r.get('so_luong_ton','0') or 0)
-            except ValueError:
-                r['so_luong_ton'] = 0
-            try:
-                r['don_gia_vnd'] = int(r.get('don_gia_vnd','0') or 0)
-            except ValueError:
-                r['don_gia_vnd'] = 0
-            res.append(r)
-    return res
+    """Danh mục nước; so_luong_ton lấy từ bảng tồn (sổ cái), không từ cột bản sao trong CSV."""
+    with _cache_lock:
+        items = _water_catalog()['items']
+        stock = _sync_water_stock()['stock']
+        return [dict(it, so_luong_ton=stock.get(_water_key(it.get('ten', '')), 0)) for it in items]
 
 def delete_water_item(ten: str) -> bool:
     """Xóa hẳn 1 loại nước khỏi danh mục (nếu không còn xuất hiện trong bán hàng).
     Trả về True nếu xóa, False nếu không tìm thấy.
-    Nếu vẫn còn bản ghi bán nước của loại này thì vẫn cho xóa (chỉ ảnh hưởng danh mục tương lai)."""
-    ensure_water_items_file()
-    ten = ten.strip().lower()
-    if not ten:
+    Nếu vẫn còn bản ghi bán nước của loại này thì vẫn cho xóa (chỉ ảnh hưởng danh mục tương lai).
+    Tồn còn lại được điều chỉnh về 0 trong sổ cái (thêm lại sau này bắt đầu từ số lượng nhập mới)."""
+    key = _water_key(ten)
+    if not key:
         return False
-    path = _abs_path(WATER_ITEMS_FILE)
-    new_rows = []
-    removed = False
-    with open(path, 'r', newline='', encoding='utf-8') as f:
-        reader = csv.DictReader(f)
-        for r in reader:
-            if r.get('ten','').strip().lower() == ten:
-                removed = True
-                continue
-            new_rows.append([r.get('ten',''), r.get('so_luong_ton','0'), r.get('don_gia_vnd','0')])
-    if removed:
-        tmp = path + '.tmp'
-        with _file_lock(path):
-            with open(tmp, 'w', newline='', encoding='utf-8') as f:
-                writer = csv.writer(f)
-                writer.writerow(WATER_ITEM_HEADERS)
-                writer.writerows(new_rows)
-            os.replace(tmp, path)
-        _invalidate_month_cache()
-    return removed
+    with _cache_lock:
+        catalog = _water_catalog()
+        removed = [it for it in catalog['items'] if _water_key(it.get('ten', '')) == key]
+        if not removed:
+            return False
+        stock = _sync_water_stock()['stock']
+        _write_water_catalog([[it.get('ten', ''), str(stock.get(_water_key(it.get('ten', '')), 0)), str(it['don_gia_vnd'])]
+                              for it in catalog['items'] if _water_key(it.get('ten', '')) != key])
+        qty = stock.get(key, 0)
+        if qty:
+            _append_water_movement(MOVE_ADJUST, removed[0]['ten'], -qty, removed[0]['don_gia_vnd'], 'xóa khỏi danh mục')
+    _invalidate_month_cache()
+    _publish_change(_table_of(WATER_ITEMS_FILE), 'deleted', (key,))
+    return True
 
 def record_water_sale(ngay: str, ten: str, so_luong: int):
     """Ghi nhận bán nước. Lấy đơn giá từ danh mục.
@@ -1407,26 +1958,101 @@ def record_water_sale(ngay: str, ten: str, so_luong: int):
         datetime.strptime(ngay, '%Y-%m-%d')
     except ValueError:
         raise ValueError('Ngày phải YYYY-MM-DD')
-    items = read_water_items()
-    match = None
-    for i in items:
-        if i.get('ten','').strip().lower() == ten.lower():
-            match = i; break
-    if not match:
-        raise ValueError('Loại nước không tồn tại trong danh mục')
-    if match['so_luong_ton'] < so_luong:
-        raise ValueError('Không đủ số lượng tồn (còn %d)' % match['so_luong_ton'])
-    don_gia = match['don_gia_vnd']
-    tong = don_gia * so_luong
-    # cập nhật tồn
-    add_water_item(ten, -so_luong, don_gia)  # dùng cộng dồn với số âm
+    key = _water_key(ten)
+    with _cache_lock:
+        match = _water_catalog()['by_name'].get(key)
+        if not match:
+            raise ValueError('Loại nước không tồn tại trong danh mục')
+        ton = _sync_water_stock()['stock'].get(key, 0)
+        if ton < so_luong:
+            raise ValueError('Không đủ số lượng tồn (còn %d)' % ton)
+        don_gia = match['don_gia_vnd']
+        tong = don_gia * so_luong
+        # cập nhật tồn: một dòng 'ban' trong sổ cái
+        _append_water_movement(MOVE_SALE, match['ten'], -so_luong, don_gia, ngay)
     ensure_water_sales_file()
     path = _abs_path(WATER_SALES_FILE)
-    _safe_append_csv(path, [ngay, ten, str(so_luong), str(don_gia), str(tong)])
+    row = [ngay, ten, str(so_luong), str(don_gia), str(tong)]
+    sig_before = _file_signature(WATER_SALES_FILE)
+    try:
+        _safe_append_csv(path, row)
+    except Exception:
+        _append_water_movement(MOVE_REVERSAL, ten, so_luong, don_gia, f"{ngay} ghi bán lỗi")
+        raise
+    _note_water_sale_appended(sig_before, row)
     _invalidate_month_cache()
+    _publish_change(_table_of(WATER_ITEMS_FILE), 'updated', (ten,))
+    _publish_change(_table_of(WATER_SALES_FILE), 'inserted', (ten,), (ngay,))
     return tong
 
+# Index bán nước trong bộ nhớ: dòng theo ngày, tổng theo ngày / tháng, lũy kế theo loại nước (toàn bộ và
+# theo tháng). Dựng lại khi thế hệ đổi (xóa dòng bán / invalidate) hoặc file bị sửa ngoài app (mtime/size);
+# bán mới chỉ cộng thêm một dòng vào index. Các list/dict trả ra dùng chung với cache: caller chỉ đọc.
+_water_sales_cache: Dict[str, Any] = {}
+_water_sales_generation = 0
+
+def _bump_water_sales_generation():
+    global _water_sales_generation
+    with _cache_lock:
+        _water_sales_generation += 1
+
+def _index_water_sale(c: Dict[str, Any], r: Dict[str, Any]):
+    ngay = r.get('ngay', '') or ''
+    tong = r.get('tong_vnd', 0)
+    c['rows'].append(r)
+    c['by_day'].setdefault(ngay, []).append(r)
+    c['day_totals'][ngay] = c['day_totals'].get(ngay, 0) + tong
+    if len(ngay) >= 8 and ngay[7] == '-':
+        thang = ngay[:7]
+        c['month_totals'][thang] = c['month_totals'].get(thang, 0) + tong
+        scopes = (c['item_totals'], c['month_items'].setdefault(thang, {}))
+    else:
+        scopes = (c['item_totals'],)
+    key = _water_key(r.get('ten', ''))
+    for scope in scopes:
+        acc = scope.get(key)
+        if acc is None:
+            acc = scope[key] = {'ten': r.get('ten', ''), 'so_luong': 0, 'tong_vnd': 0}
+        acc['so_luong'] += r.get('so_luong', 0)
+        acc['tong_vnd'] += tong
+
+def _water_sales_index() -> Dict[str, Any]:
+    sig = _file_signature(WATER_SALES_FILE)
+    with _cache_lock:
+        c = _water_sales_cache
+        if c.get('generation') == _water_sales_generation and c.get('signature') == sig:
+            metrics.inc('cache.water_sales.hit')
+            return c
+        metrics.inc('cache.water_sales.miss')
+        rows = _parse_water_sales_file()
+        c.clear()
+        c.update(generation=_water_sales_generation, signature=_file_signature(WATER_SALES_FILE), rows=[],
+                 by_day={}, day_totals={}, month_totals={}, item_totals={}, month_items={})
+        for r in rows:
+            _index_water_sale(c, r)
+        return c
+
+def _note_water_sale_appended(sig_before: Tuple[int, int], row: List[str]):
+    """Sau khi append một dòng bán: cộng thẳng vào index nếu file chỉ lớn thêm đúng dòng đó,
+    ngược lại (tiến trình khác cũng ghi) để lần đọc sau dựng lại."""
+    buf = io.StringIO()
+    csv.writer(buf).writerow(row)
+    sig_after = _file_signature(WATER_SALES_FILE)
+    with _cache_lock:
+        c = _water_sales_cache
+        if (c.get('generation') == _water_sales_generation and c.get('signature') == sig_before
+                and sig_after[1] == sig_before[1] + len(buf.getvalue().encode('utf-8'))):
+            _index_water_sale(c, {'ngay': row[0], 'ten': row[1], 'so_luong': int(row[2]),
+                                  'don_gia_vnd': int(row[3]), 'tong_vnd': int(row[4])})
+            c['signature'] = sig_after
+        else:
+            _bump_water_sales_generation()
+
 def read_water_sales() -> List[Dict[str, Any]]:
+    """Mọi dòng bán nước (từ index; caller không sửa các dict)."""
+    return list(_water_sales_index()['rows'])
+
+def _parse_water_sales_file() -> List[Dict[str, Any]]:
     ensure_water_sales_file()
     path = _abs_path(WATER_SALES_FILE)
     res: List[Dict[str, Any]] = []
@@ -1439,10 +2065,11 @@ def read_water_sales() -> List[Dict[str, Any]]:
                 except ValueError:
                     r[k] = 0
             res.append(r)
+    metrics.inc('rows_parsed.water_sales', len(res))
     return res
 
 def delete_water_sale(ngay: str, ten: str, so_luong: int, don_gia_vnd: int) -> bool:
-    """Xóa 1 dòng bán nước chính xác (match đủ 4 trường). Đồng thời hoàn lại tồn kho.
+    """Xóa 1 dòng bán nước chính xác (match đủ 4 trường). Đồng thời hoàn lại tồn kho (biến động 'hoan').
     Trả về True nếu xóa."""
     ensure_water_sales_file(); ensure_water_items_file()
     path = _abs_path(WATER_SALES_FILE)
@@ -1459,8 +2086,12 @@ def delete_water_sale(ngay: str, ten: str, so_luong: int, don_gia_vnd: int) -> b
                 continue
             rows.append(row)
     if removed:
-        # hoàn kho
-        add_water_item(ten, so_luong, don_gia_vnd)
+        # hoàn kho (loại đã bị xóa khỏi danh mục -> thêm lại như trước đây)
+        with _cache_lock:
+            if _water_key(ten) not in _water_catalog()['by_name']:
+                _sync_water_stock()  # Khởi tạo sổ cái trước khi thêm lại dòng danh mục (tránh cộng trùng)
+                _safe_append_csv(_abs_path(WATER_ITEMS_FILE), [ten.strip(), str(so_luong), str(don_gia_vnd)])
+            _append_water_movement(MOVE_REVERSAL, ten.strip(), so_luong, don_gia_vnd, f"xóa dòng bán {ngay}")
         tmp = path + '.tmp'
         with _file_lock(path):
             with open(tmp, 'w', newline='', encoding='utf-8') as f:
@@ -1468,11 +2099,25 @@ def delete_water_sale(ngay: str, ten: str, so_luong: int, don_gia_vnd: int) -> b
                 writer.writerow(WATER_SALE_HEADERS)
                 writer.writerows(rows)
             os.replace(tmp, path)
+        _bump_water_sales_generation()
         _invalidate_month_cache()
+        _publish_change(_table_of(WATER_ITEMS_FILE), 'updated', (ten.strip(),))
+        _publish_change(_table_of(WATER_SALES_FILE), 'deleted', (ten.strip(),), (ngay,))
     return removed
 
 def day_water_sales(ngay: str) -> List[Dict[str, Any]]:
-    return [r for r in read_water_sales() if r.get('ngay') == ngay]
+    return list(_water_sales_index()['by_day'].get(ngay, ()))
+
+def day_water_sales_total(ngay: str) -> int:
+    """Tổng tiền bán nước một ngày (YYYY-MM-DD)."""
+    return _water_sales_index()['day_totals'].get(ngay, 0)
+
+def water_sales_item_totals(thang: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Lũy kế theo loại nước {'ten', 'so_luong', 'tong_vnd'} – toàn bộ hoặc trong tháng YYYY-MM,
+    sắp theo doanh thu giảm dần."""
+    c = _water_sales_index()
+    scope = c['item_totals'] if thang is None else c['month_items'].get(thang, {})
+    return sorted((dict(v) for v in scope.values()), key=lambda v: -v['tong_vnd'])
 
 def aggregate_day_water_sales(ngay: str) -> List[Dict[str, Any]]:
     aggr: Dict[str, Dict[str, Any]] = {}
@@ -1485,6 +2130,388 @@ def aggregate_day_water_sales(ngay: str) -> List[Dict[str, Any]]:
     return list(aggr.values())
 
 
+# ---------------------- THỜI KHÓA BIỂU (SCHEDULE) ----------------------
+SCHEDULE_COURTS = ("Sân 1", "Sân 2")
+WEEKDAY_LABELS = ("Thứ 2", "Thứ 3", "Thứ 4", "Thứ 5", "Thứ 6", "Thứ 7", "Chủ nhật")
+# Gói tháng cũ chỉ lưu số giờ (không có khung giờ) -> giả định khung phổ biến buổi tối
+_SUBSCRIPTION_FALLBACK_HOURS = {1: (19, 20), 2: (18, 20), 3: (17, 20)}
+
+_subscription_cache: Dict[str, Any] = {}  # {'signature': (mtime_ns, size), 'rows': [...], 'by_month': {...}}
+_subscription_calendar_cache: Dict[str, Dict[str, Any]] = {}  # { 'YYYY-MM': {'subs_sig', 'occurrences', 'by_day', ...} }
+# Giờ mở cửa dùng tính công suất sân (khớp khung phụ thu đèn 5h-22h)
+SCHEDULE_OPEN_HOURS = (5, 22)
+_week_occupancy_cache: Dict[str, Dict[str, Any]] = {}  # { 'YYYY-MM-DD' (thứ 2): {'src', 'subs_sig', 'value'} }
+
+def _file_signature(filename: str) -> Tuple[int, int]:
+    try:
+        st = os.stat(_abs_path(filename))
+        return (st.st_mtime_ns, st.st_size)
+    except OSError:
+        return (0, 0)
+
+def _subscriptions_by_month() -> Dict[str, List[Dict[str, Any]]]:
+    """Gói tháng nhóm theo tháng, chỉ parse lại CSV khi file thay đổi (mtime/size)."""
+    sig = _file_signature(SUBSCRIPTION_FILE)
+    if _subscription_cache.get('signature') != sig:
+        metrics.inc('cache.subscriptions.miss')
+        ensure_subscription_file()
+        sig = _file_signature(SUBSCRIPTION_FILE)  # File vừa được tạo -> chữ ký khác (0, 0)
+        by_month: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        for r in read_all_subscriptions():
+            by_month[r.get('thang', '')].append(r)
+        _subscription_cache['signature'] = sig
+        _subscription_cache['by_month'] = dict(by_month)
+    return _subscription_cache['by_month']
+
+def _slot_hour_range(khung_gio: str) -> Optional[Tuple[int, int]]:
+    """'8h-10h' hoặc '08:00-10:00' -> (8, 10). None nếu không parse được."""
+    if not khung_gio or '-' not in khung_gio:
+        return None
+    a, b = khung_gio.split('-', 1)
+    try:
+        start = int(a.strip().lower().rstrip('h').split(':')[0])
+        end = int(b.strip().lower().rstrip('h').split(':')[0])
+    except ValueError:
+        return None
+    return (start, end) if start < end else None
+
+def _subscription_hour_range(gio_display: Any) -> Optional[Tuple[int, int]]:
+    """'2 (7:00-9:00)' -> (7, 9); chỉ có số giờ ('2') -> khung mặc định theo số giờ."""
+    text = str(gio_display or '').strip()
+    if '(' in text and ')' in text:
+        return _slot_hour_range(text.split('(', 1)[1].split(')', 1)[0])
+    try:
+        count = int(text.split()[0]) if text else 1
+    except ValueError:
+        return None
+    return _SUBSCRIPTION_FALLBACK_HOURS.get(count)
+
+def _parse_weekdays(thu: Any) -> List[int]:
+    """'Thứ 2, Thứ 4' / 'Thứ 2, 4, 6' / 'T3, CN' -> chỉ số thứ (0 = thứ 2 ... 6 = chủ nhật), không trùng."""
+    out: List[int] = []
+    for part in str(thu or '').replace(';', ',').split(','):
+        p = part.strip().lower()
+        for prefix in ('thứ', 'thu', 't'):
+            if p.startswith(prefix) and p[len(prefix):].strip().isdigit():
+                p = p[len(prefix):].strip()
+                break
+        if p.isdigit() and 2 <= int(p) <= 7:
+            wd = int(p) - 2
+        elif p in ('chủ nhật', 'chu nhat', 'cn'):
+            wd = 6
+        else:
+            continue
+        if wd not in out:
+            out.append(wd)
+    return out
+
+def _month_dates_by_weekday(thang: str) -> List[List[str]]:
+    """Các ngày ISO của tháng YYYY-MM chia theo thứ (0 = thứ 2 ... 6 = chủ nhật)."""
+    year, month = (int(x) for x in thang.split('-'))
+    dates_by_weekday: List[List[str]] = [[] for _ in range(7)]
+    for d in range(1, calendar.monthrange(year, month)[1] + 1):
+        day = date(year, month, d)
+        dates_by_weekday[day.weekday()].append(day.isoformat())
+    return dates_by_weekday
+
+def _expand_subscription(sub: Dict[str, Any], thang: str,
+                         dates_by_weekday: List[List[str]]) -> Optional[List[SubscriptionOccurrence]]:
+    """Mở rộng một dòng gói tháng thành các buổi cụ thể; None nếu thiếu thứ / khung giờ / sân."""
+    weekdays = _parse_weekdays(sub.get('thu'))
+    gio = str(sub.get('gio_moi_buoi_display', sub.get('gio_moi_buoi')) or '')
+    hours = _subscription_hour_range(gio)
+    san = (sub.get('san') or '').strip()
+    if not weekdays or not hours or not san:
+        return None
+    assumed = '(' not in gio
+    return [SubscriptionOccurrence(day_iso, san, hours[0], hours[1], sub.get('ten', ''), thang, assumed, sub)
+            for wd in weekdays for day_iso in dates_by_weekday[wd]]
+
+def compile_subscription_calendar(thang: str) -> Dict[str, Any]:
+    """Lịch gói tháng đã mở rộng cho tháng YYYY-MM: mỗi dòng monthly_subscriptions.csv của tháng được
+    biên dịch một lần thành các buổi cụ thể (ngày, sân, khung giờ).
+
+    Trả về dict:
+      - thang
+      - occurrences: [SubscriptionOccurrence] sắp theo (ngày, sân, giờ bắt đầu)
+      - by_day: { 'YYYY-MM-DD': [SubscriptionOccurrence] }
+      - unresolved: các dòng gói không xác định được thứ / khung giờ / sân (không sinh buổi nào)
+    Cache theo tháng tới khi file gói tháng thay đổi; caller chỉ đọc."""
+    subs_sig = _file_signature(SUBSCRIPTION_FILE)
+    with _cache_lock:
+        cached = _subscription_calendar_cache.get(thang)
+        if cached and cached['subs_sig'] == subs_sig:
+            metrics.inc('cache.subscription_calendar.hit')
+            return cached
+        metrics.inc('cache.subscription_calendar.miss')
+        subs_of_month = _subscriptions_by_month().get(thang, ())
+        subs_sig = _subscription_cache['signature']
+        dates_by_weekday = _month_dates_by_weekday(thang)
+        occurrences: List[SubscriptionOccurrence] = []
+        unresolved: List[Dict[str, Any]] = []
+        for sub in subs_of_month:
+            expanded = _expand_subscription(sub, thang, dates_by_weekday)
+            if expanded is None:
+                unresolved.append(sub)
+            else:
+                occurrences.extend(expanded)
+        occurrences.sort(key=lambda o: (o.ngay, o.san, o.gio_bat_dau))
+        by_day: Dict[str, List[SubscriptionOccurrence]] = {}
+        for occ in occurrences:
+            by_day.setdefault(occ.ngay, []).append(occ)
+        value = {'thang': thang, 'subs_sig': subs_sig, 'occurrences': occurrences, 'by_day': by_day,
+                 'unresolved': unresolved}
+        _subscription_calendar_cache[thang] = value
+        return value
+
+def subscription_occurrences_for_day(ngay: str) -> List[SubscriptionOccurrence]:
+    """Các buổi gói tháng trong một ngày (YYYY-MM-DD)."""
+    return list(compile_subscription_calendar(ngay[:7])['by_day'].get(ngay, ()))
+
+def month_court_utilization(thang: str, open_hours: Tuple[int, int] = SCHEDULE_OPEN_HOURS) -> Dict[str, Dict[str, Any]]:
+    """Công suất sân trong tháng: số giờ có người dùng (đặt lẻ + gói tháng, giờ trùng chỉ tính một lần)
+    trên tổng giờ mở cửa. Trả về {sân: {'booked_hours', 'daily_hours', 'subscription_hours',
+    'capacity_hours', 'ratio'}} cho SCHEDULE_COURTS và mọi sân khác xuất hiện trong dữ liệu."""
+    year, month = (int(x) for x in thang.split('-'))
+    n_days = calendar.monthrange(year, month)[1]
+    open_h, close_h = open_hours
+    daily: Dict[str, set] = defaultdict(set)
+    subs: Dict[str, set] = defaultdict(set)
+    day_index = _get_day_index()
+    for d in range(1, n_days + 1):
+        day_iso = f"{thang}-{d:02d}"
+        for r in day_index.get(day_iso, ()):
+            hours = _slot_hour_range(r.khung_gio)
+            if hours:
+                daily[r.san.strip()].update((day_iso, h) for h in range(max(open_h, hours[0]), min(close_h, hours[1])))
+    for occ in compile_subscription_calendar(thang)['occurrences']:
+        subs[occ.san].update((occ.ngay, h) for h in range(max(open_h, occ.gio_bat_dau), min(close_h, occ.gio_ket_thuc)))
+    capacity = n_days * max(0, close_h - open_h)
+    out: Dict[str, Dict[str, Any]] = {}
+    for san in list(SCHEDULE_COURTS) + sorted((set(daily) | set(subs)) - set(SCHEDULE_COURTS)):
+        booked = len(daily[san] | subs[san])
+        out[san] = {'booked_hours': booked, 'daily_hours': len(daily[san]), 'subscription_hours': len(subs[san]),
+                    'capacity_hours': capacity, 'ratio': round(booked / capacity, 4) if capacity else 0.0}
+    return out
+
+def week_occupancy(week_start: date | datetime | str) -> Dict[str, Any]:
+    """Lưới chiếm dụng sân của một tuần (bắt đầu thứ 2), dựng từ index theo ngày.
+
+    Trả về dict:
+      - week_start: 'YYYY-MM-DD'
+      - days: 7 ngày ISO của tuần
+      - courts: danh sách sân (SCHEDULE_COURTS)
+      - grid: grid[ngày 0-6][giờ 0-23][sân] = None hoặc {'booking': DailyRecord|None, 'subscription': dict|None}
+    Kết quả được cache theo tuần cho tới khi daily records hoặc file gói tháng thay đổi;
+    caller chỉ đọc, không sửa lưới trả về."""
+    if isinstance(week_start, str):
+        week_start = datetime.strptime(week_start, '%Y-%m-%d').date()
+    elif isinstance(week_start, datetime):
+        week_start = week_start.date()
+    key = week_start.isoformat()
+    recs = get_daily_records()
+    subs_sig = _file_signature(SUBSCRIPTION_FILE)
+    cached = _week_occupancy_cache.get(key)
+    if cached and cached['src'] is recs and cached['subs_sig'] == subs_sig:
+        metrics.inc('cache.week_occupancy.hit')
+        return cached['value']
+    metrics.inc('cache.week_occupancy.miss')
+
+    day_index = _get_day_index()
+    court_pos = {c: i for i, c in enumerate(SCHEDULE_COURTS)}
+    days = [(week_start + timedelta(days=i)).isoformat() for i in range(7)]
+    grid: List[List[List[Optional[Dict[str, Any]]]]] = [
+        [[None] * len(SCHEDULE_COURTS) for _ in range(24)] for _ in range(7)
+    ]
+
+    def _mark(d: int, c: int, hours: Tuple[int, int], field: str, ref: Any):
+        for h in range(max(0, hours[0]), min(24, hours[1])):
+            cell = grid[d][h][c]
+            if cell is None:
+                cell = grid[d][h][c] = {'booking': None, 'subscription': None}
+            if cell[field] is None:  # bản ghi đầu tiên thắng (giữ hành vi UI cũ)
+                cell[field] = ref
+
+    for d, day_iso in enumerate(days):
+        for r in day_index.get(day_iso, ()):
+            c = court_pos.get(r.san)
+            hours = _slot_hour_range(r.khung_gio)
+            if c is not None and hours:
+                _mark(d, c, hours, 'booking', r)
+        for occ in compile_subscription_calendar(day_iso[:7])['by_day'].get(day_iso, ()):
+            c = court_pos.get(occ.san)
+            if c is not None:
+                _mark(d, c, (occ.gio_bat_dau, occ.gio_ket_thuc), 'subscription', occ.sub)
+
+    value = {'week_start': key, 'days': days, 'courts': list(SCHEDULE_COURTS), 'grid': grid}
+    _week_occupancy_cache[key] = {'src': recs, 'subs_sig': subs_sig, 'value': value}
+    return value
+
+
+# ---------------------- CHIẾM DỤNG SÂN (ĐẶT LẺ + GÓI THÁNG) ----------------------
+_occupancy_cache: Dict[str, Dict[str, Any]] = {}  # { 'YYYY-MM': {'generation', 'daily_sig', 'subs_sig', 'cells'} }
+_occupancy_generation = 0  # tăng mỗi lần daily records đổi qua utils (chữ ký file có thể trùng trong cùng tick mtime)
+OCCUPANCY_CONFLICT_PREVIEW = 3  # số buổi trùng liệt kê trong thông báo lỗi
+
+
+class ScheduleConflictError(ValueError):
+    """Khung giờ trùng bản ghi lẻ / gói tháng. UI bắt riêng để hỏi xác nhận rồi ghi lại với
+    allow_overlap / allow_conflict; conflicts: chi tiết (nếu có, dạng subscription_conflicts)."""
+
+    def __init__(self, message: str, conflicts: Optional[List[Dict[str, Any]]] = None):
+        super().__init__(message)
+        self.conflicts = conflicts or []
+
+
+def _occupancy_cell(cells: Dict[Tuple[str, str, int], Dict[str, list]], ngay: str, san: str, h: int) -> Dict[str, list]:
+    cell = cells.get((ngay, san, h))
+    if cell is None:
+        cell = cells[(ngay, san, h)] = {'bookings': [], 'subscriptions': []}
+    return cell
+
+def _index_booking(cells: Dict[Tuple[str, str, int], Dict[str, list]], r: DailyRecord):
+    hours = _slot_hour_range(r.khung_gio)
+    if hours:
+        san = r.san.strip()
+        for h in range(hours[0], hours[1]):
+            _occupancy_cell(cells, r.ngay, san, h)['bookings'].append(r)
+
+def month_occupancy(thang: str) -> Dict[Tuple[str, str, int], Dict[str, list]]:
+    """Index chiếm dụng gộp của tháng YYYY-MM: (ngày, sân, giờ) -> {'bookings': [DailyRecord],
+    'subscriptions': [SubscriptionOccurrence]}, chỉ gồm các ô có người dùng.
+    Cache theo tháng tới khi daily records hoặc file gói tháng thay đổi (thêm bản ghi lẻ được cộng thẳng
+    vào index, không dựng lại); caller chỉ đọc."""
+    daily_sig = _file_signature(DAILY_FILE)
+    subs_sig = _file_signature(SUBSCRIPTION_FILE)
+    with _cache_lock:
+        c = _occupancy_cache.get(thang)
+        if (c and c['generation'] == _occupancy_generation and c['daily_sig'] == daily_sig
+                and c['subs_sig'] == subs_sig):
+            metrics.inc('cache.occupancy.hit')
+            return c['cells']
+        metrics.inc('cache.occupancy.miss')
+        generation = _occupancy_generation
+        cells: Dict[Tuple[str, str, int], Dict[str, list]] = {}
+        day_index = _get_day_index()
+        for days in _month_dates_by_weekday(thang):
+            for day_iso in days:
+                for r in day_index.get(day_iso, ()):
+                    _index_booking(cells, r)
+        cal = compile_subscription_calendar(thang)
+        for occ in cal['occurrences']:
+            for h in range(occ.gio_bat_dau, occ.gio_ket_thuc):
+                _occupancy_cell(cells, occ.ngay, occ.san, h)['subscriptions'].append(occ)
+        subs_sig = cal['subs_sig']
+        _occupancy_cache[thang] = {'generation': generation, 'daily_sig': daily_sig, 'subs_sig': subs_sig,
+                                   'cells': cells}
+        return cells
+
+def _note_booking_appended(generation: int, sig_before: Tuple[int, int], rec: DailyRecord, row: List[str]):
+    """Sau khi append một bản ghi lẻ: cộng thẳng vào index tháng nếu file chỉ lớn thêm đúng dòng đó,
+    ngược lại (tiến trình khác cũng ghi) để lần tra sau dựng lại."""
+    buf = io.StringIO()
+    csv.writer(buf).writerow(row)
+    sig_after = _file_signature(DAILY_FILE)
+    with _cache_lock:
+        c = _occupancy_cache.get(rec.ngay[:7])
+        if (c and c['generation'] == generation and c['daily_sig'] == sig_before
+                and sig_after[1] == sig_before[1] + len(buf.getvalue().encode('utf-8'))):
+            _index_booking(c['cells'], rec)
+            c.update(generation=_occupancy_generation, daily_sig=sig_after)
+
+def _booking_conflict_error(ngay: str, san: str, slot: str) -> Optional[str]:
+    """Thông báo lỗi nếu khung giờ (ngày, sân) đã có bản ghi lẻ hoặc buổi gói tháng; None nếu trống.
+    Buổi của gói chỉ lưu số giờ (gio_mac_dinh, khung giờ là giả định) không chặn, chỉ ghi log."""
+    hours = _slot_hour_range(slot)
+    if not hours:
+        return None
+    cells = month_occupancy(ngay[:7])
+    occupied = [cell for cell in (cells.get((ngay, san.strip(), h)) for h in range(hours[0], hours[1])) if cell]
+    for cell in occupied:
+        if cell['bookings']:
+            return f"Khung giờ chồng chéo với bản ghi đã có: {cell['bookings'][0].khung_gio}"
+    for cell in occupied:
+        for occ in cell['subscriptions']:
+            if not occ.gio_mac_dinh:
+                return f"Khung giờ trùng lịch gói tháng: nhóm {occ.ten} ({occ.gio_bat_dau}h-{occ.gio_ket_thuc}h)"
+    assumed = next((occ for cell in occupied for occ in cell['subscriptions']), None)
+    if assumed is not None:
+        logger.info("Đặt %s %s %s trùng khung giờ giả định của gói %s (gói chỉ lưu số giờ)", ngay, san, slot, assumed.ten)
+    return None
+
+def _describe_occupant(item: Any) -> str:
+    if isinstance(item, SubscriptionOccurrence):
+        return f"gói {item.ten} ({item.gio_bat_dau}h-{item.gio_ket_thuc}h)"
+    return f"đặt lẻ {item.khung_gio}{' – ' + item.nguoi if item.nguoi else ''}"
+
+def subscription_conflicts(sub: Dict[str, Any], exclude_ten: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Các buổi của một dòng gói (dict dạng read_all_subscriptions: thang, ten, san, thu,
+    gio_moi_buoi_display) trùng bản ghi lẻ hoặc gói khác. Mỗi phần tử: {'occurrence', 'with'} với 'with' là
+    DailyRecord hoặc SubscriptionOccurrence. Khung giờ giả định (gói chỉ lưu số giờ, ở cả hai phía) không
+    tính; exclude_ten: bỏ qua buổi của gói đang được sửa. Gói không mở rộng được -> []."""
+    thang = sub.get('thang', '')
+    expanded = _expand_subscription(sub, thang, _month_dates_by_weekday(thang))
+    if not expanded or expanded[0].gio_mac_dinh:
+        return []
+    cells = month_occupancy(thang)
+    out: List[Dict[str, Any]] = []
+    for occ in expanded:
+        seen: set = set()
+        for h in range(occ.gio_bat_dau, occ.gio_ket_thuc):
+            cell = cells.get((occ.ngay, occ.san, h))
+            if not cell:
+                continue
+            for other in cell['bookings'] + cell['subscriptions']:
+                if isinstance(other, SubscriptionOccurrence) and (other.gio_mac_dinh or other.ten == exclude_ten):
+                    continue
+                if id(other) not in seen:
+                    seen.add(id(other))
+                    out.append({'occurrence': occ, 'with': other})
+    return out
+
+def _check_subscription_conflicts(sub: Dict[str, Any], exclude_ten: Optional[str] = None):
+    """ScheduleConflictError nếu buổi nào của gói trùng bản ghi lẻ / gói khác cùng sân."""
+    conflicts = subscription_conflicts(sub, exclude_ten)
+    if conflicts:
+        preview = "; ".join(f"{c['occurrence'].ngay} {_describe_occupant(c['with'])}"
+                            for c in conflicts[:OCCUPANCY_CONFLICT_PREVIEW])
+        more = f" (và {len(conflicts) - OCCUPANCY_CONFLICT_PREVIEW} chỗ khác)" if len(conflicts) > OCCUPANCY_CONFLICT_PREVIEW else ""
+        raise ScheduleConflictError(f"Gói {sub.get('ten', '')} trùng lịch {sub.get('san', '')}: {preview}{more}", conflicts)
+
+def month_conflicts(thang: str) -> List[Dict[str, Any]]:
+    """Mọi chỗ trùng lịch trong tháng YYYY-MM để dọn dữ liệu: bản ghi lẻ đè buổi gói tháng và hai gói
+    cùng (ngày, sân, giờ). Mỗi phần tử: {'ngay', 'san', 'gio_bat_dau', 'gio_ket_thuc' (phần giao),
+    'loai': 'booking-subscription' | 'subscription-subscription', 'booking': DailyRecord | None,
+    'subscriptions': [SubscriptionOccurrence], 'gio_mac_dinh': True nếu có gói chỉ lưu số giờ (khung giờ giả
+    định, có thể không trùng thật)}; sắp theo (ngày, sân, giờ)."""
+    pairs: Dict[Tuple[str, int, int], Dict[str, Any]] = {}
+
+    def _add(kind: str, first: Any, occ: SubscriptionOccurrence, ngay: str, san: str, h: int):
+        key = (kind, id(first), id(occ))
+        item = pairs.get(key)
+        if item is None:
+            booking = first if kind == 'booking-subscription' else None
+            subs = [occ] if booking is not None else [first, occ]
+            pairs[key] = {'ngay': ngay, 'san': san, 'gio_bat_dau': h, 'gio_ket_thuc': h + 1, 'loai': kind,
+                          'booking': booking, 'subscriptions': subs,
+                          'gio_mac_dinh': any(o.gio_mac_dinh for o in subs)}
+        else:
+            item['gio_bat_dau'] = min(item['gio_bat_dau'], h)
+            item['gio_ket_thuc'] = max(item['gio_ket_thuc'], h + 1)
+
+    for (ngay, san, h), cell in month_occupancy(thang).items():
+        subs = cell['subscriptions']
+        if not subs or (len(subs) < 2 and not cell['bookings']):
+            continue
+        for r in cell['bookings']:
+            for occ in subs:
+                _add('booking-subscription', r, occ, ngay, san, h)
+        for i, a in enumerate(subs):
+            for b in subs[i + 1:]:
+                _add('subscription-subscription', a, b, ngay, san, h)
+    return sorted(pairs.values(), key=lambda c: (c['ngay'], c['san'], c['gio_bat_dau'], c['loai']))
+
+
 # ---------------------- SAFE FILE OPS ----------------------
 @contextmanager
 def _file_lock(path: str, retries: int = 12, delay: float = 0.1):
@@ -1493,6 +2520,7 @@ def _file_lock(path: str, retries: int = 12, delay: float = 0.1):
     Nếu không lock được sau retries -> cảnh báo & tiếp tục (fail-open)."""
     lock_path = path + '.lock'
     acquired = False
+    t0 = time.perf_counter()
     for _ in range(retries):
         try:
             fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
@@ -1501,7 +2529,9 @@ def _file_lock(path: str, retries: int = 12, delay: float = 0.1):
             break
         except FileExistsError:
             time.sleep(delay)
+    metrics.observe('lock_wait_ms.file', (time.perf_counter() - t0) * 1000.0)
     if not acquired:
+        metrics.inc('lock.timeouts')
         logger.warning("_file_lock: không acquire được lock %s (tiếp tục không khóa)", lock_path)
     try:
         yield
@@ -1524,6 +2554,16 @@ def _safe_append_csv(path: str, row: List[str]):
                 raise PermissionError("Không thể ghi file (có thể đang mở trong Excel). Hãy đóng file và thử lại.")
             time.sleep(SAFE_WRITE_DELAY)
 
+def _bucket_overlaps(ngay: str, san: str, lst: List[DailyRecord]) -> List[Dict[str, str]]:
+    """Các cặp khung giờ chồng nhau trong một bucket (ngày, sân)."""
+    slots = [x.khung_gio for x in lst]
+    pairs = []
+    for i in range(len(slots)):
+        for j in range(i+1, len(slots)):
+            if _time_overlap(slots[i], slots[j]):
+                pairs.append({'ngay': ngay, 'san': san, 'slot1': slots[i], 'slot2': slots[j]})
+    return pairs
+
 def verify_data_integrity() -> Dict[str, Any]:
     """Kiểm tra nhanh tình trạng dữ liệu (read-only).
     Trả về dict gồm:
@@ -1553,11 +2593,7 @@ def verify_data_integrity() -> Dict[str, Any]:
     for r in recs:
         by_key[(r.ngay, r.san)].append(r)
     for (ngay, san), lst in by_key.items():
-        slots = [x.khung_gio for x in lst]
-        for i in range(len(slots)):
-            for j in range(i+1, len(slots)):
-                if _time_overlap(slots[i], slots[j]):
-                    overlaps.append({'ngay': ngay, 'san': san, 'slot1': slots[i], 'slot2': slots[j]})
+        overlaps.extend(_bucket_overlaps(ngay, san, lst))
     return {
         'total_records': len(recs),
         'overlap_count': len(overlaps),
@@ -1566,13 +2602,143 @@ def verify_data_integrity() -> Dict[str, Any]:
         'has_record_id_header': has_id_header,
     }
 
+# ---------------------- KIỂM TRA TOÀN VẸN CÓ CACHE / TĂNG DẦN ----------------------
+# Kết quả lần quét gần nhất (checkpoint) được lưu kèm "thế hệ" dữ liệu (mtime_ns + size của daily_records.csv).
+# Mỗi thao tác ghi daily nối một dòng "ngày<TAB>sân" vào journal; lần kiểm tra sau chỉ xét lại các
+# bucket (ngày, sân) trong journal thay vì quét chồng giờ toàn bộ. full=True -> quét sâu như cũ.
+# File bị sửa ngoài ứng dụng (thế hệ đổi nhưng journal rỗng) -> tự chuyển sang quét toàn bộ.
+INTEGRITY_STATE_FILE = os.path.join(DATA_DIR_NAME, ".integrity_state.json")
+INTEGRITY_JOURNAL_FILE = os.path.join(DATA_DIR_NAME, ".integrity_journal")
+INTEGRITY_STATE_MAX_PAIRS = 5000  # Quá ngưỡng -> không lưu chi tiết, lần sau quét toàn bộ
+
+def data_generation() -> str:
+    """Chuỗi đại diện phiên bản dữ liệu dùng cho kiểm tra toàn vẹn (đổi khi file daily đổi)."""
+    mtime_ns, size = _file_signature(DAILY_FILE)
+    return f"{mtime_ns}:{size}"
+
+def _mark_integrity_dirty(*buckets):
+    """Ghi các bucket (ngày, sân) vừa bị thay đổi vào journal (append O(1), lỗi bỏ qua)."""
+    lines = "".join(f"{b[0]}\t{b[1]}\n" for b in buckets if len(b) >= 2 and b[0])
+    if not lines:
+        return
+    path = _abs_path(INTEGRITY_JOURNAL_FILE)
+    try:
+        with _file_lock(path), open(path, 'a', encoding='utf-8') as f:
+            f.write(lines)
+    except Exception as ex:
+        logger.debug("Không ghi được integrity journal: %s", ex)
+
+def _read_integrity_journal() -> Tuple[set, int]:
+    """(tập bucket bẩn, số byte đã đọc) – số byte dùng để chỉ cắt phần đã xử lý khi checkpoint."""
+    try:
+        with open(_abs_path(INTEGRITY_JOURNAL_FILE), 'rb') as f:
+            raw = f.read()
+    except OSError:
+        return set(), 0
+    # Bỏ dòng cuối chưa ghi xong (không có \n)
+    consumed = raw.rfind(b'\n') + 1
+    buckets = set()
+    for line in raw[:consumed].decode('utf-8', errors='replace').splitlines():
+        parts = line.split('\t')
+        if len(parts) == 2 and parts[0]:
+            buckets.add((parts[0], parts[1]))
+    return buckets, consumed
+
+def _truncate_integrity_journal(consumed: int):
+    """Bỏ consumed byte đầu journal (giữ lại dòng được ghi thêm trong lúc kiểm tra)."""
+    if consumed <= 0:
+        return
+    path = _abs_path(INTEGRITY_JOURNAL_FILE)
+    try:
+        with _file_lock(path):
+            with open(path, 'rb') as f:
+                rest = f.read()[consumed:]
+            tmp = path + '.tmp'
+            with open(tmp, 'wb') as f:
+                f.write(rest)
+            os.replace(tmp, path)
+    except Exception as ex:
+        logger.debug("Không cắt được integrity journal: %s", ex)
+
+def load_integrity_state() -> Optional[Dict[str, Any]]:
+    """Đọc sidecar kết quả kiểm tra gần nhất (None nếu chưa có / hỏng)."""
+    try:
+        with open(_abs_path(INTEGRITY_STATE_FILE), 'r', encoding='utf-8') as f:
+            state = json.load(f)
+        return state if isinstance(state, dict) and 'result' in state else None
+    except Exception:
+        return None
+
+def _save_integrity_state(generation: str, result: Dict[str, Any]):
+    stored = {k: v for k, v in result.items() if k not in ('from_cache', 'generation', 'checked_at', 'mode', 'checked_buckets')}
+    pairs = list(result.get('overlap_pairs', []))
+    stored['overlap_pairs'] = pairs[:INTEGRITY_STATE_MAX_PAIRS]
+    stored['pairs_truncated'] = len(pairs) > INTEGRITY_STATE_MAX_PAIRS
+    state = {'generation': generation, 'checked_at': datetime.now().isoformat(timespec='seconds'), 'result': stored}
+    path = _abs_path(INTEGRITY_STATE_FILE)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(state, f, ensure_ascii=False)
+        os.replace(tmp, path)
+    except Exception as ex:
+        logger.debug("Không ghi được integrity state: %s", ex)
+
+def _verify_buckets_incremental(previous: Dict[str, Any], buckets: set) -> Dict[str, Any]:
+    """Giữ kết quả checkpoint cho bucket không đổi, chỉ xét lại chồng giờ của các bucket bẩn."""
+    recs = get_daily_records(force_reload=True)
+    pairs = [p for p in previous.get('overlap_pairs', []) if (p.get('ngay'), p.get('san')) not in buckets]
+    index = _get_day_index()
+    for ngay, san in sorted(buckets):
+        lst = [r for r in index.get(ngay, ()) if r.san == san]
+        pairs.extend(_bucket_overlaps(ngay, san, lst))
+    # Ghi mới luôn có record_id -> missing_id chỉ đổi khi dữ liệu bị sửa ngoài app (đã chuyển sang quét toàn bộ)
+    return {
+        'total_records': len(recs),
+        'overlap_count': len(pairs),
+        'overlap_pairs': pairs,
+        'missing_id_count': previous.get('missing_id_count', 0),
+        'has_record_id_header': previous.get('has_record_id_header', False),
+    }
+
+def check_data_integrity_cached(full: bool = False) -> Dict[str, Any]:
+    """verify_data_integrity() có checkpoint: dữ liệu chưa đổi -> dùng lại kết quả; có journal ->
+    chỉ kiểm tra lại bucket (ngày, sân) bị chạm; full=True hoặc không đủ thông tin -> quét toàn bộ.
+    Kết quả có thêm 'mode' ('cached'|'incremental'|'full'), 'from_cache', 'checked_buckets',
+    'generation', 'checked_at'. An toàn khi chạy trên worker nền."""
+    generation = data_generation()
+    state = None if full else load_integrity_state()
+    buckets, consumed = _read_integrity_journal()
+    if state and state.get('generation') == generation and not buckets:
+        result = dict(state['result'])
+        result.update(mode='cached', from_cache=True, checked_buckets=0, generation=generation,
+                      checked_at=state.get('checked_at'))
+        metrics.inc('integrity.mode.cached')
+        return result
+    if state and buckets and not state['result'].get('pairs_truncated'):
+        result = _verify_buckets_incremental(state['result'], buckets)
+        mode = 'incremental'
+    else:
+        result = verify_data_integrity()
+        mode = 'full'
+    # Quét có thể chạy song song với thao tác ghi: chỉ lưu checkpoint nếu thế hệ không đổi trong lúc quét
+    if data_generation() == generation:
+        _save_integrity_state(generation, result)
+        _truncate_integrity_journal(consumed)
+    result.update(mode=mode, from_cache=False, checked_buckets=len(buckets) if mode == 'incremental' else 0,
+                  generation=generation, checked_at=datetime.now().isoformat(timespec='seconds'))
+    metrics.inc('integrity.mode.' + mode)
+    return result
+
 __all__ = [
     # -------- Daily core --------
     "append_daily_record", "read_daily_records_dict", "compute_daily_total", "compute_month_total",
     # -------- Financial & Monthly --------
     "format_currency", "compute_profit", "save_monthly_stat", "read_monthly_stats",
+    "get_monthly_stat", "monthly_stat_history", "delete_monthly_stat", "compact_monthly_stats",
     # -------- Safety / Helpers (additive) --------
-    "parse_currency_any", "_sanitize_text_cell", "verify_data_integrity",
+    "parse_currency_any", "_sanitize_text_cell", "verify_data_integrity", "check_data_integrity_cached", "data_generation", "load_integrity_state",
     # -------- Date / Slot utilities --------
     "today_str", "validate_time_slot", "normalize_time_slot", "delete_daily_record", "undo_last_action", "breakdown_daily_by_court", "backup_data", "month_breakdown_by_court", "compute_profit_shares",
     # -------- Date conversions --------
@@ -1581,10 +2747,18 @@ __all__ = [
     "compute_subscription_price", "add_month_subscription", "read_month_subscriptions", "compute_month_subscription_total", "delete_month_subscription",
     # -------- Water sales --------
     "add_water_item","read_water_items","record_water_sale","read_water_sales","aggregate_day_water_sales","day_water_sales","compute_month_water_sales_total",
+    "water_stock","snapshot_water_stock","read_water_ledger","adjust_water_stock","day_water_sales_total","water_sales_item_totals",
     # -------- Edit helpers --------
     "update_daily_record","update_monthly_stat","update_month_subscription","update_water_item",
     # --- ID precise helpers (additive) ---
-    "delete_daily_record_by_id","find_daily_record_by_id"
+    "delete_daily_record_by_id","find_daily_record_by_id",
+    # -------- Schedule (index theo ngày) --------
+    "get_daily_records_for_day","week_occupancy","compile_subscription_calendar","subscription_occurrences_for_day","month_court_utilization",
+    "month_occupancy","subscription_conflicts","month_conflicts","ScheduleConflictError",
+    # -------- Config --------
+    "load_app_config","get_config_value","data_dir","set_data_dir",
+    # -------- Change events --------
+    "subscribe_changes","unsubscribe_changes","invalidate_all_caches"
 ]
 
 # ---------------------- GỢI Ý GIÁ THEO BẢNG ----------------------
@@ -1613,3 +2787,32 @@ def suggest_price(ngay: str, khung_gio: str, loai: str) -> Optional[int]:
     return None
 
 __all__.append('suggest_price')
+
+
+# ---------------------- GẮN ĐO HIỆU NĂNG CHO HÀM PUBLIC ----------------------
+# Bọc tại chỗ (thay tên trong module) để cả lời gọi nội bộ lẫn "from utils import ..." ở main.py
+# đều đi qua bản đã đo. Phải đứng cuối file, sau khi mọi hàm đã được định nghĩa.
+_INSTRUMENTED_FUNCS = (
+    # Đọc
+    "get_daily_records", "read_daily_records_dict", "read_daily_records_grouped_by_date", "get_daily_records_for_day",
+    "find_daily_record_by_id", "read_monthly_stats", "get_monthly_stat", "monthly_stat_history",
+    "read_profit_share_events", "read_all_subscriptions",
+    "read_month_subscriptions", "read_water_items", "read_water_sales", "day_water_sales", "aggregate_day_water_sales",
+    "day_water_sales_total", "water_sales_item_totals", "week_occupancy", "compile_subscription_calendar",
+    "month_court_utilization", "month_occupancy", "subscription_conflicts", "month_conflicts",
+    # Tính toán
+    "compute_daily_total", "compute_month_total", "compute_month_subscription_total", "compute_month_water_sales_total",
+    "breakdown_daily_by_court", "month_breakdown_by_court", "verify_data_integrity", "check_data_integrity_cached",
+    # Ghi
+    "append_daily_record", "delete_daily_record", "delete_daily_record_by_id", "update_daily_record", "undo_last_action",
+    "save_monthly_stat", "update_monthly_stat", "delete_monthly_stat", "compact_monthly_stats", "add_profit_share_event", "delete_profit_share_event",
+    "add_month_subscription", "add_month_subscription_with_time", "update_month_subscription",
+    "update_month_subscription_with_time", "delete_month_subscription", "add_water_item", "update_water_item",
+    "delete_water_item", "record_water_sale", "delete_water_sale", "adjust_water_stock", "snapshot_water_stock",
+    "backup_data",
+)
+for _name in _INSTRUMENTED_FUNCS:
+    if not getattr(globals()[_name], '__wrapped_metrics__', False):
+        globals()[_name] = _instrumented(_name, globals()[_name])
+del _name
+__all__.extend(["metrics", "MetricsRegistry", "format_metrics"])